@@ -0,0 +1,277 @@
+from operator import add
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from cursor import Cursor
+from planner import Plan, columns_of, describe
+from query import Aggregate, Condition, column_name
+
+# reduces the values of every group of a batch sorted by group, from the group starts
+REDUCE = {"SUM": np.add, "AVG": np.add, "MIN": np.minimum, "MAX": np.maximum}
+# combines the results of an aggregate over two sets of rows
+MERGE = {"SUM": add, "AVG": add, "MIN": min, "MAX": max}
+
+# ways of computing the aggregates of a query
+COUNT_ROWS = "count"
+WALK_INDEX = "index"
+SCAN_BATCHES = "batches"
+
+
+class Aggregation:
+    """
+    The aggregates of a SELECT, over every row or per group of rows with equal values of
+    the GROUP BY columns, computed in the cheapest of three ways:
+
+    - Counting: COUNT alone without GROUP BY is the row count of the table, or for
+      a condition on one indexed column, the sum of the sizes of its posting lists.
+    - Walking an index: GROUP BY an indexed column reads each value of its index with
+      the size of its posting list, when the condition and the aggregates are on that column
+      only. No pk and no row is read.
+    - Scanning batches: otherwise the rows matching the condition are decoded a batch at a
+      time into an array per column, each batch is reduced per group with numpy and the
+      results of the batches are merged.
+
+    Groups are returned in order of their values.
+    """
+
+    def __init__(
+        self,
+        table,
+        columns: Sequence[Union[str, Aggregate]],
+        group_by: Optional[Sequence[str]] = None,
+    ):
+        self.table = table
+        self.columns = list(columns)
+        self.group_by = list(group_by or ())
+        for col in self.group_by:
+            self._check_column(col)
+        for column in self.columns:
+            if not isinstance(column, Aggregate):
+                if column not in self.group_by:
+                    raise ValueError(
+                        "Column %s must be in GROUP BY or used in an aggregate" % column
+                    )
+            elif column.col is not None:
+                self._check_column(column.col)
+                if column.function in ("SUM", "AVG") and not (
+                    table.cols[column.col].dbtype.is_numeric
+                ):
+                    raise ValueError(
+                        f"{column.function} needs a numeric column, not {column.col}"
+                    )
+        # names of the columns of the result rows
+        self.names = [column_name(column) for column in self.columns]
+
+    def method(self, condition: Optional[Condition]) -> str:
+        """Returns how the aggregates of the rows matching condition are computed"""
+        if not self.group_by:
+            if all(
+                isinstance(column, Aggregate) and column.function == "COUNT"
+                for column in self.columns
+            ):
+                return COUNT_ROWS
+            return SCAN_BATCHES
+        col = self.group_by[0]
+        if (
+            len(self.group_by) == 1
+            and col != self.table.primary_key
+            and self.table.index_using(col) is not None
+            and (condition is None or condition.col == col)
+            and all(
+                column == col
+                or (
+                    isinstance(column, Aggregate)
+                    and column.col in (None, col)
+                    and (column.col is not None or column.function == "COUNT")
+                )
+                for column in self.columns
+            )
+        ):
+            return WALK_INDEX
+        return SCAN_BATCHES
+
+    def execute(
+        self,
+        condition: Condition = None,
+        limit: int = None,
+        offset: int = 0,
+        plan: Plan = None,
+    ) -> Cursor:
+        """
+        Returns a cursor over the result rows of the aggregates over the rows matching
+        condition, or every row, skipping offset rows and returning at most limit.
+        plan, if given, is the plan of the condition from DBTable.plan().
+        The table is read from a snapshot, so writes are not blocked meanwhile.
+        """
+        if (limit is not None and limit < 0) or offset < 0:
+            raise ValueError("LIMIT and OFFSET must not be negative")
+        if condition is not None and plan is None:
+            plan = self.table.plan(condition)
+        # the indexes the plan reads, composite ones included, and those of the columns
+        # read by the aggregates
+        columns, composites = self.table._plan_indexes(plan)
+        for col in [self.table.primary_key, *self.group_by] + sorted(
+            columns_of(condition) if condition is not None else ()
+        ):
+            if col not in columns:
+                columns.append(col)
+        with self.table.snapshot(columns, composites) as snapshot, snapshot.view():
+            rows = self._rows(condition, plan)
+        rows = rows[offset:] if limit is None else rows[offset : offset + limit]
+        return Cursor([dict(zip(self.names, row)) for row in rows], self.names)
+
+    def explain(self, condition: Condition = None, plan: Plan = None) -> str:
+        """Returns how the aggregates are computed, with the plan finding the rows if any"""
+        method = self.method(condition)
+        if method == WALK_INDEX:
+            line = f"Group by {self.group_by[0]} walking its index"
+            if condition is not None:
+                line += f": {describe(condition)}"
+            return line
+        if method == COUNT_ROWS:
+            if condition is None:
+                return f"Count from table statistics  (rows={self.table.row_count()})"
+            if self._on_postings(condition):
+                return f"Count from posting lists of {condition.col}: {describe(condition)}"
+            line = "Count"
+        else:
+            line = "Aggregate in batches"
+            if self.group_by:
+                line += f" grouped by {', '.join(self.group_by)}"
+        if condition is not None:
+            plan = plan or self.table.plan(condition)
+        if plan is None:
+            return f"{line}\n  -> Full scan  (rows={self.table.row_count()})"
+        return f"{line}\n{plan.explain(1)}"
+
+    # --------- internal ---------
+    def _check_column(self, col: str):
+        if not col in self.table.cols:
+            raise ValueError(f"Column '{col}' does not exist")
+
+    def _on_postings(self, condition: Condition) -> bool:
+        """whether a condition is on one indexed nonclustered column,
+        counted by DBTable.count()
+        """
+        return (
+            condition.col in self.table.cols
+            and condition.col != self.table.primary_key
+            and self.table.index_using(condition.col) is not None
+        )
+
+    def _rows(self, condition: Optional[Condition], plan: Optional[Plan]) -> List[list]:
+        method = self.method(condition)
+        if method == COUNT_ROWS:
+            return [[self.table.count(condition, plan)] * len(self.columns)]
+        if method == WALK_INDEX:
+            groups = (
+                ((value,), self._from_count(value, count))
+                for value, count in self.table.index_counts(self.group_by[0], condition)
+            )
+        else:
+            pks = None
+            if condition is not None:
+                pks = (plan or self.table.plan(condition)).execute(self.table)
+            groups = sorted(self._scan(pks).items())
+        rows = [self._result(key, state) for key, state in groups]
+        if not rows and not self.group_by:
+            # aggregates over no rows are one row
+            return [self._result((), [0] + [None] * len(self.columns))]
+        return rows
+
+    def _from_count(self, value, count: int) -> list:
+        """the state of the aggregates of the group of rows sharing a value"""
+        state = [count]
+        for column in self.columns:
+            if isinstance(column, Aggregate) and column.function in ("SUM", "AVG"):
+                state.append(value * count)
+            else:
+                state.append(value)
+        return state
+
+    def _scan(self, pks: Optional[np.ndarray]) -> Dict[tuple, list]:
+        """
+        Reduces the rows of pks, or every row, a batch at a time, returning the state of each
+        group by its values: its number of rows then the result so far of each column
+        """
+        reduced = [
+            (i, column)
+            for i, column in enumerate(self.columns)
+            if isinstance(column, Aggregate) and column.function in REDUCE
+        ]
+        read = list(self.group_by)
+        for _, column in reduced:
+            if column.col not in read:
+                read.append(column.col)
+        if not read:
+            read = [self.table.primary_key]
+
+        groups: Dict[tuple, list] = {}
+        for batch in self.table.column_batches(read, pks):
+            size = len(batch[read[0]])
+            keys, codes = _group_codes([batch[col] for col in self.group_by], size)
+            order = np.argsort(codes, kind="stable")
+            sorted_codes = codes[order]
+            starts = np.flatnonzero(
+                np.concatenate(([True], sorted_codes[1:] != sorted_codes[:-1]))
+            )
+            counts = np.diff(np.append(starts, size)).tolist()
+            results = {
+                i: REDUCE[column.function]
+                .reduceat(batch[column.col][order], starts)
+                .tolist()
+                for i, column in reduced
+            }
+            for g, key in enumerate(keys):
+                state = groups.get(key)
+                if state is None:
+                    state = groups[key] = [0] + [None] * len(self.columns)
+                state[0] += counts[g]
+                for i, column in reduced:
+                    result = results[i][g]
+                    previous = state[i + 1]
+                    state[i + 1] = (
+                        result
+                        if previous is None
+                        else MERGE[column.function](previous, result)
+                    )
+        return groups
+
+    def _result(self, key: tuple, state: list) -> List[Any]:
+        """the result row of a group from its values and state"""
+        count = state[0]
+        row = []
+        for i, column in enumerate(self.columns):
+            if not isinstance(column, Aggregate):
+                row.append(key[self.group_by.index(column)])
+            elif column.function == "COUNT":
+                row.append(count)
+            elif column.function == "AVG" and count:
+                row.append(state[i + 1] / count)
+            else:
+                row.append(state[i + 1])
+        return row
+
+
+def _group_codes(arrays: List[np.ndarray], size: int) -> Tuple[List[tuple], np.ndarray]:
+    """
+    Returns the distinct tuples of values of arrays in order and the position among them
+    of the values of every row. Without arrays, every row is in one group.
+    """
+    if not arrays:
+        return [()], np.zeros(size, dtype=np.intp)
+    uniques = []
+    codes = []
+    for array in arrays:
+        unique, inverse = np.unique(array, return_inverse=True)
+        uniques.append(unique.tolist())
+        codes.append(inverse.reshape(-1))
+    if len(arrays) == 1:
+        return [(value,) for value in uniques[0]], codes[0]
+    combined, inverse = np.unique(np.stack(codes, axis=1), axis=0, return_inverse=True)
+    keys = [
+        tuple(values[code] for values, code in zip(uniques, row))
+        for row in combined.tolist()
+    ]
+    return keys, inverse.reshape(-1)
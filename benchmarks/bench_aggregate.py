@@ -0,0 +1,125 @@
+"""
+Aggregate queries through SQL against aggregating the rows of select_all() in Python,
+as reports did before GROUP BY: counts answered from the indexes, a group by walking
+a column's index and aggregates computed over decoded batches of rows.
+
+Run from the repository root:
+python3 -m benchmarks.bench_aggregate [--rows N] [--repeat N]
+"""
+
+import argparse
+import shutil
+import tempfile
+import time
+from collections import defaultdict
+
+from tabulate import tabulate
+
+from db import DB, ColumnInfo, DBTable, DBType
+
+
+def build(path: str, rows: int) -> DB:
+    db = DB(path)
+    table = DBTable(name="orders", path=path, pool=db.pool)
+    table.add_column("pk", ColumnInfo(DBType.INTEGER, primary_key=True))
+    table.add_column("customer", ColumnInfo(DBType.INTEGER))
+    table.add_column("total", ColumnInfo(DBType.FLOAT))
+    db[table.name] = table
+    db.create_index("orders", ["customer"])
+    table.insert_many(
+        {
+            "pk": list(range(rows)),
+            "customer": [pk % 1000 for pk in range(rows)],
+            "total": [pk / 10 for pk in range(rows)],
+        }
+    )
+    return db
+
+
+def count_customer(rows):
+    return sum(1 for row in rows if row["customer"] == 42)
+
+
+def orders_per_customer(rows):
+    counts = defaultdict(int)
+    for row in rows:
+        counts[row["customer"]] += 1
+    return sorted(counts.items())
+
+
+def totals_per_customer(rows):
+    groups = {}
+    for row in rows:
+        count, total, largest = groups.get(row["customer"], (0, 0.0, None))
+        groups[row["customer"]] = (
+            count + 1,
+            total + row["total"],
+            row["total"] if largest is None else max(largest, row["total"]),
+        )
+    return [
+        (customer, total / count, largest)
+        for customer, (count, total, largest) in sorted(groups.items())
+    ]
+
+
+def total(rows):
+    return sum(row["total"] for row in rows)
+
+
+# (name, SQL, the same aggregation over every row in Python)
+QUERIES = [
+    ("count where", "SELECT COUNT(*) FROM orders WHERE customer = 42", count_customer),
+    (
+        "group by index",
+        "SELECT customer, COUNT(*) FROM orders GROUP BY customer",
+        orders_per_customer,
+    ),
+    (
+        "group by batches",
+        "SELECT customer, AVG(total), MAX(total) FROM orders GROUP BY customer",
+        totals_per_customer,
+    ),
+    ("sum", "SELECT SUM(total) FROM orders", total),
+]
+
+
+def best(run, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", help="rows in the table", type=int, default=200000)
+    parser.add_argument("--repeat", help="runs of each query", type=int, default=3)
+    args = parser.parse_args()
+
+    path = tempfile.mkdtemp() + "/db"
+    db = build(path, args.rows)
+    table = db["orders"]
+    results = []
+    for name, sql, python in QUERIES:
+        statement = db.prepare(sql)
+        sql_time = best(lambda: statement.execute().fetchall(), args.repeat)
+        python_time = best(lambda: python(table.select_all()), args.repeat)
+        results.append(
+            [
+                name,
+                statement.explain().split("\n")[0],
+                f"{python_time * 1000:,.1f}",
+                f"{sql_time * 1000:,.1f}",
+                f"{python_time / sql_time:,.1f}x",
+            ]
+        )
+    db.close()
+    shutil.rmtree(path)
+    print(
+        tabulate(
+            results,
+            headers=["query", "method", "select_all ms", "SQL ms", "speedup"],
+        )
+    )
@@ -0,0 +1,105 @@
+"""
+Lookups with an equality condition on one column and a range condition on another, answered
+by intersecting the pks found by an index on each column against one range scan of a
+composite index on both columns, and the cost of keeping each kind of index up to date.
+
+Run from the repository root:
+python3 -m benchmarks.bench_composite [--rows N] [--lookups N]
+"""
+
+import argparse
+import random
+import shutil
+import tempfile
+import time
+
+from tabulate import tabulate
+
+from db import DB, ColumnInfo, DBTable, DBType
+from query import Condition, ConditionType
+
+CUSTOMERS = 50
+DAYS = 365
+
+
+def build(path: str, composite: bool) -> DB:
+    db = DB(path)
+    table = DBTable(name="orders", path=path, pool=db.pool)
+    table.add_column("pk", ColumnInfo(DBType.INTEGER, primary_key=True))
+    table.add_column("customer", ColumnInfo(DBType.INTEGER))
+    table.add_column("day", ColumnInfo(DBType.INTEGER))
+    table.add_column("total", ColumnInfo(DBType.FLOAT))
+    db[table.name] = table
+    if composite:
+        db.create_index("orders", ["customer", "day"])
+    else:
+        db.create_index("orders", ["customer"])
+        db.create_index("orders", ["day"])
+    return db
+
+
+def row(pk: int) -> dict:
+    return {
+        "pk": pk,
+        "customer": pk * 7919 % CUSTOMERS,
+        "day": pk * 104729 % DAYS,
+        "total": pk % 1000 / 10,
+    }
+
+
+def condition(customer: int, day: int) -> Condition:
+    return Condition(
+        ConditionType.AND,
+        None,
+        [
+            Condition(ConditionType.EQUALS, "customer", customer),
+            Condition(ConditionType.BETWEEN, "day", (day, day + 6)),
+        ],
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", help="rows inserted", type=int, default=50000)
+    parser.add_argument("--lookups", help="lookups", type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    lookups = [
+        condition(rng.randrange(CUSTOMERS), rng.randrange(DAYS))
+        for _ in range(args.lookups)
+    ]
+    results = []
+    for composite in (False, True):
+        path = tempfile.mkdtemp() + "/db"
+        db = build(path, composite)
+        table = db["orders"]
+
+        start = time.perf_counter()
+        for pk in range(args.rows):
+            table.insert(row(pk))
+        insert_time = time.perf_counter() - start
+        # the statistics drifted by the inserts are rebuilt once, before timing lookups
+        table.rebuild_stats()
+
+        start = time.perf_counter()
+        found = sum(len(table.filter(lookup)) for lookup in lookups)
+        filter_time = time.perf_counter() - start
+
+        results.append(
+            [
+                "customer, day" if composite else "customer; day",
+                table.plan(lookups[0]).describe().split(":")[0],
+                f"{args.rows / insert_time:,.0f}",
+                f"{args.lookups / filter_time:,.0f}",
+                f"{found / args.lookups:,.1f}",
+            ]
+        )
+        db.close()
+        shutil.rmtree(path)
+    print(
+        tabulate(
+            results,
+            headers=["indexes", "plan", "inserts/s", "lookups/s", "rows/lookup"],
+        )
+    )
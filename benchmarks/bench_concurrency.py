@@ -0,0 +1,153 @@
+"""
+Throughput of reader threads running point queries while one writer inserts rows
+at a steady rate, and how long the writer waits when other threads run long full-table
+scans read from snapshots, against scans holding the table's reader lock.
+
+Run from the repository root:
+python3 -m benchmarks.bench_concurrency [--rows N] [--seconds S] [--write-rate R]
+"""
+
+import argparse
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+from tabulate import tabulate
+
+from db import DB, ColumnInfo, DBTable, DBType
+from query import Condition, ConditionType
+
+
+def build(path: str, rows: int) -> DBTable:
+    db = DB(path)
+    table = DBTable(name="orders", path=path, pool=db.pool)
+    table.add_column("pk", ColumnInfo(DBType.INTEGER, primary_key=True))
+    table.add_column("customer", ColumnInfo(DBType.INTEGER))
+    db[table.name] = table
+    table.insert_many(
+        {"pk": range(rows), "customer": [pk % 1000 for pk in range(rows)]}
+    )
+    return db, table
+
+
+def run(table: DBTable, readers: int, read, seconds: float, first_pk: int, rate: float):
+    """runs reader threads calling read(table) and one writer inserting batches of 10 rows
+    at rate rows per second, returning the reads, the rows written, the slowest insert
+    and the reads' results
+    """
+    stop = threading.Event()
+    reads = [0] * readers
+    results = []
+
+    def reader(i: int):
+        while not stop.is_set():
+            results.append(read(table))
+            reads[i] += 1
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    for thread in threads:
+        thread.start()
+    written = 0
+    slowest = 0.0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        # waits for the next batch's turn, so readers get the lock in between
+        time.sleep(max(0.0, start + written / rate - time.perf_counter()))
+        pk = first_pk + written
+        insert_start = time.perf_counter()
+        table.insert_many({"pk": range(pk, pk + 10), "customer": [1] * 10})
+        slowest = max(slowest, time.perf_counter() - insert_start)
+        written += 10
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return sum(reads), written, slowest, results
+
+
+def point_query(table: DBTable):
+    pk = random.randrange(table.row_count())
+    return table.select(table.filter(Condition(ConditionType.EQUALS, "pk", pk)))
+
+
+def snapshot_scan(table: DBTable) -> int:
+    return len(table.select_all())
+
+
+def locked_scan(table: DBTable) -> int:
+    with table.lock.reader_lock:
+        return sum(1 for _ in table.scan_rows())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", help="rows in the table", type=int, default=50000)
+    parser.add_argument(
+        "--seconds", help="time spent on each measurement", type=float, default=2.0
+    )
+    parser.add_argument(
+        "--write-rate",
+        help="rows inserted per second by the writer",
+        type=float,
+        default=2000,
+    )
+    args = parser.parse_args()
+
+    path = tempfile.mkdtemp() + "/db"
+    db, table = build(path, args.rows)
+    next_pk = args.rows
+
+    results = []
+    for readers in (1, 2, 4, 8):
+        reads, written, slowest, _ = run(
+            table, readers, point_query, args.seconds, next_pk, args.write_rate
+        )
+        next_pk += written
+        results.append(
+            [
+                readers,
+                f"{reads / args.seconds:,.0f}",
+                f"{written / args.seconds:,.0f}",
+                f"{slowest * 1000:,.1f}",
+            ]
+        )
+    print(
+        tabulate(
+            results,
+            headers=["readers", "point reads/s", "rows written/s", "slowest insert ms"],
+        )
+    )
+    print()
+
+    results = []
+    for name, scan in (("snapshot", snapshot_scan), ("reader lock", locked_scan)):
+        scans, written, slowest, counts = run(
+            table, 2, scan, args.seconds, next_pk, args.write_rate
+        )
+        next_pk += written
+        # every scan of a consistent view sees whole batches of the writer's rows
+        consistent = all((count - args.rows) % 10 == 0 for count in counts)
+        results.append(
+            [
+                name,
+                f"{scans / args.seconds:,.1f}",
+                f"{written / args.seconds:,.0f}",
+                f"{slowest * 1000:,.1f}",
+                "yes" if consistent else "no",
+            ]
+        )
+    db.close()
+    shutil.rmtree(path)
+    print(
+        tabulate(
+            results,
+            headers=[
+                "2 full scans",
+                "scans/s",
+                "rows written/s",
+                "slowest insert ms",
+                "consistent",
+            ],
+        )
+    )
@@ -0,0 +1,82 @@
+"""
+Equality lookups and inserts on a column indexed with a B+tree against the same column
+with a hash index from CREATE INDEX ... USING HASH.
+
+Run from the repository root:
+python3 -m benchmarks.bench_hash [--rows N] [--lookups N]
+"""
+
+import argparse
+import random
+import shutil
+import tempfile
+import time
+
+from tabulate import tabulate
+
+from db import BTREE, DB, HASH, ColumnInfo, DBTable, DBType
+from query import Condition, ConditionType
+
+
+def build(path: str, using: str) -> DB:
+    db = DB(path)
+    table = DBTable(name="users", path=path, pool=db.pool)
+    table.add_column("pk", ColumnInfo(DBType.INTEGER, primary_key=True))
+    table.add_column("email", ColumnInfo(DBType.STRING))
+    db[table.name] = table
+    db.create_index("users", ["email"], using=using)
+    return db
+
+
+def email(pk: int) -> str:
+    return f"user{pk * 7919 % 1000003}@example.com"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", help="rows inserted", type=int, default=50000)
+    parser.add_argument("--lookups", help="lookups by email", type=int, default=20000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    keys = [email(rng.randrange(args.rows)) for _ in range(args.lookups)]
+    results = []
+    for using in (BTREE, HASH):
+        path = tempfile.mkdtemp() + "/db"
+        db = build(path, using)
+        table = db["users"]
+
+        start = time.perf_counter()
+        for pk in range(args.rows):
+            table.insert({"pk": pk, "email": email(pk)})
+        insert_time = time.perf_counter() - start
+        # the statistics drifted by the inserts are rebuilt once, before timing lookups
+        table.rebuild_stats()
+
+        index = table.cols["email"].index
+        start = time.perf_counter()
+        for key in keys:
+            index.get(key)
+        probe_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for key in keys:
+            table.filter(Condition(ConditionType.EQUALS, "email", key))
+        filter_time = time.perf_counter() - start
+
+        results.append(
+            [
+                using,
+                f"{args.rows / insert_time:,.0f}",
+                f"{args.lookups / probe_time:,.0f}",
+                f"{args.lookups / filter_time:,.0f}",
+            ]
+        )
+        db.close()
+        shutil.rmtree(path)
+    print(
+        tabulate(
+            results,
+            headers=["index", "inserts/s", "index gets/s", "filters/s"],
+        )
+    )
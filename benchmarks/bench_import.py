@@ -0,0 +1,90 @@
+"""
+Throughput of importing a CSV file with the parallel pipeline of gcsv.import_csv
+and several numbers of worker processes, against reading every row with csv.reader
+and adding them with one DBTable.insert_many.
+
+Run from the repository root:
+python3 -m benchmarks.bench_import [--rows N] [--workers N ...]
+"""
+
+import argparse
+import csv
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from tabulate import tabulate
+
+from db import ColumnInfo, DBTable, DBType
+from gcsv import import_csv
+
+
+def write_csv(path: str, rows: int):
+    pks = list(range(rows))
+    random.shuffle(pks)
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["pk", "customer", "quantity", "city"])
+        for pk in pks:
+            writer.writerow([pk, f"customer {pk % 10000}", pk % 50, f"city {pk % 97}"])
+
+
+def insert_many(table: DBTable, path: str) -> int:
+    table.add_column("pk", ColumnInfo(DBType.INTEGER, primary_key=True))
+    table.add_column("customer", ColumnInfo(DBType.STRING))
+    table.add_column("quantity", ColumnInfo(DBType.INTEGER))
+    table.add_column("city", ColumnInfo(DBType.STRING))
+    with open(path, newline="") as f:
+        reader = csv.reader(f)
+        next(reader)
+        rows = [
+            {
+                "pk": int(pk),
+                "customer": customer,
+                "quantity": int(quantity),
+                "city": city,
+            }
+            for pk, customer, quantity, city in reader
+        ]
+    return table.insert_many(rows)
+
+
+def bench(rows: int, workers: list):
+    path = tempfile.mkdtemp()
+    csv_path = os.path.join(path, "orders.csv")
+    write_csv(csv_path, rows)
+
+    methods = [("csv.reader + insert_many", None)]
+    methods += [(f"import_csv, {n} workers", n) for n in workers]
+    results = []
+    for name, n in methods:
+        table = DBTable(name="orders", path=path)
+        start = time.perf_counter()
+        if n is None:
+            count = insert_many(table, csv_path)
+        else:
+            with open(csv_path, newline="") as f:
+                count = import_csv(table, f, workers=n)
+        table.save()
+        elapsed = time.perf_counter() - start
+        table.close()
+        shutil.rmtree(table.path)
+        results.append([name, f"{elapsed:.2f}", f"{count / elapsed:,.0f}"])
+    shutil.rmtree(path)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", help="rows in the CSV file", type=int, default=300000)
+    parser.add_argument(
+        "--workers",
+        help="numbers of worker processes measured",
+        type=int,
+        nargs="+",
+        default=[1, 2, 4],
+    )
+    args = parser.parse_args()
+    print(tabulate(bench(args.rows, args.workers), headers=["method", "s", "rows/s"]))
@@ -0,0 +1,79 @@
+"""
+Throughput of DBTable.insert row by row against DBTable.insert_many
+when adding rows to a table that already holds rows, with only the primary key indexed
+and with every column indexed.
+
+Run from the repository root:
+python3 -m benchmarks.bench_insert [--count N] [--batch N]
+"""
+
+import argparse
+import random
+import shutil
+import tempfile
+import time
+
+from tabulate import tabulate
+
+from db import ColumnInfo, DBTable, DBType
+
+
+def make_table(path: str, count: int, indexed: bool) -> DBTable:
+    table = DBTable(name="orders", path=path)
+    table.add_column("pk", ColumnInfo(DBType.INTEGER, primary_key=True))
+    table.add_column("customer", ColumnInfo(DBType.STRING))
+    table.add_column("quantity", ColumnInfo(DBType.INTEGER))
+    table.add_column("price", ColumnInfo(DBType.FLOAT))
+    if indexed:
+        for col in ("customer", "quantity", "price"):
+            table.create_index(f"orders_{col}_idx", [col])
+    table.insert_many([row(pk) for pk in range(0, 2 * count, 2)])
+    return table
+
+
+def row(pk: int) -> dict:
+    return {
+        "pk": pk,
+        "customer": f"customer {pk % 1000}",
+        "quantity": pk % 50,
+        "price": pk * 0.25,
+    }
+
+
+def bench(count: int, batch: int):
+    rows = [row(pk) for pk in range(1, 2 * count, 2)]
+    random.shuffle(rows)
+    results = []
+    for name in ("insert", "insert_many"):
+        result = [name]
+        for indexed in (False, True):
+            path = tempfile.mkdtemp()
+            table = make_table(path, count, indexed)
+            start = time.perf_counter()
+            if name == "insert":
+                for r in rows:
+                    table.insert(r)
+            else:
+                for i in range(0, len(rows), batch):
+                    table.insert_many(rows[i : i + batch])
+            elapsed = time.perf_counter() - start
+            table.close()
+            shutil.rmtree(path)
+            result.append(f"{len(rows) / elapsed:,.0f}")
+        results.append(result)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", help="number of rows", type=int, default=50000)
+    parser.add_argument(
+        "--batch", help="rows per insert_many call", type=int, default=10000
+    )
+    args = parser.parse_args()
+    print(
+        tabulate(
+            bench(args.count, args.batch),
+            headers=["method", "rows/s, pk indexed", "rows/s, every column indexed"],
+        )
+    )
@@ -0,0 +1,82 @@
+"""
+Memory taken by the nodes of a BPlusTree with integer and float keys kept in Python lists
+against keys kept in typed arrays (key_type "q" and "d"), along with the size of the page
+file and the time to read every node back from it.
+
+Run from the repository root:
+python3 -m benchmarks.bench_memory [--count N] [--max-degree N]
+"""
+
+import argparse
+import gc
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from tabulate import tabulate
+
+from gdb_bplustree import BPlusTree
+from gdb_bufferpool import BufferPool
+
+# large enough for every node to stay cached
+CACHE_SIZE = 4 * 1024**3
+
+
+def bench(count: int, max_degree: int, key_type: str, typed: bool) -> list:
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "tree")
+    keys = range(count) if key_type == "q" else (i / 4 for i in range(count))
+    tree = BPlusTree(max_degree, path, key_type=key_type if typed else None)
+    # one shared value, so only the keys and the nodes are measured
+    tree.bulk_load((key, b"") for key in keys)
+    tree.close()
+
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    tree = BPlusTree(path=path, pool=BufferPool(CACHE_SIZE))
+    stats = tree.fill_stats()
+    read_time = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    tree.close()
+    file_size = os.path.getsize(path)
+    shutil.rmtree(directory)
+    return [
+        {"q": "INTEGER", "d": "FLOAT"}[key_type],
+        "array" if typed else "list",
+        f"{memory / 2**20:,.1f}",
+        f"{memory / stats['keys']:.1f}",
+        f"{file_size / 2**20:,.1f}",
+        f"{read_time:.2f}",
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", help="number of keys", type=int, default=1000000)
+    parser.add_argument(
+        "--max-degree", help="max degree of the tree", type=int, default=100
+    )
+    args = parser.parse_args()
+    results = [
+        bench(args.count, args.max_degree, key_type, typed)
+        for key_type in ("q", "d")
+        for typed in (False, True)
+    ]
+    print(
+        tabulate(
+            results,
+            headers=[
+                "keys",
+                "storage",
+                "MiB cached",
+                "bytes/key",
+                "file MiB",
+                "read s",
+            ],
+        )
+    )
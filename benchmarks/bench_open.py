@@ -0,0 +1,88 @@
+"""
+Time to open a database and answer a first query as the number of tables grows,
+against opening every table and column up front.
+
+Run from the repository root:
+python3 -m benchmarks.bench_open [--rows N]
+"""
+
+import argparse
+import shutil
+import tempfile
+import time
+
+from tabulate import tabulate
+
+from db import DB, ColumnInfo, DBTable, DBType
+from query import Condition, ConditionType
+
+
+TABLE_COUNTS = [10, 50, 200]
+COLUMNS = 6
+
+
+def build(path: str, tables: int, rows: int):
+    db = DB(path)
+    for i in range(tables):
+        table = DBTable(name=f"table_{i}", path=path, pool=db.pool)
+        table.add_column("pk", ColumnInfo(DBType.INTEGER, primary_key=True))
+        for col in range(1, COLUMNS):
+            table.add_column(f"col_{col}", ColumnInfo(DBType.INTEGER))
+            table.create_index(f"table_{i}_col_{col}_idx", [f"col_{col}"])
+        table.insert_many(
+            {
+                "pk": list(range(rows)),
+                **{
+                    f"col_{col}": [pk % 97 for pk in range(rows)]
+                    for col in range(1, COLUMNS)
+                },
+            }
+        )
+        db[table.name] = table
+    db.close()
+
+
+def first_query(path: str) -> float:
+    start = time.perf_counter()
+    db = DB(path)
+    table = db["table_0"]
+    table.select(table.filter(Condition(ConditionType.EQUALS, "col_1", 5)))
+    elapsed = time.perf_counter() - start
+    db.close()
+    return elapsed
+
+
+def open_everything(path: str) -> float:
+    start = time.perf_counter()
+    db = DB(path)
+    for table in db.values():
+        for col in table.cols.values():
+            col.col_info, col.index
+    elapsed = time.perf_counter() - start
+    db.close()
+    return elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", help="rows per table", type=int, default=2000)
+    args = parser.parse_args()
+
+    results = []
+    for tables in TABLE_COUNTS:
+        path = tempfile.mkdtemp() + "/db"
+        build(path, tables, args.rows)
+        results.append(
+            [
+                tables,
+                f"{first_query(path) * 1000:.1f}",
+                f"{open_everything(path) * 1000:.1f}",
+            ]
+        )
+        shutil.rmtree(path)
+    print(
+        tabulate(
+            results,
+            headers=["tables", "open + first query (ms)", "open every column (ms)"],
+        )
+    )
@@ -0,0 +1,69 @@
+"""
+Statements parsed per second by the recursive descent parser, with and without its
+statement cache, against the sqlparse based parser it replaced.
+
+Run from the repository root:
+python3 -m benchmarks.bench_parse [--seconds S]
+"""
+
+import argparse
+import time
+
+from tabulate import tabulate
+
+from benchmarks.sqlparse_engine import SQLEngine as SQLParseEngine
+from sqlengine import SQLEngine
+
+
+STATEMENTS = {
+    "select": "SELECT * FROM fruits WHERE price >= 2 AND (color = 'red' OR color IN (green, 'yellow')) LIMIT 10",
+    "insert": "INSERT INTO fruits VALUES (1, 'apple', 2.5), (2, 'pear', 3), (3, 'kiwi', 1.25)",
+    "update": "UPDATE fruits SET color = 'green' WHERE price BETWEEN 1 AND 3",
+    "create": "CREATE TABLE fruits (pk integer primary key, name varchar, price float)",
+}
+
+
+def rate(parse, sql: str, seconds: float) -> float:
+    """statements parsed per second"""
+    count = 0
+    start = time.perf_counter()
+    while True:
+        for _ in range(100):
+            parse(sql)
+        count += 100
+        elapsed = time.perf_counter() - start
+        if elapsed >= seconds:
+            return count / elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--seconds", help="time spent on each measurement", type=float, default=0.5
+    )
+    args = parser.parse_args()
+
+    baseline = SQLParseEngine()
+    uncached = SQLEngine(cache_size=0)
+    cached = SQLEngine()
+
+    results = []
+    for name, sql in STATEMENTS.items():
+        sqlparse_rate = rate(baseline.parse_sql, sql, args.seconds)
+        parser_rate = rate(uncached.parse, sql, args.seconds)
+        cached_rate = rate(cached.parse, sql, args.seconds)
+        results.append(
+            [
+                name,
+                f"{sqlparse_rate:,.0f}",
+                f"{parser_rate:,.0f}",
+                f"{cached_rate:,.0f}",
+                f"{parser_rate / sqlparse_rate:.1f}x",
+            ]
+        )
+    print(
+        tabulate(
+            results,
+            headers=["statement", "sqlparse/s", "parser/s", "cached/s", "speedup"],
+        )
+    )
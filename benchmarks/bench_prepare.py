@@ -0,0 +1,97 @@
+"""
+Point queries and inserts per second through a prepared statement against parsing
+and converting every statement, as parse.parse_line does.
+
+Run from the repository root:
+python3 -m benchmarks.bench_prepare [--rows N] [--queries N]
+"""
+
+import argparse
+import shutil
+import tempfile
+import time
+
+from tabulate import tabulate
+
+from db import DB, ColumnInfo, DBTable, DBType
+from parse import convert_condition
+from sqlengine import SQLEngine
+
+
+def build(path: str, rows: int) -> DB:
+    db = DB(path)
+    table = DBTable(name="orders", path=path, pool=db.pool)
+    table.add_column("pk", ColumnInfo(DBType.INTEGER, primary_key=True))
+    table.add_column("customer", ColumnInfo(DBType.INTEGER))
+    table.add_column("total", ColumnInfo(DBType.FLOAT))
+    db[table.name] = table
+    table.insert_many(
+        {
+            "pk": list(range(rows)),
+            "customer": [pk % 1000 for pk in range(rows)],
+            "total": [pk / 10 for pk in range(rows)],
+        }
+    )
+    return db
+
+
+def select_parsed(db: DB, engine: SQLEngine, queries: int) -> float:
+    start = time.perf_counter()
+    for i in range(queries):
+        statement = engine.parse(f"SELECT * FROM orders WHERE pk = {i}")
+        table = db[statement.table_name]
+        table.cursor(convert_condition(statement.conditions, table)).fetchall()
+    return queries / (time.perf_counter() - start)
+
+
+def select_prepared(db: DB, queries: int) -> float:
+    start = time.perf_counter()
+    select = db.prepare("SELECT * FROM orders WHERE pk = ?")
+    for i in range(queries):
+        select.execute((i,)).fetchall()
+    return queries / (time.perf_counter() - start)
+
+
+def insert_parsed(db: DB, engine: SQLEngine, first: int, count: int) -> float:
+    start = time.perf_counter()
+    for pk in range(first, first + count):
+        statement = engine.parse(f"INSERT INTO orders VALUES ({pk}, {pk % 1000}, 1.5)")
+        table = db[statement.table_name]
+        table.insert(dict(zip(table.cols.keys(), statement.rows[0])))
+        db.commit()
+    return count / (time.perf_counter() - start)
+
+
+def insert_prepared(db: DB, first: int, count: int) -> float:
+    start = time.perf_counter()
+    insert = db.prepare("INSERT INTO orders VALUES (?, ?, ?)")
+    for pk in range(first, first + count):
+        insert.execute((pk, pk % 1000, 1.5))
+    return count / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", help="rows in the table", type=int, default=100000)
+    parser.add_argument("--queries", help="statements per run", type=int, default=5000)
+    args = parser.parse_args()
+
+    path = tempfile.mkdtemp() + "/db"
+    db = build(path, args.rows)
+    # every statement differs, so the statement cache does not help the parsed runs
+    engine = SQLEngine(cache_size=0)
+    results = [
+        [
+            "select",
+            f"{select_parsed(db, engine, args.queries):,.0f}",
+            f"{select_prepared(db, args.queries):,.0f}",
+        ],
+        [
+            "insert",
+            f"{insert_parsed(db, engine, args.rows, args.queries):,.0f}",
+            f"{insert_prepared(db, args.rows + args.queries, args.queries):,.0f}",
+        ],
+    ]
+    db.close()
+    shutil.rmtree(path)
+    print(tabulate(results, headers=["statement", "parsed/s", "prepared/s"]))
@@ -0,0 +1,169 @@
+"""
+Load generator for a GatorDB server: point queries by primary key, with a share of inserts,
+sent over several connections each keeping a number of requests in flight (pipelining).
+Reports the queries per second and the p50 and p99 latency of each configuration.
+
+Without --port or --unix-socket, starts a local server on a temporary database first.
+
+Run from the repository root:
+python3 -m benchmarks.bench_server [--rows N] [--seconds S] [--writes FRACTION]
+    [--host H --port P | --unix-socket PATH]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from tabulate import tabulate
+
+from client import AsyncClient, Client
+
+# (connections, requests in flight per connection) measured
+CONFIGURATIONS = [(1, 1), (1, 16), (4, 1), (4, 16), (16, 4)]
+
+
+def start_server(path: str, unix_socket: str) -> subprocess.Popen:
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "gatordb.py",
+            "--serve",
+            "--dbpath",
+            path,
+            "--unix-socket",
+            unix_socket,
+        ],
+        stdout=subprocess.DEVNULL,
+    )
+    deadline = time.time() + 10
+    while not os.path.exists(unix_socket):
+        if server.poll() is not None or time.time() > deadline:
+            raise RuntimeError("The server did not start")
+        time.sleep(0.05)
+    return server
+
+
+def populate(connect: dict, rows: int):
+    with Client(**connect) as client:
+        try:
+            client.execute("DROP TABLE bench_orders")
+        except ValueError:
+            # the table does not exist yet
+            pass
+        client.execute(
+            "CREATE TABLE bench_orders (pk int primary key, customer int, total float)"
+        )
+        insert = "INSERT INTO bench_orders VALUES (?, ?, ?)"
+        for first in range(0, rows, 1000):
+            client.pipeline(
+                (insert, (pk, pk % 1000, pk / 10))
+                for pk in range(first, min(first + 1000, rows))
+            )
+
+
+async def load(
+    connect: dict,
+    connections: int,
+    depth: int,
+    seconds: float,
+    rows: int,
+    writes: float,
+    next_pk: list,
+):
+    """returns the latency of every request answered in the given time"""
+    latencies = []
+    deadline = time.perf_counter() + seconds
+
+    async def worker(client: AsyncClient):
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            if random.random() < writes:
+                pk = next_pk[0]
+                next_pk[0] += 1
+                await client.execute(
+                    "INSERT INTO bench_orders VALUES (?, ?, ?)", (pk, pk % 1000, 1.5)
+                )
+            else:
+                await client.execute(
+                    "SELECT * FROM bench_orders WHERE pk = ?", (random.randrange(rows),)
+                )
+            latencies.append(time.perf_counter() - start)
+
+    clients = [await AsyncClient.connect(**connect) for _ in range(connections)]
+    await asyncio.gather(*(worker(client) for client in clients for _ in range(depth)))
+    for client in clients:
+        await client.close()
+    return latencies
+
+
+def percentile(values: list, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", help="rows in the table", type=int, default=20000)
+    parser.add_argument(
+        "--seconds", help="time spent on each configuration", type=float, default=3.0
+    )
+    parser.add_argument(
+        "--writes", help="fraction of requests that insert", type=float, default=0.1
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int)
+    parser.add_argument("--unix-socket")
+    args = parser.parse_args()
+
+    server = path = None
+    if args.port is not None:
+        connect = {"host": args.host, "port": args.port}
+    elif args.unix_socket is not None:
+        connect = {"unix_socket": args.unix_socket}
+    else:
+        path = tempfile.mkdtemp()
+        connect = {"unix_socket": os.path.join(path, "gatordb.sock")}
+        server = start_server(os.path.join(path, "db"), connect["unix_socket"])
+
+    try:
+        populate(connect, args.rows)
+        next_pk = [args.rows]
+        results = []
+        for connections, depth in CONFIGURATIONS:
+            latencies = asyncio.run(
+                load(
+                    connect,
+                    connections,
+                    depth,
+                    args.seconds,
+                    args.rows,
+                    args.writes,
+                    next_pk,
+                )
+            )
+            results.append(
+                [
+                    connections,
+                    depth,
+                    f"{len(latencies) / args.seconds:,.0f}",
+                    f"{percentile(latencies, 0.5) * 1000:.2f}",
+                    f"{percentile(latencies, 0.99) * 1000:.2f}",
+                ]
+            )
+        print(
+            tabulate(
+                results,
+                headers=["connections", "in flight", "QPS", "p50 ms", "p99 ms"],
+            )
+        )
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+            shutil.rmtree(path)
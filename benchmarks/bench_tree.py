@@ -0,0 +1,49 @@
+"""
+Lookup and insert throughput of BPlusTree across max_degree values.
+
+Run from the repository root:
+python3 -m benchmarks.bench_tree [--count N]
+"""
+
+import argparse
+import random
+import time
+
+from tabulate import tabulate
+
+from gdb_bplustree import BPlusTree
+
+
+DEGREES = [4, 16, 50, 100, 200, 500]
+
+
+def bench(max_degree: int, keys: list, lookups: list):
+    tree = BPlusTree(max_degree)
+
+    start = time.perf_counter()
+    for key in keys:
+        tree.insert(key, key)
+    insert_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for key in lookups:
+        tree.get(key)
+    lookup_time = time.perf_counter() - start
+
+    return len(keys) / insert_time, len(lookups) / lookup_time
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", help="number of keys", type=int, default=100000)
+    args = parser.parse_args()
+
+    keys = list(range(args.count))
+    random.shuffle(keys)
+    lookups = random.choices(keys, k=args.count)
+
+    rows = []
+    for degree in DEGREES:
+        inserts, gets = bench(degree, keys, lookups)
+        rows.append([degree, f"{inserts:,.0f}", f"{gets:,.0f}"])
+    print(tabulate(rows, headers=["max_degree", "inserts/s", "lookups/s"]))
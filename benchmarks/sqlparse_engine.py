@@ -0,0 +1,592 @@
+"""
+The sqlparse based SQL parser that sqlengine.SQLEngine replaced,
+kept as the baseline of benchmarks.bench_parse.
+"""
+
+import sqlparse
+
+from query import Condition, ConditionType
+
+
+COMPARISON_TYPES = {
+    "=": ConditionType.EQUALS,
+    "!=": ConditionType.NOT_EQUALS,
+    "<>": ConditionType.NOT_EQUALS,
+    "<": ConditionType.LESS_THAN,
+    "<=": ConditionType.LESS_EQUALS,
+    ">": ConditionType.GREATER_THAN,
+    ">=": ConditionType.GREATER_EQUALS,
+}
+
+
+class SQLEngine:
+    """
+    This is a helper class used to parse SQL commands
+    """
+
+    # name of the table
+    table_name = None
+
+    # table fields, e.g varchar, integer etc
+    class_fields = {}
+
+    # primary key used in the table
+    primary_key = None
+
+    def __parse_class_fields(self, tokens):
+        """
+        Parse the CREATE TABLE (...attributes) statement
+        :param tokens: parsed SQL tokens in the CREATE table statement
+        :return: a dictionary containing the information in the parsed SQL statement
+        :raises ValueError if the provided SQL statement is invalid
+        """
+        tokens = list(filter(lambda token: not token.is_whitespace, tokens))
+        field = None
+        name = None
+        i = 0
+        while i < len(tokens):
+            token = tokens[i]
+            i = i + 1
+            if not token.normalized == "(":
+                if token.is_keyword:
+                    if token.normalized == "PRIMARY":
+                        self.primary_key = name
+                        self.class_fields[name] = field
+                        next_token = tokens[i]
+                        index = next_token.value.rfind(",")
+                        if index == -1:
+                            name = None
+                        else:
+                            name = next_token.value[index + 1 :].strip()
+                            i = i + 1
+                    elif token.normalized == "KEY":
+                        continue
+                    else:
+                        raise ValueError("Unsupported keyword: %s" % token.value)
+                elif token.ttype is None or token.ttype == sqlparse.tokens.Keyword:
+                    name = token.value.strip()
+                elif token.ttype == sqlparse.tokens.Name.Builtin:
+                    if token.normalized.lower() in (
+                        "float",
+                        "varchar",
+                        "text",
+                        "integer",
+                        "int",
+                    ):
+                        field = token.normalized.lower()
+                    else:
+                        raise ValueError("Unsupported data type: " + token.value)
+                elif token.normalized == ")" or token.normalized == ",":
+                    if name is not None and field is not None:
+                        self.class_fields[name] = field
+                    field = None
+                    name = None
+                else:
+                    raise ValueError("There is an unsupported class field")
+        return {
+            "type": "CREATE TABLE",
+            "table_name": self.table_name,
+            "attributes": self.class_fields,
+            "primary_key": self.primary_key,
+        }
+
+    def __parse_create_table_statement(self, tokens):
+        """
+        Ensure that the CREATE TABLE statement is formatted correctly
+        :param tokens: parsed SQL tokens in the CREATE table statement
+        :return: a dictionary containing the information in the parsed SQL statement
+        :raises ValueError if the provided SQL statement is invalid
+        """
+        for token in tokens:
+            if not token.is_whitespace:
+                if isinstance(token, sqlparse.sql.Identifier):
+                    self.table_name = token.value
+                elif isinstance(token, sqlparse.sql.Parenthesis):
+                    return self.__parse_class_fields(token.tokens)
+                elif token.is_group:
+                    group_tokens = token.tokens
+                    for j in range(0, len(group_tokens)):
+                        group_token = group_tokens[j]
+                        if isinstance(group_token, sqlparse.sql.Identifier):
+                            self.table_name = group_token.value
+                        elif isinstance(group_token, sqlparse.sql.Parenthesis):
+                            return self.__parse_class_fields(group_token.tokens)
+                        else:
+                            raise ValueError(
+                                "Expecting identifier after CREATE TABLE or parenthesis after identifier"
+                            )
+                else:
+                    raise ValueError("Expecting grouped statement after CREATE table")
+        raise ValueError("Empty CREATE TABLE statement")
+
+    def __parse_create_statement(self, tokens):
+        """
+        Ensure that the CREATE statement is formatted correctly
+        :param tokens: parsed SQL tokens in the CREATE table statement
+        :return: a dictionary containing the information in the parsed SQL statement
+        :raises ValueError if the provided SQL statement is invalid
+        """
+        for i in range(0, len(tokens)):
+            token = tokens[i]
+            if not token.is_whitespace:
+                if token.normalized == "TABLE":
+                    return self.__parse_create_table_statement(tokens[i + 1 :])
+                else:
+                    raise ValueError(
+                        "Unsupported operation: CREATE " % token.normalized
+                    )
+        raise ValueError("Empty CREATE statement")
+
+    @staticmethod
+    def __parse_where_conditions(tokens):
+        """
+        Parse the WHERE conditions, e.g WHERE table_column = value AND (other_column > value OR ...)
+        Supported comparisons are =, !=, <>, <, <=, >, >=, BETWEEN and IN. AND binds tighter than OR.
+        Values are left as strings for the caller to convert to the column's type.
+        :param tokens: parsed SQL tokens in the WHERE clause
+        :return: a Condition, AND and OR conditions hold a tuple of conditions as their value
+        :raises ValueError if the provided SQL statement is invalid
+        """
+        flat_tokens = [
+            token
+            for group in tokens
+            for token in group.flatten()
+            if not token.is_whitespace and token.value != ";"
+        ]
+        return _WhereParser(flat_tokens).parse()
+
+    def __parse_select_statement(self, tokens):
+        """
+        Ensure that the SELECT statement is formatted correctly
+        :param tokens: parsed SQL tokens in the SELECT table statement
+        :return: a dictionary containing the information in the parsed SQL statement
+        :raises ValueError if the provided SQL statement is invalid
+        """
+        conditions = None
+        # projected columns, None for every column
+        columns = None
+        # LIMIT and OFFSET clauses, which follow every other clause
+        clauses = {}
+        clause = None
+
+        following_wildcard = False
+        found_from = False
+
+        for i in range(0, len(tokens)):
+            token = tokens[i]
+
+            if not token.is_whitespace:
+                if token.ttype == sqlparse.tokens.Wildcard:
+                    following_wildcard = True
+                    continue
+
+                if clause is not None:
+                    if token.ttype != sqlparse.tokens.Literal.Number.Integer:
+                        raise ValueError(f"{clause} expects a number of rows")
+                    clauses[clause.lower()] = int(token.value)
+                    clause = None
+                elif token.ttype == sqlparse.tokens.Keyword and token.normalized in (
+                    "LIMIT",
+                    "OFFSET",
+                ):
+                    if token.normalized.lower() in clauses:
+                        raise ValueError(
+                            f"Duplicate {token.normalized} in SELECT statement"
+                        )
+                    clause = token.normalized
+                elif clauses:
+                    raise ValueError("LIMIT and OFFSET must end the SELECT statement")
+                elif isinstance(token, sqlparse.sql.IdentifierList) and not (
+                    self.table_name or columns
+                ):
+                    columns = [name.value for name in token.get_identifiers()]
+                    if "*" in columns:
+                        raise ValueError("Cannot select both * and columns")
+                elif isinstance(token, sqlparse.sql.Identifier):
+                    self.table_name = token.value
+                elif isinstance(token, sqlparse.sql.Where):
+                    conditions = self.__parse_where_conditions(token.tokens[1:])
+                elif token.ttype == sqlparse.tokens.Punctuation:
+                    continue
+                elif (
+                    token.ttype == sqlparse.tokens.Keyword
+                    and token.normalized == "FROM"
+                    and (following_wildcard or columns or self.table_name)
+                    and not found_from
+                ):
+                    found_from = True
+                    if self.table_name:
+                        # the identifier before FROM was the one projected column
+                        columns = [self.table_name]
+                        self.table_name = None
+                    continue
+                else:
+                    raise ValueError("Unhandled operation in SELECT statement")
+
+                following_wildcard = False
+
+        if clause is not None:
+            raise ValueError(f"{clause} expects a number of rows")
+        if self.table_name is None:
+            raise ValueError("Missing identifier in SELECT statement")
+        else:
+            return {
+                "type": "SELECT",
+                "table_name": self.table_name,
+                "conditions": conditions,
+                **({} if columns is None else {"columns": columns}),
+                **clauses,
+            }
+
+    def __process_into_values(self, tokens):
+        """
+        Ensure that the INSERT INTO statement is formatted correctly
+        :param tokens: parsed SQL tokens in the INSERT INTO table statement
+        :return: the values of the row
+        :raises ValueError if the provided SQL statement is invalid
+        """
+        values = []
+        for i in range(0, len(tokens)):
+            token = tokens[i]
+            if not token.is_whitespace:
+                if isinstance(token, sqlparse.sql.IdentifierList):
+                    for valueToken in token.tokens:
+                        if not valueToken.is_whitespace:
+
+                            def is_int(number):
+                                """
+                                Check if a variable is an integer
+                                :param number: variable to check
+                                :return: true if the variable is an integer, false otherwise
+                                """
+                                try:
+                                    int(number)
+                                    return True
+                                except:
+                                    return False
+
+                            def is_float(number):
+                                """
+                                Check if a variable is a float
+                                :param number: variable to check
+                                :return: true if the variable is an float, false otherwise
+                                """
+                                try:
+                                    float(number)
+                                    return True
+                                except:
+                                    return False
+
+                            value = valueToken.value
+                            if is_int(value):
+                                values.append(int(value))
+                            elif is_float(value):
+                                values.append(float(value))
+                            elif (
+                                valueToken.ttype is None
+                                or valueToken.ttype in sqlparse.tokens.String
+                            ):
+                                value = value.strip('"').strip("'")
+                                values.append(value)
+        if len(values) == 0:
+            raise ValueError("No values provided")
+        else:
+            return values
+
+    def __parse_insert_statement(self, tokens):
+        """
+        Ensure that the INSERT statement is formatted correctly
+        :param tokens: parsed SQL tokens in the INSERT table statement
+        :return: a dictionary containing the information in the parsed SQL statement
+        :raises ValueError if the provided SQL statement is invalid
+        """
+        found_into = False
+        for token in tokens:
+            found_into = found_into or (
+                token.normalized == "INTO"
+                and token.ttype == sqlparse.tokens.Keyword
+                and token.is_keyword
+            )
+            if not token.is_whitespace:
+                if isinstance(token, sqlparse.sql.Identifier):
+                    self.table_name = token.value
+                elif isinstance(token, sqlparse.sql.Values):
+                    values = [
+                        value
+                        for value in token.tokens[1:]
+                        if not value.is_whitespace
+                        and value.ttype != sqlparse.tokens.Punctuation
+                    ]
+                    if len(values) == 0:
+                        raise ValueError("Missing VALUES parameter")
+                    if not all(
+                        isinstance(value, sqlparse.sql.Parenthesis) for value in values
+                    ):
+                        raise ValueError("Expecting parenthesis in VALUES")
+                    rows = [
+                        self.__process_into_values(value.tokens) for value in values
+                    ]
+                    parsed = {"type": "INSERT INTO", "table_name": self.table_name}
+                    if len(rows) == 1:
+                        parsed["values"] = rows[0]
+                    else:
+                        # VALUES (...), (...) inserts several rows at once
+                        parsed["rows"] = rows
+                    return parsed
+        if found_into:
+            raise ValueError("Missing VALUES parameters")
+        else:
+            raise ValueError("Missing INTO keyword")
+
+    def __parse_update_statement(self, tokens):
+        """
+        Ensure that the UPDATE statement is formatted correctly.
+        This statement will delete all rows in a table fulfilling a given condition
+        :param tokens: parsed SQL tokens in the UPDATE table statement
+        :return: a dictionary containing the information in the parsed SQL statement
+        :raises ValueError if the provided SQL statement is invalid
+        """
+        conditions = None
+        new_value = {}
+        for i in range(0, len(tokens)):
+            token = tokens[i]
+            if token.is_whitespace:
+                continue
+            elif isinstance(token, sqlparse.sql.Identifier):
+                self.table_name = token.value
+            elif isinstance(token, sqlparse.sql.Comparison):
+                new_value[token.left.value] = token.right.value.strip('"').strip("'")
+            elif isinstance(token, sqlparse.sql.Where):
+                conditions = self.__parse_where_conditions(token.tokens[1:])
+            elif token.normalized == "SET" and token.is_keyword:
+                continue
+            else:
+                raise ValueError("Unhandled syntax in UPDATE statement")
+        if len(new_value) == 0:
+            raise ValueError(
+                "New value is not defined in UPDATE statement, i.e missing SET <table_column> = <new value>"
+            )
+        if conditions is None:
+            raise ValueError(
+                "Missing conditions in UPDATE statement, i.e missing WHERE <table_column> = <new value>"
+            )
+        return {
+            "type": "UPDATE",
+            "table_name": self.table_name,
+            "conditions": conditions,
+            "new_value": new_value,
+        }
+
+    def __parse_delete_statement(self, tokens):
+        """
+        Ensure that the DELETE statement is formatted correctly.
+        This statement will delete all rows in a table fulfilling a given condition
+        :param tokens: parsed SQL tokens in the DELETE table statement
+        :return: a dictionary containing the information in the parsed SQL statement
+        :raises ValueError if the provided SQL statement is invalid
+        """
+        conditions = None
+        for i in range(0, len(tokens)):
+            token = tokens[i]
+            if isinstance(token, sqlparse.sql.Identifier):
+                self.table_name = token.value
+            elif isinstance(token, sqlparse.sql.Where):
+                conditions = self.__parse_where_conditions(token.tokens[1:])
+        if self.table_name is None:
+            raise ValueError("Missing identifier for DELETE statement")
+        else:
+            return {
+                "type": "DELETE",
+                "table_name": self.table_name,
+                "conditions": conditions,
+            }
+
+    def __parse_truncate_statement(self, tokens):
+        """
+        Ensure that the TRUNCATE statement is formatted correctly.
+        This statement will delete all the rows in a table
+        :param tokens: parsed SQL tokens in the TRUNCATE table statement
+        :return: a dictionary containing the information in the parsed SQL statement
+        :raises ValueError if the provided SQL statement is invalid
+        """
+        conditions = None
+        for i in range(0, len(tokens)):
+            token = tokens[i]
+            if isinstance(token, sqlparse.sql.Identifier):
+                self.table_name = token.value
+            elif isinstance(token, sqlparse.sql.Where):
+                conditions = self.__parse_where_conditions(token.tokens[1:])
+        if self.table_name is None:
+            raise ValueError("Missing identifier for TRUNCATE statement")
+        else:
+            return {
+                "type": "TRUNCATE",
+                "table_name": self.table_name,
+                "conditions": conditions,
+            }
+
+    def __parse_drop_statement(self, tokens):
+        """
+        Ensure that the DROP statement is formatted correctly.
+        :param tokens: parsed SQL tokens in the DROP table statement
+        :return: a dictionary containing the information in the parsed SQL statement
+        :raises ValueError if the provided SQL statement is invalid
+        """
+        found_table = False
+        for token in tokens:
+            found_table = found_table or (
+                token.normalized == "TABLE"
+                and token.ttype == sqlparse.tokens.Keyword
+                and token.is_keyword
+            )
+            if isinstance(token, sqlparse.sql.Identifier):
+                self.table_name = token.value
+        if found_table:
+            if self.table_name is None:
+                raise ValueError("Missing identifier in DROP statement")
+            else:
+                return {"type": "DROP TABLE", "table_name": self.table_name}
+        else:
+            raise ValueError("Missing TABLE keyword in DROP table")
+
+    @staticmethod
+    def __alias_sql(sql):
+        """
+        Allow aliases for SQL commands for shortcuts.
+        The current mappings allowed are:
+        SWIPE -> SELECT
+        HATCH -> CREATE TABLE
+        CHOMP -> TRUNCATE
+        SWAMP -> DROP TABLE
+        :param sql: SQL statement in String format
+        :return: the SQL statement with the aliases replaced with the SQL-compliant keywords
+        """
+        sql_upper = sql.upper().strip()
+        if sql_upper.startswith("SWIPE"):
+            sql = "SELECT" + sql[len("SWIPE") :]
+        elif sql_upper.startswith("HATCH"):
+            sql = "CREATE TABLE" + sql[len("HATCH") :]
+        elif sql_upper.startswith("CHOMP"):
+            sql = "TRUNCATE" + sql[len("CHOMP") :]
+        elif sql_upper.startswith("SWAMP"):
+            sql = "DROP TABLE" + sql[len("SWAMP") :]
+        return sql
+
+    def parse_sql(self, sql):
+        """
+        Parse an SQL statement
+        :param sql: SQL statement to parse
+        :return: a dictionary containing the features of the SQL statement
+        :raises: ValueError if the SQL statement contains invalid fields
+        """
+        self.table_name = None
+        if sql.strip().upper().startswith("EXPLAIN "):
+            return {
+                "type": "EXPLAIN",
+                "statement": self.parse_sql(sql.strip()[len("EXPLAIN ") :]),
+            }
+        sql = self.__alias_sql(sql)
+        parsed = sqlparse.parse(sql)
+        if len(parsed) > 0:
+            tokens = parsed[0].tokens
+            for tokenId in range(0, len(tokens)):
+                token = tokens[tokenId]
+                if not token.is_whitespace:
+                    remaining_tokens = tokens[tokenId + 1 :]
+                    if token.normalized == "CREATE":
+                        return self.__parse_create_statement(remaining_tokens)
+                    elif token.normalized == "SELECT":
+                        return self.__parse_select_statement(remaining_tokens)
+                    elif token.normalized == "INSERT":
+                        return self.__parse_insert_statement(remaining_tokens)
+                    elif token.normalized == "UPDATE":
+                        return self.__parse_update_statement(remaining_tokens)
+                    elif token.normalized == "DELETE":
+                        return self.__parse_delete_statement(remaining_tokens)
+                    elif token.normalized == "TRUNCATE":
+                        return self.__parse_truncate_statement(remaining_tokens)
+                    elif token.normalized == "DROP":
+                        return self.__parse_drop_statement(remaining_tokens)
+                    else:
+                        raise ValueError("Unsupported operation: " + token.normalized)
+        raise ValueError("Empty or invalid SQL statement")
+
+
+class _WhereParser:
+    """
+    Recursive descent parser over the flattened tokens of a WHERE clause:
+    expression  := conjunction (OR conjunction)*
+    conjunction := predicate (AND predicate)*
+    predicate   := ( expression ) | column comparison value
+                 | column BETWEEN value AND value | column IN ( value, ... )
+    """
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+
+    def parse(self) -> Condition:
+        condition = self.expression()
+        if self.pos != len(self.tokens):
+            raise ValueError(
+                "Unexpected '%s' in WHERE statement" % self.tokens[self.pos].value
+            )
+        return condition
+
+    def expression(self) -> Condition:
+        conditions = [self.conjunction()]
+        while self.accept("OR"):
+            conditions.append(self.conjunction())
+        if len(conditions) == 1:
+            return conditions[0]
+        return Condition(ConditionType.OR, None, tuple(conditions))
+
+    def conjunction(self) -> Condition:
+        conditions = [self.predicate()]
+        while self.accept("AND"):
+            conditions.append(self.predicate())
+        if len(conditions) == 1:
+            return conditions[0]
+        return Condition(ConditionType.AND, None, tuple(conditions))
+
+    def predicate(self) -> Condition:
+        if self.accept("("):
+            condition = self.expression()
+            self.expect(")")
+            return condition
+
+        column = self.next().value
+        operator = self.next()
+        if operator.normalized.upper() == "BETWEEN":
+            low = self.value()
+            self.expect("AND")
+            return Condition(ConditionType.BETWEEN, column, (low, self.value()))
+        if operator.normalized.upper() == "IN":
+            self.expect("(")
+            values = [self.value()]
+            while self.accept(","):
+                values.append(self.value())
+            self.expect(")")
+            return Condition(ConditionType.IN, column, tuple(values))
+        if operator.value in COMPARISON_TYPES:
+            return Condition(COMPARISON_TYPES[operator.value], column, self.value())
+        raise ValueError("Invalid comparison in WHERE statement")
+
+    def value(self) -> str:
+        return self.next().value.strip('"').strip("'")
+
+    def next(self):
+        if self.pos >= len(self.tokens):
+            raise ValueError("Incomplete comparison in WHERE statement")
+        self.pos += 1
+        return self.tokens[self.pos - 1]
+
+    def accept(self, value: str) -> bool:
+        if self.pos < len(self.tokens) and self.tokens[self.pos].value.upper() == value:
+            self.pos += 1
+            return True
+        return False
+
+    def expect(self, value: str):
+        if not self.accept(value):
+            raise ValueError("Expecting '%s' in WHERE statement" % value)
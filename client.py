@@ -0,0 +1,144 @@
+import asyncio
+import itertools
+import socket
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from protocol import DEFAULT_HOST, DEFAULT_PORT, encode, read_message, recv_message
+
+
+# the answer to a statement: columns and rows for a SELECT, count for the rows changed
+# by an INSERT, UPDATE or DELETE, and message for anything else
+Result = NamedTuple(
+    "Result",
+    (
+        ("columns", Optional[List[str]]),
+        ("rows", List[list]),
+        ("count", Optional[int]),
+        ("message", Optional[str]),
+    ),
+)
+
+
+def _result(response: Dict[str, Any]) -> Result:
+    if not response.get("ok"):
+        raise ValueError(response.get("error", "Invalid response"))
+    return Result(
+        response.get("columns"),
+        response.get("rows", []),
+        response.get("count"),
+        response.get("message"),
+    )
+
+
+class Client:
+    """
+    A blocking connection to a GatorDB server.
+    execute() sends one statement and waits for its answer, while pipeline() sends
+    many statements before reading any answer, paying for one round trip instead of one each.
+    A statement that fails raises ValueError with the server's error message.
+    """
+
+    def __init__(
+        self,
+        host: str = DEFAULT_HOST,
+        port: int = DEFAULT_PORT,
+        unix_socket: str = None,
+    ):
+        if unix_socket is not None:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.connect(unix_socket)
+        else:
+            self.sock = socket.create_connection((host, port))
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._ids = itertools.count()
+
+    def execute(self, sql: str, params: Sequence = ()) -> Result:
+        return self.pipeline([(sql, params)])[0]
+
+    def pipeline(self, statements: Iterable[Tuple[str, Sequence]]) -> List[Result]:
+        """Runs (sql, params) statements in order, returning their results.
+        Raises the error of the first statement that failed, after every statement has run.
+        """
+        ids = []
+        messages = []
+        for sql, params in statements:
+            ids.append(next(self._ids))
+            messages.append(encode({"id": ids[-1], "sql": sql, "params": list(params)}))
+        self.sock.sendall(b"".join(messages))
+        responses = [recv_message(self.sock) for _ in ids]
+        for id, response in zip(ids, responses):
+            if response.get("id") != id:
+                # the server closed the stream after a message it could not read
+                raise ValueError(response.get("error", "Unexpected response"))
+        return [_result(response) for response in responses]
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self) -> "Client":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class AsyncClient:
+    """
+    An asyncio connection to a GatorDB server, made with AsyncClient.connect().
+    Concurrent execute() calls on one connection are pipelined: each request is sent
+    right away and its answer is matched to it when it arrives.
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._reader = reader
+        self._writer = writer
+        self._ids = itertools.count()
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._receiver = asyncio.create_task(self._receive())
+
+    @classmethod
+    async def connect(
+        cls, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, unix_socket: str = None
+    ) -> "AsyncClient":
+        if unix_socket is not None:
+            reader, writer = await asyncio.open_unix_connection(unix_socket)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+            writer.get_extra_info("socket").setsockopt(
+                socket.IPPROTO_TCP, socket.TCP_NODELAY, 1
+            )
+        return cls(reader, writer)
+
+    async def execute(self, sql: str, params: Sequence = ()) -> Result:
+        if self._receiver.done():
+            raise ConnectionError("The connection is closed")
+        id = next(self._ids)
+        answer = asyncio.get_running_loop().create_future()
+        self._pending[id] = answer
+        self._writer.write(encode({"id": id, "sql": sql, "params": list(params)}))
+        await self._writer.drain()
+        return _result(await answer)
+
+    async def close(self):
+        self._writer.close()
+        await self._writer.wait_closed()
+        await self._receiver
+
+    async def _receive(self):
+        error = ConnectionError("The server closed the connection")
+        try:
+            while True:
+                response = await read_message(self._reader)
+                if response is None:
+                    break
+                answer = self._pending.pop(response.get("id"), None)
+                if answer is None:
+                    # the server could not read a request and closed the connection
+                    error = ValueError(response.get("error", "Unexpected response"))
+                    break
+                answer.set_result(response)
+        except (ConnectionError, ValueError) as e:
+            error = e
+        for answer in self._pending.values():
+            answer.set_exception(error)
+        self._pending.clear()
@@ -0,0 +1,62 @@
+from itertools import islice
+from typing import Any, Dict, Iterable, List
+import weakref
+
+
+class Cursor:
+    """
+    Iterates over the rows of a query without materializing them.
+    Rows are read from the table as they are fetched, so stopping early
+    leaves the rest of the table unread.
+
+    If given a snapshot of the table, rows are read from it, and it is closed once every row
+    was fetched, the cursor is closed or the cursor is garbage collected.
+    """
+
+    def __init__(
+        self, rows: Iterable[Dict[str, Any]], columns: List[str], snapshot=None
+    ):
+        self.columns = columns
+        # default number of rows returned by fetchmany
+        self.arraysize = 100
+        self._rows = iter(rows)
+        self._snapshot = snapshot
+        self._release = (
+            weakref.finalize(self, snapshot.close) if snapshot is not None else None
+        )
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> Dict[str, Any]:
+        row = self.fetchone()
+        if row is None:
+            raise StopIteration
+        return row
+
+    def fetchone(self) -> Dict[str, Any]:
+        """Returns the next row, or None once every row was fetched"""
+        rows = self._fetch(1)
+        return rows[0] if rows else None
+
+    def fetchmany(self, size: int = None) -> List[Dict[str, Any]]:
+        """Returns up to size more rows, an empty list once every row was fetched"""
+        return self._fetch(self.arraysize if size is None else size)
+
+    def fetchall(self) -> List[Dict[str, Any]]:
+        return self._fetch(None)
+
+    def close(self):
+        self._rows = iter(())
+        if self._release is not None:
+            self._release()
+
+    def _fetch(self, size: int = None) -> List[Dict[str, Any]]:
+        """reads up to size rows, or every remaining row, closing the cursor after the last"""
+        if self._snapshot is None or not self._release.alive:
+            return list(islice(self._rows, size))
+        with self._snapshot.view():
+            rows = list(islice(self._rows, size))
+        if size is None or len(rows) < size:
+            self.close()
+        return rows
@@ -1,14 +1,49 @@
 import os
 import pickle
-from typing import Any, Dict, List
+from contextlib import ExitStack, contextmanager
+from functools import reduce, wraps
+from itertools import groupby, islice
+from operator import itemgetter
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
 from enum import Enum
 import json
+import threading
 
 import numpy as np
-from gdb_bplustree import BPlusTree
+from rwlock import RWLock
 
+from gdb_bplustree import BPlusTree, TreeSnapshot
+from gdb_bufferpool import DEFAULT_CAPACITY, BufferPool
+from gdb_hash import HashTable
+from gdb_postings import PostingList, PostingStore
+from gdb_rowformat import FLOAT, INTEGER, STRING, LazyRow, RowFormat
+from gdb_wal import WriteAheadLog
+
+from cursor import Cursor
+from planner import (
+    ColumnStats,
+    IndexLookup,
+    IndexOnlyScan,
+    Plan,
+    Planner,
+    PrefixLookup,
+    matches,
+)
+from prepared import PreparedStatement
 from query import Change, Condition, ConditionType
-from utils import print_red, serialize_dict
+from sqlengine import INDEX_METHODS, SQLEngine
+from utils import print_red
 
 
 class DBType(Enum):
@@ -16,19 +51,85 @@ class DBType(Enum):
     FLOAT = 1
     STRING = 2
 
+    def convert(self, value):
+        """Converts a value, e.g. a string from a statement, to this type"""
+        if self == DBType.INTEGER:
+            return int(value)
+        if self == DBType.FLOAT:
+            return float(value)
+        return str(value)
+
+    @property
+    def is_numeric(self) -> bool:
+        return self in (DBType.INTEGER, DBType.FLOAT)
+
+
+WAL_FILE = "wal.log"
+# schema and indexes of every table, read at open instead of the metadata of every column
+CATALOG_FILE = "catalog.json"
+# structures of the index of a nonclustered column, as in CREATE INDEX ... USING
+BTREE, HASH = INDEX_METHODS
+# format of the values of nonclustered index trees
+POSTINGS_VERSION = 1
+# log size that triggers a checkpoint
+CHECKPOINT_SIZE = 16 * 1024 * 1024
+# cursors over plans expected to find at most this many rows read them all at once,
+# instead of keeping a snapshot of the table for reading them as they are fetched
+EAGER_ROWS = 64
+# rows decoded at a time by DBTable.column_batches
+BATCH_ROWS = 4096
+# pairs inserted into an index at a time by DBTable.load_sorted into a table holding rows
+LOAD_BATCH = 10000
+
+# how the values of each type are stored in a row
+ROW_FIELDS = {DBType.INTEGER: INTEGER, DBType.FLOAT: FLOAT, DBType.STRING: STRING}
+# array typecodes of the keys of the trees indexing integer and float values
+TREE_KEY_TYPES = {DBType.INTEGER: "q", DBType.FLOAT: "d"}
+
+# rows accepted by DBTable.insert_many: row dicts, column name -> values, or a structured array
+RowsInput = Union[Iterable[Dict[str, Any]], Mapping[str, Iterable], np.ndarray]
+
+
+# an index created with CREATE INDEX, on columns of a table in order
+IndexInfo = NamedTuple(
+    "IndexInfo", (("name", str), ("columns", Tuple[str, ...]), ("using", str))
+)
+
+# (low, high, (low inclusive, high inclusive)) of the keys matched by each range condition
+RANGE_BOUNDS = {
+    ConditionType.LESS_THAN: lambda val: (None, val, (True, False)),
+    ConditionType.LESS_EQUALS: lambda val: (None, val, (True, True)),
+    ConditionType.GREATER_THAN: lambda val: (val, None, (False, True)),
+    ConditionType.GREATER_EQUALS: lambda val: (val, None, (True, True)),
+    ConditionType.BETWEEN: lambda val: (val[0], val[1], (True, True)),
+}
+
 
 class ColumnInfo:
     def __init__(self, dbtype: DBType = DBType.INTEGER, primary_key: bool = False):
         self.dbtype = dbtype
         self.primary_key = primary_key
+        self.stats = ColumnStats()
 
 
 class Index:
-    def __init__(self, name: str, dbtype: DBType, path, order=50):
+    # extension of the file of the index
+    extension = "tree"
+
+    def __init__(
+        self, name: str, dbtype: DBType, path, order=50, pool: BufferPool = None
+    ):
         self.path: str = path
         self.name: str = name
 
-        self.tree: BPlusTree = BPlusTree(path=f"{path}/{name}.tree", max_degree=order)
+        self.tree: BPlusTree = self._open(
+            f"{path}/{name}.{self.extension}", order, pool, TREE_KEY_TYPES.get(dbtype)
+        )
+
+    def _open(
+        self, path: str, order: int, pool: BufferPool, key_type: Optional[str]
+    ) -> BPlusTree:
+        return BPlusTree(path=path, max_degree=order, pool=pool, key_type=key_type)
 
     def insert(self, key, value):
         self.tree.insert(key, value)
@@ -39,118 +140,687 @@ class Index:
     def values(self):
         return self.tree
 
-    def save(self):
+    def range(self, lo=None, hi=None, inclusive=True, reverse: bool = False):
+        return self.tree.range(lo, hi, inclusive, reverse)
+
+    def bulk_load(self, items: Iterable[Tuple[Any, Any]]):
+        """Replaces the contents of the index with (key, value) pairs sorted by key"""
+        self.tree.bulk_load(items)
+
+    def value_counts(self) -> Iterable[Tuple[Any, int]]:
+        """Yields each value of the column with its number of rows in order"""
+        return ((key, 1) for key, _ in self.tree)
+
+    def compact(self) -> Dict[str, dict]:
+        return self.tree.compact()
+
+    def clear(self):
+        self.tree.clear()
+
+    @property
+    def lsn(self) -> int:
+        """lsn of the last logged operation included in the saved index"""
+        return self.tree.pager.meta.get("lsn", 0)
+
+    def save(self, lsn: int = None):
+        if lsn is not None:
+            self.tree.pager.meta["lsn"] = lsn
         self.tree.save()
 
+    def close(self, lsn: int = None):
+        if lsn is not None:
+            self.tree.pager.meta["lsn"] = lsn
+        self.tree.close()
+
 
 class ClusteredIndex(Index):
     def __init__(self, name: str, dbtype: DBType, **kwargs):
         super().__init__(name, dbtype, **kwargs)
+        # set by the table once its columns are known
+        self.row_format: RowFormat = None
+
+    def insert(self, data: bytes, pk) -> bool:
+        """Returns whether the pk is new"""
+        return self.tree.insert(pk, data)
+
+    def insert_many(self, items: Iterable[Tuple[Any, bytes]]) -> List[bool]:
+        """Inserts (pk, data) pairs sorted by pk, returning whether each pk is new"""
+        return self.tree.insert_many(items)
+
+    def existing(self, pks: List) -> List:
+        """Returns those of pks sorted that already have a row"""
+        return [
+            pk for pk, data in zip(pks, self.tree.get_many(pks)) if data is not None
+        ]
+
+    def range_pks(self, lo=None, hi=None, inclusive=True) -> np.ndarray:
+        """Returns the pks between lo and hi in order"""
+        if self.tree.key_type is not None:
+            arrays = list(self.tree.key_arrays(lo, hi, inclusive))
+            if not arrays:
+                return np.array([], dtype=np.int32)
+            return np.concatenate(arrays).astype(np.int32)
+        return np.fromiter(
+            (pk for pk, _ in self.tree.range(lo, hi, inclusive)), dtype=np.int32
+        )
 
-    def insert(self, data: bytes, pk):
-        self.tree.insert(pk, data)
+    def get(self, pk, columns: Iterable[str] = None) -> dict:
+        """Returns the row of a pk, decoding only the given columns if any"""
+        data = self.tree.get(pk)
+        if not data:
+            return None
+        return self.row_format.decode(data, columns)
 
-    def get(self, pk) -> dict:
-        dict_ = self.tree.get(pk)
-        if not dict_:
+    def row(self, pk) -> Optional[Mapping]:
+        """Returns the row of a pk, decoding columns as they are accessed"""
+        data = self.tree.get(pk)
+        if not data:
             return None
-        return json.loads(dict_.decode("utf-8"))
+        return self.row_format.row(data)
+
+    def rows(self) -> Iterable[Tuple[Any, Mapping]]:
+        """Yields (pk, row) of every row in pk order, decoding columns as they are accessed"""
+        for pk, data in self.tree:
+            yield pk, self.row_format.row(data)
 
 
 class NonclusteredIndex(Index):
+    """Maps each value of a column to the posting list of the pks of the rows holding it"""
+
     def __init__(self, name: str, dbtype: DBType, **kwargs):
         super().__init__(name, dbtype, **kwargs)
+        self.postings = PostingStore(self.tree.pager, self.tree.pool)
+        if self.tree.pager.meta.get("postings") != POSTINGS_VERSION:
+            self._migrate()
 
-    def insert(self, data, pk):
-        if self.tree.get(data) is None:
-            self.tree.insert(data, np.array([pk], dtype=np.int32).tobytes())
-        else:
-            pointers_to_pk = self.get(data)
-            self.tree[data] = np.concatenate(
-                (pointers_to_pk, np.array([pk], dtype=np.int32)), dtype=np.int32
-            ).tobytes()
+    def _migrate(self):
+        """rewrites pk arrays stored by older versions as posting lists"""
+        items = [
+            (data, pk)
+            for data, pks in self.tree
+            for pk in np.frombuffer(pks, dtype=np.int32).tolist()
+        ]
+        self.tree.bulk_load(
+            (data, self.postings.store(PostingList.from_array([pk for _, pk in pairs])))
+            for data, pairs in groupby(items, key=itemgetter(0))
+        )
+        self.tree.pager.meta["postings"] = POSTINGS_VERSION
+
+    def insert(self, data, pk) -> bool:
+        """Returns whether the data is new"""
+        value, is_new = self.postings.add(self.tree.get(data), int(pk))
+        self.tree.insert(data, value)
+        return is_new
+
+    def insert_many(self, items: Iterable[Tuple[Any, int]]) -> List[bool]:
+        """Adds (data, pk) pairs sorted by data in one ordered pass over the tree,
+        returning whether the data of each pair is new
+        """
+        groups = [
+            (data, [int(pk) for _, pk in pairs])
+            for data, pairs in groupby(items, key=itemgetter(0))
+        ]
+        is_new = self.tree.insert_many(groups, merge=self._add_pks)
+        return [
+            new and i == 0
+            for (_, pks), new in zip(groups, is_new)
+            for i in range(len(pks))
+        ]
+
+    def _add_pks(self, value: Optional[bytes], pks: List[int]) -> bytes:
+        value, _ = self.postings.add_many(value, pks)
+        return value
+
+    def bulk_load(self, items: Iterable[Tuple[Any, int]]):
+        """Replaces the contents of the index with (data, pk) pairs sorted by data then pk"""
+        self.bulk_load_groups(
+            (data, [pk for _, pk in pairs])
+            for data, pairs in groupby(items, key=itemgetter(0))
+        )
+
+    def bulk_load_groups(self, groups: Iterable[Tuple[Any, Iterable[int]]]):
+        """Replaces the contents of the index with the pks of each data, sorted by data"""
+        self._free_postings()
+        self.tree.bulk_load(
+            (data, self.postings.store(PostingList.from_array(pks)))
+            for data, pks in groups
+        )
+
+    def value_counts(self) -> Iterable[Tuple[Any, int]]:
+        return self.counts()
+
+    def counts(self, lo=None, hi=None, inclusive=True) -> Iterable[Tuple[Any, int]]:
+        """Yields (data, number of rows) of each data between lo and hi in order,
+        reading only the sizes recorded in the posting lists
+        """
+        for data, value in self.tree.range(lo, hi, inclusive):
+            yield data, self.postings.count(value)
+
+    def count(self, data) -> int:
+        """Returns the number of rows holding data"""
+        value = self.tree.get(data)
+        return 0 if value is None else self.postings.count(value)
+
+    def range_pks(self, lo=None, hi=None, inclusive=True) -> np.ndarray:
+        """Returns the sorted pks of the rows with data between lo and hi"""
+        arrays = [
+            self.postings.load(value).to_array()
+            for _, value in self.tree.range(lo, hi, inclusive)
+        ]
+        if not arrays:
+            return np.array([], dtype=np.int32)
+        return np.sort(np.concatenate(arrays))
+
+    def entries(
+        self, lo=None, hi=None, inclusive=True
+    ) -> Iterable[Tuple[Any, np.ndarray]]:
+        """Yields (data, sorted pks) of each data between lo and hi in order"""
+        for data, value in self.tree.range(lo, hi, inclusive):
+            yield data, self.postings.load(value).to_array()
+
+    def get_postings(self, data) -> PostingList:
+        value = self.tree.get(data)
+        if value is None:
+            return PostingList()
+        return self.postings.load(value)
 
     def get(self, data) -> np.ndarray:
-        pks = self.tree.get(data)
-        if pks is None:
-            return np.array([])
-        return np.frombuffer(pks, dtype=np.int32)
+        """Returns the sorted pks of the rows holding data"""
+        return self.get_postings(data).to_array()
 
-    def delete(self, data, pk):
+    def delete(self, data, pk) -> bool:
         """
         If the data is duplicate, removes pointer of data to primary key.
         Otherwise, removes data itself.
+        Returns whether the data itself was removed.
         """
-        pks = self.get(data)
-        pks = np.delete(pks, np.where(pks == pk))
-        if pks.size == 0:
+        value = self.tree.get(data)
+        if value is None:
+            raise ValueError(f"{data!r} is not in the index")
+        value = self.postings.remove(value, int(pk))
+        if value is None:
             self.tree.delete(data)
-        else:
-            self.tree[data] = pks
+            return True
+        self.tree.insert(data, value)
+        return False
+
+    def clear(self):
+        self._free_postings()
+        super().clear()
+
+    def _free_postings(self):
+        for _, value in self.tree:
+            self.postings.free(value)
+
+
+class HashIndex(NonclusteredIndex):
+    """
+    Maps each value of a column to the posting list of its pks in a HashTable instead of a
+    BPlusTree, for columns only compared with = and IN: a lookup reads one bucket, and
+    inserts do not keep the values in order. Reading values in order, as range conditions
+    and statistics do, sorts every value of the index.
+    """
+
+    extension = "hash"
+
+    def _open(
+        self, path: str, order: int, pool: BufferPool, key_type: Optional[str]
+    ) -> HashTable:
+        return HashTable(path=path, pool=pool)
+
+    def range(self, lo=None, hi=None, inclusive=True, reverse: bool = False):
+        return iter(
+            sorted(
+                _in_range(self.tree, lo, hi, inclusive),
+                key=itemgetter(0),
+                reverse=reverse,
+            )
+        )
+
+    def counts(self, lo=None, hi=None, inclusive=True) -> Iterable[Tuple[Any, int]]:
+        for data, value in self.range(lo, hi, inclusive):
+            yield data, self.postings.count(value)
+
+    def range_pks(self, lo=None, hi=None, inclusive=True) -> np.ndarray:
+        arrays = [
+            self.postings.load(value).to_array()
+            for _, value in _in_range(self.tree, lo, hi, inclusive)
+        ]
+        if not arrays:
+            return np.array([], dtype=np.int32)
+        return np.sort(np.concatenate(arrays))
+
+    def entries(
+        self, lo=None, hi=None, inclusive=True
+    ) -> Iterable[Tuple[Any, np.ndarray]]:
+        for data, value in self.range(lo, hi, inclusive):
+            yield data, self.postings.load(value).to_array()
+
+
+class CompositeIndex(NonclusteredIndex):
+    """
+    Maps the values of several columns of a row, as a tuple in the order of the columns,
+    to the posting list of the pks of the rows holding them. Tuples sort by their first
+    value, then their second..., so the keys sharing values of the leading columns are
+    stored next to each other, ordered by the value of the next column.
+    """
+
+    def prefix_range(
+        self, prefix: tuple, lo=None, hi=None, inclusive=True
+    ) -> Iterator[Tuple[tuple, bytes]]:
+        """Yields the (key, value) pairs of the keys starting with prefix whose next value
+        is between lo and hi, in order, from one seek and a scan of the matching keys
+        """
+        lo_inclusive, hi_inclusive = (
+            (inclusive, inclusive) if isinstance(inclusive, bool) else inclusive
+        )
+        n = len(prefix)
+        # a tuple sorts before the longer tuples starting with it
+        start = prefix if lo is None else prefix + (lo,)
+        for key, value in self.tree.range(start, None):
+            if key[:n] != prefix:
+                return
+            if n < len(key):
+                if lo is not None and not lo_inclusive and key[n] == lo:
+                    continue
+                if hi is not None and (
+                    hi < key[n] or (key[n] == hi and not hi_inclusive)
+                ):
+                    return
+            yield key, value
+
+    def prefix_pks(self, prefix: tuple, lo=None, hi=None, inclusive=True) -> np.ndarray:
+        """Returns the sorted pks of the rows found by prefix_range"""
+        arrays = [
+            self.postings.load(value).to_array()
+            for _, value in self.prefix_range(prefix, lo, hi, inclusive)
+        ]
+        if not arrays:
+            return np.array([], dtype=np.int32)
+        return np.sort(np.concatenate(arrays))
 
 
 class Column:
-    def __init__(self, name: str, col_info: ColumnInfo = None, path: str = ""):
+    """
+    A column of a table and its index, if it has one. The primary key is always indexed by
+    the clustered index holding the rows, while other columns are only indexed once an
+    index is created on them: an unindexed column costs inserts nothing but its statistics.
+    Given the column's type and whether it is the primary key, as kept in a database's catalog,
+    neither its metadata nor its index is read from disk until it is first used.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        col_info: ColumnInfo = None,
+        path: str = "",
+        pool: BufferPool = None,
+        schema: Tuple[DBType, bool] = None,
+        using: str = None,
+    ):
 
         self.path = "/".join([path, name])
         self.name = name
+        self.pool = pool
 
-        if col_info:
-            self.col_info = col_info
-        else:
-            self.col_info = pickle.load(open(self._col_info_path(), "rb"))
-
-        self.index_type = (
-            ClusteredIndex if self.col_info.primary_key else NonclusteredIndex
+        self._col_info = col_info
+        self._index: Index = None
+        # readers of the table may open the index at the same time
+        self._open_lock = threading.Lock()
+        if col_info is None and schema is None:
+            col_info = self.col_info
+        self.dbtype, self.primary_key = (
+            schema if schema is not None else (col_info.dbtype, col_info.primary_key)
         )
-        self.index = self.index_type(name, dbtype=self.col_info.dbtype, path=self.path)
+        # structure of the index of a nonclustered column, None while it has none
+        self.using = using
+        self.index_type = _index_type(self.primary_key, using)
+        # set by the table for its primary key column
+        self.row_format: RowFormat = None
 
-        if not os.path.isdir(self.path):
-            os.mkdir(self.path)
+    @property
+    def col_info(self) -> ColumnInfo:
+        if self._col_info is None:
+            if os.path.isfile(self._col_info_path()):
+                with open(self._col_info_path(), "rb") as f:
+                    self._col_info = pickle.load(f)
+            else:
+                # the table was created but not saved before a crash
+                self._col_info = ColumnInfo(self.dbtype, self.primary_key)
+            if not hasattr(self._col_info, "stats"):
+                # columns saved before statistics were kept
+                self._col_info.stats = ColumnStats()
+                if self.is_indexed:
+                    self.rebuild_stats()
+        return self._col_info
+
+    @property
+    def is_indexed(self) -> bool:
+        return self.index_type is not None
+
+    @property
+    def index(self) -> Index:
+        if self.index_type is None:
+            raise ValueError(f"Column {self.name} has no index")
+        if self._index is None:
+            with self._open_lock:
+                if self._index is None:
+                    if not os.path.isdir(self.path):
+                        os.mkdir(self.path)
+                    index = self.index_type(
+                        self.name, dbtype=self.dbtype, path=self.path, pool=self.pool
+                    )
+                    if self.row_format is not None:
+                        index.row_format = self.row_format
+                    self._index = index
+        return self._index
+
+    def create_index(
+        self,
+        using: str,
+        groups: Iterable[Tuple[Any, np.ndarray]],
+        lsn: int = None,
+    ):
+        """Indexes an unindexed column with the pks of each data, sorted by data,
+        saving the index as including the operation logged at lsn
+        """
+        self.using = using
+        self.index_type = _index_type(self.primary_key, using)
+        # replaces any file left by an index dropped before a crash
+        self.index.bulk_load_groups(groups)
+        self.index.save(lsn)
+
+    def drop_index(self):
+        """Removes the index of a nonclustered column"""
+        index = self.index
+        self._index = self.using = self.index_type = None
+        index.tree.close()
+        os.remove(index.tree.path)
+
+    def set_row_format(self, row_format: RowFormat):
+        self.row_format = row_format
+        if self._index is not None:
+            self._index.row_format = row_format
+
+    @property
+    def is_loaded(self) -> bool:
+        """Whether the metadata or index of the column has been read"""
+        return self._col_info is not None or self._index is not None
 
     def insert(self, data, pk: int | str):
-        self.index.insert(data, pk)
+        if not self.is_indexed:
+            # the distinct count is only updated by rebuilding the statistics
+            self.col_info.stats.add(data, False)
+            return
+        is_new = self.index.insert(data, pk)
+        if self.index_type == ClusteredIndex:
+            # replacing an existing row does not change the pk column
+            if is_new:
+                self.col_info.stats.add(pk, True)
+        else:
+            self.col_info.stats.add(data, is_new)
+
+    def insert_many(self, items: List[Tuple[Any, Any]]):
+        """Inserts pairs sorted by key, (pk, row) for the primary key and (data, pk) otherwise"""
+        if not self.is_indexed:
+            for key, _ in items:
+                self.col_info.stats.add(key, False)
+            return
+        is_new = self.index.insert_many(items)
+        for (key, _), new in zip(items, is_new):
+            if self.index_type == ClusteredIndex:
+                if new:
+                    self.col_info.stats.add(key, True)
+            else:
+                self.col_info.stats.add(key, new)
 
     def get(self, key):
         return self.index.get(key)
 
     def delete(self, key, value=None):
-        if self.index_type == ClusteredIndex:
+        if not self.is_indexed:
+            self.col_info.stats.remove(key, False)
+        elif self.index_type == ClusteredIndex:
             self.index.delete(key)
+            self.col_info.stats.remove(key, True)
         else:
-            self.index.delete(key, value)
+            was_last = self.index.delete(key, value)
+            self.col_info.stats.remove(key, was_last)
+
+    def bulk_load(self, items: Iterable[Tuple[Any, Any]], row_count: int):
+        if not self.is_indexed:
+            self.col_info.stats.rebuild(
+                (data, sum(1 for _ in pairs))
+                for data, pairs in groupby(items, key=itemgetter(0))
+            )
+            return
+        self.index.bulk_load(items)
+        self.col_info.stats.row_count = row_count
+        self.rebuild_stats()
+
+    def bulk_load_groups(
+        self, groups: Iterable[Tuple[Any, np.ndarray]], row_count: int
+    ):
+        """Replaces the contents of a nonclustered index with the pks of each data,
+        sorted by data
+        """
+        if not self.is_indexed:
+            self.col_info.stats.rebuild((data, len(pks)) for data, pks in groups)
+            return
+        self.index.bulk_load_groups(groups)
+        self.col_info.stats.row_count = row_count
+        self.rebuild_stats()
+
+    def stats(self) -> ColumnStats:
+        """Returns the statistics of the column, rebuilding its histogram if it has drifted"""
+        if self.col_info.stats.is_stale():
+            self.rebuild_stats()
+        return self.col_info.stats
+
+    def rebuild_stats(self):
+        self.col_info.stats.rebuild(self.index.value_counts())
+
+    def clear(self):
+        if self.is_indexed:
+            self.index.clear()
+        self.col_info.stats = ColumnStats()
 
     def _col_info_path(self):
         return f"{self.path}/{self.name}.col"
 
-    def save(self):
-        pickle.dump(self.col_info, open(self._col_info_path(), "wb"))
-        self.index.save()
+    def _save_col_info(self):
+        if not os.path.isdir(self.path):
+            os.mkdir(self.path)
+        _write_atomic(self._col_info_path(), pickle.dumps(self.col_info))
+
+    def save(self, lsn: int = None):
+        """Writes the column to disk, unless it was never read and so cannot have changed"""
+        if not self.is_loaded:
+            return
+        self._save_col_info()
+        if self.is_indexed:
+            self.index.save(lsn)
+
+    def close(self, lsn: int = None):
+        if not self.is_loaded:
+            return
+        self._save_col_info()
+        if self.is_indexed:
+            self.index.close(lsn)
+
+
+class _Reading(threading.local):
+    """how a thread is reading a table"""
+
+    def __init__(self):
+        # number of nested calls holding the reader lock
+        self.depth = 0
+        self.snapshot: "TableSnapshot" = None
+
+
+def _reading(method):
+    """runs a DBTable method holding the table's reader lock,
+    unless the thread already holds it or is reading a snapshot of the table
+    """
+
+    @wraps(method)
+    def locked(self, *args, **kwargs):
+        local = self._local
+        if local.depth or local.snapshot is not None:
+            return method(self, *args, **kwargs)
+        with self.lock.reader_lock:
+            local.depth += 1
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                local.depth -= 1
+
+    return locked
+
+
+def _writing(method):
+    """runs a DBTable method holding the table's writer lock"""
+
+    @wraps(method)
+    def locked(self, *args, **kwargs):
+        with self.lock.writer_lock:
+            return method(self, *args, **kwargs)
+
+    return locked
+
+
+class TableSnapshot:
+    """Snapshots of the indexes of some of a table's columns, taken together.
+    Inside view(), reads of the table from the current thread see the snapshot
+    and do not wait for writers.
+    """
+
+    def __init__(self, table: "DBTable", trees: List[TreeSnapshot]):
+        self.table = table
+        self.trees = trees
+
+    @contextmanager
+    def view(self):
+        local = self.table._local
+        previous = local.snapshot
+        with ExitStack() as stack:
+            for tree in self.trees:
+                stack.enter_context(tree.view())
+            local.snapshot = self
+            try:
+                yield self.table
+            finally:
+                local.snapshot = previous
+
+    def close(self):
+        for tree in self.trees:
+            tree.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
 
 class DBTable:
-    def __init__(self, name: str = "Default Table", path: str = ""):
+    """
+    A table stored as a clustered index holding its rows, the indexes of the columns
+    indexed on their own and the composite indexes on several columns.
+
+    Any number of threads can read a table while at most one writes it: writes hold the
+    table's writer lock and reads its reader lock. Cursors and select_all() read a snapshot
+    of the table instead, so a long scan sees the rows as they were when it started
+    without holding writers back.
+    """
+
+    def __init__(
+        self,
+        name: str = "Default Table",
+        path: str = "",
+        pool: BufferPool = None,
+        schema: List[Tuple[str, DBType, bool]] = None,
+        indexes: List[IndexInfo] = None,
+    ):
+        """schema is the (name, type, primary key) of each column and indexes the indexes
+        created on them, as kept in a catalog. Without them, the metadata of every column
+        is read from its directory and the indexes from the table's directory.
+        Tables saved before indexes were created explicitly have every column indexed.
+        """
         self.path = "/".join([path, name])
         self.name = name
         self.cols: Dict[str, Column] = {}
         self.primary_key = None
+        # every column shares one buffer pool
+        self.pool = pool if pool is not None else BufferPool()
+        # set when the table belongs to a DB
+        self.wal: WriteAheadLog = None
+        self.lock = RWLock()
+        self._local = _Reading()
+        # indexes by name, replaced rather than changed when one is created or dropped
+        self.indexes: Dict[str, IndexInfo] = {}
+        if indexes is None and os.path.isfile(self._indexes_path()):
+            with open(self._indexes_path(), "r") as f:
+                indexes = [
+                    IndexInfo(name, tuple(columns), using)
+                    for name, columns, using in json.load(f)
+                ]
+        legacy = indexes is None and (schema is not None or os.path.isdir(self.path))
+        for info in indexes or ():
+            self.indexes[info.name] = info
+        using = {
+            info.columns[0]: info.using
+            for info in self.indexes.values()
+            if len(info.columns) == 1
+        }
+        # indexes on several columns by name, opened when first used
+        self._composites: Dict[str, CompositeIndex] = {}
+        self._open_lock = threading.Lock()
 
-        if os.path.isdir(self.path):
+        if schema is not None:
+            for col, dbtype, primary_key in schema:
+                self.cols[col] = Column(
+                    name=col,
+                    path=self.path,
+                    pool=self.pool,
+                    schema=(dbtype, primary_key),
+                    using=BTREE if legacy else using.get(col),
+                )
+                if primary_key:
+                    self.primary_key = col
+            self._update_row_format()
+        elif os.path.isdir(self.path):
             if os.path.isfile(self._cols_path()):
                 cols = json.load(open(self._cols_path(), "r"))
             else:
-                cols = os.listdir(self.path)
+                cols = sorted(
+                    col
+                    for col in os.listdir(self.path)
+                    if os.path.isdir(os.path.join(self.path, col))
+                )
                 if len(cols) > 0:
                     print_red(
                         f"Warning: Table `{name}` missing 'cols' file. The database was not saved properly. Execution will still be attempted; columns will be read in alphabetical order."
                     )
             for col in cols:
-                self.cols[col] = Column(name=col, path=self.path)
-                info = self.cols[col].col_info
-                if info.primary_key:
+                self.cols[col] = Column(
+                    name=col,
+                    path=self.path,
+                    pool=self.pool,
+                    using=BTREE if legacy else using.get(col),
+                )
+                if self.cols[col].primary_key:
                     self.primary_key = col
+            self._update_row_format()
         else:
             os.mkdir(self.path)
+            self._save_indexes()
+        if legacy:
+            self.indexes = {
+                f"{name}_{col}_idx": IndexInfo(f"{name}_{col}_idx", (col,), BTREE)
+                for col in self.cols
+                if col != self.primary_key
+            }
 
     def _is_valid_shape(self, data: Dict[str, Any]) -> bool:
         return self.cols.keys() == data.keys()
@@ -160,106 +830,1085 @@ class DBTable:
             raise ValueError("No primary key")
         return self.cols[self.primary_key]
 
+    @_writing
     def set_primary_key(self, primary_key: str):
         if not (primary_key in self.cols):
             raise ValueError("Primary key column not in table")
         self.primary_key = primary_key
 
+    @_writing
     def add_column(self, name: str, col: ColumnInfo):
-        self.cols[name] = Column(name=name, col_info=col, path=self.path)
+        self.cols[name] = Column(
+            name=name, col_info=col, path=self.path, pool=self.pool
+        )
         if col.primary_key or not self.cols:
             if self.primary_key:
                 raise ValueError("Primary key already designated")
             self.set_primary_key(name)
+        self._update_row_format()
+
+    def schema(self) -> List[Tuple[str, DBType, bool]]:
+        """Returns the (name, type, primary key) of each column"""
+        return [(name, col.dbtype, col.primary_key) for name, col in self.cols.items()]
+
+    def index_using(self, col: str) -> Optional[str]:
+        """Returns the structure of the index of a nonclustered column, BTREE or HASH,
+        or None if it has no index
+        """
+        return self.cols[col].using
+
+    @_writing
+    def create_index(self, name: str, columns: List[str], using: str = BTREE):
+        """
+        Creates an index on nonclustered columns, built from one pass over the rows
+        sorted by value. A HASH index makes = and IN lookups cheaper than a BTREE one
+        but cannot answer range conditions. An index on several columns is a composite
+        index, a BTREE keyed by the tuple of their values in order, which finds the rows
+        with given values of its first columns and a range of values of the next one.
+        """
+        if using not in INDEX_METHODS:
+            raise ValueError(f"Unsupported index method: {using}")
+        if name in self.indexes:
+            raise ValueError(f"Index {name} already exists")
+        for col in columns:
+            if not col in self.cols:
+                raise ValueError(f"Column '{col}' does not exist")
+            if col == self.primary_key:
+                raise ValueError(
+                    f"Column {col} is the primary key, which orders the table"
+                )
+        if not columns or len(set(columns)) != len(columns):
+            raise ValueError("An index needs distinct columns")
+        if len(columns) > 1 and using != BTREE:
+            raise ValueError(f"{using} indexes on several columns are not supported")
+        for info in self.indexes.values():
+            if info.columns == tuple(columns):
+                raise ValueError(
+                    f"Columns {', '.join(columns)} already have index {info.name}"
+                )
+
+        lsn = self.wal.commit() if self.wal is not None else None
+        groups = self._index_groups(columns)
+        if len(columns) == 1:
+            self.cols[columns[0]].create_index(using, groups, lsn)
+        else:
+            # replaces any file left by an index dropped before a crash
+            index = self.composite_index(name)
+            index.bulk_load_groups(groups)
+            index.save(lsn)
+        self.indexes = {**self.indexes, name: IndexInfo(name, tuple(columns), using)}
+        self._save_indexes()
+
+    @_writing
+    def drop_index(self, name: str):
+        """Drops an index, leaving columns it indexed on their own unindexed"""
+        if name not in self.indexes:
+            raise ValueError(f"Index {name} does not exist")
+        indexes = dict(self.indexes)
+        info = indexes.pop(name)
+        self.indexes = indexes
+        self._save_indexes()
+        if len(info.columns) == 1:
+            self.cols[info.columns[0]].drop_index()
+            return
+        index = self.composite_index(name)
+        del self._composites[name]
+        index.tree.close()
+        os.remove(index.tree.path)
+
+    def composite_index(self, name: str) -> CompositeIndex:
+        """Returns the composite index called name, opening it on first use"""
+        index = self._composites.get(name)
+        if index is None:
+            # readers of the table may open it at the same time
+            with self._open_lock:
+                index = self._composites.get(name)
+                if index is None:
+                    index = CompositeIndex(name, None, path=self.path, pool=self.pool)
+                    self._composites[name] = index
+        return index
+
+    def composite_indexes(self) -> List[IndexInfo]:
+        """Returns the indexes on several columns"""
+        return [info for info in self.indexes.values() if len(info.columns) > 1]
+
+    def _update_row_format(self):
+        """rows are laid out in column order"""
+        if self.primary_key:
+            self._pk_col().set_row_format(
+                RowFormat(
+                    [(name, ROW_FIELDS[col.dbtype]) for name, col in self.cols.items()]
+                )
+            )
+
+    def _encode(self, data: Dict[str, Any]) -> bytes:
+        return self._pk_col().row_format.encode(data)
 
     def select_all(self) -> List[Dict]:
-        return [
-            json.loads(value.decode("utf-8"))
-            for key, value in self._pk_col().index.values()
-        ]
+        row_format = self._pk_col().row_format
+        with self.snapshot([self.primary_key]) as snapshot, snapshot.view():
+            return [
+                row_format.decode(value) for _, value in self._pk_col().index.values()
+            ]
 
+    def snapshot(
+        self, columns: List[str] = None, composites: List[str] = None
+    ) -> TableSnapshot:
+        """Returns a snapshot of the indexes of the given columns and of the given
+        composite indexes, or of every index, as they are now.
+        It must be closed once done with.
+        """
+        if columns is None:
+            columns = list(self.cols.keys())
+            if composites is None:
+                composites = [info.name for info in self.composite_indexes()]
+        # taken between writes even by a thread already reading a snapshot
+        with self.lock.reader_lock:
+            return TableSnapshot(
+                self,
+                [
+                    self.cols[col].index.tree.snapshot()
+                    for col in columns
+                    if self.cols[col].is_indexed
+                ]
+                + [
+                    self.composite_index(name).tree.snapshot()
+                    for name in composites or ()
+                ],
+            )
+
+    @_reading
     def select(self, pks: np.ndarray) -> List[Dict]:
         """Returns dicts from pks"""
         if pks.size == 0:
             return []
         return [self._pk_col().index.get(pk=pk) for pk in pks]
 
+    @_reading
+    def row(self, pk) -> Optional[Mapping]:
+        """Returns the row of a pk, decoding columns as they are accessed"""
+        return self._pk_col().index.row(pk)
+
+    @_reading
+    def cursor(
+        self,
+        condition: Condition = None,
+        limit: int = None,
+        offset: int = 0,
+        columns: List[str] = None,
+    ) -> Cursor:
+        """
+        Returns a cursor over the rows matching condition, or every row, in pk order.
+        Rows are read and decoded only as they are fetched: skipped rows are not decoded,
+        and once limit rows have been returned the rest of the table is never read.
+        If columns are given, only those columns are decoded, and a query whose columns
+        and condition are all held by one nonclustered index is answered from that index.
+        The cursor reads a snapshot of the table, so writes made while it is open are not seen.
+        """
+        plan = self.cursor_plan(condition, limit, columns)
+        return self.plan_cursor(plan, limit, offset, columns)
+
+    def cursor_plan(
+        self, condition: Condition = None, limit: int = None, columns: List[str] = None
+    ) -> Optional[Plan]:
+        """Returns the plan cursor() follows to find the rows, None to scan every row"""
+        if columns is not None:
+            for col in columns:
+                if not col in self.cols:
+                    raise ValueError(f"Column '{col}' does not exist")
+        if condition is None and limit is not None:
+            # the first rows of the clustered index are cheaper than merging a whole index
+            columns = None
+        return self.plan(condition, columns)
+
+    def plan_cursor(
+        self,
+        plan: Optional[Plan],
+        limit: int = None,
+        offset: int = 0,
+        columns: List[str] = None,
+    ) -> Cursor:
+        """Returns a cursor over the rows found by a plan from cursor_plan()"""
+        if (limit is not None and limit < 0) or offset < 0:
+            raise ValueError("LIMIT and OFFSET must not be negative")
+        if columns is None:
+            columns = list(self.cols.keys())
+        if plan is not None and plan.rows <= EAGER_ROWS:
+            rows = self._stream_all(plan, limit, offset)
+            return Cursor([_project(row, columns) for _, row in rows], columns)
+        snapshot = self.snapshot(*self._plan_indexes(plan))
+        with snapshot.view():
+            if plan is None:
+                rows = islice(self.scan_rows(), offset, None)
+            else:
+                rows = plan.stream(self, offset)
+        if limit is not None:
+            rows = islice(rows, limit)
+        return Cursor((_project(row, columns) for _, row in rows), columns, snapshot)
+
+    @_reading
+    def _stream_all(self, plan: Plan, limit: Optional[int], offset: int) -> list:
+        return list(islice(plan.stream(self, offset), limit))
+
+    def _plan_indexes(self, plan: Optional[Plan]) -> Tuple[List[str], List[str]]:
+        """the columns whose indexes a plan reads and the composite indexes it reads"""
+        if isinstance(plan, IndexOnlyScan):
+            return [plan.col], []
+        columns = [self.primary_key]
+        composites = []
+        plans = [plan] if plan is not None else []
+        while plans:
+            plan = plans.pop()
+            if isinstance(plan, IndexLookup) and plan.condition.col not in columns:
+                columns.append(plan.condition.col)
+            if isinstance(plan, PrefixLookup) and plan.index not in composites:
+                composites.append(plan.index)
+            plans.extend(plan.children())
+        return columns, composites
+
+    def scan_rows(self) -> Iterable[Tuple[int, Mapping]]:
+        """Yields (pk, row) of every row in pk order, decoding columns as they are accessed"""
+        return self._pk_col().index.rows()
+
+    @_reading
     def filter(self, condition: Condition) -> np.ndarray:
         """Returns pks of items that match filter"""
+        return self.plan(condition).execute(self)
+
+    @_reading
+    def plan(self, condition: Condition, columns: List[str] = None) -> Plan:
+        """Returns the cheapest plan for finding the rows matching a condition,
+        and reading the given columns of them if any
+        """
+        return Planner(self).plan(condition, columns)
+
+    def explain(self, condition: Condition) -> str:
+        return self.plan(condition).explain()
+
+    def row_count(self) -> int:
+        return self._pk_col().col_info.stats.row_count
+
+    def column_stats(self, col: str) -> ColumnStats:
+        if not col in self.cols:
+            raise ValueError(f"Column '{col}' does not exist")
+        column = self.cols[col]
+        if column.is_indexed:
+            return column.stats()
+        if column.col_info.stats.is_stale():
+            column.col_info.stats.rebuild(self._value_counts(col))
+        return column.col_info.stats
+
+    def _value_counts(self, col: str) -> Iterable[Tuple[Any, int]]:
+        """(value, number of rows) of each value of a column in order, read from the rows"""
+        arrays = [batch[col] for batch in self.column_batches([col])]
+        if not arrays:
+            return []
+        values, counts = np.unique(np.concatenate(arrays), return_counts=True)
+        return zip(values.tolist(), counts.tolist())
+
+    def _index_groups(self, columns: List[str]) -> Iterable[Tuple[Any, np.ndarray]]:
+        """(key, sorted pks) of each key of an index on columns in order, a value for
+        one column and a tuple of values for several, from one pass over the rows
+        sorted by key
+        """
+        batches = list(self.column_batches([self.primary_key, *columns]))
+        if not batches:
+            return []
+        pks = np.concatenate([batch[self.primary_key] for batch in batches])
+        values = [np.concatenate([batch[col] for batch in batches]) for col in columns]
+        # the rows are read in pk order, which stable sorts keep for equal keys
+        if len(values) == 1:
+            order = np.argsort(values[0], kind="stable")
+        else:
+            # sorted by the rank of the values of each column, the last key first
+            order = np.lexsort(
+                [np.unique(array, return_inverse=True)[1] for array in values[::-1]]
+            )
+        pks = pks[order]
+        values = [array[order] for array in values]
+        changed = np.zeros(len(pks) - 1, dtype=bool)
+        for array in values:
+            changed |= array[1:] != array[:-1]
+        starts = np.flatnonzero(np.concatenate(([True], changed)))
+        if len(values) == 1:
+            keys = values[0][starts].tolist()
+        else:
+            keys = list(zip(*(array[starts].tolist() for array in values)))
+        return zip(keys, np.split(pks, starts[1:]))
+
+    @_reading
+    def index_entries(
+        self, col: str, condition: Condition = None
+    ) -> Iterable[Tuple[Any, np.ndarray]]:
+        """Yields (value, sorted pks) of the values of a nonclustered column's index
+        matching a condition on that column alone, or every value
+        """
+        index = self.cols[col].index
+        values, bounds = _index_selection(condition)
+        if values is None:
+            for value, pks in index.entries(*bounds):
+                if condition is None or matches(condition, {col: value}):
+                    yield value, pks
+            return
+        for value in values:
+            pks = index.get(value)
+            if pks.size:
+                yield value, pks
+
+    @_reading
+    def index_counts(
+        self, col: str, condition: Condition = None
+    ) -> Iterable[Tuple[Any, int]]:
+        """Yields (value, number of rows) of the values of a nonclustered column's index
+        matching a condition on that column alone, or every value, without reading any pks
+        """
+        index = self.cols[col].index
+        values, bounds = _index_selection(condition)
+        if values is None:
+            for value, count in index.counts(*bounds):
+                if condition is None or matches(condition, {col: value}):
+                    yield value, count
+            return
+        for value in values:
+            count = index.count(value)
+            if count:
+                yield value, count
+
+    @_reading
+    def count(self, condition: Condition = None, plan: Plan = None) -> int:
+        """Returns the number of rows matching condition, or of every row.
+        A condition on one indexed nonclustered column is counted from the sizes of its
+        posting lists, without reading their pks or any row. Otherwise the rows are found
+        by plan, the plan of the condition, if given.
+        """
+        if condition is None:
+            return self.row_count()
+        if (
+            condition.col in self.cols
+            and condition.col != self.primary_key
+            and self.cols[condition.col].is_indexed
+        ):
+            return sum(
+                count for _, count in self.index_counts(condition.col, condition)
+            )
+        return len((plan or self.plan(condition)).execute(self))
+
+    def column_batches(
+        self, columns: List[str], pks: np.ndarray = None, size: int = BATCH_ROWS
+    ) -> Iterator[Dict[str, np.ndarray]]:
+        """
+        Yields the values of the given columns of the rows of pks, or of every row,
+        as an array per column for size rows at a time, in pk order.
+        The integer and float columns of each batch are decoded at once with numpy.
+        Must be read holding the table's reader lock or inside a snapshot's view().
+        """
+        index = self._pk_col().index
+        if pks is None:
+            data = (value for _, value in index.tree)
+        else:
+            data = (index.tree.get(pk) for pk in pks.tolist())
+        while True:
+            batch = [value for value in islice(data, size) if value is not None]
+            if not batch:
+                return
+            yield index.row_format.decode_columns(batch, columns)
+
+    @_reading
+    def index_lookup(self, condition: Condition) -> np.ndarray:
+        """Returns pks of items that match a condition on one column using its index"""
+        if not condition.col in self.cols:
+            raise ValueError(f"Column '{condition.col}' does not exist")
         if condition.type == ConditionType.EQUALS:
-            if not condition.col in self.cols:
-                raise ValueError(f"Column '{condition.col}' does not exist")
             if condition.col == self.primary_key:
+                if self._pk_col().index.tree.get(condition.val) is None:
+                    return np.array([], dtype=np.int32)
                 return np.array([condition.val], dtype=np.int32)
             pks = self.cols[condition.col].get(condition.val)
+        elif condition.type == ConditionType.IN:
+            if condition.col == self.primary_key:
+                pks = reduce(
+                    np.union1d,
+                    (
+                        self.index_lookup(
+                            Condition(ConditionType.EQUALS, condition.col, val)
+                        )
+                        for val in condition.val
+                    ),
+                )
+            else:
+                index = self.cols[condition.col].index
+                pks = PostingList.union_all(
+                    index.get_postings(val) for val in condition.val
+                ).to_array()
+        elif condition.type == ConditionType.NOT_EQUALS:
+            pks = np.setdiff1d(
+                self._pk_col().index.range_pks(),
+                self.index_lookup(
+                    Condition(ConditionType.EQUALS, condition.col, condition.val)
+                ),
+                assume_unique=True,
+            )
+        elif condition.type in RANGE_BOUNDS:
+            # range conditions seek to the low end and scan the index in order
+            lo, hi, inclusive = RANGE_BOUNDS[condition.type](condition.val)
+            pks = self.cols[condition.col].index.range_pks(lo, hi, inclusive)
         else:
             raise ValueError("Invalid condition code")
         return pks
 
+    @_reading
+    def prefix_lookup(self, name: str, conditions: List[Condition]) -> np.ndarray:
+        """
+        Returns pks of items that match = conditions on the first columns of a composite
+        index, in order, and optionally a range condition on the next column,
+        from one range scan of the index
+        """
+        info = self.indexes[name]
+        index = self.composite_index(name)
+        *equals, last = conditions
+        if last.type == ConditionType.EQUALS:
+            equals, last = conditions, None
+        prefix = tuple(condition.val for condition in equals)
+        for col, condition in zip(info.columns, conditions):
+            if condition.col != col:
+                raise ValueError(f"Index {name} does not start with {condition.col}")
+        if last is None and len(prefix) == len(info.columns):
+            return index.get(prefix)
+        lo, hi, inclusive = (
+            (None, None, True) if last is None else RANGE_BOUNDS[last.type](last.val)
+        )
+        return index.prefix_pks(prefix, lo, hi, inclusive)
+
+    @_writing
     def insert(self, data: Dict[str, Any]):
         if not self._is_valid_shape(data):
             raise ValueError("Invalid shape")
+        encoded = self._encode(data)
+        self._check_new_pks([data[self.primary_key]])
+        self._log("insert", data)
+        self._insert_row(data, encoded)
+
+    def _insert_row(self, data: Dict[str, Any], encoded: bytes = None, lsn: int = None):
         pk_value = data[self.primary_key]
-        self._pk_col().insert(serialize_dict(data), pk_value)
+        for col_name, col in self._cols_before(lsn):
+            if col_name == self.primary_key:
+                col.insert(encoded or self._encode(data), pk_value)
+            else:
+                col.insert(data[col_name], pk_value)
+        for info, index in self._composites_before(lsn):
+            index.insert(_index_key(data, info.columns), pk_value)
+
+    @_writing
+    def insert_many(self, rows: RowsInput) -> int:
+        """
+        Inserts many rows at once, returning the number of rows inserted.
+        rows is a list of row dicts, a dict mapping each column to a list or array of its values,
+        or a numpy structured array with a field per column.
+        Every row is validated and encoded before any index is touched, so a bad row leaves
+        the table as it was, and so does a row whose pk is already in the table. Each index
+        then receives its (key, pk) pairs sorted by key
+        in one ordered pass, reusing the current leaf for consecutive keys instead of
+        descending from the root for every row.
+        If the table is empty, every index is instead built bottom-up in one pass.
+        """
+        rows = _as_rows(rows)
+        for row in rows:
+            if not self._is_valid_shape(row):
+                raise ValueError("Invalid shape")
+        rows = sorted(rows, key=itemgetter(self.primary_key))
+        for prev, row in zip(rows, rows[1:]):
+            if prev[self.primary_key] == row[self.primary_key]:
+                raise ValueError(f"Duplicate primary key {row[self.primary_key]}")
+        encoded = [(row[self.primary_key], self._encode(row)) for row in rows]
+
+        is_empty = self._is_empty()
+        if not is_empty:
+            self._check_new_pks([row[self.primary_key] for row in rows])
+        self._log("insert_many", rows)
+        if not is_empty:
+            self._insert_many(rows, encoded)
+            return len(rows)
+
+        self._pk_col().bulk_load(encoded, len(rows))
         for col_name, col in self.cols.items():
             if col_name == self.primary_key:
                 continue
-            col.insert(data[col_name], pk_value)
+            col.bulk_load(
+                sorted((row[col_name], row[self.primary_key]) for row in rows),
+                len(rows),
+            )
+        for info in self.composite_indexes():
+            self.composite_index(info.name).bulk_load(
+                sorted(
+                    (_index_key(row, info.columns), row[self.primary_key])
+                    for row in rows
+                )
+            )
+        return len(rows)
 
+    def _insert_many(
+        self,
+        rows: List[Dict[str, Any]],
+        encoded: List[Tuple[Any, bytes]] = None,
+        lsn: int = None,
+    ):
+        """inserts rows sorted by primary key with one ordered pass per index"""
+        if encoded is None:
+            encoded = [(row[self.primary_key], self._encode(row)) for row in rows]
+        for col_name, col in self._cols_before(lsn):
+            if col_name == self.primary_key:
+                col.insert_many(encoded)
+            elif col.is_indexed:
+                col.insert_many(
+                    sorted((row[col_name], row[self.primary_key]) for row in rows)
+                )
+            else:
+                col.insert_many([(row[col_name], None) for row in rows])
+        for info, index in self._composites_before(lsn):
+            index.insert_many(
+                sorted(
+                    (_index_key(row, info.columns), row[self.primary_key])
+                    for row in rows
+                )
+            )
+
+    @_writing
+    def load_sorted(
+        self,
+        rows: Iterable[Tuple[Any, bytes]],
+        groups: Dict[str, Iterable[Tuple[Any, np.ndarray]]],
+        row_count: int,
+        pks: np.ndarray = None,
+    ) -> int:
+        """
+        Loads rows prepared outside the table, e.g. by a CSV import, returning row_count.
+        rows are (pk, encoded row) pairs sorted by pk, and groups maps every other column
+        to the (value, pks) of each of its values, sorted by value. Both may be streamed:
+        if the table is empty each index is built bottom-up in one pass, otherwise they
+        are inserted in ordered batches, once the sorted pks of the rows, read from rows
+        unless given, are checked not to be in the table already. The rows are not logged,
+        so the table should be saved afterwards. Composite indexes are then rebuilt from
+        one pass over the rows.
+        """
+        is_empty = self._is_empty()
+        if not is_empty:
+            if pks is None:
+                rows = list(rows)
+                self._check_new_pks([pk for pk, _ in rows])
+            else:
+                self._check_new_pks(pks.tolist())
+        if is_empty:
+            for name, col in self.cols.items():
+                if name == self.primary_key:
+                    col.bulk_load(rows, row_count)
+                else:
+                    col.bulk_load_groups(groups[name], row_count)
+        else:
+            for name, col in self.cols.items():
+                if name == self.primary_key:
+                    items = iter(rows)
+                else:
+                    items = (
+                        (value, pk)
+                        for value, pks in groups[name]
+                        for pk in np.sort(pks).tolist()
+                    )
+                batch = list(islice(items, LOAD_BATCH))
+                while batch:
+                    col.insert_many(batch)
+                    batch = list(islice(items, LOAD_BATCH))
+        for info in self.composite_indexes():
+            self.composite_index(info.name).bulk_load_groups(
+                self._index_groups(list(info.columns))
+            )
+        return row_count
+
+    def bulk_insert(self, rows: RowsInput) -> int:
+        """Same as insert_many"""
+        return self.insert_many(rows)
+
+    def _check_new_pks(self, pks: List):
+        """raises if a row with any of pks sorted is already in the table"""
+        existing = self._pk_col().index.existing(pks)
+        if existing:
+            raise ValueError(f"Duplicate primary key {existing[0]}")
+
+    def _is_empty(self) -> bool:
+        return next(iter(self._pk_col().index.values()), None) is None
+
+    @_writing
     def update(self, pks: np.ndarray, changes: List[Change]):
-        for pk in pks:
-            data_dict = self._pk_col().get(pk)
+        for change in changes:
+            if change.col == self.primary_key:
+                raise ValueError("The primary key cannot be updated")
+            if not change.col in self.cols:
+                raise ValueError(f"Column '{change.col}' does not exist")
 
+        for pk in pks:
+            old = self._pk_col().get(pk)
+            if old is None:
+                # deleted by another thread since the pks were found
+                continue
+            new = dict(old)
             for change in changes:
-                # Nonclustered Index: Remove and recreate pk pointer
-                self.cols[change.col].delete(data_dict[change.col], pk)
-                self.cols[change.col].insert(change.val, pk)
+                new[change.col] = change.val
+            encoded = self._encode(new)
+            self._log("update", old, new)
+            self._update_row(old, new, encoded)
 
-                # Clustered Index: Update dict
-                data_dict[change.col] = change.val
-                # Insert updates when key already exists
-                self._pk_col().insert(serialize_dict(data_dict), pk)
+    def _update_row(
+        self,
+        old: Dict[str, Any],
+        new: Dict[str, Any],
+        encoded: bytes = None,
+        lsn: int = None,
+    ):
+        pk = old[self.primary_key]
+        for col_name, col in self._cols_before(lsn):
+            if col_name == self.primary_key:
+                # Clustered Index: insert updates when key already exists
+                col.insert(encoded or self._encode(new), pk)
+            elif old[col_name] != new[col_name]:
+                # Nonclustered Index: Remove and recreate pk pointer
+                col.delete(old[col_name], pk)
+                col.insert(new[col_name], pk)
+        for info, index in self._composites_before(lsn):
+            old_key = _index_key(old, info.columns)
+            new_key = _index_key(new, info.columns)
+            if old_key != new_key:
+                index.delete(old_key, pk)
+                index.insert(new_key, pk)
 
+    @_writing
     def delete(self, pks: np.ndarray) -> int:
+        deleted = 0
         for pk in pks:
             data_dict = self._pk_col().get(pk)
+            if data_dict is None:
+                # deleted by another thread since the pks were found
+                continue
+            self._log("delete", data_dict)
+            self._delete_row(data_dict)
+            deleted += 1
+        return deleted
 
-            # get list of attributes
-            attrs = list(data_dict.keys())[1:]  # don't include pk in attrs
-
-            # delete nodes in nonclustered tree
-            for attr in attrs:
-                self.cols[attr].delete(data_dict[attr], pk)
+    def _delete_row(self, data: Dict[str, Any], lsn: int = None):
+        pk = data[self.primary_key]
+        for col_name, col in self._cols_before(lsn):
+            if col_name == self.primary_key:
+                col.delete(pk)
+            else:
+                col.delete(data[col_name], pk)
+        for info, index in self._composites_before(lsn):
+            index.delete(_index_key(data, info.columns), pk)
 
-            # delete pk in clustered tree
-            self._pk_col().delete(pk)
-        return pks.size
+    @_writing
+    def compact(self) -> Dict[str, Dict[str, dict]]:
+        """Rebuilds every index with packed nodes and refreshes the column statistics,
+        returning the fill statistics of the index of each column and of each composite
+        index
+        """
+        fill_stats = {}
+        for name, col in self.cols.items():
+            if col.is_indexed:
+                fill_stats[name] = col.index.compact()
+        for info in self.composite_indexes():
+            fill_stats[info.name] = self.composite_index(info.name).compact()
+        self._rebuild_stats()
+        return fill_stats
 
+    @_writing
     def delete_all_rows(self):
-        for col in self.cols:
-            self.cols[col] = Column(
-                name=col,
-                col_info=self.cols[col].col_info,
-                path=self.path,
-            )
+        self._log("truncate")
+        self._delete_all_rows()
+
+    def _delete_all_rows(self, lsn: int = None):
+        for _, col in self._cols_before(lsn):
+            col.clear()
+        for _, index in self._composites_before(lsn):
+            index.clear()
+
+    @_writing
+    def rebuild_stats(self):
+        self._rebuild_stats()
+
+    def _rebuild_stats(self):
+        for name, col in self.cols.items():
+            if col.is_indexed:
+                col.rebuild_stats()
+            else:
+                col.col_info.stats.rebuild(self._value_counts(name))
+
+    # --------- logging ---------
+    def _log(self, op: str, *args):
+        """appends an operation to the write-ahead log, if the table belongs to a DB"""
+        if self.wal is not None:
+            self.wal.append((self.name, op, args))
+
+    def _cols_before(self, lsn: int = None) -> List[Tuple[str, Column]]:
+        """columns whose saved index does not include the operation logged at lsn yet.
+        Unindexed columns only keep statistics, which are rebuilt after replaying the log.
+        """
+        return [
+            (name, col)
+            for name, col in self.cols.items()
+            if lsn is None or (col.is_indexed and col.index.lsn < lsn)
+        ]
+
+    def _composites_before(
+        self, lsn: int = None
+    ) -> List[Tuple[IndexInfo, CompositeIndex]]:
+        """composite indexes whose saved tree does not include the operation logged at
+        lsn yet
+        """
+        pairs = [
+            (info, self.composite_index(info.name)) for info in self.composite_indexes()
+        ]
+        return [
+            (info, index) for info, index in pairs if lsn is None or index.lsn < lsn
+        ]
+
+    def redo(self, lsn: int, op: str, args: tuple):
+        """Re-applies a logged operation to the columns saved before it was logged"""
+        if op == "insert":
+            self._insert_row(*args, lsn=lsn)
+        elif op == "insert_many":
+            self._insert_many(args[0], lsn=lsn)
+        elif op == "update":
+            self._update_row(*args, lsn=lsn)
+        elif op == "delete":
+            self._delete_row(*args, lsn=lsn)
+        elif op == "truncate":
+            self._delete_all_rows(lsn)
+        else:
+            raise ValueError(f"Unknown log record {op!r}")
 
     def _cols_path(self):
         return self.path + "/cols"
 
+    def _save_cols(self):
+        _write_atomic(self._cols_path(), json.dumps(list(self.cols.keys())).encode())
+
+    def _indexes_path(self):
+        return self.path + "/indexes"
+
+    def _save_indexes(self):
+        _write_atomic(
+            self._indexes_path(), json.dumps(list(self.indexes.values())).encode()
+        )
+
+    @_writing
     def save(self):
+        """Writes every column to disk. If the table belongs to a DB,
+        the saved indexes are marked as including every operation logged so far.
+        """
+        lsn = self.wal.commit() if self.wal is not None else None
         for col in self.cols.values():
-            col.save()
-        json.dump(list(self.cols.keys()), open(self._cols_path(), "w"))
+            col.save(lsn)
+        for index in self._composites.values():
+            index.save(lsn)
+        self._save_cols()
+        self._save_indexes()
+
+    @_writing
+    def close(self):
+        lsn = self.wal.commit() if self.wal is not None else None
+        for col in self.cols.values():
+            col.close(lsn)
+        for index in self._composites.values():
+            index.close(lsn)
+        self._save_cols()
+        self._save_indexes()
+
+
+def _index_type(primary_key: bool, using: Optional[str]) -> Optional[type]:
+    """the index class of a column, None if it has no index"""
+    if primary_key:
+        return ClusteredIndex
+    if using is None:
+        return None
+    return HashIndex if using == HASH else NonclusteredIndex
+
+
+def _index_key(row: Mapping, columns: Tuple[str, ...]) -> tuple:
+    """the key of a row in a composite index on columns"""
+    return tuple(row[col] for col in columns)
+
+
+def _in_range(
+    items: Iterable[Tuple[Any, Any]], lo, hi, inclusive
+) -> Iterator[Tuple[Any, Any]]:
+    """the (key, value) pairs with keys between lo and hi, like BPlusTree.range but
+    in the order of items
+    """
+    lo_inclusive, hi_inclusive = (
+        (inclusive, inclusive) if isinstance(inclusive, bool) else inclusive
+    )
+    for key, value in items:
+        if lo is not None and (key < lo or (key == lo and not lo_inclusive)):
+            continue
+        if hi is not None and (key > hi or (key == hi and not hi_inclusive)):
+            continue
+        yield key, value
+
+
+def _index_selection(condition: Optional[Condition]):
+    """values of an index matched by a condition on its column, as (values, None) for
+    conditions listing them and (None, (lo, hi, inclusive)) for a range to check them in
+    """
+    if condition is not None and condition.type == ConditionType.EQUALS:
+        return [condition.val], None
+    if condition is not None and condition.type == ConditionType.IN:
+        return sorted(set(condition.val)), None
+    if condition is not None and condition.type in RANGE_BOUNDS:
+        return None, RANGE_BOUNDS[condition.type](condition.val)
+    return None, (None, None, True)
+
+
+def _project(row: Mapping, columns: List[str]) -> Dict[str, Any]:
+    """decodes the given columns of a row"""
+    if isinstance(row, LazyRow):
+        return row.to_dict(columns)
+    return {col: row[col] for col in columns}
+
+
+def _as_rows(rows: RowsInput) -> List[Dict[str, Any]]:
+    """converts column-oriented input into a list of row dicts of Python values"""
+    if isinstance(rows, np.ndarray):
+        if rows.dtype.names is None:
+            raise ValueError("Arrays of rows must have a field per column")
+        rows = {name: rows[name] for name in rows.dtype.names}
+    if not isinstance(rows, Mapping):
+        return list(rows)
+
+    columns = [
+        values.tolist() if isinstance(values, np.ndarray) else list(values)
+        for values in rows.values()
+    ]
+    if len({len(values) for values in columns}) > 1:
+        raise ValueError("Columns have different lengths")
+    return [dict(zip(rows.keys(), values)) for values in zip(*columns)]
+
+
+def _write_atomic(path: str, data: bytes):
+    """replaces a file so a crash leaves either the old or the new contents"""
+    with open(path + ".tmp", "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
 
 
 class DB(dict):
-    def __init__(self, name: str, *args, **kwargs) -> "DB":
+    """
+    Every table of a database, sharing one buffer pool and one write-ahead log.
+
+    Statements append their row operations to the log and commit() makes them durable
+    with one sequential write, instead of writing every changed index.
+    Once the log grows past checkpoint_size, a checkpoint writes every table to disk
+    and empties the log. On open, operations logged after the last checkpoint are replayed.
+
+    Opening a database only lists its tables. A table is opened on first access using
+    its schema from the catalog, and its columns read their metadata and index
+    when they are first used, so startup does not grow with the size of the database.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        *args,
+        cache_size: int = DEFAULT_CAPACITY,
+        commit_delay: float = 0.0,
+        checkpoint_size: int = CHECKPOINT_SIZE,
+        **kwargs,
+    ) -> "DB":
         super().__init__(*args, **kwargs)
 
         self.name = name
+        self.engine = SQLEngine()
+        # every index of every table shares one buffer pool
+        self.pool = BufferPool(capacity=cache_size)
+        self.checkpoint_size = checkpoint_size
 
         if not os.path.isdir(name):
             os.mkdir(name)
 
+        self.catalog: Dict[str, List[Tuple[str, DBType, bool]]]
+        self.index_catalog: Dict[str, List[IndexInfo]]
+        self.catalog, self.index_catalog = _read_catalog(self._catalog_path())
+        self.wal = WriteAheadLog(os.path.join(name, WAL_FILE), commit_delay)
         for table_name in os.listdir(name):
-            self[table_name] = DBTable(name=table_name, path=name)
+            if os.path.isdir(os.path.join(name, table_name)):
+                # opened on first access
+                super().__setitem__(table_name, None)
+        self._recover()
+
+    def __getitem__(self, table_name: str) -> DBTable:
+        table = super().__getitem__(table_name)
+        if table is None:
+            table = DBTable(
+                name=table_name,
+                path=self.name,
+                pool=self.pool,
+                schema=self.catalog.get(table_name),
+                indexes=self.index_catalog.get(table_name),
+            )
+            table.wal = self.wal
+            super().__setitem__(table_name, table)
+        return table
+
+    def __setitem__(self, table_name: str, table: DBTable):
+        table.wal = self.wal
+        super().__setitem__(table_name, table)
+        self.catalog[table_name] = table.schema()
+        self.index_catalog[table_name] = list(table.indexes.values())
+        self._save_catalog()
+
+    def __delitem__(self, table_name: str):
+        super().__delitem__(table_name)
+        self.index_catalog.pop(table_name, None)
+        if self.catalog.pop(table_name, None) is not None:
+            self._save_catalog()
+
+    def get(self, table_name: str, default=None) -> DBTable:
+        return self[table_name] if table_name in self else default
+
+    def values(self) -> List[DBTable]:
+        return [self[table_name] for table_name in self]
+
+    def items(self) -> List[Tuple[str, DBTable]]:
+        return [(table_name, self[table_name]) for table_name in self]
+
+    def opened(self) -> List[DBTable]:
+        """Returns the tables opened so far"""
+        return [table for table in super().values() if table is not None]
+
+    def prepare(self, sql: str) -> PreparedStatement:
+        """Parses a SELECT, INSERT, UPDATE or DELETE once for running it many times,
+        with ? in place of the values given to each execution
+        """
+        return PreparedStatement(self, self.engine.parse(sql))
+
+    def create_index(
+        self,
+        table_name: str,
+        columns: List[str],
+        name: str = None,
+        using: str = BTREE,
+    ) -> str:
+        """Creates an index on columns of a table, named after them unless a name is given.
+        Index names are unique within the database. Returns the name of the index.
+        """
+        if table_name not in self:
+            raise ValueError("Table %s does not exist" % table_name)
+        table = self[table_name]
+        if name is None:
+            name = "_".join([table_name, *columns, "idx"])
+        if self._index_table(name) is not None:
+            raise ValueError(f"Index {name} already exists")
+        table.create_index(name, list(columns), using)
+        self._save_catalog()
+        return name
+
+    def drop_index(self, name: str, table_name: str = None):
+        """Drops an index, of the given table if any, leaving its columns unindexed"""
+        found = self._index_table(name)
+        if found is None or (table_name is not None and found != table_name):
+            raise ValueError(f"Index {name} does not exist")
+        self[found].drop_index(name)
+        self._save_catalog()
+
+    def _index_table(self, name: str) -> Optional[str]:
+        """the table of the index called name, None if there is none"""
+        for table in self.opened():
+            self.index_catalog[table.name] = list(table.indexes.values())
+        for table_name, indexes in self.index_catalog.items():
+            if table_name in self and any(info.name == name for info in indexes):
+                return table_name
+        return None
+
+    def commit(self):
+        """Makes every statement run so far durable, checkpointing if the log has grown large"""
+        self.wal.commit()
+        if self.wal.size() > self.checkpoint_size:
+            self.checkpoint()
+
+    def checkpoint(self):
+        """Writes every table to disk and empties the log"""
+        for table in self.opened():
+            table.save()
+        self._save_catalog()
+        self.wal.truncate()
+
+    def _recover(self):
+        """replays the operations logged after the tables were last saved"""
+        replayed = set()
+        for lsn, (table_name, op, args) in self.wal.records():
+            # operations on dropped tables are skipped
+            if table_name in self:
+                self[table_name].redo(lsn, op, args)
+                replayed.add(table_name)
+        for table_name in replayed:
+            self[table_name].rebuild_stats()
+        if replayed:
+            self.checkpoint()
+
+    def close(self):
+        for table in self.opened():
+            table.close()
+        self._save_catalog()
+        self.wal.truncate()
+        self.wal.close()
+
+    def _catalog_path(self) -> str:
+        return os.path.join(self.name, CATALOG_FILE)
+
+    def _save_catalog(self):
+        """records the schema and indexes of the opened tables,
+        which may have been created outside the DB
+        """
+        for table in self.opened():
+            self.catalog[table.name] = table.schema()
+            self.index_catalog[table.name] = list(table.indexes.values())
+        _write_atomic(
+            self._catalog_path(),
+            json.dumps(
+                {
+                    table_name: {
+                        "columns": [
+                            [col, dbtype.name, primary_key]
+                            for col, dbtype, primary_key in schema
+                        ],
+                        "indexes": self.index_catalog.get(table_name, []),
+                    }
+                    for table_name, schema in self.catalog.items()
+                    if table_name in self
+                }
+            ).encode(),
+        )
+
+
+def _read_catalog(
+    path: str,
+) -> Tuple[Dict[str, List[Tuple[str, DBType, bool]]], Dict[str, List[IndexInfo]]]:
+    """returns the schema and the indexes of every table in a catalog"""
+    if not os.path.isfile(path):
+        return {}, {}
+    with open(path, "r") as f:
+        tables = json.load(f)
+    schemas = {}
+    indexes = {}
+    for table_name, entry in tables.items():
+        if isinstance(entry, list):
+            # catalogs written before indexes were recorded hold the columns alone
+            entry = {"columns": entry}
+        schemas[table_name] = [
+            (col, DBType[dbtype], primary_key)
+            for col, dbtype, primary_key in entry["columns"]
+        ]
+        if "indexes" in entry:
+            indexes[table_name] = [
+                IndexInfo(name, tuple(columns), using)
+                for name, columns, using in entry["indexes"]
+            ]
+    return schemas, indexes
@@ -4,6 +4,8 @@ import argparse
 
 from interactive import run_interactive
 from gcsv import run_csv
+from protocol import DEFAULT_HOST, DEFAULT_PORT
+from server import WORKERS, run_server
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
@@ -16,10 +18,35 @@ if __name__ == "__main__":
     parser.add_argument("--csv-table", help="CSV: name of table to parse CSV into")
     parser.add_argument("--delimiter", help="CSV: delimiter", default=",")
     parser.add_argument("--dbpath", help="path to store db")
+    parser.add_argument(
+        "--cache-size",
+        help="memory budget of the buffer pool in MiB",
+        type=int,
+    )
+    parser.add_argument(
+        "--serve", help="serves the database over the network", action="store_true"
+    )
+    parser.add_argument(
+        "--host", help="serve: address to listen on", default=DEFAULT_HOST
+    )
+    parser.add_argument(
+        "--port", help="serve: TCP port to listen on", type=int, default=DEFAULT_PORT
+    )
+    parser.add_argument(
+        "--unix-socket", help="serve: path of a Unix socket to listen on instead"
+    )
+    parser.add_argument(
+        "--workers",
+        help=f"serve: threads running statements (default {WORKERS}); "
+        "CSV: processes parsing the file (default one per CPU)",
+        type=int,
+    )
 
     args = parser.parse_args()
 
     if args.interactive:
         run_interactive(args)
     if args.csv:
-        run_csv(args.csv, args.delimiter, args.csv_table, args.dbpath)
+        run_csv(args.csv, args.delimiter, args.csv_table, args.dbpath, args.workers)
+    if args.serve:
+        run_server(args)
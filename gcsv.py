@@ -1,16 +1,47 @@
-import os
-from typing import Any, List
+"""
+Imports CSV files into tables with a pipeline of processes.
+
+The reader splits the file into chunks of whole records. Worker processes parse each chunk,
+convert its values to the column types and encode its rows, then write one sorted run per
+index to a spill directory: (pk, encoded row) pairs for the primary key and the
+(value, pks) of every value of the other columns. Once every chunk is parsed, the runs of
+each index are merged and stream into DBTable.load_sorted, which builds the index bottom-up. Only a bounded number
+of chunks are in flight, so memory does not grow with the file beyond 8 bytes per row kept
+for finding duplicate primary keys.
+"""
+
 import csv
+import heapq
+import io
+import os
+import pickle
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from itertools import chain, groupby
+from operator import itemgetter
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
 
-from db import ColumnInfo, DBTable, DBType
+from db import ROW_FIELDS, ColumnInfo, DBTable, DBType
+from gdb_rowformat import RowFormat
 
+# characters of the file read into each chunk
+CHUNK_SIZE = 4 * 1024 * 1024
+# chunks being parsed or waiting for a worker, per worker
+CHUNKS_IN_FLIGHT = 2
+# items of a run pickled together, read back one block at a time while merging
+RUN_BLOCK = 1024
 
-def create_columns(table: DBTable, headers: List[str], reader: Any) -> None:
+CONVERTERS = {DBType.INTEGER: int, DBType.FLOAT: float, DBType.STRING: str}
+
+
+def create_columns(table: DBTable, headers: List[str], first_row: List[str]):
+    """Creates the columns of the table, inferring their types from the first row"""
     if len(headers) < 1:
         raise ValueError("CSV: Invalid headers")
 
-    # Infer type from first row
-    first_row: List[str] = next(reader)
     first_row_isnumerics = [val.isnumeric() for val in first_row]
     first_row_types = [
         DBType.INTEGER if val else DBType.STRING for val in first_row_isnumerics
@@ -26,22 +57,237 @@ def create_columns(table: DBTable, headers: List[str], reader: Any) -> None:
         )
 
 
-def insert_rows(table: DBTable, headers: List[str], reader: Any) -> int:
-    count = 0
-    for row in reader:
+def read_chunks(f: io.TextIOBase, chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    """Yields the rest of a CSV file in chunks of about chunk_size characters,
+    each ending at the end of a record
+    """
+    while True:
+        chunk = "".join(f.readlines(chunk_size))
+        if not chunk:
+            return
+        # a quoted value may span lines: the chunk ends once its quotes are balanced
+        while chunk.count('"') % 2:
+            line = f.readline()
+            if not line:
+                break
+            chunk += line
+        yield chunk
+
+
+def import_csv(
+    table: DBTable,
+    f: io.TextIOBase,
+    delimiter: str = ",",
+    workers: int = None,
+    chunk_size: int = CHUNK_SIZE,
+    progress: Callable[[str], Any] = None,
+) -> int:
+    """
+    Imports an open CSV file into a table, returning the number of rows imported.
+    The first line holds the column names. If the table has no columns yet,
+    they are created with types inferred from the first row and the first column as
+    the primary key. workers is the number of processes parsing chunks, one per CPU
+    by default, and progress is called with a message as chunks are parsed.
+    """
+    headers = next(csv.reader([f.readline()], delimiter=delimiter), [])
+    chunks = read_chunks(f, chunk_size)
+    if not table.cols:
+        first = next(chunks, "")
+        first_row = next(
+            (row for row in csv.reader(io.StringIO(first), delimiter=delimiter) if row),
+            None,
+        )
+        if first_row is None:
+            raise ValueError("CSV: No rows to infer the column types from")
+        create_columns(table, headers, first_row)
+        chunks = chain([first], chunks)
+    if sorted(headers) != sorted(table.cols):
+        raise ValueError(
+            f"CSV: Headers {headers} do not match the columns of table {table.name}"
+        )
+
+    schema = table.schema()
+    pk_index = next(i for i, (_, _, primary_key) in enumerate(schema) if primary_key)
+    workers = workers or os.cpu_count() or 1
+    start = time.perf_counter()
+    row_count = 0
+    # sorted pks of each chunk by chunk id
+    pk_runs: Dict[int, np.ndarray] = {}
+    with tempfile.TemporaryDirectory() as spill_dir, ProcessPoolExecutor(
+        workers
+    ) as pool:
+        # chunk id of every chunk being parsed
+        pending: Dict[Future, int] = {}
+
+        def collect(done):
+            nonlocal row_count
+            for future in done:
+                count, pks = future.result()
+                row_count += count
+                pk_runs[pending.pop(future)] = pks
+            if progress is not None:
+                elapsed = time.perf_counter() - start
+                progress(
+                    f"Parsed {row_count:,} rows ({row_count / elapsed:,.0f} rows/s)"
+                )
+
+        def run_path(chunk_id: int, i: int) -> str:
+            return os.path.join(spill_dir, f"{chunk_id}.{i}")
+
+        for chunk_id, chunk in enumerate(chunks):
+            if len(pending) >= CHUNKS_IN_FLIGHT * workers:
+                collect(wait(pending, return_when=FIRST_COMPLETED).done)
+            paths = [run_path(chunk_id, i) for i in range(len(schema))]
+            future = pool.submit(parse_chunk, chunk, delimiter, headers, schema, paths)
+            pending[future] = chunk_id
+        if pending:
+            collect(wait(pending).done)
+
+        chunk_count = len(pk_runs)
+        pks = _check_duplicates(list(pk_runs.values()))
+        order = _disjoint_order(pk_runs)
+        pk_runs.clear()
+
+        if progress is not None:
+            progress(f"Building the indexes from {chunk_count} sorted runs")
+        # the runs of each column
+        runs = [
+            [run_path(chunk_id, i) for chunk_id in range(chunk_count)]
+            for i in range(len(schema))
+        ]
+        if order is not None:
+            # the runs of the primary key follow one another
+            rows = chain.from_iterable(
+                _read_run(run_path(chunk_id, pk_index)) for chunk_id in order
+            )
+        else:
+            rows = heapq.merge(*(_read_run(path) for path in runs[pk_index]))
+        groups = {
+            name: _merge_groups(runs[i])
+            for i, (name, _, primary_key) in enumerate(schema)
+            if not primary_key
+        }
+        return table.load_sorted(rows, groups, row_count, pks)
+
+
+def parse_chunk(
+    chunk: str,
+    delimiter: str,
+    headers: List[str],
+    schema: List[Tuple[str, DBType, bool]],
+    paths: List[str],
+) -> Tuple[int, np.ndarray]:
+    """
+    Parses a chunk of a CSV file and writes a sorted run for each column of the schema
+    to the path at its position: (pk, encoded row) pairs sorted by pk for the primary key
+    and (value, sorted pks) of each value sorted by value otherwise.
+    Returns the number of rows and their sorted pks.
+    """
+    # position in the CSV of each column in table order
+    positions = [headers.index(name) for name, _, _ in schema]
+    converters = [CONVERTERS[dbtype] for _, dbtype, _ in schema]
+    pk_index = next(i for i, (_, _, primary_key) in enumerate(schema) if primary_key)
+    row_format = RowFormat([(name, ROW_FIELDS[dbtype]) for name, dbtype, _ in schema])
+
+    values_of_rows = []
+    for row in csv.reader(io.StringIO(chunk), delimiter=delimiter):
         # Ignore blank rows
         if not row:
             continue
+        if len(row) != len(headers):
+            raise ValueError(
+                f"CSV: Row {row} has {len(row)} values, expected {len(headers)}"
+            )
+        try:
+            values_of_rows.append(
+                [
+                    convert(row[position])
+                    for convert, position in zip(converters, positions)
+                ]
+            )
+        except ValueError:
+            raise ValueError(f"CSV: Row {row} does not match the column types")
+    if not values_of_rows:
+        for path in paths:
+            _write_run(path, [])
+        return 0, np.array([], dtype=np.int64)
+    rows = [row_format.encode_values(values) for values in values_of_rows]
+    columns = [list(column) for column in zip(*values_of_rows)]
+
+    pks = columns[pk_index]
+    pk_array = np.array(pks, dtype=np.int64)
+    # positions of the rows in pk order, which orders the pks of equal values
+    by_pk = np.argsort(pk_array, kind="stable")
+    for i, path in enumerate(paths):
+        if i == pk_index:
+            order = by_pk.tolist()
+            _write_run(
+                path,
+                list(zip(map(pks.__getitem__, order), map(rows.__getitem__, order))),
+            )
+            continue
+        dtype = object if schema[i][1] == DBType.STRING else None
+        values = np.array(columns[i], dtype=dtype)[by_pk]
+        order = np.argsort(values, kind="stable")
+        values = values[order]
+        starts = np.flatnonzero(np.concatenate(([True], values[1:] != values[:-1])))
+        _write_run(
+            path,
+            list(
+                zip(
+                    values[starts].tolist(),
+                    np.split(pk_array[by_pk][order], starts[1:]),
+                )
+            ),
+        )
+    return len(rows), pk_array[by_pk]
+
+
+def _check_duplicates(pk_runs: List[np.ndarray]) -> np.ndarray:
+    """returns the pks of every run sorted, raising if one is in several rows"""
+    if not pk_runs:
+        return np.array([], dtype=np.int64)
+    pks = np.sort(np.concatenate(pk_runs))
+    duplicates = pks[1:][pks[1:] == pks[:-1]]
+    if len(duplicates):
+        raise ValueError(f"Duplicate primary key {duplicates[0]}")
+    return pks
+
+
+def _disjoint_order(pk_runs: Dict[int, np.ndarray]) -> Optional[List[int]]:
+    """chunk ids in pk order if the pks of no two chunks interleave, otherwise None"""
+    bounds = sorted(
+        (pks[0], pks[-1], chunk_id) for chunk_id, pks in pk_runs.items() if len(pks)
+    )
+    for (_, last, _), (first, _, _) in zip(bounds, bounds[1:]):
+        if first <= last:
+            return None
+    return [chunk_id for _, _, chunk_id in bounds]
+
 
-        to_insert = {}
-        for val, header in zip(row, headers):
-            if val.isnumeric():
-                val = int(val)
-            to_insert[header] = val
-        table.insert(to_insert)
+def _merge_groups(paths: List[str]) -> Iterable[Tuple[Any, np.ndarray]]:
+    """merges runs of (value, pks), joining the pks of a value found in several runs"""
+    merged = heapq.merge(*(_read_run(path) for path in paths), key=itemgetter(0))
+    for value, groups in groupby(merged, key=itemgetter(0)):
+        first = next(groups)[1]
+        rest = [pks for _, pks in groups]
+        yield value, np.concatenate([first, *rest]) if rest else first
 
-        count += 1
-    return count
+
+def _write_run(path: str, items: List[tuple]):
+    with open(path, "wb") as f:
+        for i in range(0, len(items), RUN_BLOCK):
+            pickle.dump(items[i : i + RUN_BLOCK], f, pickle.HIGHEST_PROTOCOL)
+
+
+def _read_run(path: str) -> Iterable[tuple]:
+    with open(path, "rb") as f:
+        while True:
+            try:
+                block = pickle.load(f)
+            except EOFError:
+                return
+            yield from block
 
 
 def run_csv(
@@ -49,6 +295,7 @@ def run_csv(
     delimiter: str = ",",
     table_name: str = "default_table",
     dbpath: str = "default_db",
+    workers: int = None,
 ) -> None:
     if not table_name:
         print("Table name not specified, defaulting to `default_table`")
@@ -59,26 +306,18 @@ def run_csv(
         )
 
     print(f'Parsing CSV "{file_path}"...')
-    with open(file_path) as f:
-        reader = csv.reader(f, delimiter=delimiter)
-
-        table_exists = False
-
-        dbdir = os.path.join(os.curdir, dbpath)
-        if not os.path.isdir(dbdir):
-            os.mkdir(dbdir)
-        if os.path.isdir("/".join([dbdir, table_name])):
-            table_exists = True
-
-        table = DBTable(name=table_name, path=dbdir)
-
-        headers: List[str] = next(reader)
-
-        if not table_exists:
-            create_columns(table, headers, reader)
-
-        rows_inserted = insert_rows(table, headers, reader) + 1
+    dbdir = os.path.join(os.curdir, dbpath or "default_db")
+    if not os.path.isdir(dbdir):
+        os.mkdir(dbdir)
+    table = DBTable(name=table_name, path=dbdir)
 
-        table.save()
+    start = time.perf_counter()
+    with open(file_path, newline="") as f:
+        rows_inserted = import_csv(table, f, delimiter, workers, progress=print)
+    table.save()
 
-        print(f"Parsing finished, {rows_inserted} rows inserted.")
+    elapsed = time.perf_counter() - start
+    print(
+        f"Parsing finished, {rows_inserted} rows inserted "
+        f"({rows_inserted / elapsed:,.0f} rows/s)."
+    )
@@ -1,52 +1,62 @@
-from typing import List
+from array import array
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 from os.path import exists
+import os
 import pickle
-import sys
+import threading
 
+import numpy as np
 
-sys.setrecursionlimit(15000)
+from gdb_bufferpool import BufferPool
+from gdb_pager import Pager
+
+
+# array typecodes of the keys of trees holding only integer or float keys,
+# with the numpy types of their values
+KEY_TYPES = {"q": np.int64, "d": np.float64}
+
+# the keys of a node, an array for trees with a key type and a list otherwise
+Keys = Union[list, array]
 
 
 class Node:
-    def __init__(self, parent=None):
-        self.keys = []
-        self.values: [Node] = []
-        self.parent = parent
+    __slots__ = ("keys", "values", "page_id")
+
+    def __init__(self, page_id: int = 0):
+        self.keys: Keys = []
+        # page ids of the children
+        self.values: List[int] = []
+        self.page_id = page_id
 
     def properIdx(self, key):
         """Returns the index where that key belongs"""
-        for idx, item in enumerate(self.keys):
-            if key < item:
-                return idx
-        return len(self.keys)
+        return bisect_right(self.keys, key)
 
     def set(self, key, value):
         i = self.properIdx(key)
-        self.keys[i:i] = [key]
+        self.keys.insert(i, key)
         self.values.pop(i)
         self.values[i:i] = value
 
     def get(self, key):
         return self.values[self.properIdx(key)]
 
-    def split(self):
-        """split the node into two and store them as children of the current parent
-        returns the key for the two children and both children
+    def split(self, left: "Node"):
+        """split the node into two, moving the lower half into left
+        returns the key that divides the two
         """
-        left = Node(self.parent)
         mid = len(self.keys) // 2
 
         left.keys = self.keys[:mid]
         left.values = self.values[: mid + 1]
 
-        for child in left.values:
-            child.parent = left
-
         key = self.keys[mid]
         self.keys = self.keys[mid + 1 :]
         self.values = self.values[mid + 1 :]
 
-        return key, [left, self]
+        return key
 
     # --------- deleting ---------
     def delete(self, key):
@@ -63,37 +73,58 @@ class Node:
             # delete the last key
             self.keys.pop(idx - 1)
 
+    # --------- paging ---------
+    def copy(self) -> "Node":
+        node = Node(self.page_id)
+        node.keys = self.keys[:]
+        node.values = self.values.copy()
+        return node
+
+    def serialize(self) -> bytes:
+        return pickle.dumps(
+            (False, self.keys, self.values, 0, 0), protocol=pickle.HIGHEST_PROTOCOL
+        )
+
+    @staticmethod
+    def deserialize(page_id: int, data: bytes) -> "Node":
+        is_leaf, keys, values, prev, next = pickle.loads(data)
+        node = Leaf(page_id, prev, next) if is_leaf else Node(page_id)
+        node.keys = keys
+        node.values = values
+        return node
+
 
 class Leaf(Node):
-    def __init__(self, parent: Node = None, prev: "Leaf" = None, next: "Leaf" = None):
-        super(Leaf, self).__init__(parent)
-        self.prev: Leaf | None = prev
-        self.next: Leaf | None = next
-
-        # set prev and next of surrounding
-        if next is not None:
-            next.prev = self
-        if prev is not None:
-            prev.next = self
+    __slots__ = ("prev", "next")
+
+    def __init__(self, page_id: int = 0, prev: int = 0, next: int = 0):
+        super(Leaf, self).__init__(page_id)
+        # page ids of the neighboring leaves, 0 if there is none
+        self.prev: int = prev
+        self.next: int = next
+
+    def search(self, key):
+        """Returns the index where that key is or belongs and whether it is there"""
+        idx = bisect_left(self.keys, key)
+        return idx, idx < len(self.keys) and self.keys[idx] == key
 
     def get(self, key):
-        return self.values[self.keys.index(key)]
+        idx, found = self.search(key)
+        return self.values[idx] if found else None
 
-    def set(self, key, value):
-        idx = self.properIdx(key)
-        if key not in self.keys:
+    def set(self, key, value) -> bool:
+        """Returns whether the key is new"""
+        idx, found = self.search(key)
+        if not found:
             # add new key value pair where it belongs
             self.keys.insert(idx, key)
             self.values.insert(idx, value)
         else:
             # update existing value of key
-            self.values[idx - 1] = value
-
-    def split(self):
-        # create new node
-        left = Leaf(self.parent, self.prev, self)
-        self.prev = left
+            self.values[idx] = value
+        return not found
 
+    def split(self, left: "Leaf"):
         # set left node to half of the current node's values
         mid = len(self.keys) // 2
         left.keys = self.keys[:mid]
@@ -104,72 +135,315 @@ class Leaf(Node):
         self.values = self.values[mid:]
 
         # key that divides the two new nodes is the leftmost key of the right leaf
-        parentKey = self.keys[0]
-
-        return parentKey, [left, self]
+        return self.keys[0]
 
     # --------- deleting ---------
     def delete(self, key):
         # easier for leaves because keys 🤝 values here
-        idx = self.keys.index(key)
+        idx, found = self.search(key)
+        if not found:
+            raise ValueError(f"{key!r} is not in the tree")
         self.keys.pop(idx)
         self.values.pop(idx)
 
+    # --------- paging ---------
+    def copy(self) -> "Leaf":
+        leaf = Leaf(self.page_id, self.prev, self.next)
+        leaf.keys = self.keys[:]
+        leaf.values = self.values.copy()
+        return leaf
+
+    def serialize(self) -> bytes:
+        return pickle.dumps(
+            (True, self.keys, self.values, self.prev, self.next),
+            protocol=pickle.HIGHEST_PROTOCOL,
+        )
+
+
+class _Operation(threading.local):
+    """the operation in progress in a thread and the snapshot it reads"""
+
+    def __init__(self):
+        self.depth = 0
+        self.pins: List[int] = []
+        self.write = False
+        self.snapshot: "TreeSnapshot" = None
+
 
 class BPlusTree:
-    def __init__(self, path: str = None, max_degree: int = 100):
-        if path is not None and exists(path):
-            # tree already exists
-            old_tree = pickle.load(open(path, "rb"))
-            self.root = old_tree.root
-            self.path = old_tree.path
-            self.max_keys = old_tree.max_keys
-            self.min_keys = old_tree.min_keys
+    """
+    B+ tree stored in a page file, one node per page.
+    Nodes are read from disk when they are needed and cached in a buffer pool,
+    which may be shared between trees. Only dirty nodes are written back.
+
+    Nodes used by an operation stay pinned in the pool until the operation finishes.
+
+    Writes must not run concurrently with each other or with reads, which callers ensure
+    with a lock. snapshot() gives a view of the tree that can be read from other threads
+    while it is written: nodes changed after it was taken are copied in the pool first.
+
+    A tree created with a key_type from KEY_TYPES only holds integer ("q") or float ("d")
+    keys, which its nodes keep in an array of that type instead of a list of Python
+    objects: a key takes 8 bytes in memory instead of about 40, and a node is read
+    from its page by copying the array instead of creating an object per key.
+    """
+
+    def __init__(
+        self,
+        max_degree: int = 100,
+        path: str = None,
+        pool: BufferPool = None,
+        key_type: str = None,
+    ):
+        if key_type is not None and key_type not in KEY_TYPES:
+            raise ValueError(f"Unsupported key type {key_type!r}")
+        legacy_items = None
+        if path is not None:
+            legacy_path = path + ".legacy"
+            if exists(path) and not Pager.is_page_file(path):
+                os.replace(path, legacy_path)
+            if exists(legacy_path):
+                # the pickled tree is kept until it is converted, so a conversion cut
+                # short starts over from it, dropping the pages it wrote
+                for stale in (path, path + ".journal"):
+                    if exists(stale):
+                        os.remove(stale)
+                legacy_items, max_degree = _load_legacy_tree(legacy_path)
+
+        self.path = path
+        self.pager = Pager(path)
+        self.pool = pool if pool is not None else BufferPool()
+
+        # pages pinned by each thread's operation in progress, and the snapshot it reads
+        self._local = _Operation()
+
+        if self.pager.meta:
+            # tree already exists, with the key type it was created with
+            self._root: int = self.pager.meta["root"]
+            self.max_keys: int = self.pager.meta["max_keys"]
+            self.min_keys: int = self.pager.meta["min_keys"]
+            self.key_type: Optional[str] = self.pager.meta.get("key_type")
         else:
             # new tree
-            self.root = Leaf()
-            self.path = path
+            self.key_type = key_type
+            self._root = self._new_node(Leaf).page_id
             self.max_keys = max_degree - 1
             self.min_keys = max_degree // 2
 
+        if legacy_items is not None:
+            for key, value in legacy_items:
+                self.insert(key, value)
+            self.save()
+            os.remove(legacy_path)
+
+    @property
+    def root(self) -> int:
+        snapshot = self._local.snapshot
+        return self._root if snapshot is None else snapshot.root
+
+    @root.setter
+    def root(self, page_id: int):
+        self._root = page_id
+
     # --------- public ---------
     def insert(self, key, value):
-        """Inserts if key is new. Updates if already exists"""
-        leaf = self.find(key)
-        leaf.set(key, value)
-
-        # if greater than max_keys,
-        # will need to split and then insert that into the tree
-        if len(leaf.keys) > self.max_keys:
-            self.insert_from_split(*leaf.split())
-
-    def get(self, key) -> Node | None:
-        leaf = self.find(key)
-        if key in leaf.keys:
-            return leaf.get(key)
-        else:
-            return None
+        """Inserts if key is new. Updates if already exists. Returns whether the key is new"""
+        with self._operation(write=True):
+            leaf, path = self.find_with_path(key)
+            is_new = leaf.set(key, value)
+            self._mark_dirty(leaf)
+
+            # if greater than max_keys,
+            # will need to split and then insert that into the tree
+            if len(leaf.keys) > self.max_keys:
+                self.insert_from_split(leaf, path)
+            return is_new
+
+    def insert_many(self, items, merge=None) -> List[bool]:
+        """Inserts or updates (key, value) pairs, returning whether each key was new.
+        With items sorted by key, consecutive keys that fall in the same leaf are set
+        without descending from the root again.
+        If merge is given, merge(old value or None, value) is stored instead of value.
+        """
+        results = []
+        items = iter(items)
+        item = next(items, None)
+        while item is not None:
+            with self._operation(write=True):
+                leaf, path, lo, hi = self._find_with_bounds(item[0])
+                while True:
+                    key, value = item
+                    if merge is not None:
+                        value = merge(leaf.get(key), value)
+                    results.append(leaf.set(key, value))
+                    self._mark_dirty(leaf)
+                    item = next(items, None)
+
+                    if len(leaf.keys) > self.max_keys:
+                        self.insert_from_split(leaf, path)
+                        break
+                    if item is None or not _within(item[0], lo, hi):
+                        break
+        return results
 
-    def delete(self, key):
-        node = self.find(key)
-        node.delete(key)
+    def get(self, key):
+        with self._operation():
+            return self.find(key).get(key)
 
-        # rebalance *might* be implemented in the future
+    def get_many(self, keys: List) -> list:
+        """Returns the value of each of keys sorted, None for the keys not in the tree.
+        Consecutive keys that fall in the same leaf are found without descending from the
+        root again.
+        """
+        results = []
+        i = 0
+        while i < len(keys):
+            with self._operation():
+                leaf, _, lo, hi = self._find_with_bounds(keys[i])
+                while i < len(keys) and _within(keys[i], lo, hi):
+                    results.append(leaf.get(keys[i]))
+                    i += 1
+        return results
 
-    def save(self, path: str = None):
-        if path is None:
-            if self.path is not None:
-                path = self.path
+    def delete(self, key):
+        with self._operation(write=True):
+            leaf, path = self.find_with_path(key)
+            leaf.delete(key)
+            self._mark_dirty(leaf)
+            self.rebalance(leaf, path)
+
+    def clear(self):
+        """Removes every key, freeing all pages of the tree"""
+        self._free_pages(self.root)
+        with self._operation(write=True):
+            self.root = self._new_node(Leaf).page_id
+
+    def bulk_load(self, items, fill_factor: float = 1.0):
+        """Replaces the contents of the tree with (key, value) pairs sorted by key.
+        The tree is built bottom-up in one pass: leaves are filled in order, then each
+        level of internal nodes is built over the one below it.
+        Nodes are filled to fill_factor of their capacity; below 1 leaves room for later inserts.
+        """
+        if not 0 < fill_factor <= 1:
+            raise ValueError("fill_factor must be in (0, 1]")
+        self._free_pages(self.root)
+        self.root = self._build(items, fill_factor)
+
+    def compact(self, fill_factor: float = 1.0) -> Dict[str, dict]:
+        """Rebuilds the tree with packed nodes from its own leaves.
+        The old tree stays readable until the new one replaces it.
+        Returns the fill statistics from before and after.
+        """
+        if not 0 < fill_factor <= 1:
+            raise ValueError("fill_factor must be in (0, 1]")
+        before = self.fill_stats()
+        old_root = self.root
+        self.root = self._build(iter(self), fill_factor)
+        self._free_pages(old_root)
+        return {"before": before, "after": self.fill_stats()}
+
+    def snapshot(self) -> "TreeSnapshot":
+        """Returns a view of the tree as it is now, to be read inside its view() while
+        the tree keeps being written. Must be taken while no write is in progress.
+        """
+        return TreeSnapshot(self, self._root, self.pool.open_snapshot(self.pager))
+
+    def fill_stats(self) -> Dict[str, float]:
+        """Returns how many nodes the tree has and how full they are"""
+        leaves = internal = keys = children = underfull = empty = 0
+        for page_id in self._page_ids(self.root):
+            node = self._node(page_id)
+            is_root = page_id == self.root
+            if type(node) is Leaf:
+                leaves += 1
+                keys += len(node.keys)
+                empty += not node.keys
+                underfull += not is_root and len(node.keys) < self.min_keys
             else:
-                print("no save path provided")
-                return
-        pickle.dump(self, open(path, "wb"))
+                internal += 1
+                children += len(node.values)
+                underfull += not is_root and len(node.values) < self._min_children()
+
+        depth = 1
+        node = self._node(self.root)
+        while type(node) is Node:
+            node = self._node(node.values[0])
+            depth += 1
+
+        return {
+            "depth": depth,
+            "keys": keys,
+            "leaves": leaves,
+            "internal_nodes": internal,
+            "leaf_fill": keys / (leaves * self.max_keys),
+            "internal_fill": children / (internal * (self.max_keys + 1))
+            if internal
+            else 0.0,
+            "underfull_nodes": underfull,
+            "empty_leaves": empty,
+        }
+
+    def _build(self, items, fill_factor: float) -> int:
+        """builds a tree from sorted (key, value) pairs in new pages, returning its root"""
+        per_leaf = min(
+            self.max_keys, max(self.min_keys, int(self.max_keys * fill_factor))
+        )
+        # (smallest key, page id) of every node of the level being built
+        level = []
+        leaf = None
+        for key, value in items:
+            if leaf is not None and key <= leaf.keys[-1]:
+                raise ValueError("bulk_load needs keys in strictly increasing order")
+            if leaf is None or len(leaf.keys) == per_leaf:
+                leaf = self._append_leaf(leaf)
+                level.append((key, leaf.page_id))
+            leaf.keys.append(key)
+            leaf.values.append(value)
+
+        if leaf is None:
+            leaf = self._append_leaf(None)
+            level.append((None, leaf.page_id))
+        elif len(leaf.keys) < self.min_keys and leaf.prev:
+            level[-2:] = self._balance_last_leaf(leaf)
+        self.pool.unpin(self.pager, leaf.page_id)
+
+        per_node = min(
+            self.max_keys + 1,
+            max(self.min_keys, int((self.max_keys + 1) * fill_factor)),
+        )
+        while len(level) > 1:
+            next_level = []
+            for group in _even_chunks(level, per_node, self._min_children()):
+                node = self._new_pinned(Node)
+                node.keys = self._keys(key for key, _ in group[1:])
+                node.values = [page_id for _, page_id in group]
+                self.pool.unpin(self.pager, node.page_id)
+                next_level.append((group[0][0], node.page_id))
+            level = next_level
+        return level[0][1]
+
+    def save(self):
+        """Writes back the nodes changed since the last save"""
+        self.pool.flush(self.pager)
+        self.pager.meta.update(
+            root=self._root,
+            max_keys=self.max_keys,
+            min_keys=self.min_keys,
+            key_type=self.key_type,
+        )
+        self.pager.flush()
+
+    def close(self):
+        self.save()
+        self.pool.drop(self.pager)
+        self.pager.close()
 
     def display(self, node=None, _prefix="", _last=True, imm="") -> str:
         if node is None:
-            node = self.root
+            with self._operation():
+                return self.display(self._node(self.root), _prefix, _last, imm)
 
-        imm += _prefix + ("└─ " if _last else "├─ ") + str(node.keys)
+        imm += _prefix + ("└─ " if _last else "├─ ") + str(list(node.keys))
 
         _prefix += "   " if _last else "│  "
 
@@ -177,24 +451,118 @@ class BPlusTree:
             for i, child in enumerate(node.values):
                 _last = i == len(node.values) - 1
                 imm += "\n"
-                imm = self.display(child, _prefix, _last, imm)
+                imm = self.display(self._node(child), _prefix, _last, imm)
 
         return imm
 
+    def range(self, lo=None, hi=None, inclusive=True, reverse: bool = False):
+        """
+        Lazily iterates over the (key, value) pairs with keys between lo and hi,
+        in key order or in reverse key order. None leaves that end unbounded.
+        inclusive is either a bool for both ends or a (lo, hi) pair of bools.
+
+        Seeks to the first pair with one descent from the root, then follows the leaf links,
+        keeping only the current leaf pinned.
+        """
+        lo_inclusive, hi_inclusive = (
+            (inclusive, inclusive) if isinstance(inclusive, bool) else inclusive
+        )
+
+        with self._operation():
+            if not reverse:
+                leaf = self.leftmost_leaf() if lo is None else self.find(lo)
+                if lo is None:
+                    idx = 0
+                elif lo_inclusive:
+                    idx = bisect_left(leaf.keys, lo)
+                else:
+                    idx = bisect_right(leaf.keys, lo)
+            else:
+                leaf = self.rightmost_leaf() if hi is None else self.find(hi)
+                if hi is None:
+                    idx = len(leaf.keys) - 1
+                elif hi_inclusive:
+                    idx = bisect_right(leaf.keys, hi) - 1
+                else:
+                    idx = bisect_left(leaf.keys, hi) - 1
+            page_id = leaf.page_id
+
+        # pins the current leaf itself since the iteration can outlive any operation
+        while page_id:
+            curr = self.pool.fetch(self.pager, page_id, Node.deserialize)
+            try:
+                keys = curr.keys
+                if not reverse:
+                    if idx is None:
+                        idx = 0
+                    while idx < len(keys):
+                        key = keys[idx]
+                        if hi is not None and (
+                            hi < key or (key == hi and not hi_inclusive)
+                        ):
+                            return
+                        yield key, curr.values[idx]
+                        idx += 1
+                    page_id = curr.next
+                else:
+                    if idx is None:
+                        idx = len(keys) - 1
+                    while idx >= 0:
+                        key = keys[idx]
+                        if lo is not None and (
+                            key < lo or (key == lo and not lo_inclusive)
+                        ):
+                            return
+                        yield key, curr.values[idx]
+                        idx -= 1
+                    page_id = curr.prev
+                idx = None
+            finally:
+                self.pool.unpin(self.pager, curr.page_id)
+
+    def key_arrays(self, lo=None, hi=None, inclusive=True) -> Iterator[np.ndarray]:
+        """
+        Lazily yields the keys between lo and hi in order as an array per leaf, for trees
+        with a key type. Each leaf's keys are copied at once from its key array, and the
+        ends of the range are found in the first and last leaves with searchsorted.
+        inclusive is either a bool for both ends or a (lo, hi) pair of bools.
+        """
+        if self.key_type is None:
+            raise ValueError("Only trees with a key type have key arrays")
+        dtype = KEY_TYPES[self.key_type]
+        lo_inclusive, hi_inclusive = (
+            (inclusive, inclusive) if isinstance(inclusive, bool) else inclusive
+        )
+        with self._operation():
+            leaf = self.leftmost_leaf() if lo is None else self.find(lo)
+            page_id = leaf.page_id
+
+        first = True
+        while page_id:
+            curr = self.pool.fetch(self.pager, page_id, Node.deserialize)
+            try:
+                # a copy, since an array exporting its buffer cannot be resized by writes
+                keys = np.frombuffer(curr.keys, dtype=dtype).copy()
+                page_id = curr.next
+            finally:
+                self.pool.unpin(self.pager, curr.page_id)
+            start = 0
+            if first and lo is not None:
+                start = np.searchsorted(keys, lo, "left" if lo_inclusive else "right")
+            first = False
+            if hi is not None:
+                end = np.searchsorted(keys, hi, "right" if hi_inclusive else "left")
+                if end < len(keys):
+                    if end > start:
+                        yield keys[start:end]
+                    return
+            if len(keys) > start:
+                yield keys[start:]
+
     # --------- sugar support ---------
     def __iter__(self):
         """Iterates over (key, value) of each leaf node"""
-
-        curr = self.leftmost_leaf()
-
-        while True:
-            for elem in zip(curr.keys, curr.values):
-                yield elem
-
-            if curr.next != None:
-                curr = curr.next
-            else:
-                break
+        return self.range()
 
     def __setitem__(self, key, value):
         self.insert(key, value)
@@ -203,35 +571,354 @@ class BPlusTree:
         return self.get(key)
 
     # --------- internal ---------
-    def insert_from_split(self, key, values: List[Node]):
-        parent: Node = values[0].parent
+    def insert_from_split(self, node: Node, path: List[Node]):
+        """splits node and every ancestor that overflows as a result"""
+        while len(node.keys) > self.max_keys:
+            left = self._new_node(type(node))
+            key = node.split(left)
+            if type(node) is Leaf:
+                self._link_before(left, node)
+            self._mark_dirty(node)
+
+            if not path:
+                # the top node just split, so we need to create a new root
+                root = self._new_node(Node)
+                root.keys = self._keys([key])
+                root.values = [left.page_id, node.page_id]
+                self.root = root.page_id
+                return
 
-        if parent is None:
-            # the top node just split, so we need to create a new root
-            self.root = Node()
-            values[0].parent = self.root
-            values[1].parent = self.root
+            # if the the parent is now full, we need to do this whole things over again
+            parent = path.pop()
+            parent.set(key, [left.page_id, node.page_id])
+            self._mark_dirty(parent)
+            node = parent
 
-            self.root.keys = [key]
-            self.root.values = values
-            return
+    def rebalance(self, node: Node, path: List[Node]):
+        """fixes up a node that may have too few keys after a delete
+        by borrowing from a sibling or merging with one, then does the same for its parent.
+        an internal root left with a single child is replaced by that child
+        """
+        while path:
+            is_leaf = type(node) is Leaf
+            min_keys = self.min_keys if is_leaf else self._min_children() - 1
+            if len(node.keys) >= min_keys:
+                return
 
-        parent.set(key, values)
+            parent = path.pop()
+            idx = parent.values.index(node.page_id)
+            left = self._node(parent.values[idx - 1]) if idx > 0 else None
+            right = (
+                self._node(parent.values[idx + 1])
+                if idx + 1 < len(parent.values)
+                else None
+            )
+
+            if left is not None and len(left.keys) > min_keys:
+                if is_leaf:
+                    node.keys.insert(0, left.keys.pop())
+                    node.values.insert(0, left.values.pop())
+                    parent.keys[idx - 1] = node.keys[0]
+                else:
+                    node.keys.insert(0, parent.keys[idx - 1])
+                    node.values.insert(0, left.values.pop())
+                    parent.keys[idx - 1] = left.keys.pop()
+                self._mark_dirty(left)
+                self._mark_dirty(node)
+            elif right is not None and len(right.keys) > min_keys:
+                if is_leaf:
+                    node.keys.append(right.keys.pop(0))
+                    node.values.append(right.values.pop(0))
+                    parent.keys[idx] = right.keys[0]
+                else:
+                    node.keys.append(parent.keys[idx])
+                    node.values.append(right.values.pop(0))
+                    parent.keys[idx] = right.keys.pop(0)
+                self._mark_dirty(right)
+                self._mark_dirty(node)
+            elif left is not None:
+                self._merge(left, node, parent, idx - 1)
+            else:
+                self._merge(node, right, parent, idx)
+            self._mark_dirty(parent)
+            node = parent
 
-        # if the the parent is now full, we need to do this whole things over again
-        if len(parent.keys) > self.max_keys:
-            self.insert_from_split(*parent.split())
+        # node is the root
+        if type(node) is Node and len(node.values) == 1:
+            self.root = node.values[0]
+            self._free_page(node.page_id)
 
     def find(self, key) -> Leaf:
         """finds the leaf that should contain that key"""
-        node = self.root
+        return self.find_with_path(key)[0]
+
+    def find_with_path(self, key) -> Tuple[Leaf, List[Node]]:
+        """finds the leaf that should contain that key and the internal nodes above it"""
+        path = []
+        node = self._node(self.root)
         # keep traversing until you hit a leaf
         while type(node) is not Leaf:
-            node = node.get(key)
-        return node
+            path.append(node)
+            node = self._node(node.get(key))
+        return node, path
+
+    def _find_with_bounds(self, key) -> Tuple[Leaf, List[Node], Any, Any]:
+        """like find_with_path, also returning the separator keys bounding the leaf,
+        None where it is unbounded
+        """
+        path = []
+        lo = hi = None
+        node = self._node(self.root)
+        while type(node) is not Leaf:
+            path.append(node)
+            i = node.properIdx(key)
+            if i > 0:
+                lo = node.keys[i - 1]
+            if i < len(node.keys):
+                hi = node.keys[i]
+            node = self._node(node.values[i])
+        return node, path, lo, hi
 
     def leftmost_leaf(self) -> Leaf:
-        node = self.root
+        node = self._node(self.root)
         while type(node) is not Leaf:
-            node = node.values[0]
+            node = self._node(node.values[0])
         return node
+
+    def rightmost_leaf(self) -> Leaf:
+        node = self._node(self.root)
+        while type(node) is not Leaf:
+            node = self._node(node.values[-1])
+        return node
+
+    @contextmanager
+    def _operation(self, write: bool = False):
+        """keeps every node fetched inside pinned until the outermost operation ends.
+        nodes fetched inside a write operation are fetched to be changed
+        """
+        local = self._local
+        if not local.depth:
+            local.write = write
+        local.depth += 1
+        try:
+            yield
+        finally:
+            local.depth -= 1
+            if not local.depth:
+                self.pool.unpin_many(self.pager, local.pins)
+                local.pins = []
+                local.write = False
+
+    def _node(self, page_id: int) -> Node:
+        local = self._local
+        if local.write:
+            node = self.pool.fetch_for_write(self.pager, page_id, Node.deserialize)
+        else:
+            node = self.pool.fetch(self.pager, page_id, Node.deserialize)
+        if local.depth:
+            local.pins.append(page_id)
+        else:
+            self.pool.unpin(self.pager, page_id)
+        return node
+
+    def _keys(self, keys: Iterable = ()) -> Keys:
+        """the keys of a node, in an array of the tree's key type if it has one"""
+        if self.key_type is None:
+            return list(keys)
+        return array(self.key_type, keys)
+
+    def _new_node(self, cls) -> Node:
+        node = cls(self.pager.allocate())
+        node.keys = self._keys()
+        self.pool.add(self.pager, node.page_id, node)
+        if self._local.depth:
+            self._local.pins.append(node.page_id)
+        else:
+            self.pool.unpin(self.pager, node.page_id)
+        return node
+
+    def _mark_dirty(self, node: Node):
+        self.pool.mark_dirty(self.pager, node.page_id)
+
+    def _link_before(self, left: Leaf, right: Leaf):
+        """links a new leaf into the leaf chain right before another"""
+        left.prev = right.prev
+        left.next = right.page_id
+        if right.prev:
+            prev = self._node(right.prev)
+            prev.next = left.page_id
+            self._mark_dirty(prev)
+        right.prev = left.page_id
+
+    def _new_pinned(self, cls) -> Node:
+        """creates a node that stays pinned until it is unpinned explicitly"""
+        node = cls(self.pager.allocate())
+        node.keys = self._keys()
+        self.pool.add(self.pager, node.page_id, node)
+        return node
+
+    def _append_leaf(self, prev: Leaf) -> Leaf:
+        """creates a pinned leaf after prev, the last leaf, and unpins prev"""
+        leaf = self._new_pinned(Leaf)
+        if prev is not None:
+            leaf.prev = prev.page_id
+            prev.next = leaf.page_id
+            self._mark_dirty(prev)
+            self.pool.unpin(self.pager, prev.page_id)
+        return leaf
+
+    def _balance_last_leaf(self, leaf: Leaf):
+        """fixes up an underfull last leaf after a bulk load by merging it into
+        or sharing keys with the leaf before it.
+        returns the (smallest key, page id) of the resulting leaves
+        """
+        prev = self.pool.fetch(self.pager, leaf.prev, Node.deserialize)
+        keys = prev.keys + leaf.keys
+        values = prev.values + leaf.values
+
+        if len(keys) <= self.max_keys:
+            prev.keys, prev.values = keys, values
+            prev.next = 0
+            self._mark_dirty(prev)
+            self.pool.unpin(self.pager, prev.page_id)
+            leaf.keys, leaf.values = self._keys(), []
+            self.pool.discard(self.pager, leaf.page_id, Node.deserialize)
+            self.pager.free(leaf.page_id)
+            return [(prev.keys[0], prev.page_id)]
+
+        mid = len(keys) // 2
+        prev.keys, prev.values = keys[:mid], values[:mid]
+        leaf.keys, leaf.values = keys[mid:], values[mid:]
+        self._mark_dirty(prev)
+        self._mark_dirty(leaf)
+        self.pool.unpin(self.pager, prev.page_id)
+        return [(prev.keys[0], prev.page_id), (leaf.keys[0], leaf.page_id)]
+
+    def _merge(self, left: Node, right: Node, parent: Node, sep_idx: int):
+        """moves everything in right into left, its sibling before it, and frees right"""
+        if type(left) is Leaf:
+            left.next = right.next
+            if right.next:
+                after = self._node(right.next)
+                after.prev = left.page_id
+                self._mark_dirty(after)
+        else:
+            left.keys.append(parent.keys[sep_idx])
+        left.keys.extend(right.keys)
+        left.values.extend(right.values)
+        self._mark_dirty(left)
+
+        parent.keys.pop(sep_idx)
+        parent.values.pop(sep_idx + 1)
+        self._free_page(right.page_id)
+
+    def _min_children(self) -> int:
+        return max(2, self.min_keys)
+
+    def _free_page(self, page_id: int):
+        self.pool.discard(self.pager, page_id, Node.deserialize)
+        self.pager.free(page_id)
+
+    def _free_pages(self, root: int):
+        for page_id in list(self._page_ids(root)):
+            self._free_page(page_id)
+
+    def _page_ids(self, root: int):
+        stack = [root]
+        while stack:
+            page_id = stack.pop()
+            yield page_id
+            node = self._node(page_id)
+            if type(node) is Node:
+                stack.extend(node.values)
+
+
+class TreeSnapshot:
+    """A view of a BPlusTree as it was when BPlusTree.snapshot() was called.
+    Inside view(), reads of the tree from the current thread see the snapshot.
+    It must be closed once done with, so the pool can drop the nodes kept for it.
+    """
+
+    def __init__(self, tree: BPlusTree, root: int, version: int):
+        self.tree = tree
+        self.root = root
+        self.version = version
+        self.closed = False
+
+    @contextmanager
+    def view(self):
+        if self.closed:
+            raise ValueError("The snapshot is closed")
+        local = self.tree._local
+        previous = local.snapshot
+        local.snapshot = self
+        try:
+            with self.tree.pool.reading(self.tree.pager, self.version):
+                yield self.tree
+        finally:
+            local.snapshot = previous
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.tree.pool.close_snapshot(self.tree.pager, self.version)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _within(key, lo, hi) -> bool:
+    """whether key falls between the separator keys bounding a leaf"""
+    return (lo is None or lo <= key) and (hi is None or key < hi)
+
+
+def _even_chunks(items: list, per_chunk: int, min_chunk: int) -> List[list]:
+    """splits items into ceil(len / per_chunk) chunks of nearly equal size,
+    using fewer chunks if that would make them smaller than min_chunk
+    """
+    count = -(-len(items) // per_chunk)
+    if count > 1 and len(items) // count < min_chunk:
+        count = max(1, len(items) // min_chunk)
+    size, extra = divmod(len(items), count)
+    chunks = []
+    start = 0
+    for i in range(count):
+        end = start + size + (1 if i < extra else 0)
+        chunks.append(items[start:end])
+        start = end
+    return chunks
+
+
+# --------- legacy format ---------
+class _LegacyObject:
+    pass
+
+
+class _LegacyUnpickler(pickle.Unpickler):
+    def find_class(self, module, name):
+        if module == "gdb_bplustree":
+            return _LegacyObject
+        return super().find_class(module, name)
+
+
+def _load_legacy_tree(path: str):
+    """Reads a tree saved by pickling the whole object graph.
+    Unpickling does not recurse, and the leaves are then followed in a loop, so a graph
+    of any depth is read without raising the recursion limit.
+    Returns the (key, value) pairs in order and the tree's max degree.
+    """
+    with open(path, "rb") as f:
+        old_tree = _LegacyUnpickler(f).load()
+
+    node = old_tree.root
+    while hasattr(node, "values") and not hasattr(node, "next"):
+        node = node.values[0]
+
+    items = []
+    while node is not None:
+        items.extend(zip(node.keys, node.values))
+        node = node.next
+    return items, old_tree.max_keys + 1
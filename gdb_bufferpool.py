@@ -0,0 +1,353 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Set, Tuple
+import threading
+
+from gdb_pager import Pager
+
+
+DEFAULT_CAPACITY = 64 * 1024 * 1024
+
+
+class Frame:
+    __slots__ = ("obj", "pins", "dirty", "size")
+
+    def __init__(self, obj, size: int, dirty: bool = False):
+        self.obj = obj
+        self.pins = 0
+        self.dirty = dirty
+        self.size = size
+
+
+class Versions:
+    """The snapshots open on a page file and the old objects of its pages kept for them"""
+
+    __slots__ = ("version", "open", "images")
+
+    def __init__(self):
+        # version of the next snapshot
+        self.version = 0
+        # version -> number of open snapshots taken at it
+        self.open: Dict[int, int] = {}
+        # page id -> (version of the first write after the image, object before that write)
+        self.images: Dict[int, List[Tuple[int, Any]]] = {}
+
+
+class _Reading(threading.local):
+    """the snapshots a thread is reading"""
+
+    def __init__(self):
+        # page file -> version of the snapshot read from it
+        self.views: Dict[Pager, int] = {}
+        # pages this thread fetched old objects of without pinning anything
+        self.unpinned: Dict[Tuple[Pager, int], int] = {}
+
+
+class BufferPool:
+    """
+    Caches deserialized pages of any number of page files within a memory budget.
+
+    Pages are kept in least recently used order. When the budget is exceeded,
+    the least recently used pages that are not pinned are evicted,
+    writing them back to their page file first if they are dirty.
+    Cached objects must have a serialize() method returning the page payload.
+    The budget is measured in the pages taken up on disk, not in Python object size.
+
+    Snapshots give readers a consistent view of a page file while it is being written.
+    While a snapshot is open, the first write to a page after it replaces the cached object
+    with a copy (copy-on-write), keeping the old object for the snapshot's readers
+    until every snapshot that can see it is closed. Objects must have a copy() method for this.
+    Every method can be called from several threads at once.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.used = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.writes = 0
+
+        self._frames: "OrderedDict[Tuple[Pager, int], Frame]" = OrderedDict()
+        self._dirty: Dict[Pager, Set[int]] = {}
+        self._versions: Dict[Pager, Versions] = {}
+
+        self._lock = threading.RLock()
+        self._local = _Reading()
+        # threads inside reading(), and fetches of old objects not balanced by an unpin yet,
+        # so fetches and unpins skip looking at the thread's state while there are none
+        self._readers = 0
+        self._unpinned = 0
+
+    # --------- public ---------
+    def fetch(self, pager: Pager, page_id: int, load: Callable[[int, bytes], Any]):
+        """Returns the pinned object of a page, reading it with load(page_id, data) on a miss.
+        Inside reading(), returns the object the page held when that snapshot was taken.
+        """
+        with self._lock:
+            views = self._local.views if self._readers else None
+            if views and pager in views:
+                image = self._image(pager, page_id, views[pager])
+                if image is not None:
+                    # pinned anyway so the caller's unpin stays balanced
+                    frame = self._frames.get((pager, page_id))
+                    if frame is not None:
+                        frame.pins += 1
+                    else:
+                        unpinned = self._local.unpinned
+                        unpinned[(pager, page_id)] = (
+                            unpinned.get((pager, page_id), 0) + 1
+                        )
+                        self._unpinned += 1
+                    return image
+            frame = self._frames.get((pager, page_id))
+            if frame is None:
+                return self._fetch(pager, page_id, load).obj
+            self.hits += 1
+            self._frames.move_to_end((pager, page_id))
+            frame.pins += 1
+            return frame.obj
+
+    def fetch_for_write(
+        self, pager: Pager, page_id: int, load: Callable[[int, bytes], Any]
+    ):
+        """Returns the pinned object of a page about to be changed.
+        If an open snapshot still sees the cached object, it is kept for that snapshot
+        and a copy is cached and returned in its place.
+        """
+        with self._lock:
+            frame = self._fetch(pager, page_id, load)
+            if self._preserve(pager, page_id, frame.obj):
+                frame.obj = frame.obj.copy()
+            return frame.obj
+
+    def add(self, pager: Pager, page_id: int, obj):
+        """Caches the object of a newly allocated page, pinned and dirty"""
+        with self._lock:
+            frame = Frame(obj, pager.page_size, dirty=True)
+            frame.pins += 1
+            self._dirty.setdefault(pager, set()).add(page_id)
+            self._admit(pager, page_id, frame)
+
+    def pin(self, pager: Pager, page_id: int):
+        with self._lock:
+            self._frames[(pager, page_id)].pins += 1
+
+    def unpin(self, pager: Pager, page_id: int):
+        with self._lock:
+            self._unpin(pager, page_id)
+
+    def unpin_many(self, pager: Pager, page_ids: List[int]):
+        with self._lock:
+            if self._unpinned:
+                for page_id in page_ids:
+                    self._unpin(pager, page_id)
+                return
+            frames = self._frames
+            for page_id in page_ids:
+                frame = frames.get((pager, page_id))
+                if frame is not None and frame.pins > 0:
+                    frame.pins -= 1
+
+    def mark_dirty(self, pager: Pager, page_id: int):
+        with self._lock:
+            frame = self._frames[(pager, page_id)]
+            if not frame.dirty:
+                frame.dirty = True
+                self._dirty.setdefault(pager, set()).add(page_id)
+
+    def discard(
+        self, pager: Pager, page_id: int, load: Callable[[int, bytes], Any] = None
+    ):
+        """Forgets a page without writing it back, e.g. after it was freed.
+        If an open snapshot still sees the page, its object is kept for that snapshot,
+        reading it with load if it is not cached.
+        """
+        with self._lock:
+            frame = self._frames.pop((pager, page_id), None)
+            if frame is not None:
+                self.used -= frame.size
+                self._dirty.get(pager, set()).discard(page_id)
+            versions = self._versions.get(pager)
+            if versions is not None and versions.open:
+                if frame is not None:
+                    self._preserve(pager, page_id, frame.obj)
+                elif load is not None:
+                    self._preserve(pager, page_id, load(page_id, pager.read(page_id)))
+
+    def flush(self, pager: Pager):
+        """Writes back every dirty page of a page file"""
+        with self._lock:
+            for page_id in self._dirty.pop(pager, set()):
+                frame = self._frames[(pager, page_id)]
+                self._write_back(pager, page_id, frame)
+
+    def drop(self, pager: Pager):
+        """Writes back and forgets every page of a page file"""
+        with self._lock:
+            self.flush(pager)
+            for key in [key for key in self._frames if key[0] is pager]:
+                self.used -= self._frames.pop(key).size
+            self._versions.pop(pager, None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "capacity": self.capacity,
+                "used": self.used,
+                "pages": len(self._frames),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "writes": self.writes,
+                "snapshots": sum(
+                    sum(versions.open.values()) for versions in self._versions.values()
+                ),
+                "page_versions": sum(
+                    len(images)
+                    for versions in self._versions.values()
+                    for images in versions.images.values()
+                ),
+            }
+
+    # --------- snapshots ---------
+    def open_snapshot(self, pager: Pager) -> int:
+        """Starts keeping the pages of a page file as they are now, returning the snapshot's version.
+        Must not be called while a page of the file is being changed.
+        """
+        with self._lock:
+            versions = self._versions.setdefault(pager, Versions())
+            version = versions.version
+            versions.version += 1
+            versions.open[version] = versions.open.get(version, 0) + 1
+            return version
+
+    def close_snapshot(self, pager: Pager, version: int):
+        """Closes a snapshot, dropping the old page objects no open snapshot sees anymore"""
+        with self._lock:
+            versions = self._versions.get(pager)
+            if versions is None or version not in versions.open:
+                return
+            versions.open[version] -= 1
+            if not versions.open[version]:
+                del versions.open[version]
+            if not versions.open:
+                versions.images.clear()
+                return
+            # an image is only seen by snapshots older than the write that replaced it
+            oldest = min(versions.open)
+            for page_id in list(versions.images):
+                images = [
+                    image for image in versions.images[page_id] if image[0] > oldest
+                ]
+                if images:
+                    versions.images[page_id] = images
+                else:
+                    del versions.images[page_id]
+
+    @contextmanager
+    def reading(self, pager: Pager, version: int):
+        """Makes this thread's fetches from a page file return the pages of a snapshot"""
+        views = self._local.views
+        previous = views.get(pager)
+        with self._lock:
+            views[pager] = version
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                if previous is None:
+                    del views[pager]
+                else:
+                    views[pager] = previous
+                self._readers -= 1
+
+    # --------- internal ---------
+    def _unpin(self, pager: Pager, page_id: int):
+        if self._unpinned:
+            unpinned = self._local.unpinned
+            if unpinned.get((pager, page_id)):
+                # balances a fetch of an old object that pinned nothing
+                unpinned[(pager, page_id)] -= 1
+                self._unpinned -= 1
+                return
+        frame = self._frames.get((pager, page_id))
+        if frame is not None and frame.pins > 0:
+            frame.pins -= 1
+
+    def _fetch(self, pager: Pager, page_id: int, load) -> Frame:
+        frame = self._frames.get((pager, page_id))
+        if frame is not None:
+            self.hits += 1
+            self._frames.move_to_end((pager, page_id))
+            frame.pins += 1
+        else:
+            self.misses += 1
+            data = pager.read(page_id)
+            frame = Frame(load(page_id, data), self._page_bytes(pager, len(data)))
+            frame.pins += 1
+            self._admit(pager, page_id, frame)
+        return frame
+
+    def _image(self, pager: Pager, page_id: int, version: int):
+        """the object a page held at a snapshot's version, None if it is still cached"""
+        versions = self._versions.get(pager)
+        if versions is None:
+            return None
+        for written, obj in versions.images.get(page_id, ()):
+            if written > version:
+                return obj
+        return None
+
+    def _preserve(self, pager: Pager, page_id: int, obj) -> bool:
+        """keeps obj for the open snapshots that still see it, returning whether it was kept"""
+        versions = self._versions.get(pager)
+        if versions is None or not versions.open:
+            return False
+        images = versions.images.setdefault(page_id, [])
+        if images and images[-1][0] > max(versions.open):
+            # already kept since the newest snapshot, so only later writers see obj
+            return False
+        images.append((versions.version, obj))
+        return True
+
+    def _admit(self, pager: Pager, page_id: int, frame: Frame):
+        self._frames[(pager, page_id)] = frame
+        self.used += frame.size
+        if self.used > self.capacity:
+            self._evict()
+
+    def _evict(self):
+        """evicts least recently used unpinned pages until the pool fits its budget"""
+        victims = []
+        excess = self.used - self.capacity
+        for key, frame in self._frames.items():
+            if excess <= 0:
+                break
+            if not frame.pins:
+                victims.append(key)
+                excess -= frame.size
+
+        for key in victims:
+            frame = self._frames.pop(key)
+            pager, page_id = key
+            if frame.dirty:
+                self._dirty[pager].discard(page_id)
+                self._write_back(pager, page_id, frame)
+            self.used -= frame.size
+            self.evictions += 1
+
+    def _write_back(self, pager: Pager, page_id: int, frame: Frame):
+        pages = pager.write(page_id, frame.obj.serialize())
+        self.used += pages * pager.page_size - frame.size
+        frame.size = pages * pager.page_size
+        frame.dirty = False
+        self.writes += 1
+
+    @staticmethod
+    def _page_bytes(pager: Pager, length: int) -> int:
+        return max(1, -(-length // pager.page_size)) * pager.page_size
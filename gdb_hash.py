@@ -0,0 +1,382 @@
+from array import array
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Tuple
+import pickle
+import struct
+import zlib
+
+from gdb_bufferpool import BufferPool
+from gdb_pager import Pager
+
+
+# average keys per bucket above which the next bucket is split
+MAX_LOAD = 32
+# average keys per bucket below which the last bucket is merged back
+MIN_LOAD = 8
+
+_MASK = (1 << 64) - 1
+_DOUBLE = struct.Struct("<d")
+_BITS = struct.Struct("<Q")
+# level, split pointer and key count of the table
+_DIRECTORY_HEADER = struct.Struct("<IIQ")
+
+
+def key_hash(key) -> int:
+    """Returns a hash of a key that stays the same across processes, unlike hash() of strings.
+    Equal ints and floats hash the same.
+    """
+    if isinstance(key, str):
+        return zlib.crc32(key.encode("utf-8"))
+    if isinstance(key, float):
+        if key.is_integer():
+            key = int(key)
+        else:
+            (key,) = _BITS.unpack(_DOUBLE.pack(key))
+    # mixes the bits so keys following a pattern do not share their low bits
+    key = (int(key) * 0x9E3779B97F4A7C15) & _MASK
+    return key ^ (key >> 29)
+
+
+class Bucket:
+    """The keys whose hash addresses one bucket and their values, in no particular order"""
+
+    __slots__ = ("page_id", "keys", "values")
+
+    def __init__(self, page_id: int = 0, keys: list = None, values: list = None):
+        self.page_id = page_id
+        self.keys = keys if keys is not None else []
+        self.values = values if values is not None else []
+
+    def find(self, key) -> int:
+        """Returns the position of a key, -1 if it is not in the bucket"""
+        try:
+            return self.keys.index(key)
+        except ValueError:
+            return -1
+
+    def copy(self) -> "Bucket":
+        return Bucket(self.page_id, self.keys.copy(), self.values.copy())
+
+    def serialize(self) -> bytes:
+        return pickle.dumps((self.keys, self.values), protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def deserialize(page_id: int, data: bytes) -> "Bucket":
+        keys, values = pickle.loads(data)
+        return Bucket(page_id, keys, values)
+
+
+class Directory:
+    """The page id of every bucket by bucket number, with the state of the linear hashing"""
+
+    __slots__ = ("page_id", "level", "split", "count", "buckets")
+
+    def __init__(self, page_id: int = 0):
+        self.page_id = page_id
+        # buckets 0 to 2^level + split - 1 exist, and those below split were split at this level
+        self.level = 0
+        self.split = 0
+        self.count = 0
+        self.buckets = array("I")
+
+    def bucket(self, h: int) -> int:
+        """Returns the number of the bucket holding the keys of hash h"""
+        number = h & ((1 << self.level) - 1)
+        if number < self.split:
+            number = h & ((1 << (self.level + 1)) - 1)
+        return number
+
+    def copy(self) -> "Directory":
+        directory = Directory(self.page_id)
+        directory.level = self.level
+        directory.split = self.split
+        directory.count = self.count
+        directory.buckets = array("I", self.buckets)
+        return directory
+
+    def serialize(self) -> bytes:
+        return (
+            _DIRECTORY_HEADER.pack(self.level, self.split, self.count)
+            + self.buckets.tobytes()
+        )
+
+    @staticmethod
+    def deserialize(page_id: int, data: bytes) -> "Directory":
+        directory = Directory(page_id)
+        (
+            directory.level,
+            directory.split,
+            directory.count,
+        ) = _DIRECTORY_HEADER.unpack_from(data)
+        directory.buckets.frombytes(data[_DIRECTORY_HEADER.size :])
+        return directory
+
+
+class HashTable:
+    """
+    Linear hash table stored in a page file, one bucket per page, cached in a buffer pool
+    like the nodes of a BPlusTree.
+
+    A lookup reads the directory and the one bucket its key hashes to. The table grows
+    one bucket at a time: once the keys outnumber MAX_LOAD per bucket, the bucket at the
+    split pointer is split in two, so there is never a pause to rehash the whole table.
+    It shrinks the same way as keys are deleted. Keys are not kept in order.
+
+    Writes must not run concurrently with each other or with reads, which callers ensure
+    with a lock. snapshot() gives a view of the table that can be read from other threads
+    while it is written: pages changed after it was taken are copied in the pool first.
+    """
+
+    def __init__(self, path: str = None, pool: BufferPool = None):
+        self.path = path
+        self.pager = Pager(path)
+        self.pool = pool if pool is not None else BufferPool()
+
+        if "directory" in self.pager.meta:
+            self._directory: int = self.pager.meta["directory"]
+        else:
+            directory = Directory(self.pager.allocate())
+            directory.buckets.append(self._new_bucket().page_id)
+            self.pool.add(self.pager, directory.page_id, directory)
+            self.pool.unpin(self.pager, directory.page_id)
+            self._directory = directory.page_id
+
+    # --------- public ---------
+    def insert(self, key, value) -> bool:
+        """Inserts if key is new. Updates if already exists. Returns whether the key is new"""
+        with self._operation(write=True) as fetch:
+            directory = fetch(self._directory, Directory.deserialize)
+            bucket = self._bucket(fetch, directory, key)
+            i = bucket.find(key)
+            self._mark_dirty(bucket)
+            if i >= 0:
+                bucket.values[i] = value
+                return False
+            bucket.keys.append(key)
+            bucket.values.append(value)
+            directory.count += 1
+            self._mark_dirty(directory)
+            if directory.count > MAX_LOAD * len(directory.buckets):
+                self._split(fetch, directory)
+            return True
+
+    def insert_many(self, items: Iterable[Tuple[Any, Any]], merge=None) -> List[bool]:
+        """Inserts or updates (key, value) pairs, returning whether each key was new.
+        If merge is given, merge(old value or None, value) is stored instead of value.
+        """
+        results = []
+        for key, value in items:
+            if merge is not None:
+                value = merge(self.get(key), value)
+            results.append(self.insert(key, value))
+        return results
+
+    def get(self, key):
+        with self._operation() as fetch:
+            directory = fetch(self._directory, Directory.deserialize)
+            bucket = self._bucket(fetch, directory, key)
+            i = bucket.find(key)
+            return bucket.values[i] if i >= 0 else None
+
+    def delete(self, key):
+        with self._operation(write=True) as fetch:
+            directory = fetch(self._directory, Directory.deserialize)
+            bucket = self._bucket(fetch, directory, key)
+            i = bucket.find(key)
+            if i < 0:
+                raise ValueError(f"{key!r} is not in the table")
+            del bucket.keys[i]
+            del bucket.values[i]
+            directory.count -= 1
+            self._mark_dirty(bucket)
+            self._mark_dirty(directory)
+            if len(directory.buckets) > 1 and directory.count < MIN_LOAD * len(
+                directory.buckets
+            ):
+                self._merge(fetch, directory)
+
+    def clear(self):
+        """Removes every key, freeing all bucket pages"""
+        self.bulk_load(())
+
+    def bulk_load(self, items: Iterable[Tuple[Any, Any]]):
+        """Replaces the contents of the table with (key, value) pairs of distinct keys.
+        The table is sized for them up front, so every bucket is written once.
+        """
+        items = list(items)
+        level = 0
+        while (1 << level) * MAX_LOAD // 2 < len(items):
+            level += 1
+        groups: List[Tuple[list, list]] = [([], []) for _ in range(1 << level)]
+        mask = (1 << level) - 1
+        for key, value in items:
+            keys, values = groups[key_hash(key) & mask]
+            keys.append(key)
+            values.append(value)
+
+        with self._operation(write=True) as fetch:
+            directory = fetch(self._directory, Directory.deserialize)
+            for page_id in directory.buckets:
+                self._free_page(page_id)
+            directory.level, directory.split, directory.count = level, 0, len(items)
+            directory.buckets = array("I")
+            for keys, values in groups:
+                bucket = self._new_bucket(keys, values)
+                directory.buckets.append(bucket.page_id)
+            self._mark_dirty(directory)
+
+    def compact(self) -> Dict[str, dict]:
+        """Rewrites the table sized for its keys, returning the fill statistics
+        from before and after
+        """
+        before = self.fill_stats()
+        self.bulk_load(list(self))
+        return {"before": before, "after": self.fill_stats()}
+
+    def fill_stats(self) -> Dict[str, float]:
+        """Returns how many buckets the table has and how full they are"""
+        with self._operation() as fetch:
+            directory = fetch(self._directory, Directory.deserialize)
+            sizes = [
+                len(fetch(page_id, Bucket.deserialize).keys)
+                for page_id in directory.buckets
+            ]
+        return {
+            "keys": sum(sizes),
+            "buckets": len(sizes),
+            "load": sum(sizes) / len(sizes),
+            "largest_bucket": max(sizes),
+            "empty_buckets": sizes.count(0),
+        }
+
+    def snapshot(self) -> "HashSnapshot":
+        """Returns a view of the table as it is now, to be read inside its view() while
+        the table keeps being written. Must be taken while no write is in progress.
+        """
+        return HashSnapshot(self, self.pool.open_snapshot(self.pager))
+
+    def __iter__(self):
+        """Iterates over the (key, value) pairs of every bucket in bucket order,
+        keeping only the current bucket pinned
+        """
+        with self._operation() as fetch:
+            buckets = list(fetch(self._directory, Directory.deserialize).buckets)
+        for page_id in buckets:
+            with self._operation() as fetch:
+                bucket = fetch(page_id, Bucket.deserialize)
+                items = list(zip(bucket.keys, bucket.values))
+            yield from items
+
+    def __len__(self) -> int:
+        with self._operation() as fetch:
+            return fetch(self._directory, Directory.deserialize).count
+
+    def save(self):
+        """Writes back the pages changed since the last save"""
+        self.pool.flush(self.pager)
+        self.pager.meta["directory"] = self._directory
+        self.pager.flush()
+
+    def close(self):
+        self.save()
+        self.pool.drop(self.pager)
+        self.pager.close()
+
+    # --------- internal ---------
+    @contextmanager
+    def _operation(self, write: bool = False):
+        """yields a function fetching pages that stay pinned until the operation ends.
+        pages fetched inside a write operation are fetched to be changed
+        """
+        pins = []
+        get = self.pool.fetch_for_write if write else self.pool.fetch
+
+        def fetch(page_id: int, load):
+            obj = get(self.pager, page_id, load)
+            pins.append(page_id)
+            return obj
+
+        try:
+            yield fetch
+        finally:
+            self.pool.unpin_many(self.pager, pins)
+
+    def _bucket(self, fetch, directory: Directory, key) -> Bucket:
+        page_id = directory.buckets[directory.bucket(key_hash(key))]
+        return fetch(page_id, Bucket.deserialize)
+
+    def _split(self, fetch, directory: Directory):
+        """splits the bucket at the split pointer between itself and a new last bucket"""
+        bucket = fetch(directory.buckets[directory.split], Bucket.deserialize)
+        high_bit = 1 << directory.level
+        stay = ([], [])
+        move = ([], [])
+        for key, value in zip(bucket.keys, bucket.values):
+            keys, values = move if key_hash(key) & high_bit else stay
+            keys.append(key)
+            values.append(value)
+        bucket.keys, bucket.values = stay
+        self._mark_dirty(bucket)
+        directory.buckets.append(self._new_bucket(*move).page_id)
+
+        directory.split += 1
+        if directory.split == high_bit:
+            directory.level += 1
+            directory.split = 0
+
+    def _merge(self, fetch, directory: Directory):
+        """merges the last bucket back into the bucket it was split from"""
+        if directory.split == 0:
+            directory.level -= 1
+            directory.split = 1 << directory.level
+        directory.split -= 1
+        last = fetch(directory.buckets[-1], Bucket.deserialize)
+        bucket = fetch(directory.buckets[directory.split], Bucket.deserialize)
+        bucket.keys.extend(last.keys)
+        bucket.values.extend(last.values)
+        self._mark_dirty(bucket)
+        directory.buckets.pop()
+        self._free_page(last.page_id)
+
+    def _new_bucket(self, keys: list = None, values: list = None) -> Bucket:
+        bucket = Bucket(self.pager.allocate(), keys, values)
+        self.pool.add(self.pager, bucket.page_id, bucket)
+        self.pool.unpin(self.pager, bucket.page_id)
+        return bucket
+
+    def _mark_dirty(self, page):
+        self.pool.mark_dirty(self.pager, page.page_id)
+
+    def _free_page(self, page_id: int):
+        self.pool.discard(self.pager, page_id, Bucket.deserialize)
+        self.pager.free(page_id)
+
+
+class HashSnapshot:
+    """A view of a HashTable as it was when HashTable.snapshot() was called.
+    Inside view(), reads of the table from the current thread see the snapshot.
+    It must be closed once done with, so the pool can drop the pages kept for it.
+    """
+
+    def __init__(self, table: HashTable, version: int):
+        self.table = table
+        self.version = version
+        self.closed = False
+
+    @contextmanager
+    def view(self):
+        if self.closed:
+            raise ValueError("The snapshot is closed")
+        with self.table.pool.reading(self.table.pager, self.version):
+            yield self.table
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.table.pool.close_snapshot(self.table.pager, self.version)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,320 @@
+from enum import IntEnum
+from os.path import exists
+from typing import Dict, List
+import io
+import os
+import pickle
+import struct
+import threading
+import zlib
+
+
+PAGE_SIZE = 4096
+MAGIC = b"GDBPAGE1"
+JOURNAL_MAGIC = b"GDBJRNL1"
+# bytes of page images held in memory between flushes before they are moved to the journal
+DIRTY_LIMIT = 4 * 1024 * 1024
+
+# magic, page size, page count, head of the free list, length of the metadata blob
+_FILE_HEADER = struct.Struct("<8sIIII")
+# page type, next page of the chain, length of the payload stored in this page
+_PAGE_HEADER = struct.Struct("<BII")
+# magic, page size, number of pages in the journal
+_JOURNAL_HEADER = struct.Struct("<8sII")
+_JOURNAL_PAGE = struct.Struct("<I")
+_JOURNAL_CHECKSUM = struct.Struct("<I")
+
+
+class PageType(IntEnum):
+    FREE = 0
+    DATA = 1
+    OVERFLOW = 2
+
+
+class Pager:
+    """
+    Stores variable length payloads in a file of fixed-size pages.
+
+    Page 0 is the header page, holding the page size, the page count,
+    the head of the free list and a small pickled metadata dict for the owner of the file.
+    Every other page starts with a small header of its own.
+    A payload too large for one page continues on a chain of overflow pages,
+    so page ids stay stable no matter how much a payload grows or shrinks.
+    Page id 0 doubles as the null pointer since the header page is never handed out.
+    If no path is given, the pages are kept in memory.
+
+    Writes are held until flush(), which first copies every changed page
+    to a journal file and only then writes them in place,
+    so a crash mid-flush leaves the file as it was either before or after the flush.
+    Once more than dirty_limit bytes of changed pages are held in memory, they are moved
+    to the end of the journal, which only becomes valid once flush() completes it,
+    so memory stays bounded however much is written between flushes.
+    Its methods can be called from several threads at once.
+    """
+
+    def __init__(
+        self,
+        path: str = None,
+        page_size: int = PAGE_SIZE,
+        dirty_limit: int = DIRTY_LIMIT,
+    ):
+        self.path = path
+        self.page_size = page_size
+        self.dirty_limit = dirty_limit
+        self.page_count = 1
+        self.free_head = 0
+        self.meta: dict = {}
+
+        # page ids of the overflow chain starting at each known data page
+        self._chains: Dict[int, List[int]] = {}
+        # images of the pages written since the last flush
+        self._dirty: Dict[int, bytes] = {}
+        # journal offsets of the images of the pages moved out of memory since the last flush
+        self._spilled: Dict[int, int] = {}
+        self._journal = None
+        # number of pages in the journal and their running checksum
+        self._journal_count = 0
+        self._journal_checksum = 0
+        # reads seek the shared file object
+        self._lock = threading.RLock()
+
+        if path is not None:
+            self._recover_journal()
+        if path is not None and Pager.is_page_file(path):
+            self.file = open(path, "r+b")
+            self._read_header()
+        else:
+            self.file = open(path, "w+b") if path is not None else io.BytesIO()
+            self.flush()
+
+    @staticmethod
+    def is_page_file(path: str) -> bool:
+        if not exists(path):
+            return False
+        with open(path, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+
+    # --------- public ---------
+    def allocate(self) -> int:
+        """Returns the id of an unused page, reusing freed pages first"""
+        with self._lock:
+            if self.free_head:
+                page_id = self.free_head
+                _, self.free_head, _ = self._read_page_header(page_id)
+            else:
+                page_id = self.page_count
+                self.page_count += 1
+            self._chains[page_id] = [page_id]
+            return page_id
+
+    def free(self, page_id: int):
+        """Puts a page and its overflow chain on the free list"""
+        with self._lock:
+            for pid in self._chain(page_id):
+                self._write_page(pid, PageType.FREE, self.free_head, b"")
+                self.free_head = pid
+                self._chains.pop(pid, None)
+
+    def read(self, page_id: int) -> bytes:
+        with self._lock:
+            chunks = []
+            chain = []
+            pid = page_id
+            while pid:
+                raw = self._read_page(pid)
+                _, next_pid, length = _PAGE_HEADER.unpack_from(raw)
+                chunks.append(raw[_PAGE_HEADER.size : _PAGE_HEADER.size + length])
+                chain.append(pid)
+                pid = next_pid
+            self._chains[page_id] = chain
+            return b"".join(chunks)
+
+    def write(self, page_id: int, payload: bytes) -> int:
+        """Writes payload starting at page_id, growing or shrinking its overflow chain.
+        Returns the number of pages used.
+        """
+        with self._lock:
+            capacity = self.page_size - _PAGE_HEADER.size
+            pieces = [
+                payload[i : i + capacity] for i in range(0, len(payload), capacity)
+            ]
+            if not pieces:
+                pieces = [b""]
+
+            chain = self._chain(page_id)
+            while len(chain) < len(pieces):
+                chain.append(self.allocate())
+                self._chains.pop(chain[-1], None)
+            if len(chain) > len(pieces):
+                for pid in chain[len(pieces) :]:
+                    self._write_page(pid, PageType.FREE, self.free_head, b"")
+                    self.free_head = pid
+                del chain[len(pieces) :]
+
+            for i, (pid, piece) in enumerate(zip(chain, pieces)):
+                page_type = PageType.DATA if i == 0 else PageType.OVERFLOW
+                next_pid = chain[i + 1] if i + 1 < len(chain) else 0
+                self._write_page(pid, page_type, next_pid, piece)
+
+            self._chains[page_id] = chain
+            return len(chain)
+
+    def flush(self):
+        """Writes the header page and every page changed since the last flush"""
+        with self._lock:
+            meta = pickle.dumps(self.meta, protocol=pickle.HIGHEST_PROTOCOL)
+            if _FILE_HEADER.size + len(meta) > self.page_size:
+                raise ValueError("Page file metadata does not fit in the header page")
+            header = _FILE_HEADER.pack(
+                MAGIC, self.page_size, self.page_count, self.free_head, len(meta)
+            )
+            self._dirty[0] = (header + meta).ljust(self.page_size, b"\0")
+
+            if self.path is not None:
+                self._write_journal()
+            for page_id in sorted(self._dirty.keys() | self._spilled.keys()):
+                raw = self._read_page(page_id)
+                self.file.seek(page_id * self.page_size)
+                self.file.write(raw)
+            self.file.flush()
+            if self.path is not None:
+                os.fsync(self.file.fileno())
+                self._journal.close()
+                os.remove(self._journal_path())
+            self._dirty.clear()
+            self._spilled.clear()
+            self._journal = None
+            self._journal_count = self._journal_checksum = 0
+
+    @property
+    def buffered_bytes(self) -> int:
+        """Bytes of changed page images held in memory until the next flush"""
+        return len(self._dirty) * self.page_size
+
+    def close(self):
+        with self._lock:
+            self.flush()
+            self.file.close()
+
+    # --------- internal ---------
+    def _read_header(self):
+        self.file.seek(0)
+        raw = self.file.read(_FILE_HEADER.size)
+        (
+            magic,
+            self.page_size,
+            self.page_count,
+            self.free_head,
+            meta_len,
+        ) = _FILE_HEADER.unpack(raw)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a GatorDB page file")
+        self.meta = pickle.loads(self.file.read(meta_len)) if meta_len else {}
+
+    def _read_page(self, page_id: int) -> bytes:
+        raw = self._dirty.get(page_id)
+        if raw is not None:
+            return raw
+        offset = self._spilled.get(page_id)
+        if offset is not None:
+            self._journal.seek(offset)
+            return self._journal.read(self.page_size)
+        self.file.seek(page_id * self.page_size)
+        return self.file.read(self.page_size)
+
+    def _read_page_header(self, page_id: int):
+        return _PAGE_HEADER.unpack_from(self._read_page(page_id))
+
+    def _write_page(self, page_id: int, page_type: PageType, next_pid: int, piece):
+        self._dirty[page_id] = (
+            _PAGE_HEADER.pack(page_type, next_pid, len(piece)) + piece
+        ).ljust(self.page_size, b"\0")
+        if (
+            self.path is not None
+            and len(self._dirty) * self.page_size > self.dirty_limit
+        ):
+            self._spill()
+
+    def _journal_path(self) -> str:
+        return self.path + ".journal"
+
+    def _spill(self):
+        """moves the pages held in memory to the end of the journal"""
+        if self._journal is None:
+            self._journal = open(self._journal_path(), "w+b")
+            # the page count stays 0, leaving the journal invalid, until it is completed
+            self._journal.write(_JOURNAL_HEADER.pack(JOURNAL_MAGIC, self.page_size, 0))
+        journal = self._journal
+        journal.seek(0, os.SEEK_END)
+        for page_id, raw in self._dirty.items():
+            entry = _JOURNAL_PAGE.pack(page_id) + raw
+            self._journal_checksum = zlib.crc32(entry, self._journal_checksum)
+            # a page moved again is recovered from its last copy
+            self._spilled[page_id] = journal.tell() + _JOURNAL_PAGE.size
+            journal.write(entry)
+        self._journal_count += len(self._dirty)
+        self._dirty.clear()
+
+    def _write_journal(self):
+        """copies the pages about to be written in place to the journal, completes it
+        and syncs it
+        """
+        self._spill()
+        journal = self._journal
+        journal.write(_JOURNAL_CHECKSUM.pack(self._journal_checksum))
+        journal.seek(0)
+        journal.write(
+            _JOURNAL_HEADER.pack(JOURNAL_MAGIC, self.page_size, self._journal_count)
+        )
+        journal.flush()
+        os.fsync(journal.fileno())
+
+    def _recover_journal(self):
+        """finishes a flush interrupted by a crash, or drops a journal that was never completed"""
+        if not exists(self._journal_path()):
+            return
+        with open(self._journal_path(), "rb") as journal:
+            data = journal.read()
+
+        pages = _parse_journal(data)
+        if pages:
+            with open(self.path, "r+b" if exists(self.path) else "w+b") as f:
+                for offset, raw in pages:
+                    f.seek(offset)
+                    f.write(raw)
+                f.flush()
+                os.fsync(f.fileno())
+        os.remove(self._journal_path())
+
+    def _chain(self, page_id: int) -> List[int]:
+        chain = self._chains.get(page_id)
+        if chain is None:
+            chain = [page_id]
+            page_type, next_pid, _ = self._read_page_header(page_id)
+            while page_type != PageType.FREE and next_pid:
+                chain.append(next_pid)
+                page_type, next_pid, _ = self._read_page_header(next_pid)
+            self._chains[page_id] = chain
+        return chain
+
+
+def _parse_journal(data: bytes) -> List[tuple]:
+    """Returns the (file offset, page) of each page of a complete journal, or [] if it is torn"""
+    end = len(data) - _JOURNAL_CHECKSUM.size
+    if end < _JOURNAL_HEADER.size:
+        return []
+    magic, page_size, count = _JOURNAL_HEADER.unpack_from(data)
+    body = data[_JOURNAL_HEADER.size : end]
+    entry_size = _JOURNAL_PAGE.size + page_size
+    if magic != JOURNAL_MAGIC or len(body) != count * entry_size:
+        return []
+    if zlib.crc32(body) != _JOURNAL_CHECKSUM.unpack_from(data, end)[0]:
+        return []
+
+    pages = []
+    for start in range(0, len(body), entry_size):
+        (page_id,) = _JOURNAL_PAGE.unpack_from(body, start)
+        pages.append(
+            (page_id * page_size, body[start + _JOURNAL_PAGE.size : start + entry_size])
+        )
+    return pages
@@ -0,0 +1,435 @@
+from functools import reduce
+from typing import Dict, Iterable, List, Optional
+import struct
+
+import numpy as np
+
+from gdb_bufferpool import BufferPool
+from gdb_pager import Pager
+
+
+# containers with more pks than this are stored as bitmaps
+ARRAY_LIMIT = 4096
+BITMAP_BYTES = 1 << 13
+# containers larger than this are stored in their own chunk page instead of the tree value
+CHUNK_BYTES = 512
+
+ARRAY = 0
+BITMAP = 1
+CHUNK = 2
+
+# number of containers
+_HEADER = struct.Struct("<I")
+# high bits of the pks, kind, number of pks
+_ENTRY = struct.Struct("<qBI")
+_PAGE_ID = struct.Struct("<I")
+
+# number of set bits in each byte value
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.int32)
+
+
+# --------- containers ---------
+# A container holds the low 16 bits of the pks sharing the same high bits,
+# either as a sorted uint16 array or as a bitmap of 2^16 bits.
+def _is_bitmap(container: np.ndarray) -> bool:
+    return container.dtype == np.uint8
+
+
+def _lows(container: np.ndarray) -> np.ndarray:
+    if _is_bitmap(container):
+        bits = np.unpackbits(container, bitorder="little")
+        return np.flatnonzero(bits).astype(np.uint16)
+    return container
+
+
+def _bitmap(container: np.ndarray) -> np.ndarray:
+    if _is_bitmap(container):
+        return container
+    bits = np.zeros(1 << 16, dtype=bool)
+    bits[container] = True
+    return np.packbits(bits, bitorder="little")
+
+
+def _cardinality(container: np.ndarray) -> int:
+    if _is_bitmap(container):
+        return int(_POPCOUNT[container].sum())
+    return container.size
+
+
+def _compress(lows: np.ndarray) -> np.ndarray:
+    """picks the smaller representation of sorted unique low bits"""
+    if lows.size > ARRAY_LIMIT:
+        return _bitmap(lows)
+    return lows.astype(np.uint16)
+
+
+def _payload(container: np.ndarray) -> bytes:
+    return container.tobytes()
+
+
+def _from_payload(kind: int, payload: bytes) -> np.ndarray:
+    if kind == BITMAP:
+        return np.frombuffer(payload, dtype=np.uint8).copy()
+    return np.frombuffer(payload, dtype=np.uint16).copy()
+
+
+class PostingList:
+    """
+    Sorted set of pks, split into containers by their high bits like a roaring bitmap.
+    A container holds up to 4096 pks as a sorted array of their low 16 bits,
+    and switches to a bitmap of 2^16 bits once it has more.
+    Supports int32 and int64 pks.
+    """
+
+    __slots__ = ("containers",)
+
+    def __init__(self, containers: Dict[int, np.ndarray] = None):
+        self.containers: Dict[int, np.ndarray] = containers or {}
+
+    @staticmethod
+    def from_array(pks: Iterable[int]) -> "PostingList":
+        pks = np.unique(np.asarray(pks, dtype=np.int64))
+        keys = pks >> 16
+        lows = (pks & 0xFFFF).astype(np.uint16)
+        containers = {}
+        bounds = np.concatenate(([0], np.flatnonzero(np.diff(keys)) + 1, [pks.size]))
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            if start < end:
+                containers[int(keys[start])] = _compress(lows[start:end])
+        return PostingList(containers)
+
+    def add(self, pk: int) -> bool:
+        """Returns whether the pk was added"""
+        key, low = pk >> 16, pk & 0xFFFF
+        container = self.containers.get(key)
+        if container is None:
+            self.containers[key] = np.array([low], dtype=np.uint16)
+            return True
+        added, self.containers[key] = _container_add(container, low)
+        return added
+
+    def remove(self, pk: int) -> bool:
+        """Returns whether the pk was removed"""
+        key, low = pk >> 16, pk & 0xFFFF
+        container = self.containers.get(key)
+        if container is None:
+            return False
+        removed, container = _container_remove(container, low)
+        if container.size == 0:
+            del self.containers[key]
+        else:
+            self.containers[key] = container
+        return removed
+
+    def __contains__(self, pk: int) -> bool:
+        container = self.containers.get(pk >> 16)
+        return container is not None and _container_has(container, pk & 0xFFFF)
+
+    def __len__(self) -> int:
+        return sum(_cardinality(c) for c in self.containers.values())
+
+    def to_array(self) -> np.ndarray:
+        """Returns the pks in order, as int32 if they fit"""
+        if not self.containers:
+            return np.array([], dtype=np.int32)
+        pks = np.concatenate(
+            [
+                (np.int64(key) << 16) | _lows(self.containers[key]).astype(np.int64)
+                for key in sorted(self.containers)
+            ]
+        )
+        if pks[0] >= np.iinfo(np.int32).min and pks[-1] <= np.iinfo(np.int32).max:
+            return pks.astype(np.int32)
+        return pks
+
+    def intersect(self, other: "PostingList") -> "PostingList":
+        containers = {}
+        for key in self.containers.keys() & other.containers.keys():
+            a, b = self.containers[key], other.containers[key]
+            if _is_bitmap(a) and _is_bitmap(b):
+                lows = _lows(a & b)
+            elif _is_bitmap(a) or _is_bitmap(b):
+                array, bitmap = (b, a) if _is_bitmap(a) else (a, b)
+                lows = array[np.unpackbits(bitmap, bitorder="little")[array] == 1]
+            else:
+                lows = np.intersect1d(a, b, assume_unique=True)
+            if lows.size:
+                containers[key] = _compress(lows)
+        return PostingList(containers)
+
+    def union(self, other: "PostingList") -> "PostingList":
+        containers = dict(self.containers)
+        for key, b in other.containers.items():
+            a = containers.get(key)
+            if a is None:
+                containers[key] = b
+            elif _is_bitmap(a) or _is_bitmap(b):
+                containers[key] = _compress(_lows(_bitmap(a) | _bitmap(b)))
+            else:
+                containers[key] = _compress(np.union1d(a, b))
+        return PostingList(containers)
+
+    @staticmethod
+    def union_all(lists: Iterable["PostingList"]) -> "PostingList":
+        return reduce(PostingList.union, lists, PostingList())
+
+
+def _container_has(container: np.ndarray, low: int) -> bool:
+    if _is_bitmap(container):
+        return bool(container[low >> 3] & (1 << (low & 7)))
+    idx = np.searchsorted(container, low)
+    return idx < container.size and container[idx] == low
+
+
+def _container_add(container: np.ndarray, low: int):
+    if _is_bitmap(container):
+        if _container_has(container, low):
+            return False, container
+        container[low >> 3] |= 1 << (low & 7)
+        return True, container
+    idx = int(np.searchsorted(container, low))
+    if idx < container.size and container[idx] == low:
+        return False, container
+    container = np.concatenate(
+        (container[:idx], np.array([low], dtype=np.uint16), container[idx:])
+    )
+    if container.size > ARRAY_LIMIT:
+        container = _bitmap(container)
+    return True, container
+
+
+def _container_remove(container: np.ndarray, low: int):
+    if _is_bitmap(container):
+        if not _container_has(container, low):
+            return False, container
+        container[low >> 3] &= ~(1 << (low & 7)) & 0xFF
+        if _cardinality(container) <= ARRAY_LIMIT // 2:
+            container = _lows(container)
+        return True, container
+    idx = int(np.searchsorted(container, low))
+    if idx == container.size or container[idx] != low:
+        return False, container
+    return True, np.concatenate((container[:idx], container[idx + 1 :]))
+
+
+def _container_merge(container: np.ndarray, lows: np.ndarray) -> np.ndarray:
+    """adds sorted unique low bits to a container"""
+    if _is_bitmap(container):
+        return container | _bitmap(lows)
+    return _compress(np.union1d(container, lows))
+
+
+# --------- storage ---------
+class Chunk:
+    """A container stored in its own page"""
+
+    __slots__ = ("container",)
+
+    def __init__(self, container: np.ndarray):
+        self.container = container
+
+    def serialize(self) -> bytes:
+        kind = BITMAP if _is_bitmap(self.container) else ARRAY
+        return bytes([kind]) + _payload(self.container)
+
+    def copy(self) -> "Chunk":
+        return Chunk(self.container.copy())
+
+    @staticmethod
+    def deserialize(page_id: int, data: bytes) -> "Chunk":
+        return Chunk(_from_payload(data[0], data[1:]))
+
+
+class PostingStore:
+    """
+    Stores posting lists as tree values.
+
+    A value is a small directory of the list's containers: small containers are stored inline,
+    while containers larger than CHUNK_BYTES live in a chunk page of the tree's page file,
+    cached by the buffer pool like tree nodes.
+    Adding or removing a pk only rewrites the directory and the one container it falls in,
+    so appending to a long list costs the same as appending to a short one.
+    """
+
+    def __init__(self, pager: Pager, pool: BufferPool):
+        self.pager = pager
+        self.pool = pool
+
+    # --------- public ---------
+    def load(self, value: bytes) -> PostingList:
+        containers = {}
+        for key, kind, _, payload in _entries(value):
+            if kind == CHUNK:
+                containers[key] = self._chunk(payload).container.copy()
+            else:
+                containers[key] = _from_payload(kind, payload)
+        return PostingList(containers)
+
+    def count(self, value: bytes) -> int:
+        return sum(count for _, _, count, _ in _entries(value))
+
+    def store(self, postings: PostingList) -> bytes:
+        """Returns the tree value for a new posting list"""
+        return _value(
+            [
+                self._entry(key, c, _cardinality(c))
+                for key, c in sorted(postings.containers.items())
+            ]
+        )
+
+    def add(self, value: Optional[bytes], pk: int) -> (bytes, bool):
+        """Returns the tree value with pk added and whether the value is new"""
+        return self._update(value, pk, _container_add, 1)
+
+    def add_many(self, value: Optional[bytes], pks: Iterable[int]) -> (bytes, bool):
+        """Returns the tree value with every pk added and whether the value is new.
+        Each container is rewritten once for all of its pks.
+        """
+        pks = np.unique(np.asarray(pks, dtype=np.int64))
+        keys = pks >> 16
+        lows = (pks & 0xFFFF).astype(np.uint16)
+        bounds = np.concatenate(([0], np.flatnonzero(np.diff(keys)) + 1, [pks.size]))
+
+        entries = _entries(value) if value is not None else []
+        positions = {entry[0]: i for i, entry in enumerate(entries)}
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            if start == end:
+                continue
+            key = int(keys[start])
+            i = positions.get(key)
+            if i is None:
+                container = _compress(lows[start:end])
+                entries.append(self._entry(key, container, _cardinality(container)))
+                continue
+
+            _, kind, _, payload = entries[i]
+            if kind == CHUNK:
+                chunk = self._chunk(payload, pin=True, write=True)
+                try:
+                    chunk.container = _container_merge(chunk.container, lows[start:end])
+                    self.pool.mark_dirty(self.pager, payload)
+                finally:
+                    self.pool.unpin(self.pager, payload)
+                container = chunk.container
+            else:
+                container = _container_merge(
+                    _from_payload(kind, payload), lows[start:end]
+                )
+            entries[i] = self._entry(
+                key,
+                container,
+                _cardinality(container),
+                payload if kind == CHUNK else None,
+            )
+        entries.sort(key=lambda entry: entry[0])
+        return _value(entries), value is None
+
+    def remove(self, value: bytes, pk: int) -> Optional[bytes]:
+        """Returns the tree value with pk removed, or None once the list is empty"""
+        value, _ = self._update(value, pk, _container_remove, -1)
+        return value
+
+    def free(self, value: bytes):
+        """Frees the chunk pages of a posting list"""
+        for _, kind, _, payload in _entries(value):
+            if kind == CHUNK:
+                self._free_chunk(payload)
+
+    # --------- internal ---------
+    def _update(
+        self, value: Optional[bytes], pk: int, change, delta: int
+    ) -> (bytes, bool):
+        key, low = pk >> 16, pk & 0xFFFF
+        entries = _entries(value) if value is not None else []
+        for i, (entry_key, kind, count, payload) in enumerate(entries):
+            if entry_key != key:
+                continue
+            if kind == CHUNK:
+                chunk = self._chunk(payload, pin=True, write=True)
+                try:
+                    changed, chunk.container = change(chunk.container, low)
+                    if changed:
+                        self.pool.mark_dirty(self.pager, payload)
+                finally:
+                    self.pool.unpin(self.pager, payload)
+                container = chunk.container
+            else:
+                changed, container = change(_from_payload(kind, payload), low)
+            if not changed:
+                return value, False
+            if container.size == 0:
+                if kind == CHUNK:
+                    self._free_chunk(payload)
+                del entries[i]
+            else:
+                entries[i] = self._entry(
+                    key, container, count + delta, payload if kind == CHUNK else None
+                )
+            return (_value(entries) if entries else None), False
+
+        # the first pk of a new container
+        changed, container = change(np.array([], dtype=np.uint16), low)
+        if not changed:
+            return value, False
+        entries.append(self._entry(key, container, 1))
+        entries.sort(key=lambda entry: entry[0])
+        return _value(entries), value is None
+
+    def _entry(self, key: int, container: np.ndarray, count: int, page_id: int = None):
+        """builds a directory entry, moving the container in or out of a chunk page by its size"""
+        size = container.nbytes
+        if page_id is not None:
+            if size >= CHUNK_BYTES // 2:
+                # the container was already written to its chunk in place
+                return key, CHUNK, count, page_id
+            self._free_chunk(page_id)
+        if size > CHUNK_BYTES:
+            page_id = self.pager.allocate()
+            self.pool.add(self.pager, page_id, Chunk(container))
+            self.pool.unpin(self.pager, page_id)
+            return key, CHUNK, count, page_id
+        return (
+            key,
+            BITMAP if _is_bitmap(container) else ARRAY,
+            count,
+            _payload(container),
+        )
+
+    def _chunk(self, page_id: int, pin: bool = False, write: bool = False) -> Chunk:
+        """fetches a chunk, with write=True to change it"""
+        fetch = self.pool.fetch_for_write if write else self.pool.fetch
+        chunk = fetch(self.pager, page_id, Chunk.deserialize)
+        if not pin:
+            self.pool.unpin(self.pager, page_id)
+        return chunk
+
+    def _free_chunk(self, page_id: int):
+        self.pool.discard(self.pager, page_id, Chunk.deserialize)
+        self.pager.free(page_id)
+
+
+def _entries(value: bytes) -> List[list]:
+    """parses a directory into [key, kind, count, payload or chunk page id] entries"""
+    (n,) = _HEADER.unpack_from(value)
+    offset = _HEADER.size
+    entries = []
+    for _ in range(n):
+        key, kind, count = _ENTRY.unpack_from(value, offset)
+        offset += _ENTRY.size
+        if kind == CHUNK:
+            (payload,) = _PAGE_ID.unpack_from(value, offset)
+            offset += _PAGE_ID.size
+        else:
+            size = BITMAP_BYTES if kind == BITMAP else 2 * count
+            payload = value[offset : offset + size]
+            offset += size
+        entries.append([key, kind, count, payload])
+    return entries
+
+
+def _value(entries: List[list]) -> bytes:
+    parts = [_HEADER.pack(len(entries))]
+    for key, kind, count, payload in entries:
+        parts.append(_ENTRY.pack(key, kind, count))
+        parts.append(_PAGE_ID.pack(payload) if kind == CHUNK else payload)
+    return b"".join(parts)
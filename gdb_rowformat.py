@@ -0,0 +1,202 @@
+from collections.abc import Mapping
+from typing import Any, Dict, Iterable, List, Tuple
+import json
+import struct
+
+import numpy as np
+
+
+ROW_VERSION = 1
+
+INTEGER = "q"
+FLOAT = "d"
+STRING = "s"
+
+# end offset of a string within the variable-length section
+_STRING_END = "I"
+
+# numpy type of each field of the fixed section
+_NUMPY_TYPES = {INTEGER: "<i8", FLOAT: "<f8", _STRING_END: "<u4"}
+
+
+class RowFormat:
+    """
+    Encodes the rows of a table in a compact binary format driven by its schema.
+
+    A row is a version byte, then a fixed section packing every integer and float column
+    along with the end offset of every string column, then the utf-8 bytes of the strings.
+    Column names are not repeated in every row and any one column can be decoded
+    without decoding the rest of the row.
+    Rows stored as JSON before this format existed start with "{" and are still read.
+    """
+
+    def __init__(self, columns: List[Tuple[str, str]]):
+        """columns are (name, INTEGER | FLOAT | STRING) in table order"""
+        self.names = [name for name, _ in columns]
+        self.fixed = struct.Struct(
+            "<B"
+            + "".join(_STRING_END if kind == STRING else kind for _, kind in columns)
+        )
+
+        # name -> (struct of the field, offset in the row, offset of the previous string end)
+        self._fields: Dict[str, Tuple[struct.Struct, int, int]] = {}
+        offset = 1
+        prev_end = -1
+        for name, kind in columns:
+            field = struct.Struct("<" + (_STRING_END if kind == STRING else kind))
+            self._fields[name] = (field, offset, prev_end if kind == STRING else None)
+            if kind == STRING:
+                prev_end = offset
+            offset += field.size
+        self._strings = [i for i, (_, kind) in enumerate(columns) if kind == STRING]
+        # the fixed section as a numpy record, for decoding many rows at once
+        self._dtype = np.dtype(
+            [("", "u1")]
+            + [
+                ("", _NUMPY_TYPES[_STRING_END if kind == STRING else kind])
+                for _, kind in columns
+            ]
+        )
+        self._kinds = dict(columns)
+        # name -> (position in the fixed section, position of the previous string end)
+        self._positions: Dict[str, Tuple[int, int]] = {}
+        prev = None
+        for i, (name, kind) in enumerate(columns):
+            self._positions[name] = (i + 1, prev)
+            if kind == STRING:
+                prev = i + 1
+        # positions of the string end offsets among the unpacked fixed section
+        self._fixed_strings = [i + 1 for i in self._strings]
+
+    def encode(self, row: Dict[str, Any]) -> bytes:
+        return self._pack([row[name] for name in self.names])
+
+    def encode_values(self, values: Iterable[Any]) -> bytes:
+        """Encodes a row given as its values in table order"""
+        return self._pack(list(values))
+
+    def _pack(self, values: List[Any]) -> bytes:
+        """encodes a list of values in table order, overwriting its strings"""
+        strings = []
+        end = 0
+        try:
+            for i in self._strings:
+                encoded = values[i].encode("utf-8")
+                strings.append(encoded)
+                end += len(encoded)
+                values[i] = end
+            return self.fixed.pack(ROW_VERSION, *values) + b"".join(strings)
+        except (AttributeError, struct.error) as e:
+            raise ValueError(f"Row does not match the column types: {e}")
+
+    def decode(self, data: bytes, columns: Iterable[str] = None) -> Dict[str, Any]:
+        """Decodes a whole row, or only the given columns"""
+        if data[0] != ROW_VERSION:
+            return self._decode_legacy(data, columns)
+        if columns is not None:
+            return {name: self.decode_column(data, name) for name in columns}
+
+        values = list(self.fixed.unpack_from(data))
+        start = size = self.fixed.size
+        for i in self._fixed_strings:
+            end = size + values[i]
+            values[i] = data[start:end].decode("utf-8")
+            start = end
+        return dict(zip(self.names, values[1:]))
+
+    def decode_column(self, data: bytes, name: str):
+        if data[0] != ROW_VERSION:
+            return json.loads(data.decode("utf-8"))[name]
+        field, offset, prev_end = self._fields[name]
+        (value,) = field.unpack_from(data, offset)
+        if prev_end is None:
+            return value
+
+        start = self.fixed.size
+        if prev_end >= 0:
+            start += struct.unpack_from("<" + _STRING_END, data, prev_end)[0]
+        return data[start : self.fixed.size + value].decode("utf-8")
+
+    def decode_columns(
+        self, rows: List[bytes], columns: Iterable[str]
+    ) -> Dict[str, np.ndarray]:
+        """Decodes the given columns of many rows into an array per column.
+        The fixed sections of all the rows are unpacked at once by numpy, so integer and
+        float columns are decoded without a Python step per row.
+        """
+        columns = list(columns)
+        size = self.fixed.size
+        if any(data[0] != ROW_VERSION for data in rows):
+            decoded = [self.decode(data, columns) for data in rows]
+            return {
+                name: self._array([row[name] for row in decoded], name)
+                for name in columns
+            }
+
+        fixed = np.frombuffer(b"".join(data[:size] for data in rows), dtype=self._dtype)
+        fields = fixed.dtype.names
+        arrays = {}
+        for name in columns:
+            position, prev = self._positions[name]
+            values = fixed[fields[position]]
+            if self._kinds[name] != STRING:
+                arrays[name] = values.astype(values.dtype.newbyteorder("="))
+                continue
+            ends = (values + size).tolist()
+            if prev is None:
+                starts = [size] * len(rows)
+            else:
+                starts = (fixed[fields[prev]] + size).tolist()
+            arrays[name] = self._array(
+                [
+                    data[start:end].decode("utf-8")
+                    for data, start, end in zip(rows, starts, ends)
+                ],
+                name,
+            )
+        return arrays
+
+    def _array(self, values: list, name: str) -> np.ndarray:
+        """an array of the values of a column, holding strings as Python objects"""
+        if self._kinds[name] == STRING:
+            array = np.empty(len(values), dtype=object)
+            array[:] = values
+            return array
+        return np.array(values)
+
+    def row(self, data: bytes) -> Mapping:
+        """Returns a row whose columns are only decoded when accessed"""
+        if data[0] != ROW_VERSION:
+            return self._decode_legacy(data)
+        return LazyRow(self, data)
+
+    @staticmethod
+    def _decode_legacy(data: bytes, columns: Iterable[str] = None) -> Dict[str, Any]:
+        row = json.loads(data.decode("utf-8"))
+        if columns is None:
+            return row
+        return {name: row[name] for name in columns}
+
+
+class LazyRow(Mapping):
+    __slots__ = ("format", "data")
+
+    def __init__(self, format: RowFormat, data: bytes):
+        self.format = format
+        self.data = data
+
+    def __getitem__(self, name: str):
+        return self.format.decode_column(self.data, name)
+
+    def __iter__(self):
+        return iter(self.format.names)
+
+    def __len__(self) -> int:
+        return len(self.format.names)
+
+    def to_dict(self, columns: Iterable[str] = None) -> Dict[str, Any]:
+        """Decodes every column, or only the given columns"""
+        if columns is not None and list(columns) == self.format.names:
+            # decoding the whole row at once is faster
+            columns = None
+        return self.format.decode(self.data, columns)
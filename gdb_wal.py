@@ -0,0 +1,177 @@
+from os.path import exists
+from typing import Any, Iterator, List, Tuple
+import os
+import pickle
+import struct
+import threading
+import time
+import zlib
+
+
+MAGIC = b"GDBWAL01"
+
+# magic, lsn of the first record in the file
+_FILE_HEADER = struct.Struct("<8sQ")
+# payload length, crc32 of the payload, lsn
+_RECORD_HEADER = struct.Struct("<IIQ")
+
+
+class WriteAheadLog:
+    """
+    Append-only log of the logical row operations applied since the last checkpoint.
+
+    Records are numbered by a log sequence number (lsn) and buffered in memory until commit(),
+    which appends them in one sequential write and fsyncs the file.
+    Commits arriving while another thread is syncing wait for it to finish and are then
+    covered by a single fsync for all of them (group commit).
+    commit_delay makes the syncing thread wait that many seconds first so more commits can join.
+    A torn record at the end of the file, left by a crash mid-append, is dropped on open.
+    If writing the records fails, they are kept buffered and the commit raises, so a later
+    commit writes them again.
+    """
+
+    def __init__(self, path: str, commit_delay: float = 0.0):
+        self.path = path
+        self.commit_delay = commit_delay
+
+        self.commits = 0
+        self.syncs = 0
+
+        self._lock = threading.Lock()
+        self._synced = threading.Condition(self._lock)
+        self._syncing = False
+        self._buffer: List[bytes] = []
+
+        # unbuffered, so a failed write leaves nothing behind to be written later
+        if exists(path):
+            self.file = open(path, "r+b", buffering=0)
+            magic, self.start_lsn = _FILE_HEADER.unpack(
+                self.file.read(_FILE_HEADER.size)
+            )
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a GatorDB log file")
+            last_lsn, end = self.start_lsn - 1, _FILE_HEADER.size
+            for lsn, _, end in self._scan():
+                last_lsn = lsn
+            self.file.truncate(end)
+            self.file.seek(end)
+        else:
+            self.file = open(path, "w+b", buffering=0)
+            self.start_lsn = 1
+            self._write_header()
+            last_lsn = 0
+
+        self.next_lsn = last_lsn + 1
+        self.synced_lsn = last_lsn
+
+    # --------- public ---------
+    def append(self, record: Any) -> int:
+        """Buffers a record until the next commit, returning its lsn"""
+        payload = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            lsn = self.next_lsn
+            self.next_lsn += 1
+            self._buffer.append(
+                _RECORD_HEADER.pack(len(payload), zlib.crc32(payload), lsn) + payload
+            )
+        return lsn
+
+    def commit(self, lsn: int = None) -> int:
+        """Makes every record up to lsn durable, by default every record appended so far.
+        Returns the lsn made durable.
+        """
+        with self._lock:
+            if lsn is None:
+                lsn = self.next_lsn - 1
+            self.commits += 1
+            while self.synced_lsn < lsn:
+                if self._syncing:
+                    # the sync in progress may already cover this commit
+                    self._synced.wait()
+                    continue
+                self._sync()
+            return lsn
+
+    def records(self) -> Iterator[Tuple[int, Any]]:
+        """Yields (lsn, record) of every durable record in order"""
+        for lsn, payload, _ in self._scan():
+            yield lsn, pickle.loads(payload)
+
+    def size(self) -> int:
+        """Bytes of records in the log"""
+        return os.path.getsize(self.path) - _FILE_HEADER.size
+
+    def truncate(self):
+        """Empties the log once a checkpoint made its records unnecessary"""
+        self.commit()
+        with self._lock:
+            self.start_lsn = self.next_lsn
+            self.file.truncate(0)
+            self._write_header()
+
+    def stats(self) -> dict:
+        return {
+            "next_lsn": self.next_lsn,
+            "bytes": self.size(),
+            "commits": self.commits,
+            "syncs": self.syncs,
+        }
+
+    def close(self):
+        self.commit()
+        self.file.close()
+
+    # --------- internal ---------
+    def _sync(self):
+        """writes and fsyncs the buffered records, called holding the lock.
+        If that fails, the records are buffered again and the error is raised
+        """
+        self._syncing = True
+        self._lock.release()
+        try:
+            if self.commit_delay:
+                time.sleep(self.commit_delay)
+            with self._lock:
+                records = self._buffer
+                self._buffer = []
+                upto = self.next_lsn - 1
+            end = self.file.tell()
+            try:
+                data = memoryview(b"".join(records))
+                while data:
+                    data = data[self.file.write(data) :]
+                os.fsync(self.file.fileno())
+            except BaseException:
+                with self._lock:
+                    self._buffer[:0] = records
+                # drops any part written, so the records are written again after the
+                # last intact one
+                self.file.truncate(end)
+                self.file.seek(end)
+                raise
+        finally:
+            self._lock.acquire()
+            self._syncing = False
+            self._synced.notify_all()
+        self.synced_lsn = upto
+        self.syncs += 1
+
+    def _write_header(self):
+        self.file.seek(0)
+        self.file.write(_FILE_HEADER.pack(MAGIC, self.start_lsn))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def _scan(self) -> Iterator[Tuple[int, bytes, int]]:
+        """yields (lsn, payload, end offset) of each intact record on disk"""
+        with open(self.path, "rb") as f:
+            f.seek(_FILE_HEADER.size)
+            while True:
+                header = f.read(_RECORD_HEADER.size)
+                if len(header) < _RECORD_HEADER.size:
+                    return
+                length, checksum, lsn = _RECORD_HEADER.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length or zlib.crc32(payload) != checksum:
+                    return
+                yield lsn, payload, f.tell()
@@ -1,12 +1,20 @@
-from parse import parse_line, initialize_db
+import sys
+
+import parse
+from parse import close_db, parse_line, initialize_db
 
 
 def run_interactive(args):
     print("Welcome to GatorDB!")
+    # wait between pages of long results when a user is at the terminal
+    parse.paged = sys.stdin.isatty()
     if args.dbpath:
-        initialize_db(args.dbpath)
+        cache_size = args.cache_size * 1024 * 1024 if args.cache_size else None
+        initialize_db(args.dbpath, cache_size)
     while True:
         line = input("$ ")
         if line.lower() in ("exit", "quit"):
             break
         parse_line(line)
+    if args.dbpath:
+        close_db()
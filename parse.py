@@ -3,23 +3,53 @@ import shutil
 
 from tabulate import tabulate
 
+from aggregate import Aggregation
 from db import DB, ColumnInfo, DBTable, DBType
 from sqlengine import SQLEngine
-from query import Condition, ConditionType, Change
+from query import (
+    Aggregate,
+    Change,
+    ConditionType,
+    CreateIndex,
+    CreateTable,
+    Delete,
+    DropIndex,
+    DropTable,
+    Explain,
+    Insert,
+    Parameter,
+    Select,
+    Truncate,
+    Update,
+    is_aggregate,
+)
 from utils import bolden, print_bold, print_green, print_red
 
 # SQL parsing engine
 engine = SQLEngine()
 
+# rows printed per page of a SELECT
+page_size = 50
+# whether to wait for the user between pages, set in interactive mode
+paged = False
+
 # global tables
 
 
-def initialize_db(name: str):
+def initialize_db(name: str, cache_size: int = None):
     global tables
-    tables = DB(name=name)
+    if cache_size is None:
+        tables = DB(name=name)
+    else:
+        tables = DB(name=name, cache_size=cache_size)
     print(f"(Using database '{name}')")
 
 
+def close_db():
+    """Writes every table to disk and empties the write-ahead log"""
+    tables.close()
+
+
 def get_db_type(column_type: str):
     """
     Convert a data type string in SQL syntax into DBType enum
@@ -46,9 +76,11 @@ def convert_value_to_data_type(value, table, column_name):
     :return: the value converted to the correct data type
     :raises: ValueError if the column does not exist or an incompatible data type is supplied
     """
+    if isinstance(value, Parameter):
+        raise ValueError("Parameters (?) can only be used in prepared statements")
     try:
         column = table.cols[column_name]
-        column_type = column.col_info.dbtype
+        column_type = column.dbtype
         if column_type == DBType.INTEGER:
             return int(value)
         elif column_type == DBType.STRING:
@@ -66,6 +98,30 @@ def convert_value_to_data_type(value, table, column_name):
         )
 
 
+def convert_condition(condition, table):
+    """
+    Convert the string values of a parsed WHERE condition into the data types of their columns
+    :param condition: Condition parsed by the SQL engine
+    :param table: table relation
+    :return: the Condition with converted values
+    :raises: ValueError if a column does not exist or an incompatible data type is supplied
+    """
+    if condition.type in (ConditionType.AND, ConditionType.OR):
+        return condition._replace(
+            val=tuple(convert_condition(child, table) for child in condition.val)
+        )
+    if condition.type in (ConditionType.BETWEEN, ConditionType.IN):
+        return condition._replace(
+            val=tuple(
+                convert_value_to_data_type(val, table, condition.col)
+                for val in condition.val
+            )
+        )
+    return condition._replace(
+        val=convert_value_to_data_type(condition.val, table, condition.col)
+    )
+
+
 def create_table(table_name, attributes, primary_key):
     """
     Create a table
@@ -78,7 +134,7 @@ def create_table(table_name, attributes, primary_key):
     if table_name in tables:
         raise ValueError("Table %s already exists" % table_name)
     else:
-        table = DBTable(name=table_name, path=tables.name)
+        table = DBTable(name=table_name, path=tables.name, pool=tables.pool)
         for column_name, column_type in attributes.items():
             is_primary_key = primary_key == column_name
             db_type = get_db_type(column_type)
@@ -93,107 +149,149 @@ def create_table(table_name, attributes, primary_key):
         )
 
 
-def select(table_name, where_colum, equals_value):
+def create_index(table_name, columns, name=None, using="BTREE"):
     """
-    Select some information from the table
+    Create an index on columns of a table
     :param table_name: name of the table
-    :param where_colum: where column
-    :param equals_value: equivalence value in the where column
+    :param columns: indexed columns
+    :param name: name of the index, derived from the table and columns if None
+    :param using: index structure, BTREE or HASH
     :return: None
-    :raises: ValueError if the table does not exist
+    :raises: ValueError if the table or a column does not exist or the index cannot be created
+    """
+    name = tables.create_index(table_name, columns, name, using)
+    print_green("Successfully created %s index %s on %s" % (using, name, table_name))
+
+
+def drop_index(name, table_name=None):
+    """
+    Drop an index, leaving its columns unindexed
+    :param name: name of the index
+    :param table_name: name of the table of the index, any table if None
+    :return: None
+    :raises: ValueError if the index does not exist
+    """
+    tables.drop_index(name, table_name)
+    print_green("Successfully dropped index %s" % name)
+
+
+def select(table_name, conditions, limit=None, offset=0, columns=None, group_by=None):
+    """
+    Select some information from the table, or aggregates of it
+    :param table_name: name of the table
+    :param conditions: parsed WHERE condition, None to select every row
+    :param limit: maximum number of rows to return, None for every row
+    :param offset: number of matching rows to skip
+    :param columns: columns and Aggregates to return, None for every column
+    :param group_by: columns whose values group the rows of the aggregates, None for one group
+    :return: None
+    :raises: ValueError if the table or a column does not exist
     """
     if table_name in tables:
         table = tables[table_name]
-        if where_colum is None or equals_value is None:
-            result = table.select_all()
-        else:
-            equals_value = convert_value_to_data_type(equals_value, table, where_colum)
-            pks = table.filter(
-                Condition(ConditionType.EQUALS, where_colum, equals_value)
+        if conditions is not None:
+            conditions = convert_condition(conditions, table)
+        if group_by is not None or any(
+            isinstance(column, Aggregate) for column in columns or ()
+        ):
+            cursor = Aggregation(table, columns, group_by).execute(
+                conditions, limit, offset
             )
-            result = table.select(pks)
-        # print the results
-        headers = list(table.cols.keys())
-        table_data = []
-        for i in result:
-            table_data.append(list(i.values()))
-        print_bold(tabulate(table_data, headers=headers))
+        else:
+            cursor = table.cursor(conditions, limit, offset, columns)
+        print_rows(cursor)
     else:
         raise ValueError("Table %s does not exist" % table_name)
 
 
-def insert_into(table_name, values):
+def print_rows(cursor):
+    """
+    Print the rows of a cursor a page at a time, fetching each page only when it is printed.
+    In paged mode, waits for the user between pages.
+    :param cursor: cursor over the rows to print
+    :return: None
+    """
+    page = cursor.fetchmany(page_size)
+    while True:
+        print_bold(
+            tabulate([list(row.values()) for row in page], headers=cursor.columns)
+        )
+        if len(page) < page_size:
+            break
+        page = cursor.fetchmany(page_size)
+        if not page:
+            break
+        if paged and input("-- More (Enter to continue, q to stop) -- ").lower() == "q":
+            cursor.close()
+            break
+
+
+def insert_into(table_name, rows):
     """
     Insert some rows into a table
     :param table_name: name of the table
-    :param values: column values to insert
+    :param rows: column values of each row to insert
     :return: None
     :raises: ValueError if the table does not exist
     """
     if table_name in tables:
         table = tables[table_name]
-        data = {}
-        i = 0
-        for column in list(table.cols.keys()):
-            data[column] = values[i]
-            i = i + 1
-        table.insert(data)
-        print_green("Successfully inserted 1 row into table %s" % table.name)
+        columns = list(table.cols.keys())
+        if any(isinstance(value, Parameter) for values in rows for value in values):
+            raise ValueError("Parameters (?) can only be used in prepared statements")
+        if len(rows) == 1:
+            table.insert(dict(zip(columns, rows[0])))
+        else:
+            table.insert_many([dict(zip(columns, values)) for values in rows])
+        print_green(
+            "Successfully inserted %d row%s into table %s"
+            % (len(rows), "" if len(rows) == 1 else "s", table.name)
+        )
     else:
         raise ValueError("Table %s does not exist" % table_name)
 
 
-def update(table_name, conditions, new_values):
+def update(table_name, conditions, changes):
     """
     Update table to change column values
     :param table_name: table name
-    :param conditions: conditions matching
-    :param new_values: new table values
+    :param conditions: parsed WHERE condition
+    :param changes: parsed SET changes, with values as strings
     :return: None
     :raises: ValueError if the SQL statement is formatted badly
     """
     if table_name in tables:
         table = tables[table_name]
-        condition_column_name = list(conditions.keys())[0]
-        condition_column_value = convert_value_to_data_type(
-            list(conditions.values())[0], table, condition_column_name
-        )
-        new_value_column_name = list(new_values.keys())[0]
-        new_value_column_value = convert_value_to_data_type(
-            list(new_values.values())[0], table, new_value_column_name
-        )
-        table.update(
-            table.filter(
-                Condition(
-                    ConditionType.EQUALS, condition_column_name, condition_column_value
-                )
-            ),
-            [Change(col=new_value_column_name, val=new_value_column_value)],
-        )
+        changes = [
+            Change(
+                col=change.col,
+                val=convert_value_to_data_type(change.val, table, change.col),
+            )
+            for change in changes
+        ]
+        table.update(table.filter(convert_condition(conditions, table)), changes)
         print_green("Successfully updated the table %s" % table_name)
     else:
         raise ValueError("Table %s does not exist" % table_name)
 
 
-def delete(table_name, where_colum, equals_value):
+def delete(table_name, conditions):
     """
     Delete some data (rows) in the table
     :param table_name: name of the table
-    :param where_colum: where column
-    :param equals_value: equivalence value in the where column
+    :param conditions: parsed WHERE condition
     :return: None
     :raises: ValueError if the table does not exist
     """
     if table_name in tables:
         table = tables[table_name]
-        if where_colum is None or equals_value is None:
+        if conditions is None:
             raise ValueError(
                 "DELETE command missing condition. If deleting all conditions is desired, call TRUNCATE instead."
             )
         else:
-            equals_value = convert_value_to_data_type(equals_value, table, where_colum)
             deleted_count = table.delete(
-                table.filter(Condition(ConditionType.EQUALS, where_colum, equals_value))
+                table.filter(convert_condition(conditions, table))
             )
         if deleted_count > 0:
             print_green(
@@ -206,21 +304,16 @@ def delete(table_name, where_colum, equals_value):
         raise ValueError("Table %s does not exist" % table_name)
 
 
-def truncate(table_name, where_colum, equals_value):  # delete rows
+def truncate(table_name):  # delete rows
     """
-    Delete some data (rows) in the table
+    Delete all the data (rows) in the table
     :param table_name: name of the table
-    :param where_colum: where column
-    :param equals_value: equivalence value in the where column
     :return: None
     :raises: ValueError if the table does not exist
     """
     if table_name in tables:
         table = tables[table_name]
-        if where_colum is None or equals_value is None:
-            table.delete_all_rows()
-        else:
-            raise ValueError("Invalid TRUNCATE command")
+        table.delete_all_rows()
         print_green("Successfully truncated table %s" % (table_name))
     else:
         raise ValueError("Table %s does not exist" % table_name)
@@ -235,7 +328,7 @@ def drop_table(table_name):
     """
     if table_name in tables:
         table = tables[table_name]
-        table.save()
+        table.close()
         del tables[table_name]
         shutil.rmtree(os.path.join(tables.name, table_name))
         print_green("Successfully dropped the table %s" % table_name)
@@ -243,6 +336,50 @@ def drop_table(table_name):
         raise ValueError("Table %s does not exist" % table_name)
 
 
+def explain(statement):
+    """
+    Print the plan used to find the rows of a SELECT, UPDATE or DELETE statement
+    :param statement: the parsed statement to explain
+    :return: None
+    :raises: ValueError if the table does not exist or the statement cannot be explained
+    """
+    if not isinstance(statement, (Select, Update, Delete)):
+        raise ValueError("Only SELECT, UPDATE and DELETE statements can be explained")
+    table_name = statement.table_name
+    if table_name in tables:
+        table = tables[table_name]
+        conditions = statement.conditions
+        depth = 0
+        columns = None
+        if isinstance(statement, Select) and is_aggregate(statement):
+            if conditions is not None:
+                conditions = convert_condition(conditions, table)
+            aggregation = Aggregation(table, statement.columns, statement.group_by)
+            print_bold(aggregation.explain(conditions))
+            return
+        if isinstance(statement, Select):
+            columns = statement.columns
+            if statement.limit is not None or statement.offset is not None:
+                limit = statement.limit
+                print_bold(
+                    f"Limit: {'all' if limit is None else limit} offset {statement.offset or 0}"
+                )
+                depth = 1
+        if conditions is not None:
+            conditions = convert_condition(conditions, table)
+        plan = table.plan(conditions, columns)
+        if plan is None:
+            print_bold(
+                "  " * depth
+                + ("-> " if depth else "")
+                + f"Full scan  (rows={table.row_count()})"
+            )
+        else:
+            print_bold(plan.explain(depth))
+    else:
+        raise ValueError("Table %s does not exist" % table_name)
+
+
 def parse_line(line: str):
     """
     Parse an SQL line and print its executed statement
@@ -253,48 +390,58 @@ def parse_line(line: str):
         print_bold(", ".join(tables.keys()))
         print()
         return
+    if line.lower() in ("cache_stats", ".stats"):
+        stats = tables.pool.stats()
+        print_bold(tabulate(stats.items(), headers=["buffer pool", "value"]))
+        print()
+        print_bold(tabulate(tables.wal.stats().items(), headers=["log", "value"]))
+        print()
+        return
+    if line.lower() in ("checkpoint", ".checkpoint"):
+        tables.checkpoint()
+        print_green("Checkpoint complete")
+        print()
+        return
     try:
-        parsed = engine.parse_sql(line)
-        if parsed["type"] == "CREATE TABLE":
-            table_name = parsed["table_name"]
-            attributes = parsed["attributes"]
-            primary_key = parsed["primary_key"]
-            create_table(table_name, attributes, primary_key)
-            tables[table_name].save()
-        elif parsed["type"] == "SELECT":
-            table_name = parsed["table_name"]
-            conditions = parsed["conditions"]
-            where_colum = None if len(conditions) == 0 else list(conditions.keys())[0]
-            equals_value = None if where_colum is None else conditions[where_colum]
-            select(table_name, where_colum, equals_value)
-        elif parsed["type"] == "INSERT INTO":
-            table_name = parsed["table_name"]
-            values = parsed["values"]
-            insert_into(table_name, values)
-            tables[table_name].save()
-        elif parsed["type"] == "UPDATE":
-            table_name = parsed["table_name"]
-            conditions = parsed["conditions"]
-            new_values = parsed["new_value"]
-            update(table_name, conditions, new_values)
+        statement = engine.parse(line)
+        if isinstance(statement, CreateTable):
+            table_name = statement.table_name
+            create_table(table_name, dict(statement.columns), statement.primary_key)
             tables[table_name].save()
-        elif parsed["type"] == "DELETE":
-            table_name = parsed["table_name"]
-            conditions = parsed["conditions"]
-            where_colum = None if len(conditions) == 0 else list(conditions.keys())[0]
-            equals_value = None if where_colum is None else conditions[where_colum]
-            delete(table_name, where_colum, equals_value)
-            tables[table_name].save()
-        elif parsed["type"] == "TRUNCATE":
-            table_name = parsed["table_name"]
-            conditions = parsed["conditions"]
-            where_colum = None if len(conditions) == 0 else list(conditions.keys())[0]
-            equals_value = None if where_colum is None else conditions[where_colum]
-            truncate(table_name, where_colum, equals_value)
-            tables[table_name].save()
-        elif parsed["type"] == "DROP TABLE":
-            table_name = parsed["table_name"]
-            drop_table(table_name)
+        elif isinstance(statement, Select):
+            select(
+                statement.table_name,
+                statement.conditions,
+                statement.limit,
+                statement.offset or 0,
+                statement.columns,
+                statement.group_by,
+            )
+        elif isinstance(statement, Insert):
+            insert_into(statement.table_name, statement.rows)
+            tables.commit()
+        elif isinstance(statement, Update):
+            update(statement.table_name, statement.conditions, statement.changes)
+            tables.commit()
+        elif isinstance(statement, Delete):
+            delete(statement.table_name, statement.conditions)
+            tables.commit()
+        elif isinstance(statement, Truncate):
+            truncate(statement.table_name)
+            tables.commit()
+        elif isinstance(statement, Explain):
+            explain(statement.statement)
+        elif isinstance(statement, DropTable):
+            drop_table(statement.table_name)
+        elif isinstance(statement, CreateIndex):
+            create_index(
+                statement.table_name,
+                statement.columns,
+                statement.name,
+                statement.using,
+            )
+        elif isinstance(statement, DropIndex):
+            drop_index(statement.name, statement.table_name)
         else:
             raise ValueError("Unknown command")
     except Exception as e:
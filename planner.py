@@ -0,0 +1,741 @@
+from bisect import bisect_left
+from copy import copy
+from functools import reduce
+import heapq
+from itertools import islice, repeat
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Set, Tuple
+
+import numpy as np
+
+from query import Condition, ConditionType, Parameter, bind
+
+
+HISTOGRAM_BUCKETS = 32
+
+# cost of one root-to-leaf descent of a tree
+SEEK_COST = 4.0
+# cost of finding a value in a hash index, reading its directory and one bucket
+PROBE_COST = 2.0
+# cost of stepping over one key during an index range scan
+KEY_COST = 0.1
+# cost of producing one pk from a nonclustered index's pk array
+PK_COST = 0.01
+# cost of decoding one row and checking a condition against it during a scan
+ROW_COST = 1.0
+# cost of fetching one row by pk
+ROW_FETCH_COST = SEEK_COST + ROW_COST
+# fraction of the rows a range condition is assumed to match when its bound is a parameter
+PARAMETER_RANGE_FRACTION = 1 / 3
+
+RANGE_TYPES = (
+    ConditionType.LESS_THAN,
+    ConditionType.LESS_EQUALS,
+    ConditionType.GREATER_THAN,
+    ConditionType.GREATER_EQUALS,
+    ConditionType.BETWEEN,
+)
+
+OPERATORS = {
+    ConditionType.EQUALS: "=",
+    ConditionType.NOT_EQUALS: "!=",
+    ConditionType.LESS_THAN: "<",
+    ConditionType.LESS_EQUALS: "<=",
+    ConditionType.GREATER_THAN: ">",
+    ConditionType.GREATER_EQUALS: ">=",
+}
+
+
+class ColumnStats:
+    """
+    Statistics about the values of a column: row count, distinct count, min, max
+    and an equi-depth histogram.
+
+    The counts are kept exact on every insert and delete. min and max only ever widen
+    until the next rebuild, and rows are added to and removed from the existing histogram
+    buckets, so the histogram is rebuilt from the index once the row count has doubled or halved.
+    """
+
+    def __init__(self):
+        self.row_count = 0
+        self.distinct_count = 0
+        self.min = None
+        self.max = None
+
+        # inclusive upper bound and row count of each histogram bucket
+        self.bounds: List[Any] = []
+        self.counts: List[int] = []
+        self.built_row_count = 0
+
+    def add(self, value, is_new: bool):
+        self.row_count += 1
+        self.distinct_count += is_new
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        if self.bounds:
+            i = bisect_left(self.bounds, value)
+            if i == len(self.bounds):
+                i -= 1
+                self.bounds[i] = value
+            self.counts[i] += 1
+
+    def remove(self, value, was_last: bool):
+        self.row_count -= 1
+        self.distinct_count -= was_last
+        if self.row_count == 0:
+            self.min = self.max = None
+        if self.bounds:
+            i = min(bisect_left(self.bounds, value), len(self.bounds) - 1)
+            self.counts[i] = max(0, self.counts[i] - 1)
+
+    def is_stale(self) -> bool:
+        if not self.bounds:
+            return self.row_count > 0
+        return (
+            self.row_count > 2 * self.built_row_count
+            or 2 * self.row_count < self.built_row_count
+        )
+
+    def rebuild(self, value_counts: Iterable[Tuple[Any, int]]):
+        """Rebuilds every statistic from the (value, row count) pairs of the column in value order"""
+        depth = max(1.0, self.row_count / HISTOGRAM_BUCKETS)
+        self.row_count = self.distinct_count = 0
+        self.min = self.max = None
+        self.bounds, self.counts = [], []
+
+        bucket_count = 0
+        for value, count in value_counts:
+            if self.min is None:
+                self.min = value
+            self.max = value
+            self.row_count += count
+            self.distinct_count += 1
+            bucket_count += count
+            if bucket_count >= depth:
+                self.bounds.append(value)
+                self.counts.append(bucket_count)
+                bucket_count = 0
+        if bucket_count:
+            self.bounds.append(self.max)
+            self.counts.append(bucket_count)
+        if len(self.bounds) > 2 * HISTOGRAM_BUCKETS:
+            # the row count was unknown up front, so merge the buckets down to size
+            self._merge_buckets(self.row_count / HISTOGRAM_BUCKETS)
+        self.built_row_count = self.row_count
+
+    def _merge_buckets(self, depth: float):
+        bounds, counts = [], []
+        bucket_count = 0
+        for bound, count in zip(self.bounds, self.counts):
+            bucket_count += count
+            if bucket_count >= depth or bound == self.bounds[-1]:
+                bounds.append(bound)
+                counts.append(bucket_count)
+                bucket_count = 0
+        self.bounds, self.counts = bounds, counts
+
+    # --------- estimates ---------
+    def estimate_equals(self, value) -> float:
+        if self.min is None:
+            return 0.0
+        try:
+            if value < self.min or value > self.max:
+                return 0.0
+        except TypeError:
+            return 0.0
+        return self.row_count / max(1, self.distinct_count)
+
+    def estimate_range(self, lo, hi) -> float:
+        """Estimates the rows with values between lo and hi, where None is unbounded"""
+        if not self.bounds:
+            return self.row_count / 3
+        try:
+            rows = 0.0
+            lower = self.min
+            for bound, count in zip(self.bounds, self.counts):
+                rows += count * _overlap(lower, bound, lo, hi)
+                lower = bound
+            return rows
+        except TypeError:
+            return self.row_count / 3
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "rows": self.row_count,
+            "distinct": self.distinct_count,
+            "min": self.min,
+            "max": self.max,
+            "buckets": len(self.bounds),
+        }
+
+
+def _overlap(lower, upper, lo, hi) -> float:
+    """fraction of the histogram bucket (lower, upper] inside [lo, hi]"""
+    if (hi is not None and hi < lower) or (lo is not None and lo > upper):
+        return 0.0
+    if (lo is None or lo <= lower) and (hi is None or hi >= upper):
+        return 1.0
+    if isinstance(lower, (int, float)) and isinstance(upper, (int, float)):
+        if upper == lower:
+            return 1.0
+        start = lower if lo is None else max(lo, lower)
+        end = upper if hi is None else min(hi, upper)
+        return min(1.0, max(0.0, (end - start) / (upper - lower)))
+    return 0.5
+
+
+# --------- plans ---------
+class Plan:
+    """A step of a query plan, returning the pks of the matching rows when executed"""
+
+    cost: float = 0.0
+    rows: float = 0.0
+
+    def execute(self, table) -> np.ndarray:
+        raise NotImplementedError
+
+    def stream(self, table, offset: int = 0) -> Iterator[Tuple[int, Mapping]]:
+        """Yields (pk, row) of the matching rows in pk order after skipping offset of them.
+        Rows are only read as they are consumed, so a caller that stops early skips the rest.
+        """
+        for pk in self.execute(table)[offset:]:
+            yield pk, table.row(pk)
+
+    def describe(self) -> str:
+        raise NotImplementedError
+
+    def children(self) -> List["Plan"]:
+        return []
+
+    def bind(self, params) -> "Plan":
+        """Returns this plan with the parameters of its conditions replaced by their values"""
+        bound = copy(self)
+        if hasattr(self, "condition"):
+            bound.condition = bind(self.condition, params)
+        return bound
+
+    def explain(self, depth: int = 0) -> str:
+        line = "  " * depth + ("-> " if depth else "")
+        line += f"{self.describe()}  (cost={self.cost:.2f} rows={self.rows:.0f})"
+        return "\n".join(
+            [line] + [child.explain(depth + 1) for child in self.children()]
+        )
+
+
+class IndexLookup(Plan):
+    """answers one condition on one column from that column's index"""
+
+    def __init__(self, condition: Condition, access: str, cost: float, rows: float):
+        self.condition = condition
+        self.access = access
+        self.cost = cost
+        self.rows = rows
+
+    def execute(self, table) -> np.ndarray:
+        return table.index_lookup(self.condition)
+
+    def describe(self) -> str:
+        return f"{self.access} on {self.condition.col}: {describe(self.condition)}"
+
+
+class PrefixLookup(Plan):
+    """answers = conditions on the first columns of a composite index and a range condition
+    on the next one, if any, from one range scan of that index
+    """
+
+    def __init__(
+        self, index: str, conditions: List[Condition], cost: float, rows: float
+    ):
+        self.index = index
+        self.conditions = conditions
+        self.cost = cost
+        self.rows = rows
+
+    def execute(self, table) -> np.ndarray:
+        return table.prefix_lookup(self.index, self.conditions)
+
+    def describe(self) -> str:
+        joined = " AND ".join(describe(c) for c in self.conditions)
+        return f"Index prefix scan on {self.index}: {joined}"
+
+    def bind(self, params) -> Plan:
+        bound = copy(self)
+        bound.conditions = [bind(condition, params) for condition in self.conditions]
+        return bound
+
+
+class Intersect(Plan):
+    def __init__(self, plans: List[Plan], rows: float):
+        self.plans = plans
+        self.cost = sum(plan.cost for plan in plans)
+        self.rows = rows
+
+    def execute(self, table) -> np.ndarray:
+        pks = np.unique(self.plans[0].execute(table))
+        for plan in self.plans[1:]:
+            if pks.size == 0:
+                break
+            pks = np.intersect1d(pks, plan.execute(table), assume_unique=True)
+        return pks
+
+    def describe(self) -> str:
+        return "Intersect"
+
+    def children(self) -> List[Plan]:
+        return self.plans
+
+    def bind(self, params) -> Plan:
+        bound = copy(self)
+        bound.plans = [plan.bind(params) for plan in self.plans]
+        return bound
+
+
+class Union(Plan):
+    def __init__(self, plans: List[Plan], rows: float):
+        self.plans = plans
+        self.cost = sum(plan.cost for plan in plans)
+        self.rows = rows
+
+    def execute(self, table) -> np.ndarray:
+        return reduce(np.union1d, (plan.execute(table) for plan in self.plans))
+
+    def describe(self) -> str:
+        return "Union"
+
+    def children(self) -> List[Plan]:
+        return self.plans
+
+    def bind(self, params) -> Plan:
+        bound = copy(self)
+        bound.plans = [plan.bind(params) for plan in self.plans]
+        return bound
+
+
+class Filter(Plan):
+    """fetches the rows found by another plan and keeps those matching the remaining conditions"""
+
+    def __init__(self, plan: Plan, conditions: List[Condition], rows: float):
+        self.plan = plan
+        self.conditions = conditions
+        self.cost = plan.cost + plan.rows * ROW_FETCH_COST
+        self.rows = rows
+
+    def execute(self, table) -> np.ndarray:
+        return np.array([pk for pk, _ in self.stream(table)], dtype=np.int32)
+
+    def stream(self, table, offset: int = 0) -> Iterator[Tuple[int, Mapping]]:
+        rows = (
+            (pk, row)
+            for pk in np.unique(self.plan.execute(table))
+            for row in (table.row(pk),)
+            if all(matches(condition, row) for condition in self.conditions)
+        )
+        return islice(rows, offset, None)
+
+    def describe(self) -> str:
+        return "Filter: " + " AND ".join(describe(c) for c in self.conditions)
+
+    def children(self) -> List[Plan]:
+        return [self.plan]
+
+    def bind(self, params) -> Plan:
+        bound = copy(self)
+        bound.plan = self.plan.bind(params)
+        bound.conditions = [bind(condition, params) for condition in self.conditions]
+        return bound
+
+
+class FullScan(Plan):
+    """reads every row in pk order and keeps those matching the condition"""
+
+    def __init__(self, condition: Condition, row_count: int, rows: float):
+        self.condition = condition
+        self.cost = row_count * ROW_COST
+        self.rows = rows
+
+    def execute(self, table) -> np.ndarray:
+        return np.array([pk for pk, _ in self.stream(table)], dtype=np.int32)
+
+    def stream(self, table, offset: int = 0) -> Iterator[Tuple[int, Mapping]]:
+        rows = (
+            (pk, row) for pk, row in table.scan_rows() if matches(self.condition, row)
+        )
+        return islice(rows, offset, None)
+
+    def describe(self) -> str:
+        return f"Full scan: {describe(self.condition)}"
+
+
+class IndexOnlyScan(Plan):
+    """answers a query from one nonclustered index when it holds every column the query reads,
+    without fetching any row
+    """
+
+    def __init__(
+        self,
+        condition: Optional[Condition],
+        col: str,
+        columns: List[str],
+        cost: float,
+        rows: float,
+    ):
+        self.condition = condition
+        self.col = col
+        self.columns = columns
+        self.cost = cost
+        self.rows = rows
+
+    def execute(self, table) -> np.ndarray:
+        arrays = [pks for _, pks in table.index_entries(self.col, self.condition)]
+        if not arrays:
+            return np.array([], dtype=np.int32)
+        return np.sort(np.concatenate(arrays))
+
+    def stream(self, table, offset: int = 0) -> Iterator[Tuple[int, Mapping]]:
+        # each value's pks are sorted, so merging them yields every row in pk order
+        merged = heapq.merge(
+            *(
+                zip(pks.tolist(), repeat(value))
+                for value, pks in table.index_entries(self.col, self.condition)
+            )
+        )
+        rows = (
+            (
+                pk,
+                {
+                    col: pk if col == table.primary_key else value
+                    for col in self.columns
+                },
+            )
+            for pk, value in merged
+        )
+        return islice(rows, offset, None)
+
+    def describe(self) -> str:
+        if self.condition is None:
+            return f"Index only scan on {self.col}"
+        return f"Index only scan on {self.col}: {describe(self.condition)}"
+
+
+class Planner:
+    """
+    Picks the cheapest way to find the rows matching a condition using per-column statistics:
+    primary key seeks and range scans, nonclustered index probes and range scans,
+    probes of hash indexes, which cannot scan a range, scans for conditions on unindexed columns,
+    range scans of a composite index for the conditions of an AND matching a prefix of its columns,
+    intersections and unions of those, fetching rows to check the remaining conditions of an AND,
+    or a full scan of the table.
+    """
+
+    def __init__(self, table):
+        self.table = table
+
+    def plan(self, condition: Condition, columns: List[str] = None) -> Optional[Plan]:
+        """
+        Returns the cheapest plan for a condition. If the columns read are given,
+        considers answering from an index alone, counting the cost of fetching
+        the result rows against the other plans.
+        Returns None when there is no condition and reading every row is best.
+        """
+        covering = None
+        if columns is not None:
+            covering = self._plan_covering(condition, columns)
+        if condition is None:
+            return covering
+
+        best = self._plan_condition(condition)
+        if covering is not None and covering.cost < best.cost + _fetch_cost(best):
+            return covering
+        return best
+
+    def _plan_condition(self, condition: Condition) -> Plan:
+        row_count = self.table.row_count()
+        if condition.type == ConditionType.AND:
+            best = self._plan_and(condition, row_count)
+        elif condition.type == ConditionType.OR:
+            plans = [self._plan_condition(child) for child in condition.val]
+            rows = min(row_count, sum(plan.rows for plan in plans))
+            best = Union(plans, rows)
+        else:
+            best = self._plan_index(condition, row_count)
+            prefix = self._plan_prefix([condition], row_count, best.rows)
+            if prefix is not None and prefix.cost < best.cost:
+                best = prefix
+
+        scan = FullScan(condition, row_count, best.rows)
+        return scan if scan.cost < best.cost else best
+
+    def estimate(self, condition: Condition) -> float:
+        """Estimates the number of rows matching a condition"""
+        row_count = self.table.row_count()
+        if condition.type == ConditionType.AND:
+            rows = row_count
+            for child in condition.val:
+                rows *= self.estimate(child) / row_count if row_count else 0
+            return rows
+        if condition.type == ConditionType.OR:
+            return min(row_count, sum(self.estimate(c) for c in condition.val))
+
+        stats = self.table.column_stats(condition.col)
+        if has_parameters(condition):
+            return self._estimate_generic(condition, stats, row_count)
+        if condition.type == ConditionType.EQUALS:
+            if condition.col == self.table.primary_key:
+                return min(1.0, stats.estimate_equals(condition.val))
+            return stats.estimate_equals(condition.val)
+        if condition.type == ConditionType.IN:
+            return min(
+                row_count, sum(stats.estimate_equals(val) for val in condition.val)
+            )
+        if condition.type == ConditionType.NOT_EQUALS:
+            return row_count - stats.estimate_equals(condition.val)
+        lo, hi = range_of(condition)
+        return stats.estimate_range(lo, hi)
+
+    # --------- internal ---------
+    def _estimate_generic(
+        self, condition: Condition, stats: ColumnStats, row_count: int
+    ) -> float:
+        """estimates for a condition whose values are not known until it is executed,
+        assuming values as common as the average one and ranges of a fixed fraction of the rows
+        """
+        equals = (
+            stats.row_count / max(1, stats.distinct_count) if stats.row_count else 0.0
+        )
+        if condition.type == ConditionType.EQUALS:
+            if condition.col == self.table.primary_key:
+                return min(1.0, equals)
+            return equals
+        if condition.type == ConditionType.IN:
+            return min(row_count, len(condition.val) * equals)
+        if condition.type == ConditionType.NOT_EQUALS:
+            return row_count - equals
+        if condition.type == ConditionType.BETWEEN:
+            return row_count * PARAMETER_RANGE_FRACTION**2
+        return row_count * PARAMETER_RANGE_FRACTION
+
+    def _plan_index(self, condition: Condition, row_count: int) -> Plan:
+        rows = self.estimate(condition)
+        is_pk = condition.col == self.table.primary_key
+        if not is_pk and self.table.index_using(condition.col) is None:
+            return FullScan(condition, row_count, rows)
+        if self._is_hashed(condition.col):
+            if condition.type == ConditionType.EQUALS:
+                return IndexLookup(condition, "Hash probe", PROBE_COST, rows)
+            if condition.type == ConditionType.IN:
+                cost = len(condition.val) * PROBE_COST + rows * PK_COST
+                return IndexLookup(condition, "Hash probe", cost, rows)
+            if condition.type in RANGE_TYPES:
+                return FullScan(condition, row_count, rows)
+        if condition.type == ConditionType.EQUALS:
+            access = "Primary key seek" if is_pk else "Index probe"
+            cost = SEEK_COST + rows * PK_COST
+        elif condition.type == ConditionType.IN:
+            access = "Primary key seek" if is_pk else "Index probe"
+            cost = len(condition.val) * SEEK_COST + rows * PK_COST
+        elif condition.type == ConditionType.NOT_EQUALS:
+            # every pk of the clustered index except the ones found by a probe
+            access = "Primary key scan minus probe"
+            cost = 2 * SEEK_COST + row_count * KEY_COST
+        else:
+            access = "Primary key range scan" if is_pk else "Index range scan"
+            stats = self.table.column_stats(condition.col)
+            distinct = rows * stats.distinct_count / max(1, stats.row_count)
+            cost = SEEK_COST + distinct * KEY_COST + rows * PK_COST
+        return IndexLookup(condition, access, cost, rows)
+
+    def _plan_covering(
+        self, condition: Optional[Condition], columns: List[str]
+    ) -> Optional[Plan]:
+        """an index only scan, if the index of one nonclustered column holds every column read"""
+        cols = set(columns) - {self.table.primary_key}
+        if condition is not None:
+            # the index can only check conditions on its own column
+            if len(columns_of(condition) | cols) != 1:
+                return None
+            cols = columns_of(condition)
+        if len(cols) != 1:
+            return None
+        (col,) = cols
+        if col == self.table.primary_key or self.table.index_using(col) is None:
+            return None
+
+        stats = self.table.column_stats(col)
+        rows = self.estimate(condition) if condition else stats.row_count
+        seek = PROBE_COST if self._is_hashed(col) else SEEK_COST
+        if condition is not None and condition.type == ConditionType.EQUALS:
+            cost = seek + rows * PK_COST
+        elif condition is not None and condition.type == ConditionType.IN:
+            cost = len(condition.val) * seek + rows * PK_COST
+        else:
+            if (
+                condition is not None
+                and condition.type in RANGE_TYPES
+                and not self._is_hashed(col)
+            ):
+                distinct = rows * stats.distinct_count / max(1, stats.row_count)
+            else:
+                # every value of the index is checked
+                distinct = stats.distinct_count
+            cost = SEEK_COST + distinct * KEY_COST + rows * PK_COST
+        return IndexOnlyScan(condition, col, columns, cost, rows)
+
+    def _plan_prefix(
+        self, conditions: List[Condition], row_count: int, rows: float
+    ) -> Optional[Plan]:
+        """
+        the cheapest range scan of a composite index for the conditions of an AND,
+        expected to match rows, that match a prefix of its columns: = on its first columns
+        and = or a range on the next one, fetching the rows to check the other conditions.
+        None if no index matches.
+        """
+        equals: Dict[str, Condition] = {}
+        ranges: Dict[str, Condition] = {}
+        for condition in conditions:
+            if condition.type == ConditionType.EQUALS:
+                equals.setdefault(condition.col, condition)
+            elif condition.type in RANGE_TYPES:
+                ranges.setdefault(condition.col, condition)
+
+        best = None
+        for info in self.table.composite_indexes():
+            matched = []
+            for col in info.columns:
+                if col not in equals:
+                    break
+                matched.append(equals[col])
+            unmatched = list(info.columns[len(matched) :])
+            if unmatched and unmatched[0] in ranges:
+                matched.append(ranges[unmatched.pop(0)])
+            if not matched:
+                continue
+
+            found = row_count
+            for condition in matched:
+                found *= self.estimate(condition) / row_count if row_count else 0
+            keys = 1.0
+            if matched[-1].type != ConditionType.EQUALS:
+                stats = self.table.column_stats(matched[-1].col)
+                keys *= max(
+                    1.0,
+                    self.estimate(matched[-1])
+                    * stats.distinct_count
+                    / max(1, stats.row_count),
+                )
+            for col in unmatched:
+                keys *= self.table.column_stats(col).distinct_count
+            # each key found holds at least one row
+            keys = max(1.0, min(found, keys))
+            cost = SEEK_COST + keys * KEY_COST + found * PK_COST
+            rest = [condition for condition in conditions if condition not in matched]
+            if rest:
+                plan = Filter(PrefixLookup(info.name, matched, cost, found), rest, rows)
+            else:
+                plan = PrefixLookup(info.name, matched, cost, rows)
+            if best is None or plan.cost < best.cost:
+                best = plan
+        return best
+
+    def _is_hashed(self, col: str) -> bool:
+        """whether a column's index is a hash index, which finds values but keeps no order"""
+        return col != self.table.primary_key and self.table.index_using(col) == "HASH"
+
+    def _plan_and(self, condition: Condition, row_count: int) -> Plan:
+        """intersects the most selective k conditions and filters the fetched rows
+        with the rest, picking the k with the lowest cost
+        """
+        pairs = sorted(
+            ((self._plan_condition(child), child) for child in condition.val),
+            key=lambda pair: pair[0].rows,
+        )
+        plans = [plan for plan, _ in pairs]
+        rows = self.estimate(condition)
+
+        best = self._plan_prefix(condition.val, row_count, rows)
+        selectivity = 1.0
+        for k in range(1, len(plans) + 1):
+            selectivity *= plans[k - 1].rows / row_count if row_count else 0
+            if k == 1:
+                driver = plans[0]
+            else:
+                driver = Intersect(plans[:k], row_count * selectivity)
+            if k < len(plans):
+                candidate = Filter(driver, [child for _, child in pairs[k:]], rows)
+            else:
+                candidate = driver
+                candidate.rows = rows
+            if best is None or candidate.cost < best.cost:
+                best = candidate
+        return best
+
+
+# --------- conditions ---------
+def range_of(condition: Condition):
+    """Returns the (low, high) values of a range condition, None where unbounded"""
+    if condition.type in (ConditionType.LESS_THAN, ConditionType.LESS_EQUALS):
+        return None, condition.val
+    if condition.type in (ConditionType.GREATER_THAN, ConditionType.GREATER_EQUALS):
+        return condition.val, None
+    return condition.val
+
+
+def columns_of(condition: Condition) -> Set[str]:
+    """Returns the columns a condition reads"""
+    if condition.type in (ConditionType.AND, ConditionType.OR):
+        return set().union(*(columns_of(child) for child in condition.val))
+    return {condition.col}
+
+
+def has_parameters(condition: Condition) -> bool:
+    """Checks whether a condition has a parameter of a prepared statement among its values"""
+    if condition.type in (ConditionType.AND, ConditionType.OR):
+        return any(has_parameters(child) for child in condition.val)
+    if isinstance(condition.val, tuple):
+        return any(isinstance(val, Parameter) for val in condition.val)
+    return isinstance(condition.val, Parameter)
+
+
+def _fetch_cost(plan: Plan) -> float:
+    """cost of fetching the rows found by a plan, which scans and filters already did"""
+    if isinstance(plan, (FullScan, Filter)):
+        return 0.0
+    return plan.rows * ROW_FETCH_COST
+
+
+def matches(condition: Condition, row: Dict[str, Any]) -> bool:
+    """Checks a condition against a decoded row"""
+    if condition.type == ConditionType.AND:
+        return all(matches(child, row) for child in condition.val)
+    if condition.type == ConditionType.OR:
+        return any(matches(child, row) for child in condition.val)
+
+    value = row[condition.col]
+    if condition.type == ConditionType.EQUALS:
+        return value == condition.val
+    if condition.type == ConditionType.NOT_EQUALS:
+        return value != condition.val
+    if condition.type == ConditionType.IN:
+        return value in condition.val
+    if condition.type == ConditionType.LESS_THAN:
+        return value < condition.val
+    if condition.type == ConditionType.LESS_EQUALS:
+        return value <= condition.val
+    if condition.type == ConditionType.GREATER_THAN:
+        return value > condition.val
+    if condition.type == ConditionType.GREATER_EQUALS:
+        return value >= condition.val
+    if condition.type == ConditionType.BETWEEN:
+        return condition.val[0] <= value <= condition.val[1]
+    raise ValueError("Invalid condition code")
+
+
+def describe(condition: Condition) -> str:
+    if condition.type in (ConditionType.AND, ConditionType.OR):
+        joined = f" {condition.type.name} ".join(describe(c) for c in condition.val)
+        return f"({joined})"
+    if condition.type == ConditionType.BETWEEN:
+        return f"{condition.col} BETWEEN {condition.val[0]!r} AND {condition.val[1]!r}"
+    if condition.type == ConditionType.IN:
+        return f"{condition.col} IN ({', '.join(repr(v) for v in condition.val)})"
+    return f"{condition.col} {OPERATORS[condition.type]} {condition.val!r}"
@@ -0,0 +1,238 @@
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+from aggregate import Aggregation
+from planner import Plan
+from query import (
+    Change,
+    Condition,
+    ConditionType,
+    Delete,
+    Insert,
+    Parameter,
+    Select,
+    Update,
+    bind,
+    bind_value,
+    is_aggregate,
+)
+
+
+class PreparedStatement:
+    """
+    A SELECT, INSERT, UPDATE or DELETE parsed once and run many times with different values
+    for its ? parameters, from DB.prepare().
+
+    The table is looked up, literal values are converted to their columns' types and the plan
+    of the condition is chosen when the statement is prepared, using estimates for average
+    parameter values. Executing it only converts the parameters and substitutes them into
+    the plan. The plan is chosen again once the table has doubled or halved in size,
+    or once an index of the table has been created or dropped.
+    """
+
+    def __init__(self, db, statement):
+        if not isinstance(statement, (Select, Insert, Update, Delete)):
+            raise ValueError(
+                "Only SELECT, INSERT, UPDATE and DELETE statements can be prepared"
+            )
+        if statement.table_name not in db:
+            raise ValueError("Table %s does not exist" % statement.table_name)
+        self.db = db
+        self.statement = statement
+        self.table = db[statement.table_name]
+        # converter of each parameter to the type of the column it is compared with
+        self._converters: Dict[int, Callable[[Any], Any]] = {}
+
+        # columns of the rows of an INSERT, or the columns returned by a SELECT
+        self.columns = None
+        self.condition = None
+        # the aggregates of a SELECT computing them
+        self.aggregation = None
+        if isinstance(statement, Insert):
+            columns = list(self.table.cols.keys())
+            for values in statement.rows:
+                if len(values) != len(columns):
+                    raise ValueError(
+                        "Expecting %d values per row but found %d"
+                        % (len(columns), len(values))
+                    )
+            self.rows = [
+                [self._convert(col, value) for col, value in zip(columns, values)]
+                for values in statement.rows
+            ]
+            self.columns = columns
+        else:
+            self.condition = self._convert_condition(statement.conditions)
+        if isinstance(statement, Select) and is_aggregate(statement):
+            self.aggregation = Aggregation(
+                self.table, statement.columns, statement.group_by
+            )
+            self.columns = self.aggregation.names
+        elif isinstance(statement, Select) and statement.columns is not None:
+            self.columns = list(statement.columns)
+        elif isinstance(statement, Update):
+            self.changes = [
+                Change(change.col, self._convert(change.col, change.val))
+                for change in statement.changes
+            ]
+        elif isinstance(statement, Delete) and self.condition is None:
+            raise ValueError(
+                "DELETE command missing condition. If deleting all conditions is desired, call TRUNCATE instead."
+            )
+
+        self.param_count = len(self._converters)
+        self._plan()
+
+    def execute(self, params: Sequence = ()) -> Any:
+        """
+        Runs the statement with params as the values of its parameters in order.
+        A SELECT returns a cursor over its rows, and the other statements return the number
+        of rows inserted, updated or deleted, committed to the write-ahead log.
+        """
+        params = self._convert_params(params)
+        if self.aggregation is not None:
+            return self.aggregation.execute(
+                bind(self.condition, params),
+                self.statement.limit,
+                self.statement.offset or 0,
+                self._bound_plan(params),
+            )
+        if isinstance(self.statement, Select):
+            return self.table.plan_cursor(
+                self._bound_plan(params),
+                self.statement.limit,
+                self.statement.offset or 0,
+                self.columns,
+            )
+        count = self._execute(params)
+        self.db.commit()
+        return count
+
+    def executemany(self, seq_of_params: Iterable[Sequence]) -> int:
+        """
+        Runs an INSERT, UPDATE or DELETE once for every sequence of parameters,
+        committing them together. Returns the number of rows inserted, updated or deleted.
+        The rows of an INSERT are added with one DBTable.insert_many.
+        """
+        if isinstance(self.statement, Select):
+            raise ValueError("executemany() cannot run a SELECT")
+        if isinstance(self.statement, Insert):
+            rows = [
+                row
+                for params in seq_of_params
+                for row in self._bound_rows(self._convert_params(params))
+            ]
+            count = self.table.insert_many(rows) if rows else 0
+        else:
+            count = sum(
+                self._execute(self._convert_params(params)) for params in seq_of_params
+            )
+        self.db.commit()
+        return count
+
+    def explain(self) -> str:
+        """Returns the plan of the condition with its parameters shown as ?"""
+        self._replan_if_stale()
+        if self.aggregation is not None:
+            return self.aggregation.explain(self.condition, self.plan)
+        if self.plan is None:
+            return f"Full scan  (rows={self.table.row_count()})"
+        return self.plan.explain()
+
+    # --------- internal ---------
+    def _execute(self, params: List) -> int:
+        if isinstance(self.statement, Insert):
+            rows = self._bound_rows(params)
+            if len(rows) == 1:
+                self.table.insert(rows[0])
+            else:
+                self.table.insert_many(rows)
+            return len(rows)
+
+        pks = self._bound_plan(params).execute(self.table)
+        if isinstance(self.statement, Update):
+            changes = [
+                change._replace(val=bind_value(change.val, params))
+                for change in self.changes
+            ]
+            self.table.update(pks, changes)
+            return len(pks)
+        return self.table.delete(pks)
+
+    def _plan(self):
+        self._planned_rows = self.table.row_count()
+        # the table replaces its indexes when one is created or dropped
+        self._planned_indexes = self.table.indexes
+        if self.aggregation is not None:
+            self.plan = None
+            if self.condition is not None:
+                self.plan = self.table.plan(self.condition)
+        elif isinstance(self.statement, Select):
+            self.plan = self.table.cursor_plan(
+                self.condition, self.statement.limit, self.columns
+            )
+        elif isinstance(self.statement, (Update, Delete)):
+            self.plan = self.table.plan(self.condition)
+        else:
+            self.plan = None
+
+    def _replan_if_stale(self):
+        """plans again once the table has doubled or halved in size, or once an index
+        of it was created or dropped
+        """
+        rows = self.table.row_count()
+        if (
+            rows > 2 * self._planned_rows
+            or 2 * rows < self._planned_rows
+            or self.table.indexes is not self._planned_indexes
+        ):
+            self._plan()
+
+    def _bound_plan(self, params: List) -> Optional[Plan]:
+        self._replan_if_stale()
+        if self.plan is None:
+            return None
+        return self.plan.bind(params)
+
+    def _bound_rows(self, params: List) -> List[Dict[str, Any]]:
+        return [
+            {col: bind_value(value, params) for col, value in zip(self.columns, row)}
+            for row in self.rows
+        ]
+
+    def _convert_params(self, params: Sequence) -> List:
+        if len(params) != self.param_count:
+            raise ValueError(
+                "Expecting %d parameters but found %d" % (self.param_count, len(params))
+            )
+        try:
+            return [self._converters[i](value) for i, value in enumerate(params)]
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Invalid parameter: {e}")
+
+    def _convert_condition(self, condition: Optional[Condition]) -> Optional[Condition]:
+        if condition is None:
+            return None
+        if condition.type in (ConditionType.AND, ConditionType.OR):
+            return condition._replace(
+                val=tuple(self._convert_condition(child) for child in condition.val)
+            )
+        if isinstance(condition.val, tuple):
+            val = tuple(self._convert(condition.col, val) for val in condition.val)
+        else:
+            val = self._convert(condition.col, condition.val)
+        return condition._replace(val=val)
+
+    def _convert(self, col: str, value):
+        """converts a literal to the column's type, or records the converter of a parameter"""
+        if not col in self.table.cols:
+            raise ValueError(
+                "The table %s does not have a column called %s" % (self.table.name, col)
+            )
+        dbtype = self.table.cols[col].dbtype
+        if isinstance(value, Parameter):
+            self._converters[value.index] = dbtype.convert
+            return value
+        try:
+            return dbtype.convert(value)
+        except ValueError as e:
+            raise ValueError(f"Invalid value for column {col}: {e}")
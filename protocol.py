@@ -0,0 +1,78 @@
+"""
+Messages exchanged by a GatorDB server and its clients.
+
+Every message is a 4-byte big-endian length followed by that many bytes of UTF-8 JSON.
+A request is {"id": n, "sql": "...", "params": [...]}, params being the values of the
+statement's ? parameters, if any. Its response carries the same id and either
+{"ok": true, ...} with "columns" and "rows" for a SELECT, "count" for the rows changed by
+an INSERT, UPDATE or DELETE, or "message" for other statements, or {"ok": false, "error": "..."}.
+
+Requests can be pipelined: a client may send many before reading any response.
+The server answers the requests of a connection in the order they were sent.
+"""
+
+import asyncio
+import json
+import socket
+import struct
+from typing import Any, Dict, Optional
+
+# length of the payload of a message
+HEADER = struct.Struct("!I")
+# longest payload accepted, so a bad length cannot exhaust memory
+MAX_MESSAGE = 64 * 1024 * 1024
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 7443
+
+
+def encode(message: Dict[str, Any]) -> bytes:
+    payload = json.dumps(message, separators=(",", ":")).encode()
+    if len(payload) > MAX_MESSAGE:
+        raise ValueError(f"Message of {len(payload)} bytes is too long")
+    return HEADER.pack(len(payload)) + payload
+
+
+def decode(payload: bytes) -> Dict[str, Any]:
+    try:
+        message = json.loads(payload)
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError(f"Invalid message: {e}")
+    if not isinstance(message, dict):
+        raise ValueError("Invalid message: expecting a JSON object")
+    return message
+
+
+async def read_message(reader: asyncio.StreamReader) -> Optional[Dict[str, Any]]:
+    """Reads the next message from a stream, None once the other end has closed it"""
+    try:
+        header = await reader.readexactly(HEADER.size)
+    except asyncio.IncompleteReadError as e:
+        if e.partial:
+            raise ValueError("Connection closed in the middle of a message")
+        return None
+    (length,) = HEADER.unpack(header)
+    if length > MAX_MESSAGE:
+        raise ValueError(f"Message of {length} bytes is too long")
+    try:
+        return decode(await reader.readexactly(length))
+    except asyncio.IncompleteReadError:
+        raise ValueError("Connection closed in the middle of a message")
+
+
+def recv_message(sock: socket.socket) -> Dict[str, Any]:
+    """Reads the next message from a blocking socket"""
+    (length,) = HEADER.unpack(_recv_exactly(sock, HEADER.size))
+    if length > MAX_MESSAGE:
+        raise ValueError(f"Message of {length} bytes is too long")
+    return decode(_recv_exactly(sock, length))
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytes:
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("The server closed the connection")
+        data += chunk
+    return bytes(data)
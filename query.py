@@ -1,12 +1,137 @@
-from typing import Any, List, NamedTuple
+from typing import Any, List, NamedTuple, Optional, Sequence, Tuple, Union
 from enum import Enum
 
 
 class ConditionType(Enum):
     EQUALS = 0
+    LESS_THAN = 1
+    LESS_EQUALS = 2
+    GREATER_THAN = 3
+    GREATER_EQUALS = 4
+    # val is a (low, high) pair, both inclusive
+    BETWEEN = 5
+    NOT_EQUALS = 6
+    # val is a tuple of values
+    IN = 7
+    # col is None and val is a tuple of conditions
+    AND = 8
+    OR = 9
 
 
 Condition = NamedTuple(
     "Condition", (("type", ConditionType), ("col", str), ("val", Any))
 )
 Change = NamedTuple("Change", (("col", str), ("val", Any)))
+
+
+class Parameter:
+    """A ? of a prepared statement, standing for the parameter at index when it is executed"""
+
+    __slots__ = ("index",)
+
+    def __init__(self, index: int):
+        self.index = index
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Parameter) and other.index == self.index
+
+    def __hash__(self) -> int:
+        return hash((Parameter, self.index))
+
+    def __repr__(self) -> str:
+        return "?"
+
+
+def bind(condition: Optional[Condition], params: Sequence) -> Optional[Condition]:
+    """Returns a condition with its parameters replaced by their values"""
+    if condition is None:
+        return None
+    if condition.type in (ConditionType.AND, ConditionType.OR):
+        return condition._replace(
+            val=tuple(bind(child, params) for child in condition.val)
+        )
+    return condition._replace(val=bind_value(condition.val, params))
+
+
+def bind_value(value, params: Sequence):
+    """Returns a value, or the values of a BETWEEN or IN, with parameters replaced"""
+    if isinstance(value, Parameter):
+        return params[value.index]
+    if isinstance(value, tuple):
+        return tuple(bind_value(val, params) for val in value)
+    return value
+
+
+# an aggregate in the columns of a SELECT, e.g. ("SUM", "total"), with col None for COUNT(*)
+Aggregate = NamedTuple("Aggregate", (("function", str), ("col", Optional[str])))
+
+
+def column_name(column: Union[str, Aggregate]) -> str:
+    """Returns the name of a column of a SELECT in its results, e.g. SUM(total)"""
+    if isinstance(column, Aggregate):
+        return f"{column.function}({column.col or '*'})"
+    return column
+
+
+# statements returned by SQLEngine.parse, immutable so parsed statements can be cached
+# limit and offset are None when the statement does not give them
+# columns are names and Aggregates, and group_by is None without GROUP BY
+Select = NamedTuple(
+    "Select",
+    (
+        ("table_name", str),
+        ("conditions", Optional[Condition]),
+        ("columns", Optional[Tuple[Union[str, Aggregate], ...]]),
+        ("limit", Optional[int]),
+        ("offset", Optional[int]),
+        ("group_by", Optional[Tuple[str, ...]]),
+    ),
+)
+
+
+def is_aggregate(select: Select) -> bool:
+    """Returns whether a SELECT computes aggregates or groups rows"""
+    return select.group_by is not None or any(
+        isinstance(column, Aggregate) for column in select.columns or ()
+    )
+
+
+# rows are tuples of values in table column order
+Insert = NamedTuple(
+    "Insert", (("table_name", str), ("rows", Tuple[Tuple[Any, ...], ...]))
+)
+Update = NamedTuple(
+    "Update",
+    (
+        ("table_name", str),
+        ("conditions", Condition),
+        ("changes", Tuple[Change, ...]),
+    ),
+)
+Delete = NamedTuple(
+    "Delete", (("table_name", str), ("conditions", Optional[Condition]))
+)
+Truncate = NamedTuple("Truncate", (("table_name", str),))
+# columns are (name, type) pairs in table order, e.g. ("price", "float")
+CreateTable = NamedTuple(
+    "CreateTable",
+    (
+        ("table_name", str),
+        ("columns", Tuple[Tuple[str, str], ...]),
+        ("primary_key", Optional[str]),
+    ),
+)
+DropTable = NamedTuple("DropTable", (("table_name", str),))
+# name is None when the statement does not give one, using is BTREE or HASH
+CreateIndex = NamedTuple(
+    "CreateIndex",
+    (
+        ("name", Optional[str]),
+        ("table_name", str),
+        ("columns", Tuple[str, ...]),
+        ("using", str),
+    ),
+)
+# table_name is None when the statement does not give it
+DropIndex = NamedTuple("DropIndex", (("name", str), ("table_name", Optional[str])))
+Explain = NamedTuple("Explain", (("statement", Any),))
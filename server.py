@@ -0,0 +1,256 @@
+import asyncio
+import os
+import shutil
+import signal
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, Dict, List
+
+from rwlock import RWLock
+
+from db import DB, ColumnInfo, DBTable
+from parse import get_db_type
+from prepared import PreparedStatement
+from protocol import DEFAULT_HOST, DEFAULT_PORT, encode, read_message
+from query import (
+    CreateIndex,
+    CreateTable,
+    Delete,
+    DropIndex,
+    DropTable,
+    Explain,
+    Insert,
+    Select,
+    Truncate,
+    Update,
+)
+
+# threads running statements
+WORKERS = 4
+# requests of one connection read ahead of the one being run
+PIPELINE_DEPTH = 64
+# prepared statements kept per server, by SQL text
+PREPARED_CACHE_SIZE = 256
+
+
+class Server:
+    """
+    Serves a database over TCP or a Unix socket with the protocol of protocol.py.
+
+    Each connection is read by the event loop while its requests run one after another
+    in order on a pool of worker threads, so statements never block the loop and pipelined
+    requests are read while earlier ones run. The pipelined requests waiting when a worker
+    becomes free are handed to it together and their responses written back at once.
+    Requests of different connections run concurrently, relying on the tables' own locks.
+    SELECT, INSERT, UPDATE and DELETE statements are prepared once per SQL text and cached,
+    so repeated statements with ? parameters are neither parsed nor planned again.
+    CREATE TABLE, CREATE INDEX, DROP TABLE, DROP INDEX and TRUNCATE wait for running
+    statements and run alone.
+    """
+
+    def __init__(
+        self,
+        db: DB,
+        workers: int = WORKERS,
+        prepared_cache_size: int = PREPARED_CACHE_SIZE,
+    ):
+        self.db = db
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix="gatordb")
+        self.requests = 0
+        self.connections = 0
+        # held as a reader by statements on tables and as a writer by changes to the schema
+        self._schema_lock = RWLock()
+        self._prepare = lru_cache(maxsize=prepared_cache_size)(self._prepare_sql)
+
+    # --------- public ---------
+    async def start(
+        self,
+        host: str = DEFAULT_HOST,
+        port: int = DEFAULT_PORT,
+        unix_socket: str = None,
+    ) -> asyncio.AbstractServer:
+        """Starts listening on a Unix socket if one is given, otherwise on host:port"""
+        if unix_socket is not None:
+            return await asyncio.start_unix_server(self._serve, path=unix_socket)
+        return await asyncio.start_server(self._serve, host, port)
+
+    def execute(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Runs one request, returning its response"""
+        response = {"id": request.get("id")}
+        try:
+            sql = request.get("sql")
+            params = request.get("params") or []
+            if not isinstance(sql, str) or not isinstance(params, list):
+                raise ValueError("A request needs sql and a list of params")
+            response.update(self._run(sql, params))
+            response["ok"] = True
+        except Exception as e:
+            response.update(ok=False, error=str(e))
+        return response
+
+    def close(self):
+        self.executor.shutdown()
+
+    # --------- internal ---------
+    def _execute_all(self, requests: List[Dict[str, Any]]) -> List[bytes]:
+        """runs requests in order, returning their encoded responses"""
+        responses = []
+        for request in requests:
+            response = self.execute(request)
+            try:
+                responses.append(encode(response))
+            except ValueError as e:
+                responses.append(
+                    encode({"id": response["id"], "ok": False, "error": str(e)})
+                )
+        return responses
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        loop = asyncio.get_running_loop()
+        requests: asyncio.Queue = asyncio.Queue(PIPELINE_DEPTH)
+
+        async def respond():
+            while True:
+                # requests already read are run together with one hand-off to a worker
+                batch = [await requests.get()]
+                while not requests.empty() and len(batch) < PIPELINE_DEPTH:
+                    batch.append(requests.get_nowait())
+                done = batch[-1] is None
+                if done:
+                    batch.pop()
+                if batch:
+                    responses = await loop.run_in_executor(
+                        self.executor, self._execute_all, batch
+                    )
+                    self.requests += len(batch)
+                    writer.write(b"".join(responses))
+                    await writer.drain()
+                if done:
+                    return
+
+        responder = asyncio.create_task(respond())
+        error = None
+        try:
+            while not responder.done():
+                request = await read_message(reader)
+                if request is None:
+                    break
+                await requests.put(request)
+        except ValueError as e:
+            # the rest of the stream cannot be read after a bad message
+            error = str(e)
+        except ConnectionError:
+            pass
+        finally:
+            if not responder.done():
+                await requests.put(None)
+            try:
+                await responder
+                if error is not None:
+                    writer.write(encode({"id": None, "ok": False, "error": error}))
+                    await writer.drain()
+            except ConnectionError:
+                pass
+            self.connections -= 1
+            writer.close()
+
+    def _run(self, sql: str, params: List) -> Dict[str, Any]:
+        statement = self.db.engine.parse(sql)
+        if isinstance(statement, (Select, Insert, Update, Delete)):
+            with self._schema_lock.reader_lock:
+                prepared = self._prepare(sql)
+                result = prepared.execute(params)
+                if isinstance(statement, Select):
+                    return {
+                        "columns": result.columns,
+                        "rows": [list(row.values()) for row in result.fetchall()],
+                    }
+                return {"count": result}
+        if params:
+            raise ValueError(
+                "Parameters (?) can only be used in SELECT, INSERT, UPDATE and DELETE"
+            )
+        if isinstance(statement, Explain):
+            with self._schema_lock.reader_lock:
+                return {
+                    "message": PreparedStatement(self.db, statement.statement).explain()
+                }
+
+        with self._schema_lock.writer_lock:
+            # cached statements may refer to tables about to change
+            self._prepare.cache_clear()
+            if isinstance(statement, CreateTable):
+                return {"message": self._create_table(statement)}
+            if isinstance(statement, CreateIndex):
+                name = self.db.create_index(
+                    statement.table_name,
+                    statement.columns,
+                    statement.name,
+                    statement.using,
+                )
+                return {"message": "Created index %s" % name}
+            if isinstance(statement, DropIndex):
+                self.db.drop_index(statement.name, statement.table_name)
+                return {"message": "Dropped index %s" % statement.name}
+            if statement.table_name not in self.db:
+                raise ValueError("Table %s does not exist" % statement.table_name)
+            table = self.db[statement.table_name]
+            if isinstance(statement, Truncate):
+                table.delete_all_rows()
+                self.db.commit()
+                return {"message": "Truncated table %s" % table.name}
+            if isinstance(statement, DropTable):
+                table.close()
+                del self.db[table.name]
+                shutil.rmtree(os.path.join(self.db.name, table.name))
+                return {"message": "Dropped table %s" % table.name}
+        raise ValueError("Unknown command")
+
+    def _prepare_sql(self, sql: str) -> PreparedStatement:
+        return self.db.prepare(sql)
+
+    def _create_table(self, statement: CreateTable) -> str:
+        if statement.table_name in self.db:
+            raise ValueError("Table %s already exists" % statement.table_name)
+        table = DBTable(name=statement.table_name, path=self.db.name, pool=self.db.pool)
+        for name, column_type in statement.columns:
+            table.add_column(
+                name,
+                ColumnInfo(
+                    dbtype=get_db_type(column_type),
+                    primary_key=name == statement.primary_key,
+                ),
+            )
+        self.db[table.name] = table
+        table.save()
+        return "Created table %s with %d columns" % (table.name, len(table.cols))
+
+
+def run_server(args):
+    """Serves the database at args.dbpath until interrupted, then closes it"""
+    name = args.dbpath or "database"
+    if args.cache_size:
+        db = DB(name=name, cache_size=args.cache_size * 1024 * 1024)
+    else:
+        db = DB(name=name)
+    server = Server(db, workers=args.workers or WORKERS)
+
+    async def serve():
+        listener = await server.start(args.host, args.port, args.unix_socket)
+        where = args.unix_socket or f"{args.host}:{args.port}"
+        print(f"(Serving database '{name}' on {where})")
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        async with listener:
+            await stop.wait()
+
+    try:
+        asyncio.run(serve())
+    finally:
+        server.close()
+        db.close()
+        if args.unix_socket and os.path.exists(args.unix_socket):
+            os.remove(args.unix_socket)
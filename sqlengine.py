@@ -1,436 +1,585 @@
-import sqlparse
+from functools import lru_cache
+from typing import Any, List, Optional, Tuple, Union
+import re
 
+from query import (
+    Aggregate,
+    Change,
+    Condition,
+    ConditionType,
+    CreateIndex,
+    CreateTable,
+    Delete,
+    DropIndex,
+    DropTable,
+    Explain,
+    Insert,
+    Parameter,
+    Select,
+    Truncate,
+    Update,
+)
 
-class SQLEngine:
-    """
-    This is a helper class used to parse SQL commands
-    """
 
-    # name of the table
-    table_name = None
+COMPARISON_TYPES = {
+    "=": ConditionType.EQUALS,
+    "!=": ConditionType.NOT_EQUALS,
+    "<>": ConditionType.NOT_EQUALS,
+    "<": ConditionType.LESS_THAN,
+    "<=": ConditionType.LESS_EQUALS,
+    ">": ConditionType.GREATER_THAN,
+    ">=": ConditionType.GREATER_EQUALS,
+}
 
-    # table fields, e.g varchar, integer etc
-    class_fields = {}
+COLUMN_TYPES = ("float", "varchar", "text", "integer", "int")
 
-    # primary key used in the table
-    primary_key = None
+# index structures of CREATE INDEX ... USING, the first being the default
+INDEX_METHODS = ("BTREE", "HASH")
 
-    def __parse_class_fields(self, tokens):
-        """
-        Parse the CREATE TABLE (...attributes) statement
-        :param tokens: parsed SQL tokens in the CREATE table statement
-        :return: a dictionary containing the information in the parsed SQL statement
-        :raises ValueError if the provided SQL statement is invalid
-        """
-        tokens = list(filter(lambda token: not token.is_whitespace, tokens))
-        field = None
-        name = None
-        i = 0
-        while i < len(tokens):
-            token = tokens[i]
-            i = i + 1
-            if not token.normalized == "(":
-                if token.is_keyword:
-                    if token.normalized == "PRIMARY":
-                        self.primary_key = name
-                        self.class_fields[name] = field
-                        next_token = tokens[i]
-                        index = next_token.value.rfind(",")
-                        if index == -1:
-                            name = None
-                        else:
-                            name = next_token.value[index + 1 :].strip()
-                            i = i + 1
-                    elif token.normalized == "KEY":
-                        continue
-                    else:
-                        raise ValueError("Unsupported keyword: %s" % token.value)
-                elif token.ttype is None or token.ttype == sqlparse.tokens.Keyword:
-                    name = token.value.strip()
-                elif token.ttype == sqlparse.tokens.Name.Builtin:
-                    if token.normalized.lower() in (
-                        "float",
-                        "varchar",
-                        "text",
-                        "integer",
-                        "int",
-                    ):
-                        field = token.normalized.lower()
-                    else:
-                        raise ValueError("Unsupported data type: " + token.value)
-                elif token.normalized == ")" or token.normalized == ",":
-                    if name is not None and field is not None:
-                        self.class_fields[name] = field
-                    field = None
-                    name = None
-                else:
-                    raise ValueError("There is an unsupported class field")
-        return {
-            "type": "CREATE TABLE",
-            "table_name": self.table_name,
-            "attributes": self.class_fields,
-            "primary_key": self.primary_key,
-        }
+# functions that can be used in the columns of SELECT
+AGGREGATES = ("COUNT", "SUM", "AVG", "MIN", "MAX")
 
-    def __parse_create_table_statement(self, tokens):
-        """
-        Ensure that the CREATE TABLE statement is formatted correctly
-        :param tokens: parsed SQL tokens in the CREATE table statement
-        :return: a dictionary containing the information in the parsed SQL statement
-        :raises ValueError if the provided SQL statement is invalid
-        """
-        for token in tokens:
-            if not token.is_whitespace:
-                if isinstance(token, sqlparse.sql.Identifier):
-                    self.table_name = token.value
-                elif isinstance(token, sqlparse.sql.Parenthesis):
-                    return self.__parse_class_fields(token.tokens)
-                elif token.is_group:
-                    group_tokens = token.tokens
-                    for j in range(0, len(group_tokens)):
-                        group_token = group_tokens[j]
-                        if isinstance(group_token, sqlparse.sql.Identifier):
-                            self.table_name = group_token.value
-                        elif isinstance(group_token, sqlparse.sql.Parenthesis):
-                            return self.__parse_class_fields(group_token.tokens)
-                        else:
-                            raise ValueError(
-                                "Expecting identifier after CREATE TABLE or parenthesis after identifier"
-                            )
-                else:
-                    raise ValueError("Expecting grouped statement after CREATE table")
-        raise ValueError("Empty CREATE TABLE statement")
-
-    def __parse_create_statement(self, tokens):
+# statement keywords that stand for others
+ALIASES = {
+    "SWIPE": ("SELECT",),
+    "HATCH": ("CREATE", "TABLE"),
+    "CHOMP": ("TRUNCATE",),
+    "SWAMP": ("DROP", "TABLE"),
+}
+
+# number of parsed statements SQLEngine keeps by default
+CACHE_SIZE = 256
+
+NUMBER = "number"
+STRING = "string"
+NAME = "name"
+OPERATOR = "operator"
+PUNCTUATION = "punctuation"
+
+_TOKENS = re.compile(
+    r"""\s*(?:
+        (?P<number>-?(?:\d+\.\d*|\.\d+|\d+)(?:[eE][-+]?\d+)?)
+      | (?P<string>'(?:[^']|'')*'|"(?:[^"]|"")*")
+      | (?P<name>[A-Za-z_][A-Za-z0-9_]*)
+      | (?P<operator><=|>=|!=|<>|=|<|>)
+      | (?P<punctuation>[(),*;?])
+    )""",
+    re.VERBOSE,
+)
+
+# (kind, text) where the text of a string is its value without quotes
+Token = Tuple[str, str]
+
+
+class SQLEngine:
+    """
+    This is a helper class used to parse SQL commands.
+    Parsed statements are kept in a bounded LRU cache keyed on the statement text,
+    so repeated statements are only parsed once.
+    """
+
+    def __init__(self, cache_size: int = CACHE_SIZE):
         """
-        Ensure that the CREATE statement is formatted correctly
-        :param tokens: parsed SQL tokens in the CREATE table statement
-        :return: a dictionary containing the information in the parsed SQL statement
-        :raises ValueError if the provided SQL statement is invalid
+        :param cache_size: number of parsed statements to keep, 0 to parse every statement
         """
-        for i in range(0, len(tokens)):
-            token = tokens[i]
-            if not token.is_whitespace:
-                if token.normalized == "TABLE":
-                    return self.__parse_create_table_statement(tokens[i + 1 :])
-                else:
-                    raise ValueError(
-                        "Unsupported operation: CREATE " % token.normalized
-                    )
-        raise ValueError("Empty CREATE statement")
+        self._parse_cached = lru_cache(maxsize=cache_size)(_parse)
 
-    @staticmethod
-    def __parse_where_conditions(tokens):
+    def parse(self, sql: str):
         """
-        Parse the WHERE conditions, e.g WHERE table_column = value
-        :param tokens: parsed SQL tokens in the CREATE table statement
-        :return: a dictionary containing the information in the parsed SQL statement
-        :raises ValueError if the provided SQL statement is invalid
+        Parse an SQL statement into a statement object
+        :param sql: SQL statement to parse
+        :return: a Select, Insert, Update, Delete, Truncate, CreateTable, DropTable or Explain
+        :raises: ValueError if the SQL statement is invalid
         """
-        conditions = {}
-        for i in range(0, len(tokens)):
-            token = tokens[i]
-            if isinstance(token, sqlparse.sql.Comparison):
-                conditions[token.left.value] = token.right.value.strip('"').strip("'")
-                return conditions
-        raise ValueError("Invalid comparison in WHERE statement")
+        return self._parse_cached(normalize(sql))
 
-    def __parse_select_statement(self, tokens):
+    def parse_sql(self, sql: str) -> dict:
         """
-        Ensure that the SELECT statement is formatted correctly
-        :param tokens: parsed SQL tokens in the SELECT table statement
-        :return: a dictionary containing the information in the parsed SQL statement
-        :raises ValueError if the provided SQL statement is invalid
+        Parse an SQL statement
+        :param sql: SQL statement to parse
+        :return: a dictionary containing the features of the SQL statement
+        :raises: ValueError if the SQL statement contains invalid fields
         """
-        conditions = {}
-
-        following_wildcard = False
-
-        for i in range(0, len(tokens)):
-            token = tokens[i]
-
-            if not token.is_whitespace:
-                if token.ttype == sqlparse.tokens.Wildcard:
-                    following_wildcard = True
-                    continue
-
-                if isinstance(token, sqlparse.sql.Identifier):
-                    self.table_name = token.value
-                elif isinstance(token, sqlparse.sql.Where):
-                    conditions = self.__parse_where_conditions(token.tokens[1:])
-                elif token.ttype == sqlparse.tokens.Punctuation:
-                    continue
-                elif (
-                    token.ttype == sqlparse.tokens.Keyword
-                    and token.value == "FROM"
-                    and following_wildcard
-                ):
-                    continue
-                else:
-                    raise ValueError("Unhandled operation in SELECT statement")
-
-                following_wildcard = False
-
-        if self.table_name is None:
-            raise ValueError("Missing identifier in SELECT statement")
-        else:
-            return {
-                "type": "SELECT",
-                "table_name": self.table_name,
-                "conditions": conditions,
-            }
+        return as_dict(self.parse(sql))
 
-    def __process_into_values(self, tokens):
+    def cache_info(self):
         """
-        Ensure that the INSERT INTO statement is formatted correctly
-        :param tokens: parsed SQL tokens in the INSERT INTO table statement
-        :return: a dictionary containing the information in the parsed SQL statement
-        :raises ValueError if the provided SQL statement is invalid
+        :return: hits, misses, maximum size and current size of the statement cache
         """
-        values = []
-        for i in range(0, len(tokens)):
-            token = tokens[i]
-            if not token.is_whitespace:
-                if isinstance(token, sqlparse.sql.IdentifierList):
-                    for valueToken in token.tokens:
-                        if not valueToken.is_whitespace:
-
-                            def is_int(number):
-                                """
-                                Check if a variable is an integer
-                                :param number: variable to check
-                                :return: true if the variable is an integer, false otherwise
-                                """
-                                try:
-                                    int(number)
-                                    return True
-                                except:
-                                    return False
-
-                            def is_float(number):
-                                """
-                                Check if a variable is a float
-                                :param number: variable to check
-                                :return: true if the variable is an float, false otherwise
-                                """
-                                try:
-                                    float(number)
-                                    return True
-                                except:
-                                    return False
-
-                            value = valueToken.value
-                            if is_int(value):
-                                values.append(int(value))
-                            elif is_float(value):
-                                values.append(float(value))
-                            elif valueToken.ttype is None:
-                                value = value.strip('"').strip("'")
-                                values.append(value)
-        if len(values) == 0:
-            raise ValueError("No values provided")
+        return self._parse_cached.cache_info()
+
+
+def normalize(sql: str) -> str:
+    """
+    Normalize the text of a statement so equivalent statements share a cache entry
+    :param sql: SQL statement
+    :return: the statement without surrounding whitespace and trailing semicolons
+    """
+    return sql.strip().rstrip(";").rstrip()
+
+
+def as_dict(statement) -> dict:
+    """
+    Convert a statement object into the dictionary returned by SQLEngine.parse_sql
+    :param statement: parsed statement
+    :return: a dictionary containing the features of the statement
+    """
+    if isinstance(statement, Select):
+        parsed = {
+            "type": "SELECT",
+            "table_name": statement.table_name,
+            "conditions": statement.conditions,
+        }
+        if statement.columns is not None:
+            parsed["columns"] = list(statement.columns)
+        if statement.limit is not None:
+            parsed["limit"] = statement.limit
+        if statement.offset is not None:
+            parsed["offset"] = statement.offset
+        if statement.group_by is not None:
+            parsed["group_by"] = list(statement.group_by)
+        return parsed
+    if isinstance(statement, Insert):
+        parsed = {"type": "INSERT INTO", "table_name": statement.table_name}
+        if len(statement.rows) == 1:
+            parsed["values"] = list(statement.rows[0])
         else:
-            return {
-                "type": "INSERT INTO",
-                "table_name": self.table_name,
-                "values": values,
-            }
+            parsed["rows"] = [list(row) for row in statement.rows]
+        return parsed
+    if isinstance(statement, Update):
+        return {
+            "type": "UPDATE",
+            "table_name": statement.table_name,
+            "conditions": statement.conditions,
+            "new_value": {change.col: change.val for change in statement.changes},
+        }
+    if isinstance(statement, Delete):
+        return {
+            "type": "DELETE",
+            "table_name": statement.table_name,
+            "conditions": statement.conditions,
+        }
+    if isinstance(statement, Truncate):
+        return {
+            "type": "TRUNCATE",
+            "table_name": statement.table_name,
+            "conditions": None,
+        }
+    if isinstance(statement, CreateTable):
+        return {
+            "type": "CREATE TABLE",
+            "table_name": statement.table_name,
+            "attributes": dict(statement.columns),
+            "primary_key": statement.primary_key,
+        }
+    if isinstance(statement, DropTable):
+        return {"type": "DROP TABLE", "table_name": statement.table_name}
+    if isinstance(statement, CreateIndex):
+        return {
+            "type": "CREATE INDEX",
+            "index_name": statement.name,
+            "table_name": statement.table_name,
+            "columns": list(statement.columns),
+            "using": statement.using,
+        }
+    if isinstance(statement, DropIndex):
+        parsed = {"type": "DROP INDEX", "index_name": statement.name}
+        if statement.table_name is not None:
+            parsed["table_name"] = statement.table_name
+        return parsed
+    if isinstance(statement, Explain):
+        return {"type": "EXPLAIN", "statement": as_dict(statement.statement)}
+    raise ValueError("Unknown statement: %r" % (statement,))
 
-    def __parse_insert_statement(self, tokens):
-        """
-        Ensure that the INSERT statement is formatted correctly
-        :param tokens: parsed SQL tokens in the INSERT table statement
-        :return: a dictionary containing the information in the parsed SQL statement
-        :raises ValueError if the provided SQL statement is invalid
-        """
-        found_into = False
-        for token in tokens:
-            found_into = found_into or (
-                token.normalized == "INTO"
-                and token.ttype == sqlparse.tokens.Keyword
-                and token.is_keyword
+
+def tokenize(sql: str) -> List[Token]:
+    """
+    Split an SQL statement into tokens
+    :param sql: SQL statement
+    :return: (kind, text) of each token
+    :raises: ValueError on a character that cannot start a token
+    """
+    tokens = []
+    pos = 0
+    end = len(sql.rstrip())
+    while pos < end:
+        match = _TOKENS.match(sql, pos)
+        if match is None:
+            raise ValueError(
+                "Unexpected character '%s' in SQL statement" % sql[pos:].lstrip()[0]
             )
-            if not token.is_whitespace:
-                if isinstance(token, sqlparse.sql.Identifier):
-                    self.table_name = token.value
-                elif isinstance(token, sqlparse.sql.Values):
-                    values = token.tokens[1:]
-                    if len(values) == 0:
-                        raise ValueError("Missing VALUES parameter")
-                    values = values[-1]
-                    if isinstance(values, sqlparse.sql.Parenthesis):
-                        return self.__process_into_values(values.tokens)
-                    else:
-                        raise ValueError("Expecting parenthesis in VALUES")
-        if found_into:
-            raise ValueError("Missing VALUES parameters")
+        kind = match.lastgroup
+        text = match.group(kind)
+        if kind == STRING:
+            quote = text[0]
+            text = text[1:-1].replace(quote * 2, quote)
+        tokens.append((kind, text))
+        pos = match.end()
+    return tokens
+
+
+def _parse(sql: str):
+    """parses a normalized statement, cached by SQLEngine"""
+    tokens = tokenize(sql)
+    if not tokens:
+        raise ValueError("Empty or invalid SQL statement")
+    return _Parser(tokens).parse()
+
+
+class _Parser:
+    """
+    Recursive descent parser for GatorSQL:
+    statement   := [EXPLAIN] (select | insert | update | delete | truncate | create | drop
+                   | index | drop_index) [;]
+    select      := SELECT (* FROM name | column (, column)* FROM name | name)
+                   [WHERE expression] [GROUP BY name (, name)*] [LIMIT integer] [OFFSET integer]
+    column      := name | aggregate ( name ) | COUNT ( * )
+    aggregate   := COUNT | SUM | AVG | MIN | MAX
+    insert      := INSERT INTO name VALUES row (, row)*
+    row         := ( literal (, literal)* )
+    update      := UPDATE name SET name = value (, name = value)* WHERE expression
+    delete      := DELETE [FROM] name [WHERE expression]
+    truncate    := TRUNCATE [TABLE] name
+    create      := CREATE TABLE name ( name type [PRIMARY KEY] (, name type [PRIMARY KEY])* )
+    drop        := DROP TABLE name
+    index       := CREATE INDEX [name] ON name [USING method] ( name (, name)* ) [USING method]
+    method      := BTREE | HASH
+    drop_index  := DROP INDEX name [ON name]
+    expression  := conjunction (OR conjunction)*
+    conjunction := predicate (AND predicate)*
+    predicate   := ( expression ) | name comparison value
+                 | name BETWEEN value AND value | name IN ( value (, value)* )
+    SWIPE, HATCH, CHOMP and SWAMP stand for SELECT, CREATE TABLE, TRUNCATE and DROP TABLE.
+    With aggregates or GROUP BY, every column that is not an aggregate must be in GROUP BY.
+    Keywords are case insensitive, names keep their case.
+    Values of WHERE and SET are left as strings for the caller to convert to the column's type,
+    while literals of INSERT are converted to int or float when they are numbers.
+    A ? in place of any of them is a Parameter, numbered from 0 in order of appearance.
+    """
+
+    def __init__(self, tokens: List[Token]):
+        self.tokens = tokens
+        self.pos = 0
+        self.parameters = 0
+
+    def parse(self):
+        statement = self.statement()
+        self.accept_punctuation(";")
+        if self.pos != len(self.tokens):
+            raise ValueError("Unexpected '%s' in SQL statement" % self.peek()[1])
+        return statement
+
+    # --------- statements ---------
+    def statement(self):
+        keyword = self.next_keyword()
+        if keyword in ALIASES:
+            keyword, *rest = ALIASES[keyword]
+            self.tokens[self.pos : self.pos] = [(NAME, word) for word in rest]
+        if keyword == "EXPLAIN":
+            return Explain(self.statement())
+        if keyword == "SELECT":
+            return self.select()
+        if keyword == "INSERT":
+            return self.insert()
+        if keyword == "UPDATE":
+            return self.update()
+        if keyword == "DELETE":
+            return self.delete()
+        if keyword == "TRUNCATE":
+            self.accept_keyword("TABLE")
+            return Truncate(self.name("TRUNCATE"))
+        if keyword == "CREATE":
+            if self.accept_keyword("INDEX"):
+                return self.create_index()
+            self.expect_keyword("TABLE", "CREATE")
+            return self.create_table()
+        if keyword == "DROP":
+            if self.accept_keyword("INDEX"):
+                name = self.name("DROP INDEX")
+                table_name = None
+                if self.accept_keyword("ON"):
+                    table_name = self.name("DROP INDEX")
+                return DropIndex(name, table_name)
+            self.expect_keyword("TABLE", "DROP")
+            return DropTable(self.name("DROP TABLE"))
+        raise ValueError("Unsupported operation: " + keyword)
+
+    def select(self) -> Select:
+        columns = None
+        if self.accept_punctuation("*"):
+            self.expect_keyword("FROM", "SELECT *")
+            table_name = self.name("SELECT")
         else:
-            raise ValueError("Missing INTO keyword")
+            names = [self.column()]
+            while self.accept_punctuation(","):
+                names.append(self.column())
+            if self.accept_keyword("FROM"):
+                columns = tuple(names)
+                table_name = self.name("SELECT")
+            elif len(names) == 1 and isinstance(names[0], str):
+                # SELECT <table_name> selects every column
+                table_name = names[0]
+            else:
+                raise ValueError("Expecting FROM after the columns of SELECT")
 
-    def __parse_update_statement(self, tokens):
-        """
-        Ensure that the UPDATE statement is formatted correctly.
-        This statement will delete all rows in a table fulfilling a given condition
-        :param tokens: parsed SQL tokens in the UPDATE table statement
-        :return: a dictionary containing the information in the parsed SQL statement
-        :raises ValueError if the provided SQL statement is invalid
-        """
-        conditions = {}
-        new_value = {}
-        for i in range(0, len(tokens)):
-            token = tokens[i]
-            if token.is_whitespace:
-                continue
-            elif isinstance(token, sqlparse.sql.Identifier):
-                self.table_name = token.value
-            elif isinstance(token, sqlparse.sql.Comparison):
-                new_value[token.left.value] = token.right.value.strip('"').strip("'")
-            elif isinstance(token, sqlparse.sql.Where):
-                conditions = self.__parse_where_conditions(token.tokens[1:])
-            elif token.normalized == "SET" and token.is_keyword:
-                continue
+        conditions = self.where()
+        group_by = None
+        if self.accept_keyword("GROUP"):
+            self.expect_keyword("BY", "GROUP")
+            group_by = [self.name("GROUP BY")]
+            while self.accept_punctuation(","):
+                group_by.append(self.name("GROUP BY"))
+            group_by = tuple(group_by)
+        if group_by is not None or any(
+            isinstance(column, Aggregate) for column in columns or ()
+        ):
+            if columns is None:
+                raise ValueError("GROUP BY needs a list of columns instead of *")
+            for column in columns:
+                if isinstance(column, str) and column not in (group_by or ()):
+                    raise ValueError(
+                        "Column %s must be in GROUP BY or used in an aggregate" % column
+                    )
+        limit = offset = None
+        while True:
+            if limit is None and self.accept_keyword("LIMIT"):
+                limit = self.integer("LIMIT")
+            elif offset is None and self.accept_keyword("OFFSET"):
+                offset = self.integer("OFFSET")
             else:
-                raise ValueError("Unhandled syntax in UPDATE statement")
-        if len(new_value) == 0:
+                break
+        return Select(table_name, conditions, columns, limit, offset, group_by)
+
+    def column(self) -> Union[str, Aggregate]:
+        """a column of SELECT, either a name or an aggregate of a column"""
+        name = self.name("SELECT")
+        if name.upper() not in AGGREGATES or not self.accept_punctuation("("):
+            return name
+        function = name.upper()
+        if self.accept_punctuation("*"):
+            if function != "COUNT":
+                raise ValueError("Only COUNT can be given *, not %s" % function)
+            column = None
+        else:
+            column = self.name(function)
+        self.expect_punctuation(")", function)
+        return Aggregate(function, column)
+
+    def insert(self) -> Insert:
+        if not self.accept_keyword("INTO"):
+            raise ValueError("Missing INTO keyword")
+        table_name = self.name("INSERT INTO")
+        if not self.accept_keyword("VALUES"):
+            raise ValueError("Missing VALUES parameters")
+        rows = [self.row()]
+        while self.accept_punctuation(","):
+            rows.append(self.row())
+        return Insert(table_name, tuple(rows))
+
+    def row(self) -> Tuple[Any, ...]:
+        self.expect_punctuation("(", "VALUES")
+        values = [self.literal()]
+        while self.accept_punctuation(","):
+            values.append(self.literal())
+        self.expect_punctuation(")", "VALUES")
+        return tuple(values)
+
+    def update(self) -> Update:
+        table_name = self.name("UPDATE")
+        if not self.accept_keyword("SET"):
             raise ValueError(
                 "New value is not defined in UPDATE statement, i.e missing SET <table_column> = <new value>"
             )
-        if len(conditions) == 0:
+        changes = [self.change()]
+        while self.accept_punctuation(","):
+            changes.append(self.change())
+        conditions = self.where()
+        if conditions is None:
             raise ValueError(
                 "Missing conditions in UPDATE statement, i.e missing WHERE <table_column> = <new value>"
             )
-        return {
-            "type": "UPDATE",
-            "table_name": self.table_name,
-            "conditions": conditions,
-            "new_value": new_value,
-        }
+        return Update(table_name, conditions, tuple(changes))
 
-    def __parse_delete_statement(self, tokens):
-        """
-        Ensure that the DELETE statement is formatted correctly.
-        This statement will delete all rows in a table fulfilling a given condition
-        :param tokens: parsed SQL tokens in the DELETE table statement
-        :return: a dictionary containing the information in the parsed SQL statement
-        :raises ValueError if the provided SQL statement is invalid
-        """
-        conditions = {}
-        for i in range(0, len(tokens)):
-            token = tokens[i]
-            if isinstance(token, sqlparse.sql.Identifier):
-                self.table_name = token.value
-            elif isinstance(token, sqlparse.sql.Where):
-                conditions = self.__parse_where_conditions(token.tokens[1:])
-        if self.table_name is None:
-            raise ValueError("Missing identifier for DELETE statement")
-        else:
-            return {
-                "type": "DELETE",
-                "table_name": self.table_name,
-                "conditions": conditions,
-            }
+    def change(self) -> Change:
+        column = self.name("SET")
+        kind, text = self.next("SET")
+        if text != "=":
+            raise ValueError("Expecting '=' after %s in SET" % column)
+        return Change(column, self.value())
 
-    def __parse_truncate_statement(self, tokens):
-        """
-        Ensure that the TRUNCATE statement is formatted correctly.
-        This statement will delete all the rows in a table
-        :param tokens: parsed SQL tokens in the TRUNCATE table statement
-        :return: a dictionary containing the information in the parsed SQL statement
-        :raises ValueError if the provided SQL statement is invalid
-        """
-        conditions = {}
-        for i in range(0, len(tokens)):
-            token = tokens[i]
-            if isinstance(token, sqlparse.sql.Identifier):
-                self.table_name = token.value
-            elif isinstance(token, sqlparse.sql.Where):
-                conditions = self.__parse_where_conditions(token.tokens[1:])
-        if self.table_name is None:
-            raise ValueError("Missing identifier for TRUNCATE statement")
-        else:
-            return {
-                "type": "TRUNCATE",
-                "table_name": self.table_name,
-                "conditions": conditions,
-            }
+    def delete(self) -> Delete:
+        self.accept_keyword("FROM")
+        return Delete(self.name("DELETE"), self.where())
 
-    def __parse_drop_statement(self, tokens):
-        """
-        Ensure that the DROP statement is formatted correctly.
-        :param tokens: parsed SQL tokens in the DROP table statement
-        :return: a dictionary containing the information in the parsed SQL statement
-        :raises ValueError if the provided SQL statement is invalid
-        """
-        found_table = False
-        for token in tokens:
-            found_table = found_table or (
-                token.normalized == "TABLE"
-                and token.ttype == sqlparse.tokens.Keyword
-                and token.is_keyword
-            )
-            if isinstance(token, sqlparse.sql.Identifier):
-                self.table_name = token.value
-        if found_table:
-            if self.table_name is None:
-                raise ValueError("Missing identifier in DROP statement")
-            else:
-                return {"type": "DROP TABLE", "table_name": self.table_name}
-        else:
-            raise ValueError("Missing TABLE keyword in DROP table")
+    def create_table(self) -> CreateTable:
+        table_name = self.name("CREATE TABLE")
+        self.expect_punctuation("(", "CREATE TABLE")
+        columns = []
+        primary_key = None
+        while True:
+            column = self.name("CREATE TABLE")
+            kind, column_type = self.next("CREATE TABLE")
+            if kind != NAME or column_type.lower() not in COLUMN_TYPES:
+                raise ValueError("Unsupported data type: " + column_type)
+            if self.accept_punctuation("("):
+                # lengths such as varchar(255) are accepted and ignored
+                self.integer(column_type)
+                self.expect_punctuation(")", column_type)
+            if self.accept_keyword("PRIMARY"):
+                self.expect_keyword("KEY", "PRIMARY")
+                if primary_key is not None:
+                    raise ValueError("Table %s has two primary keys" % table_name)
+                primary_key = column
+            columns.append((column, column_type.lower()))
+            if not self.accept_punctuation(","):
+                break
+        self.expect_punctuation(")", "CREATE TABLE")
+        return CreateTable(table_name, tuple(columns), primary_key)
 
-    @staticmethod
-    def __alias_sql(sql):
-        """
-        Allow aliases for SQL commands for shortcuts.
-        The current mappings allowed are:
-        SWIPE -> SELECT
-        HATCH -> CREATE TABLE
-        CHOMP -> TRUNCATE
-        SWAMP -> DROP TABLE
-        :param sql: SQL statement in String format
-        :return: the SQL statement with the aliases replaced with the SQL-compliant keywords
-        """
-        sql_upper = sql.upper().strip()
-        if sql_upper.startswith("SWIPE"):
-            sql = "SELECT" + sql[len("SWIPE") :]
-        elif sql_upper.startswith("HATCH"):
-            sql = "CREATE TABLE" + sql[len("HATCH") :]
-        elif sql_upper.startswith("CHOMP"):
-            sql = "TRUNCATE" + sql[len("CHOMP") :]
-        elif sql_upper.startswith("SWAMP"):
-            sql = "DROP TABLE" + sql[len("SWAMP") :]
-        return sql
-
-    def parse_sql(self, sql):
-        """
-        Parse an SQL statement
-        :param sql: SQL statement to parse
-        :return: a dictionary containing the features of the SQL statement
-        :raises: ValueError if the SQL statement contains invalid fields
-        """
-        self.table_name = None
-        sql = self.__alias_sql(sql)
-        parsed = sqlparse.parse(sql)
-        if len(parsed) > 0:
-            tokens = parsed[0].tokens
-            for tokenId in range(0, len(tokens)):
-                token = tokens[tokenId]
-                if not token.is_whitespace:
-                    remaining_tokens = tokens[tokenId + 1 :]
-                    if token.normalized == "CREATE":
-                        return self.__parse_create_statement(remaining_tokens)
-                    elif token.normalized == "SELECT":
-                        return self.__parse_select_statement(remaining_tokens)
-                    elif token.normalized == "INSERT":
-                        return self.__parse_insert_statement(remaining_tokens)
-                    elif token.normalized == "UPDATE":
-                        return self.__parse_update_statement(remaining_tokens)
-                    elif token.normalized == "DELETE":
-                        return self.__parse_delete_statement(remaining_tokens)
-                    elif token.normalized == "TRUNCATE":
-                        return self.__parse_truncate_statement(remaining_tokens)
-                    elif token.normalized == "DROP":
-                        return self.__parse_drop_statement(remaining_tokens)
-                    else:
-                        raise ValueError("Unsupported operation: " + token.normalized)
-        raise ValueError("Empty or invalid SQL statement")
+    def create_index(self) -> CreateIndex:
+        name = None
+        if not self.accept_keyword("ON"):
+            name = self.name("CREATE INDEX")
+            self.expect_keyword("ON", "CREATE INDEX")
+        table_name = self.name("CREATE INDEX")
+        using = self.using()
+        self.expect_punctuation("(", "CREATE INDEX")
+        columns = [self.name("CREATE INDEX")]
+        while self.accept_punctuation(","):
+            columns.append(self.name("CREATE INDEX"))
+        self.expect_punctuation(")", "CREATE INDEX")
+        using = self.using() or using
+        return CreateIndex(name, table_name, tuple(columns), using or INDEX_METHODS[0])
+
+    def using(self) -> Optional[str]:
+        """the index method of an optional USING clause"""
+        if not self.accept_keyword("USING"):
+            return None
+        method = self.name("USING").upper()
+        if method not in INDEX_METHODS:
+            raise ValueError("Unsupported index method: " + method)
+        return method
+
+    # --------- conditions ---------
+    def where(self) -> Optional[Condition]:
+        if self.accept_keyword("WHERE"):
+            return self.expression()
+        return None
+
+    def expression(self) -> Condition:
+        conditions = [self.conjunction()]
+        while self.accept_keyword("OR"):
+            conditions.append(self.conjunction())
+        if len(conditions) == 1:
+            return conditions[0]
+        return Condition(ConditionType.OR, None, tuple(conditions))
+
+    def conjunction(self) -> Condition:
+        conditions = [self.predicate()]
+        while self.accept_keyword("AND"):
+            conditions.append(self.predicate())
+        if len(conditions) == 1:
+            return conditions[0]
+        return Condition(ConditionType.AND, None, tuple(conditions))
+
+    def predicate(self) -> Condition:
+        if self.accept_punctuation("("):
+            condition = self.expression()
+            self.expect_punctuation(")", "WHERE")
+            return condition
+
+        column = self.name("WHERE")
+        kind, text = self.next("WHERE")
+        if kind == OPERATOR:
+            return Condition(COMPARISON_TYPES[text], column, self.value())
+        if kind == NAME and text.upper() == "BETWEEN":
+            low = self.value()
+            self.expect_keyword("AND", "BETWEEN")
+            return Condition(ConditionType.BETWEEN, column, (low, self.value()))
+        if kind == NAME and text.upper() == "IN":
+            self.expect_punctuation("(", "IN")
+            values = [self.value()]
+            while self.accept_punctuation(","):
+                values.append(self.value())
+            self.expect_punctuation(")", "IN")
+            return Condition(ConditionType.IN, column, tuple(values))
+        raise ValueError("Invalid comparison in WHERE statement")
+
+    # --------- values ---------
+    def value(self) -> Union[str, Parameter]:
+        """a value of WHERE or SET, as written"""
+        if self.accept_punctuation("?"):
+            return self.parameter()
+        kind, text = self.next("WHERE")
+        if kind not in (NUMBER, STRING, NAME):
+            raise ValueError("Expecting a value but found '%s'" % text)
+        return text
+
+    def literal(self):
+        """a value of INSERT, converted to int or float when it is a number"""
+        if self.accept_punctuation("?"):
+            return self.parameter()
+        kind, text = self.next("VALUES")
+        if kind == NUMBER:
+            if any(c in text for c in ".eE"):
+                return float(text)
+            return int(text)
+        if kind in (STRING, NAME):
+            return text
+        raise ValueError("Expecting a value but found '%s'" % text)
+
+    def parameter(self) -> Parameter:
+        self.parameters += 1
+        return Parameter(self.parameters - 1)
+
+    def integer(self, clause: str) -> int:
+        kind, text = self.next(clause)
+        if kind != NUMBER or not text.isdigit():
+            raise ValueError("%s expects a non-negative integer" % clause)
+        return int(text)
+
+    def name(self, clause: str) -> str:
+        kind, text = self.next(clause)
+        if kind != NAME:
+            raise ValueError("Expecting a name in %s but found '%s'" % (clause, text))
+        return text
+
+    # --------- tokens ---------
+    def peek(self) -> Optional[Token]:
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return None
+
+    def next(self, clause: str) -> Token:
+        if self.pos >= len(self.tokens):
+            raise ValueError("Incomplete %s statement" % clause)
+        self.pos += 1
+        return self.tokens[self.pos - 1]
+
+    def next_keyword(self) -> str:
+        kind, text = self.next("SQL")
+        if kind != NAME:
+            raise ValueError("Unsupported operation: " + text)
+        return text.upper()
+
+    def accept_keyword(self, keyword: str) -> bool:
+        token = self.peek()
+        if token is not None and token[0] == NAME and token[1].upper() == keyword:
+            self.pos += 1
+            return True
+        return False
+
+    def expect_keyword(self, keyword: str, clause: str):
+        if not self.accept_keyword(keyword):
+            raise ValueError("Expecting %s after %s" % (keyword, clause))
+
+    def accept_punctuation(self, text: str) -> bool:
+        token = self.peek()
+        if token is not None and token[0] == PUNCTUATION and token[1] == text:
+            self.pos += 1
+            return True
+        return False
+
+    def expect_punctuation(self, text: str, clause: str):
+        if not self.accept_punctuation(text):
+            raise ValueError("Expecting '%s' in %s" % (text, clause))
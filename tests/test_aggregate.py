@@ -0,0 +1,176 @@
+import shutil
+import unittest
+
+from aggregate import COUNT_ROWS, SCAN_BATCHES, WALK_INDEX, Aggregation
+from db import DB, ColumnInfo, DBTable, DBType
+from query import Aggregate, Condition, ConditionType
+
+
+class AggregateTests(unittest.TestCase):
+    def setUp(self):
+        shutil.rmtree("/tmp/gatordb_aggregate", ignore_errors=True)
+        self.table = DBTable(name="gatordb_aggregate", path="/tmp")
+        self.table.add_column("pk", ColumnInfo(primary_key=True))
+        self.table.add_column("customer", ColumnInfo(dbtype=DBType.INTEGER))
+        self.table.add_column("total", ColumnInfo(dbtype=DBType.FLOAT))
+        self.table.add_column("city", ColumnInfo(dbtype=DBType.STRING))
+        self.table.create_index("customer_idx", ["customer"])
+        self.table.create_index("city_idx", ["city"])
+        self.rows = [
+            {"pk": pk, "customer": pk % 7, "total": pk / 4, "city": f"city {pk % 3}"}
+            for pk in range(10000)
+        ]
+        self.table.insert_many(self.rows)
+
+    def tearDown(self):
+        self.table.close()
+        shutil.rmtree("/tmp/gatordb_aggregate", ignore_errors=True)
+
+    def test_count(self):
+        count = Aggregation(self.table, [Aggregate("COUNT", None)])
+        self.assertEqual(count.method(None), COUNT_ROWS)
+        self.assertEqual(count.execute().fetchall(), [{"COUNT(*)": 10000}])
+        for condition, expected in (
+            (Condition(ConditionType.EQUALS, "customer", 3), 1429),
+            (Condition(ConditionType.IN, "city", ("city 1", "city 9")), 3333),
+            (Condition(ConditionType.GREATER_EQUALS, "customer", 5), 2856),
+            (Condition(ConditionType.LESS_THAN, "pk", 10), 10),
+        ):
+            self.assertEqual(
+                count.execute(condition).fetchone()["COUNT(*)"], expected, condition
+            )
+        self.assertIn(
+            "posting lists",
+            count.explain(Condition(ConditionType.EQUALS, "customer", 3)),
+        )
+
+    def test_aggregates(self):
+        columns = [
+            Aggregate("SUM", "total"),
+            Aggregate("AVG", "total"),
+            Aggregate("MIN", "city"),
+            Aggregate("MAX", "customer"),
+            Aggregate("COUNT", None),
+        ]
+        aggregation = Aggregation(self.table, columns)
+        self.assertEqual(aggregation.method(None), SCAN_BATCHES)
+        totals = [row["total"] for row in self.rows]
+        self.assertEqual(
+            aggregation.execute().fetchone(),
+            {
+                "SUM(total)": sum(totals),
+                "AVG(total)": sum(totals) / len(totals),
+                "MIN(city)": "city 0",
+                "MAX(customer)": 6,
+                "COUNT(*)": 10000,
+            },
+        )
+        # aggregates of no rows
+        self.assertEqual(
+            list(
+                aggregation.execute(
+                    Condition(ConditionType.GREATER_THAN, "pk", 10**6)
+                )
+                .fetchone()
+                .values()
+            ),
+            [None, None, None, None, 0],
+        )
+
+    def test_group_by(self):
+        condition = Condition(ConditionType.LESS_THAN, "total", 1000.0)
+        aggregation = Aggregation(
+            self.table,
+            ["city", "customer", Aggregate("COUNT", None), Aggregate("SUM", "total")],
+            ["city", "customer"],
+        )
+        expected = {}
+        for row in self.rows:
+            if row["total"] < 1000.0:
+                key = (row["city"], row["customer"])
+                count, total = expected.get(key, (0, 0.0))
+                expected[key] = (count + 1, total + row["total"])
+        self.assertEqual(
+            [
+                list(row.values())
+                for row in aggregation.execute(condition, offset=1).fetchall()
+            ],
+            [list(key) + list(value) for key, value in sorted(expected.items())][1:],
+        )
+
+        # a nonclustered column is grouped from its index alone
+        walk = Aggregation(
+            self.table,
+            ["customer", Aggregate("COUNT", None), Aggregate("SUM", "customer")],
+            ["customer"],
+        )
+        condition = Condition(ConditionType.BETWEEN, "customer", (2, 3))
+        self.assertEqual(walk.method(condition), WALK_INDEX)
+        self.assertEqual(
+            walk.execute(condition).fetchall(),
+            [
+                {"customer": 2, "COUNT(*)": 1429, "SUM(customer)": 2858},
+                {"customer": 3, "COUNT(*)": 1429, "SUM(customer)": 4287},
+            ],
+        )
+
+    def test_invalid(self):
+        for columns, group_by in (
+            (["city", Aggregate("COUNT", None)], None),
+            ([Aggregate("SUM", "city")], None),
+            ([Aggregate("MIN", "missing")], None),
+            ([Aggregate("COUNT", None)], ["missing"]),
+        ):
+            with self.assertRaises(ValueError):
+                Aggregation(self.table, columns, group_by)
+
+
+class AggregateSQLTests(unittest.TestCase):
+    def setUp(self):
+        shutil.rmtree("/tmp/gatordb_aggregate_db", ignore_errors=True)
+        self.db = DB("/tmp/gatordb_aggregate_db")
+        table = DBTable(name="orders", path=self.db.name, pool=self.db.pool)
+        table.add_column("pk", ColumnInfo(primary_key=True))
+        table.add_column("customer", ColumnInfo(dbtype=DBType.INTEGER))
+        self.db["orders"] = table
+        table.insert_many([{"pk": pk, "customer": pk % 4} for pk in range(100)])
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree("/tmp/gatordb_aggregate_db", ignore_errors=True)
+
+    def test_prepared(self):
+        statement = self.db.prepare(
+            "SELECT customer, COUNT(*), MAX(pk) FROM orders WHERE pk < ? "
+            "GROUP BY customer LIMIT 2"
+        )
+        self.assertEqual(statement.columns, ["customer", "COUNT(*)", "MAX(pk)"])
+        self.assertEqual(
+            statement.execute([10]).fetchall(),
+            [
+                {"customer": 0, "COUNT(*)": 3, "MAX(pk)": 8},
+                {"customer": 1, "COUNT(*)": 3, "MAX(pk)": 9},
+            ],
+        )
+        self.assertIn("pk < ?", statement.explain())
+
+    def test_count_matches_select(self):
+        self.db.create_index("orders", ["customer"])
+        count = self.db.prepare("SELECT COUNT(*) FROM orders WHERE customer = ?")
+        select = self.db.prepare("SELECT * FROM orders WHERE customer = ?")
+        self.assertIn("posting lists", count.explain())
+
+        self.db.prepare("UPDATE orders SET customer = ? WHERE pk < ?").execute([9, 10])
+        with self.assertRaises(ValueError):
+            self.db.prepare("INSERT INTO orders VALUES (?, ?)").execute([50, 7])
+        for customer in (0, 2, 7, 9):
+            self.assertEqual(
+                count.execute([customer]).fetchone()["COUNT(*)"],
+                len(select.execute([customer]).fetchall()),
+                customer,
+            )
+        self.assertEqual(count.execute([9]).fetchone()["COUNT(*)"], 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
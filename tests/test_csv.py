@@ -0,0 +1,77 @@
+import io
+import shutil
+import unittest
+
+from db import DBTable, DBType
+from gcsv import import_csv, read_chunks
+from query import Condition, ConditionType
+
+
+def csv_file(pks) -> io.StringIO:
+    lines = ["pk,name,quantity"]
+    for pk in pks:
+        name = f'"line\nbreak {pk}"' if pk % 7 == 0 else f"name {pk % 5}"
+        lines.append(f"{pk},{name},{pk % 3}")
+    return io.StringIO("\n".join(lines) + "\n")
+
+
+class ImportTests(unittest.TestCase):
+    def setUp(self):
+        shutil.rmtree("/tmp/gatordb_csv", ignore_errors=True)
+        self.table = DBTable(name="gatordb_csv", path="/tmp")
+
+    def tearDown(self):
+        self.table.close()
+        shutil.rmtree("/tmp/gatordb_csv", ignore_errors=True)
+
+    def test_read_chunks(self):
+        f = csv_file(range(1, 100))
+        f.readline()
+        chunks = list(read_chunks(f, chunk_size=50))
+        self.assertGreater(len(chunks), 10)
+        # quoted line breaks are never split across chunks
+        for chunk in chunks:
+            self.assertEqual(chunk.count('"') % 2, 0)
+        self.assertEqual(
+            "".join(chunks), csv_file(range(1, 100)).read().split("\n", 1)[1]
+        )
+
+    def test_import(self):
+        # chunks of interleaved pks are merged
+        pks = [pk for start in range(0, 7) for pk in range(start, 700, 7)]
+        count = import_csv(self.table, csv_file(pks), workers=2, chunk_size=500)
+        self.assertEqual(count, 700)
+        self.assertEqual(self.table.schema()[0], ("pk", DBType.INTEGER, True))
+
+        rows = self.table.select_all()
+        self.assertEqual([row["pk"] for row in rows], list(range(700)))
+        self.assertEqual(rows[14], {"pk": 14, "name": "line\nbreak 14", "quantity": 2})
+        quantity = self.table.filter(Condition(ConditionType.EQUALS, "quantity", 1))
+        self.assertEqual(quantity.tolist(), list(range(1, 700, 3)))
+        self.assertEqual(self.table.column_stats("quantity").row_count, 700)
+
+        # a table holding rows is merged into, here with runs of disjoint pks
+        count = import_csv(self.table, csv_file(range(700, 1000)), chunk_size=500)
+        self.assertEqual(count, 300)
+        self.assertEqual(self.table.row_count(), 1000)
+        # rows whose pk is already in the table are not imported
+        with self.assertRaises(ValueError):
+            import_csv(self.table, csv_file([2000, 999]), chunk_size=500)
+        self.assertEqual(self.table.row_count(), 1000)
+        name = self.table.filter(Condition(ConditionType.EQUALS, "name", "name 3"))
+        self.assertEqual(
+            name.tolist(), [pk for pk in range(1000) if pk % 5 == 3 and pk % 7]
+        )
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            import_csv(self.table, csv_file([1, 2, 3, 2]), chunk_size=10)
+        self.assertEqual(self.table.row_count(), 0)
+        with self.assertRaises(ValueError):
+            import_csv(self.table, io.StringIO("pk,name,quantity\n1,a,many\n"))
+        with self.assertRaises(ValueError):
+            import_csv(self.table, io.StringIO("pk,name\n1,a\n"))
+
+
+if __name__ == "__main__":
+    unittest.main()
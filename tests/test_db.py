@@ -1,10 +1,18 @@
+import os
+import shutil
+import threading
 import unittest
 
-from db import ColumnInfo, DBTable, DBType
+import numpy as np
+
+from db import DB, ColumnInfo, DBTable, DBType
 from query import Change, Condition, ConditionType
 
 
 class TableTests(unittest.TestCase):
+    def setUp(self):
+        shutil.rmtree("/tmp/favorite_numbers", ignore_errors=True)
+
     def test_create_table(self):
         table = DBTable(name="favorite_numbers", path="/tmp/")
         table.add_column(
@@ -213,6 +221,264 @@ class TableTests(unittest.TestCase):
             ],
         )
 
+    def test_bulk_insert(self):
+        table = DBTable(name="favorite_numbers", path="/tmp/")
+        table.add_column(
+            name="pk", col=ColumnInfo(dbtype=DBType.INTEGER, primary_key=True)
+        )
+        table.add_column(name="first_name", col=ColumnInfo(dbtype=DBType.STRING))
+        table.add_column(
+            name="favorite_number",
+            col=ColumnInfo(dbtype=DBType.INTEGER),
+        )
+        rows = [
+            {"pk": pk, "first_name": f"John {pk % 3}", "favorite_number": pk % 5}
+            for pk in reversed(range(100))
+        ]
+        self.assertEqual(table.bulk_insert(rows), 100)
+        self.assertEqual(table.select_all(), sorted(rows, key=lambda row: row["pk"]))
+        self.assertEqual(
+            list(table.filter(Condition(ConditionType.EQUALS, "favorite_number", 3))),
+            list(range(3, 100, 5)),
+        )
+
+        self.assertEqual(
+            list(table.filter(Condition(ConditionType.LESS_THAN, "pk", 3))),
+            [0, 1, 2],
+        )
+        self.assertEqual(
+            list(
+                table.filter(
+                    Condition(ConditionType.BETWEEN, "favorite_number", (1, 2))
+                )
+            ),
+            [pk for pk in range(100) if pk % 5 in (1, 2)],
+        )
+        self.assertEqual(
+            list(
+                table.filter(
+                    Condition(ConditionType.GREATER_THAN, "first_name", "John 1")
+                )
+            ),
+            list(range(2, 100, 3)),
+        )
+
+        self.assertEqual(
+            list(
+                table.filter(
+                    Condition(
+                        ConditionType.AND,
+                        None,
+                        (
+                            Condition(ConditionType.GREATER_EQUALS, "pk", 50),
+                            Condition(ConditionType.EQUALS, "favorite_number", 3),
+                            Condition(ConditionType.NOT_EQUALS, "first_name", "John 2"),
+                        ),
+                    )
+                )
+            ),
+            [pk for pk in range(50, 100) if pk % 5 == 3 and pk % 3 != 2],
+        )
+        self.assertEqual(
+            list(
+                table.filter(
+                    Condition(
+                        ConditionType.OR,
+                        None,
+                        (
+                            Condition(ConditionType.IN, "pk", (1, 7, 1000)),
+                            Condition(ConditionType.LESS_THAN, "pk", 3),
+                        ),
+                    )
+                )
+            ),
+            [0, 1, 2, 7],
+        )
+
+        # a table that already has rows is updated with an ordered pass per index
+        table.bulk_insert([{"pk": 100, "first_name": "Adam", "favorite_number": 3}])
+        self.assertEqual(
+            list(table.filter(Condition(ConditionType.EQUALS, "first_name", "Adam"))),
+            [100],
+        )
+        table.close()
+
+    def test_insert_many(self):
+        table = DBTable(name="favorite_numbers", path="/tmp/")
+        table.add_column(
+            name="pk", col=ColumnInfo(dbtype=DBType.INTEGER, primary_key=True)
+        )
+        table.add_column(name="first_name", col=ColumnInfo(dbtype=DBType.STRING))
+        table.add_column(
+            name="favorite_number",
+            col=ColumnInfo(dbtype=DBType.INTEGER),
+        )
+        for pk in range(0, 2000, 2):
+            table.insert(
+                {"pk": pk, "first_name": f"John {pk % 7}", "favorite_number": pk % 5}
+            )
+
+        pks = np.arange(1999, 0, -2)
+        self.assertEqual(
+            table.insert_many(
+                {
+                    "pk": pks,
+                    "first_name": [f"John {pk % 7}" for pk in pks.tolist()],
+                    "favorite_number": pks % 5,
+                }
+            ),
+            1000,
+        )
+        rows = np.array(
+            [(2000, "Adam", 3), (2001, "Adam", 42)],
+            dtype=[("pk", "i8"), ("first_name", "U10"), ("favorite_number", "i8")],
+        )
+        self.assertEqual(table.insert_many(rows), 2)
+
+        self.assertEqual(
+            list(table.filter(Condition(ConditionType.EQUALS, "favorite_number", 3))),
+            list(range(3, 2000, 5)) + [2000],
+        )
+        self.assertEqual(
+            list(table.filter(Condition(ConditionType.EQUALS, "first_name", "John 4"))),
+            list(range(4, 2000, 7)),
+        )
+        self.assertEqual(table._pk_col().get(2001)["first_name"], "Adam")
+        self.assertEqual(type(table._pk_col().get(1999)["pk"]), int)
+
+        stats = table.column_stats("favorite_number")
+        self.assertEqual((stats.row_count, stats.distinct_count), (2002, 6))
+        self.assertEqual((stats.min, stats.max), (0, 42))
+
+        # nothing is inserted when any row is invalid
+        with self.assertRaises(ValueError):
+            table.insert_many(
+                [
+                    {"pk": 3000, "first_name": "Eve", "favorite_number": 1},
+                    {"pk": 3000, "first_name": "Eve", "favorite_number": 2},
+                ]
+            )
+        with self.assertRaises(ValueError):
+            table.insert_many(
+                [
+                    {"pk": 3000, "first_name": "Eve", "favorite_number": 1},
+                    {"pk": 3001, "first_name": 5, "favorite_number": 2},
+                ]
+            )
+        with self.assertRaises(ValueError):
+            table.insert_many({"pk": [3000], "first_name": [], "favorite_number": [1]})
+        self.assertEqual(table.row_count(), 2002)
+        table.close()
+
+    def test_cursor(self):
+        table = DBTable(name="favorite_numbers", path="/tmp/")
+        table.add_column(
+            name="pk", col=ColumnInfo(dbtype=DBType.INTEGER, primary_key=True)
+        )
+        table.add_column(
+            name="favorite_number",
+            col=ColumnInfo(dbtype=DBType.INTEGER),
+        )
+        table.insert_many({"pk": range(5000), "favorite_number": range(5000)})
+        table.insert_many({"pk": range(5000, 6000), "favorite_number": [7] * 1000})
+
+        cursor = table.cursor()
+        self.assertEqual(cursor.columns, ["pk", "favorite_number"])
+        self.assertEqual(cursor.fetchone(), {"pk": 0, "favorite_number": 0})
+        self.assertEqual([row["pk"] for row in cursor.fetchmany(3)], [1, 2, 3])
+        self.assertEqual(len(cursor.fetchmany()), cursor.arraysize)
+        self.assertEqual(len(cursor.fetchall()), 6000 - 104)
+        self.assertEqual(cursor.fetchmany(), [])
+
+        self.assertEqual(
+            [row["pk"] for row in table.cursor(limit=3, offset=4000)],
+            [4000, 4001, 4002],
+        )
+        # an index probe, a pk range and a full scan
+        for condition in (
+            Condition(ConditionType.EQUALS, "favorite_number", 7),
+            Condition(ConditionType.GREATER_EQUALS, "pk", 5000),
+            Condition(ConditionType.NOT_EQUALS, "favorite_number", -1),
+        ):
+            self.assertEqual(
+                [row["pk"] for row in table.cursor(condition, limit=5, offset=10)],
+                list(table.filter(condition)[10:15]),
+            )
+        self.assertEqual(table.cursor(limit=0).fetchall(), [])
+        with self.assertRaises(ValueError):
+            table.cursor(offset=-1)
+
+        # a limit stops reading the table early
+        before = table.pool.stats()
+        table.cursor(limit=5).fetchall()
+        after = table.pool.stats()
+        self.assertLess(
+            after["hits"] + after["misses"] - before["hits"] - before["misses"], 10
+        )
+        table.close()
+
+    def test_planner(self):
+        table = DBTable(name="favorite_numbers", path="/tmp/")
+        table.add_column(
+            name="pk", col=ColumnInfo(dbtype=DBType.INTEGER, primary_key=True)
+        )
+        table.add_column(
+            name="favorite_number",
+            col=ColumnInfo(dbtype=DBType.INTEGER),
+        )
+        table.create_index("favorite_number_idx", ["favorite_number"])
+        table.bulk_insert(
+            [{"pk": pk, "favorite_number": pk % 10} for pk in range(1000)]
+        )
+        for pk in range(1000, 1100):
+            table.insert({"pk": pk, "favorite_number": 42})
+        table.delete(table.filter(Condition(ConditionType.LESS_THAN, "pk", 100)))
+
+        stats = table.column_stats("favorite_number")
+        self.assertEqual(stats.row_count, 1000)
+        self.assertEqual(stats.distinct_count, 11)
+        self.assertEqual((stats.min, stats.max), (0, 42))
+        self.assertEqual(sum(stats.counts), 1000)
+        self.assertEqual(table.row_count(), 1000)
+
+        # a pk seek drives the plan and the other condition is checked on its row
+        condition = Condition(
+            ConditionType.AND,
+            None,
+            (
+                Condition(ConditionType.GREATER_EQUALS, "favorite_number", 1),
+                Condition(ConditionType.EQUALS, "pk", 105),
+            ),
+        )
+        plan = table.explain(condition)
+        self.assertTrue(plan.startswith("Filter: favorite_number >= 1"))
+        self.assertIn("Primary key seek on pk: pk = 105", plan)
+        self.assertEqual(list(table.filter(condition)), [105])
+
+        # two selective conditions are intersected
+        condition = Condition(
+            ConditionType.AND,
+            None,
+            (
+                Condition(ConditionType.BETWEEN, "pk", (200, 1050)),
+                Condition(ConditionType.EQUALS, "favorite_number", 3),
+            ),
+        )
+        self.assertTrue(table.explain(condition).startswith("Intersect"))
+        self.assertEqual(list(table.filter(condition)), list(range(203, 1000, 10)))
+
+        self.assertEqual(
+            table.plan(Condition(ConditionType.EQUALS, "pk", 5000)).rows, 0
+        )
+        with self.assertRaises(ValueError):
+            table.explain(Condition(ConditionType.EQUALS, "missing", 7))
+
+        # statistics are saved with the column info
+        table.close()
+        table = DBTable(name="favorite_numbers", path="/tmp/")
+        self.assertEqual(table.column_stats("favorite_number").distinct_count, 11)
+        table.close()
+
 
 # class TableLoadTests(unittest.TestCase):
 #     def test_create_table(self):
@@ -239,5 +505,207 @@ class TableTests(unittest.TestCase):
 #         self.assertEqual(len(table.select_all()), count)
 
 
+class DBTests(unittest.TestCase):
+    def setUp(self):
+        shutil.rmtree("/tmp/gatordb_lazy", ignore_errors=True)
+
+    def test_lazy_open(self):
+        db = DB("/tmp/gatordb_lazy")
+        for name in ("numbers", "other"):
+            table = DBTable(name=name, path=db.name, pool=db.pool)
+            table.add_column("pk", ColumnInfo(dbtype=DBType.INTEGER, primary_key=True))
+            table.add_column("number", ColumnInfo(dbtype=DBType.INTEGER))
+            db[name] = table
+            table.insert_many(
+                {"pk": range(100), "number": [pk % 7 for pk in range(100)]}
+            )
+        db.close()
+
+        db = DB("/tmp/gatordb_lazy")
+        self.assertEqual(sorted(db), ["numbers", "other"])
+        self.assertEqual(db.opened(), [])
+
+        table = db["numbers"]
+        self.assertEqual([col.is_loaded for col in table.cols.values()], [False, False])
+        self.assertEqual(
+            table.select(table.filter(Condition(ConditionType.EQUALS, "pk", 3))),
+            [{"pk": 3, "number": 3}],
+        )
+        # only the primary key column was read
+        self.assertEqual([col.is_loaded for col in table.cols.values()], [True, False])
+        self.assertEqual(db.opened(), [table])
+
+        table.insert({"pk": 100, "number": 2})
+        db.close()
+
+        # a table missing from the catalog is read from its directory
+        os.remove("/tmp/gatordb_lazy/catalog.json")
+        db = DB("/tmp/gatordb_lazy")
+        table = db["numbers"]
+        self.assertEqual(table.schema()[0], ("pk", DBType.INTEGER, True))
+        self.assertEqual(
+            list(table.filter(Condition(ConditionType.EQUALS, "number", 2))),
+            list(range(2, 100, 7)) + [100],
+        )
+        self.assertEqual(table.column_stats("number").row_count, 101)
+        db.close()
+
+    def test_projection(self):
+        db = DB("/tmp/gatordb_lazy")
+        table = DBTable(name="people", path=db.name, pool=db.pool)
+        table.add_column("pk", ColumnInfo(dbtype=DBType.INTEGER, primary_key=True))
+        table.add_column("name", ColumnInfo(dbtype=DBType.STRING))
+        table.add_column("age", ColumnInfo(dbtype=DBType.INTEGER))
+        table.add_column("score", ColumnInfo(dbtype=DBType.FLOAT))
+        db["people"] = table
+        db.create_index("people", ["age"])
+        table.insert_many(
+            {
+                "pk": range(1000),
+                "name": [f"person {pk}" for pk in range(1000)],
+                "age": [pk % 60 for pk in range(1000)],
+                "score": [pk / 4 for pk in range(1000)],
+            }
+        )
+        db.close()
+
+        db = DB("/tmp/gatordb_lazy")
+        table = db["people"]
+        condition = Condition(ConditionType.BETWEEN, "age", (10, 11))
+        rows = table.cursor(condition, columns=["age", "pk"]).fetchall()
+        self.assertEqual(
+            rows,
+            [{"age": pk % 60, "pk": pk} for pk in range(1000) if pk % 60 in (10, 11)],
+        )
+        self.assertEqual(list(rows[0]), ["age", "pk"])
+        self.assertIn("Index only scan", table.plan(condition, ["age"]).explain())
+        # answered without reading the clustered index
+        self.assertIsNone(table.cols["pk"]._index)
+
+        self.assertEqual(
+            table.cursor(
+                Condition(ConditionType.EQUALS, "pk", 3), columns=["score", "name"]
+            ).fetchall(),
+            [{"score": 0.75, "name": "person 3"}],
+        )
+        self.assertEqual(
+            table.cursor(condition, limit=2, offset=1, columns=["name"]).fetchall(),
+            [{"name": "person 11"}, {"name": "person 70"}],
+        )
+        with self.assertRaises(ValueError):
+            table.cursor(columns=["height"])
+        db.close()
+
+    def test_prepare(self):
+        db = DB("/tmp/gatordb_lazy")
+        table = DBTable(name="people", path=db.name, pool=db.pool)
+        table.add_column("pk", ColumnInfo(dbtype=DBType.INTEGER, primary_key=True))
+        table.add_column("name", ColumnInfo(dbtype=DBType.STRING))
+        table.add_column("age", ColumnInfo(dbtype=DBType.INTEGER))
+        db["people"] = table
+
+        insert = db.prepare("INSERT INTO people VALUES (?, ?, ?)")
+        self.assertEqual(insert.execute((0, "person 0", "30")), 1)
+        self.assertEqual(
+            insert.executemany((pk, f"person {pk}", pk % 60) for pk in range(1, 1000)),
+            999,
+        )
+        self.assertEqual(table.row_count(), 1000)
+
+        select = db.prepare("SELECT name FROM people WHERE age = ? AND pk < ?")
+        self.assertIn("age = ?", select.explain())
+        self.assertEqual(
+            select.execute([30, 200]).fetchall(),
+            [{"name": f"person {pk}"} for pk in (0, 30, 90, 150)],
+        )
+        self.assertEqual(
+            select.execute(["5", 70]).fetchall(),
+            [{"name": "person 5"}, {"name": "person 65"}],
+        )
+        self.assertEqual(
+            db.prepare("SELECT pk FROM people WHERE age IN (?, 2) LIMIT 2")
+            .execute([1])
+            .fetchall(),
+            [{"pk": 1}, {"pk": 2}],
+        )
+
+        update = db.prepare("UPDATE people SET name = ? WHERE pk BETWEEN ? AND ?")
+        self.assertEqual(update.execute(("young", 1, 10)), 10)
+        delete = db.prepare("DELETE FROM people WHERE age = ?")
+        self.assertEqual(delete.executemany([[2], [3]]), 34)
+        self.assertEqual(table.row_count(), 966)
+        self.assertEqual(table.row(1)["name"], "young")
+
+        # explain() shows the plan execute() would use once the table halved in size
+        scan = db.prepare("SELECT * FROM people WHERE pk < ?")
+        before = scan.explain()
+        table.delete(np.arange(100, 1000))
+        self.assertNotEqual(scan.explain(), before)
+        self.assertIn(f"rows={table.row_count() // 3}", scan.explain())
+
+        with self.assertRaises(ValueError):
+            select.execute([30])
+        with self.assertRaises(ValueError):
+            select.execute(["thirty", 1])
+        with self.assertRaises(ValueError):
+            select.executemany([[30, 1]])
+        with self.assertRaises(ValueError):
+            db.prepare("SELECT * FROM people WHERE height = ?")
+        with self.assertRaises(ValueError):
+            db.prepare("DROP TABLE people")
+        db.close()
+
+    def test_concurrent_reads(self):
+        db = DB("/tmp/gatordb_lazy")
+        table = DBTable(name="numbers", path=db.name, pool=db.pool)
+        table.add_column("pk", ColumnInfo(dbtype=DBType.INTEGER, primary_key=True))
+        table.add_column("number", ColumnInfo(dbtype=DBType.INTEGER))
+        db["numbers"] = table
+        table.insert_many({"pk": range(500), "number": [pk % 5 for pk in range(500)]})
+
+        # a cursor keeps reading the rows as they were when it was opened
+        cursor = table.cursor(Condition(ConditionType.EQUALS, "number", 3))
+        first = cursor.fetchmany(10)
+        table.insert_many(
+            {"pk": range(500, 1000), "number": [pk % 5 for pk in range(500, 1000)]}
+        )
+        table.delete(np.arange(0, 500, 2))
+        rows = first + cursor.fetchall()
+        self.assertEqual([row["pk"] for row in rows], list(range(3, 500, 5)))
+        self.assertEqual(db.pool.stats()["snapshots"], 0)
+
+        errors = []
+
+        def read():
+            try:
+                for _ in range(20):
+                    rows = table.select_all()
+                    pks = [row["pk"] for row in rows]
+                    # every scan sees some whole number of the writer's inserts
+                    self.assertEqual(pks, sorted(pks))
+                    self.assertEqual(len(rows) % 10, 0)
+                    self.assertEqual(
+                        len(table.filter(Condition(ConditionType.EQUALS, "pk", 999))),
+                        1,
+                    )
+            except Exception as e:
+                errors.append(e)
+
+        readers = [threading.Thread(target=read) for _ in range(4)]
+        for reader in readers:
+            reader.start()
+        for first in range(1000, 2000, 10):
+            table.insert_many({"pk": range(first, first + 10), "number": [1] * 10})
+        for reader in readers:
+            reader.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(table.row_count(), 1750)
+        self.assertEqual(
+            len(table.filter(Condition(ConditionType.EQUALS, "number", 1))), 1150
+        )
+        self.assertEqual(db.pool.stats()["page_versions"], 0)
+        db.close()
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,142 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from db import DB, HASH, ColumnInfo, DBTable, DBType, HashIndex, NonclusteredIndex
+from gdb_hash import MAX_LOAD, HashTable
+from query import Condition, ConditionType
+
+
+class HashTableTests(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "t.hash")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_insert_get_delete(self):
+        table = HashTable(self.path)
+        keys = np.random.default_rng(0).permutation(5000).tolist()
+        for key in keys:
+            self.assertTrue(table.insert(key, key * 2))
+        self.assertFalse(table.insert(keys[0], -1))
+        self.assertEqual(len(table), 5000)
+        self.assertEqual(table.get(keys[0]), -1)
+        self.assertTrue(all(table.get(key) == key * 2 for key in keys[1:]))
+        self.assertIsNone(table.get(5000))
+        # grown one bucket at a time to keep the load under MAX_LOAD
+        stats = table.fill_stats()
+        self.assertGreater(stats["buckets"], 5000 // MAX_LOAD - 1)
+        self.assertLessEqual(stats["load"], MAX_LOAD)
+
+        for key in keys[:4900]:
+            table.delete(key)
+        with self.assertRaises(ValueError):
+            table.delete(keys[0])
+        self.assertEqual(sorted(key for key, _ in table), sorted(keys[4900:]))
+        self.assertLess(table.fill_stats()["buckets"], stats["buckets"])
+        table.close()
+
+    def test_persistence_and_snapshot(self):
+        table = HashTable(self.path)
+        table.bulk_load((f"key {i}", i) for i in range(1000))
+        table.insert(2.5, "float")
+        table.insert(3.0, "three")
+        snapshot = table.snapshot()
+        table.clear()
+        table.insert("new", 1)
+        with snapshot.view():
+            self.assertEqual(len(table), 1002)
+            self.assertEqual(table.get("key 10"), 10)
+        snapshot.close()
+        self.assertEqual(list(table), [("new", 1)])
+        table.bulk_load((i, i) for i in range(100))
+        # integral floats find their int keys
+        self.assertEqual(table.get(3.0), 3)
+        table.close()
+
+        table = HashTable(self.path)
+        self.assertEqual(len(table), 100)
+        self.assertEqual(table.get(42), 42)
+        self.assertEqual(table.compact()["after"]["keys"], 100)
+        table.close()
+
+
+class HashIndexTests(unittest.TestCase):
+    def setUp(self):
+        shutil.rmtree("gatordb_hash", ignore_errors=True)
+        self.db = DB("gatordb_hash")
+        table = DBTable(name="orders", path=self.db.name, pool=self.db.pool)
+        table.add_column("pk", ColumnInfo(primary_key=True))
+        table.add_column("customer", ColumnInfo(dbtype=DBType.STRING))
+        table.add_column("total", ColumnInfo(dbtype=DBType.FLOAT))
+        self.db["orders"] = table
+        table.insert_many(
+            [
+                {"pk": pk, "customer": f"customer {pk % 50}", "total": pk / 2}
+                for pk in range(2000)
+            ]
+        )
+        self.db.commit()
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree("gatordb_hash", ignore_errors=True)
+
+    def test_create_index(self):
+        table = self.db["orders"]
+        name = self.db.create_index("orders", ["customer"], using=HASH)
+        self.assertEqual(name, "orders_customer_idx")
+        self.assertIsInstance(table.cols["customer"].index, HashIndex)
+        equals = Condition(ConditionType.EQUALS, "customer", "customer 7")
+        expected = np.arange(7, 2000, 50)
+        np.testing.assert_array_equal(table.filter(equals), expected)
+        self.assertIn("Hash probe on customer", table.explain(equals))
+        values = Condition(ConditionType.IN, "customer", ("customer 7", "customer 8"))
+        self.assertEqual(len(table.filter(values)), 80)
+        # ranges cannot be read from the hash table in order
+        between = Condition(
+            ConditionType.BETWEEN, "customer", ("customer 10", "customer 12")
+        )
+        self.assertIn("Full scan", table.explain(between))
+        self.assertEqual(len(table.filter(between)), 120)
+        self.assertEqual(len(table.index_lookup(between)), 120)
+        self.assertEqual(table.column_stats("customer").distinct_count, 50)
+
+        table.insert({"pk": 2000, "customer": "customer 7", "total": 1.0})
+        table.delete(np.array([7]))
+        np.testing.assert_array_equal(
+            table.filter(equals), np.append(expected[1:], 2000)
+        )
+        self.db.commit()
+
+        for statement in (
+            lambda: self.db.create_index("orders", ["customer"], using=HASH),
+            lambda: self.db.create_index("orders", ["total"], name=name),
+            lambda: self.db.create_index("orders", ["pk"], using=HASH),
+            lambda: self.db.create_index("orders", ["missing"]),
+            lambda: self.db.create_index("orders", ["customer", "total"], using=HASH),
+            lambda: self.db.create_index("missing", ["customer"]),
+        ):
+            with self.assertRaises(ValueError):
+                statement()
+
+    def test_reopen(self):
+        self.db.create_index("orders", ["customer"], using=HASH)
+        self.db.create_index("orders", ["total"], name="by_total")
+        self.db["orders"].insert({"pk": 2000, "customer": "customer 7", "total": 1.0})
+        self.db.commit()
+        self.assertFalse(os.path.exists("gatordb_hash/orders/customer/customer.tree"))
+        # reopened without a checkpoint, replaying the insert into the hash index
+        self.db.wal.close()
+        self.db = DB("gatordb_hash")
+        table = self.db["orders"]
+        self.assertEqual(sorted(table.indexes), ["by_total", "orders_customer_idx"])
+        self.assertIsInstance(table.cols["customer"].index, HashIndex)
+        self.assertIsInstance(table.cols["total"].index, NonclusteredIndex)
+        equals = Condition(ConditionType.EQUALS, "customer", "customer 7")
+        self.assertEqual(len(table.filter(equals)), 41)
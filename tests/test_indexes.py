@@ -0,0 +1,383 @@
+import json
+import os
+import shutil
+import threading
+import unittest
+
+import numpy as np
+
+from aggregate import Aggregation
+from db import DB, ColumnInfo, DBTable, DBType, NonclusteredIndex
+from planner import matches
+from query import Aggregate, Change, Condition, ConditionType
+
+PATH = "/tmp/gatordb_indexes"
+
+
+class IndexManagementTests(unittest.TestCase):
+    def setUp(self):
+        shutil.rmtree(PATH, ignore_errors=True)
+        self.db = DB(PATH)
+        table = DBTable(name="orders", path=self.db.name, pool=self.db.pool)
+        table.add_column("pk", ColumnInfo(primary_key=True))
+        table.add_column("customer", ColumnInfo(dbtype=DBType.STRING))
+        table.add_column("quantity", ColumnInfo(dbtype=DBType.INTEGER))
+        self.db["orders"] = table
+        table.insert_many(
+            {
+                "pk": range(3000),
+                "customer": [f"customer {pk % 30}" for pk in range(3000)],
+                "quantity": [pk % 100 for pk in range(3000)],
+            }
+        )
+        self.db.commit()
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(PATH, ignore_errors=True)
+
+    def test_unindexed_columns(self):
+        table = self.db["orders"]
+        self.assertEqual(table.indexes, {})
+        self.assertFalse(table.cols["customer"].is_indexed)
+        self.assertFalse(os.path.exists(f"{PATH}/orders/customer/customer.tree"))
+        with self.assertRaises(ValueError):
+            table.cols["customer"].index
+
+        equals = Condition(ConditionType.EQUALS, "customer", "customer 4")
+        self.assertTrue(table.explain(equals).startswith("Full scan"))
+        np.testing.assert_array_equal(table.filter(equals), np.arange(4, 3000, 30))
+        self.assertEqual(table.count(equals), 100)
+        self.assertIsNone(table.plan(None, ["customer"]))
+        stats = table.column_stats("quantity")
+        self.assertEqual((stats.row_count, stats.distinct_count), (3000, 100))
+        self.assertEqual((stats.min, stats.max), (0, 99))
+
+        table.update(np.array([4]), [Change("customer", "customer 99")])
+        table.delete(np.array([34]))
+        self.assertEqual(len(table.filter(equals)), 98)
+
+    def test_create_and_drop(self):
+        table = self.db["orders"]
+        select = self.db.prepare("SELECT * FROM orders WHERE customer = ?")
+        self.assertIn("Full scan", select.explain())
+
+        # built from the rows already in the table
+        name = self.db.create_index("orders", ["customer"])
+        self.assertEqual(name, "orders_customer_idx")
+        self.assertIsInstance(table.cols["customer"].index, NonclusteredIndex)
+        equals = Condition(ConditionType.EQUALS, "customer", "customer 4")
+        self.assertIn("Index probe on customer", table.explain(equals))
+        np.testing.assert_array_equal(table.filter(equals), np.arange(4, 3000, 30))
+        # planned again once the index exists
+        self.assertIn("Index probe", select.explain())
+        self.assertEqual(len(select.execute(["customer 4"]).fetchall()), 100)
+
+        table.insert({"pk": 3000, "customer": "customer 4", "quantity": 1})
+        table.delete(np.array([4]))
+        self.assertEqual(len(table.filter(equals)), 100)
+
+        with self.assertRaises(ValueError):
+            self.db.create_index("orders", ["customer"], name="again")
+        with self.assertRaises(ValueError):
+            self.db.drop_index("orders_customer_idx", "missing")
+
+        self.db.drop_index("orders_customer_idx")
+        self.assertFalse(os.path.exists(f"{PATH}/orders/customer/customer.tree"))
+        self.assertTrue(table.explain(equals).startswith("Full scan"))
+        self.assertEqual(len(table.filter(equals)), 100)
+        self.assertIn("Full scan", select.explain())
+        self.assertEqual(len(select.execute(["customer 4"]).fetchall()), 100)
+        with self.assertRaises(ValueError):
+            self.db.drop_index("orders_customer_idx")
+
+    def test_existing_primary_key(self):
+        self.db.create_index("orders", ["quantity"])
+        table = self.db["orders"]
+        with self.assertRaises(ValueError):
+            table.insert({"pk": 4, "customer": "customer 99", "quantity": 200})
+        # a batch holding one existing pk inserts none of its rows
+        with self.assertRaises(ValueError):
+            table.insert_many(
+                {"pk": [5000, 34, 5001], "customer": ["x"] * 3, "quantity": [200] * 3}
+            )
+        with self.assertRaises(ValueError):
+            self.db.prepare("INSERT INTO orders VALUES (?, ?, ?)").execute(
+                [2, "customer 2", 200]
+            )
+
+        self.assertEqual(table.row_count(), 3000)
+        self.assertEqual(table._pk_col().get(4)["quantity"], 4)
+        for quantity in (4, 34, 200):
+            equals = Condition(ConditionType.EQUALS, "quantity", quantity)
+            self.assertEqual(table.count(equals), len(table.filter(equals)))
+        self.assertEqual(table.column_stats("quantity").row_count, 3000)
+
+    def test_reopen(self):
+        self.db.create_index("orders", ["quantity"], name="by_quantity")
+        table = self.db["orders"]
+        table.insert({"pk": 3000, "customer": "customer 4", "quantity": 7})
+        self.db.commit()
+        # reopened without a checkpoint, replaying the insert
+        self.db.wal.close()
+        self.db = DB(PATH)
+        table = self.db["orders"]
+        self.assertEqual(list(table.indexes), ["by_quantity"])
+        # integer keys are kept in typed arrays
+        self.assertEqual(table.cols["quantity"].index.tree.key_type, "q")
+        self.assertEqual(table.cols["pk"].index.tree.key_type, "q")
+        self.assertFalse(table.cols["customer"].is_indexed)
+        between = Condition(ConditionType.BETWEEN, "quantity", (7, 8))
+        self.assertIn("Index range scan", table.explain(between))
+        self.assertEqual(len(table.filter(between)), 61)
+        equals = Condition(ConditionType.EQUALS, "customer", "customer 4")
+        self.assertEqual(len(table.filter(equals)), 101)
+        self.assertEqual(table.column_stats("customer").row_count, 3001)
+
+    def test_tables_from_before_explicit_indexes(self):
+        self.db.close()
+        # catalogs listed the columns of a table alone and every column was indexed
+        self.db = DB(PATH)
+        table = self.db["orders"]
+        self.db.create_index("orders", ["customer"])
+        self.db.create_index("orders", ["quantity"])
+        self.db.close()
+        os.remove(f"{PATH}/orders/indexes")
+        with open(f"{PATH}/catalog.json") as f:
+            catalog = json.load(f)
+        with open(f"{PATH}/catalog.json", "w") as f:
+            json.dump({"orders": catalog["orders"]["columns"]}, f)
+
+        self.db = DB(PATH)
+        table = self.db["orders"]
+        self.assertEqual(
+            sorted(table.indexes), ["orders_customer_idx", "orders_quantity_idx"]
+        )
+        equals = Condition(ConditionType.EQUALS, "customer", "customer 4")
+        self.assertIn("Index probe", table.explain(equals))
+        self.assertEqual(len(table.filter(equals)), 100)
+
+
+class CompositeIndexTests(unittest.TestCase):
+    def setUp(self):
+        shutil.rmtree(PATH, ignore_errors=True)
+        self.db = DB(PATH)
+        table = DBTable(name="orders", path=self.db.name, pool=self.db.pool)
+        table.add_column("pk", ColumnInfo(primary_key=True))
+        table.add_column("customer", ColumnInfo(dbtype=DBType.STRING))
+        table.add_column("quantity", ColumnInfo(dbtype=DBType.INTEGER))
+        table.add_column("price", ColumnInfo(dbtype=DBType.FLOAT))
+        self.db["orders"] = table
+        table.insert_many([self.row(pk) for pk in range(3000)])
+        self.db.commit()
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(PATH, ignore_errors=True)
+
+    @staticmethod
+    def row(pk: int) -> dict:
+        return {
+            "pk": pk,
+            "customer": f"customer {pk % 30}",
+            "quantity": pk % 100,
+            "price": float(pk % 7),
+        }
+
+    def expected(self, check) -> np.ndarray:
+        return np.array(
+            [pk for pk, row in self.db["orders"].scan_rows() if check(row)],
+            dtype=np.int32,
+        )
+
+    def test_prefix_and_range(self):
+        table = self.db["orders"]
+        name = self.db.create_index("orders", ["customer", "quantity"])
+        self.assertEqual(name, "orders_customer_quantity_idx")
+        self.assertFalse(table.cols["customer"].is_indexed)
+
+        customer = Condition(ConditionType.EQUALS, "customer", "customer 4")
+        conditions = [
+            Condition(ConditionType.BETWEEN, "quantity", (10, 40)),
+            Condition(ConditionType.GREATER_THAN, "quantity", 34),
+            Condition(ConditionType.LESS_THAN, "quantity", 34),
+            Condition(ConditionType.EQUALS, "quantity", 34),
+        ]
+        for condition in conditions:
+            both = Condition(ConditionType.AND, None, [condition, customer])
+            self.assertIn(f"Index prefix scan on {name}", table.explain(both))
+            np.testing.assert_array_equal(
+                table.filter(both),
+                self.expected(
+                    lambda row: row["customer"] == "customer 4"
+                    and matches(condition, row)
+                ),
+            )
+        # the first column alone is a prefix too
+        self.assertIn("Index prefix scan", table.explain(customer))
+        self.assertEqual(table.count(customer), 100)
+        # the second column alone is not
+        quantity = Condition(ConditionType.EQUALS, "quantity", 34)
+        self.assertTrue(table.explain(quantity).startswith("Full scan"))
+
+        # the other conditions are checked on the fetched rows
+        three = Condition(
+            ConditionType.AND,
+            None,
+            [
+                customer,
+                Condition(ConditionType.LESS_EQUALS, "quantity", 50),
+                Condition(ConditionType.EQUALS, "price", 3.0),
+            ],
+        )
+        plan = table.explain(three)
+        self.assertTrue(plan.startswith("Filter: price = 3.0"))
+        self.assertIn("Index prefix scan", plan)
+        np.testing.assert_array_equal(
+            table.filter(three),
+            self.expected(
+                lambda row: row["customer"] == "customer 4"
+                and row["quantity"] <= 50
+                and row["price"] == 3.0
+            ),
+        )
+
+        select = self.db.prepare(
+            "SELECT * FROM orders WHERE customer = ? AND quantity >= ?"
+        )
+        self.assertIn("Index prefix scan", select.explain())
+        rows = select.execute(["customer 4", 50]).fetchall()
+        np.testing.assert_array_equal(
+            [row["pk"] for row in rows],
+            self.expected(
+                lambda row: row["customer"] == "customer 4" and row["quantity"] >= 50
+            ),
+        )
+
+    def test_maintained_by_writes(self):
+        table = self.db["orders"]
+        self.db.create_index("orders", ["customer", "quantity", "price"], name="cqp")
+        both = Condition(
+            ConditionType.AND,
+            None,
+            [
+                Condition(ConditionType.EQUALS, "customer", "customer 4"),
+                Condition(ConditionType.EQUALS, "quantity", 34),
+            ],
+        )
+        self.assertIn("Index prefix scan on cqp", table.explain(both))
+        np.testing.assert_array_equal(table.filter(both), np.arange(34, 3000, 300))
+
+        table.insert(
+            {"pk": 3000, "customer": "customer 4", "quantity": 34, "price": 1.0}
+        )
+        table.insert_many([{**self.row(pk), "quantity": 34} for pk in (3004, 3034)])
+        table.update(np.array([934]), [Change("quantity", 35)])
+        table.delete(np.array([1834]))
+        expected = self.expected(lambda row: matches(both, row))
+        self.assertEqual(len(expected), 11)
+        np.testing.assert_array_equal(table.filter(both), expected)
+        self.db.commit()
+
+        # reopened without a checkpoint, replaying the writes into the composite index
+        self.db.wal.close()
+        self.db = DB(PATH)
+        table = self.db["orders"]
+        self.assertEqual(
+            table.indexes["cqp"].columns, ("customer", "quantity", "price")
+        )
+        np.testing.assert_array_equal(table.filter(both), expected)
+        every = Condition(
+            ConditionType.AND,
+            None,
+            [
+                Condition(ConditionType.EQUALS, "price", 1.0),
+                Condition(ConditionType.EQUALS, "customer", "customer 4"),
+                Condition(ConditionType.EQUALS, "quantity", 34),
+            ],
+        )
+        np.testing.assert_array_equal(table.filter(every), [1534, 3000, 3004])
+        # a long cursor reads a snapshot of the composite index
+        rows = table.cursor(
+            Condition(ConditionType.EQUALS, "customer", "customer 4")
+        ).fetchall()
+        self.assertEqual(len(rows), 102)
+
+        table.delete_all_rows()
+        self.assertEqual(len(table.filter(both)), 0)
+        table.insert(self.row(34))
+        np.testing.assert_array_equal(table.filter(both), [34])
+
+        self.db.drop_index("cqp")
+        self.assertFalse(os.path.exists(f"{PATH}/orders/cqp.tree"))
+        self.assertTrue(table.explain(both).startswith("Full scan"))
+        np.testing.assert_array_equal(table.filter(both), [34])
+
+    def test_concurrent_aggregates(self):
+        table = self.db["orders"]
+        self.db.create_index("orders", ["customer", "quantity"])
+        condition = Condition(
+            ConditionType.AND,
+            None,
+            [
+                Condition(ConditionType.EQUALS, "customer", "customer 4"),
+                Condition(ConditionType.BETWEEN, "quantity", (30, 40)),
+            ],
+        )
+        aggregation = Aggregation(
+            table, [Aggregate("COUNT", None), Aggregate("SUM", "quantity")]
+        )
+        self.assertIn("Index prefix scan", aggregation.explain(condition))
+        before = len(self.expected(lambda row: matches(condition, row)))
+        before_sum = aggregation.execute(condition).fetchone()["SUM(quantity)"]
+        errors = []
+
+        def read():
+            try:
+                for _ in range(50):
+                    row = aggregation.execute(condition).fetchone()
+                    added = row["COUNT(*)"] - before
+                    # every aggregate sees some whole number of the writer's batches
+                    self.assertEqual(added % 10, 0)
+                    self.assertEqual(row["SUM(quantity)"], before_sum + 35 * added)
+            except Exception as e:
+                errors.append(e)
+
+        readers = [threading.Thread(target=read) for _ in range(4)]
+        for reader in readers:
+            reader.start()
+        for first in range(3000, 4000, 10):
+            table.insert_many(
+                [
+                    {**self.row(pk), "customer": "customer 4", "quantity": 35}
+                    for pk in range(first, first + 10)
+                ]
+            )
+        for reader in readers:
+            reader.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(
+            aggregation.execute(condition).fetchone()["COUNT(*)"], before + 1000
+        )
+
+        # rows written while an aggregate reads its snapshot are not seen by it
+        prefix_lookup = table.prefix_lookup
+
+        def write_then_lookup(*args):
+            rows = [
+                {**self.row(pk), "customer": "customer 4", "quantity": 35}
+                for pk in range(4000, 4010)
+            ]
+            writer = threading.Thread(target=table.insert_many, args=(rows,))
+            writer.start()
+            writer.join()
+            return prefix_lookup(*args)
+
+        table.prefix_lookup = write_then_lookup
+        count = Aggregation(table, [Aggregate("COUNT", None)])
+        row = count.execute(condition).fetchone()
+        del table.prefix_lookup
+        self.assertEqual(row["COUNT(*)"], before + 1000)
+        self.assertEqual(
+            aggregation.execute(condition).fetchone()["COUNT(*)"], before + 1010
+        )
@@ -1,5 +1,16 @@
 import unittest
 
+from query import (
+    Aggregate,
+    Change,
+    Condition,
+    ConditionType,
+    CreateIndex,
+    DropIndex,
+    Insert,
+    Select,
+    Update,
+)
 from sqlengine import SQLEngine
 
 
@@ -46,45 +57,130 @@ class TableTests(unittest.TestCase):
             "SELECT fruits": {
                 "type": "SELECT",
                 "table_name": "fruits",
-                "conditions": {},
+                "conditions": None,
             },
             "swipe fruits": {
                 "type": "SELECT",
                 "table_name": "fruits",
-                "conditions": {},
+                "conditions": None,
             },
             "select fruits where fruit_name = apple": {
                 "type": "SELECT",
                 "table_name": "fruits",
-                "conditions": {"fruit_name": "apple"},
+                "conditions": Condition(ConditionType.EQUALS, "fruit_name", "apple"),
             },
             "swipe fruits where fruit_name = apple": {
                 "type": "SELECT",
                 "table_name": "fruits",
-                "conditions": {"fruit_name": "apple"},
+                "conditions": Condition(ConditionType.EQUALS, "fruit_name", "apple"),
+            },
+            "select fruit_name, price from fruits where price > 2": {
+                "type": "SELECT",
+                "table_name": "fruits",
+                "conditions": Condition(ConditionType.GREATER_THAN, "price", "2"),
+                "columns": ["fruit_name", "price"],
+            },
+            "select * from fruits where price > 2 limit 10 offset 20": {
+                "type": "SELECT",
+                "table_name": "fruits",
+                "conditions": Condition(ConditionType.GREATER_THAN, "price", "2"),
+                "limit": 10,
+                "offset": 20,
+            },
+            "explain swipe fruits where fruit_name = apple": {
+                "type": "EXPLAIN",
+                "statement": {
+                    "type": "SELECT",
+                    "table_name": "fruits",
+                    "conditions": Condition(
+                        ConditionType.EQUALS, "fruit_name", "apple"
+                    ),
+                },
             },
             'insert into fruits values(1,2,3, "44", 5.5);': {
                 "type": "INSERT INTO",
                 "table_name": "fruits",
                 "values": [1, 2, 3, "44", 5.5],
             },
+            "insert into fruits values (1, 'apple', 2.5), (2, 'pear', 3)": {
+                "type": "INSERT INTO",
+                "table_name": "fruits",
+                "rows": [[1, "apple", 2.5], [2, "pear", 3]],
+            },
             "truncate fruits": {
                 "type": "TRUNCATE",
                 "table_name": "fruits",
-                "conditions": {},
+                "conditions": None,
             },
             "chomp fruits": {
                 "type": "TRUNCATE",
                 "table_name": "fruits",
-                "conditions": {},
+                "conditions": None,
             },
             "delete fruits where fruitName = 'apple'": {
                 "type": "DELETE",
                 "table_name": "fruits",
-                "conditions": {"fruitName": "apple"},
+                "conditions": Condition(ConditionType.EQUALS, "fruitName", "apple"),
+            },
+            "select fruits where price >= 2 and (color = 'red' or color in (green, 'yellow'))": {
+                "type": "SELECT",
+                "table_name": "fruits",
+                "conditions": Condition(
+                    ConditionType.AND,
+                    None,
+                    (
+                        Condition(ConditionType.GREATER_EQUALS, "price", "2"),
+                        Condition(
+                            ConditionType.OR,
+                            None,
+                            (
+                                Condition(ConditionType.EQUALS, "color", "red"),
+                                Condition(
+                                    ConditionType.IN, "color", ("green", "yellow")
+                                ),
+                            ),
+                        ),
+                    ),
+                ),
+            },
+            "select fruits where price between 1 and 3 or price != 10": {
+                "type": "SELECT",
+                "table_name": "fruits",
+                "conditions": Condition(
+                    ConditionType.OR,
+                    None,
+                    (
+                        Condition(ConditionType.BETWEEN, "price", ("1", "3")),
+                        Condition(ConditionType.NOT_EQUALS, "price", "10"),
+                    ),
+                ),
+            },
+            "SELECT * FROM fruits WHERE price < 5 AND price > 1": {
+                "type": "SELECT",
+                "table_name": "fruits",
+                "conditions": Condition(
+                    ConditionType.AND,
+                    None,
+                    (
+                        Condition(ConditionType.LESS_THAN, "price", "5"),
+                        Condition(ConditionType.GREATER_THAN, "price", "1"),
+                    ),
+                ),
             },
             "drop table fruits": {"type": "DROP TABLE", "table_name": "fruits"},
             "SWAMP fruits": {"type": "DROP TABLE", "table_name": "fruits"},
+            "create index fruits_name on fruits using hash (name)": {
+                "type": "CREATE INDEX",
+                "index_name": "fruits_name",
+                "table_name": "fruits",
+                "columns": ["name"],
+                "using": "HASH",
+            },
+            "drop index fruits_name on fruits": {
+                "type": "DROP INDEX",
+                "index_name": "fruits_name",
+                "table_name": "fruits",
+            },
         }
 
         engine = SQLEngine()
@@ -92,6 +188,93 @@ class TableTests(unittest.TestCase):
             actual_output = engine.parse_sql(statement)
             self.assertEqual(actual_output, expected_output)
 
+    def test_statement_objects(self):
+        engine = SQLEngine()
+        self.assertEqual(
+            engine.parse("select name, price from fruits where price <= 2 limit 5"),
+            Select(
+                "fruits",
+                Condition(ConditionType.LESS_EQUALS, "price", "2"),
+                ("name", "price"),
+                5,
+                None,
+                None,
+            ),
+        )
+        self.assertEqual(
+            engine.parse("INSERT INTO fruits VALUES (-1, 'it''s', 1e3)"),
+            Insert("fruits", ((-1, "it's", 1000.0),)),
+        )
+        self.assertEqual(
+            engine.parse("update fruits set name = 'kiwi', price = 3 where pk = 1"),
+            Update(
+                "fruits",
+                Condition(ConditionType.EQUALS, "pk", "1"),
+                (Change("name", "kiwi"), Change("price", "3")),
+            ),
+        )
+        self.assertEqual(
+            engine.parse(
+                "select name, count(*), avg(price) from fruits where price > 1 group by name"
+            ),
+            Select(
+                "fruits",
+                Condition(ConditionType.GREATER_THAN, "price", "1"),
+                ("name", Aggregate("COUNT", None), Aggregate("AVG", "price")),
+                None,
+                None,
+                ("name",),
+            ),
+        )
+        self.assertEqual(
+            engine.parse("CREATE INDEX ON fruits (name, price) USING btree;"),
+            CreateIndex(None, "fruits", ("name", "price"), "BTREE"),
+        )
+        self.assertEqual(
+            engine.parse("create index by_name on fruits (name)"),
+            CreateIndex("by_name", "fruits", ("name",), "BTREE"),
+        )
+        self.assertEqual(engine.parse("DROP INDEX by_name"), DropIndex("by_name", None))
+        # aggregate names are still column names when not called
+        self.assertEqual(engine.parse("select count from fruits").columns, ("count",))
+        for statement in (
+            "",
+            "select",
+            "select sum(*) from fruits",
+            "select name, count(*) from fruits",
+            "select * from fruits group by name",
+            "select count(name from fruits",
+            "select * fruits",
+            "select a, b fruits",
+            "select fruits where price",
+            "select fruits limit -1",
+            "insert fruits values (1)",
+            "insert into fruits values 1",
+            "update fruits set name = 'kiwi'",
+            "create table fruits (pk blob)",
+            "truncate fruits where pk = 1",
+            "create index on fruits using bitmap (name)",
+            "create index on fruits ()",
+            "create index fruits (name)",
+            "drop index",
+            "drop index by_name on",
+            "merge fruits",
+            "select fruits where name = 'apple",
+        ):
+            with self.assertRaises(ValueError, msg=statement):
+                engine.parse(statement)
+
+    def test_cache(self):
+        engine = SQLEngine(cache_size=2)
+        first = engine.parse("select fruits where pk = 1")
+        self.assertIs(engine.parse("  select fruits where pk = 1 ;"), first)
+        engine.parse("select fruits where pk = 2")
+        engine.parse("select fruits where pk = 3")
+        info = engine.cache_info()
+        self.assertEqual((info.hits, info.misses, info.currsize), (1, 3, 2))
+        # the least recently used statement was evicted
+        self.assertIsNot(engine.parse("select fruits where pk = 1"), first)
+
 
 if __name__ == "__main__":
     unittest.main()
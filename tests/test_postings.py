@@ -0,0 +1,105 @@
+import os
+import random
+import shutil
+import unittest
+
+import numpy as np
+
+from db import DBType, NonclusteredIndex
+from gdb_bplustree import BPlusTree
+from gdb_postings import PostingList
+
+PATH = "/tmp/gatordb_postings"
+
+
+class PostingListTests(unittest.TestCase):
+    def test_set_operations(self):
+        random.seed(3)
+        for span in (100, 1 << 20, 1 << 40):
+            a = {random.randrange(-span // 4, span) for _ in range(6000)}
+            b = {random.randrange(-span // 4, span) for _ in range(3000)}
+            pa = PostingList.from_array(list(a))
+            pb = PostingList.from_array(list(b))
+            self.assertEqual(list(pa.to_array()), sorted(a))
+            self.assertEqual(len(pa), len(a))
+            self.assertEqual(list(pa.intersect(pb).to_array()), sorted(a & b))
+            self.assertEqual(list(pa.union(pb).to_array()), sorted(a | b))
+
+            for pk in random.sample(sorted(a), 100):
+                self.assertTrue(pa.remove(pk))
+                self.assertNotIn(pk, pa)
+                a.discard(pk)
+            self.assertTrue(pa.add(span + 1))
+            self.assertFalse(pa.add(span + 1))
+            a.add(span + 1)
+            self.assertEqual(list(pa.to_array()), sorted(a))
+
+        self.assertEqual(PostingList.from_array([1, 2]).to_array().dtype, np.int32)
+        self.assertEqual(
+            PostingList.from_array([1, 1 << 40]).to_array().dtype, np.int64
+        )
+
+
+class NonclusteredIndexTests(unittest.TestCase):
+    def setUp(self):
+        shutil.rmtree(PATH, ignore_errors=True)
+        os.mkdir(PATH)
+
+    def test_append_delete(self):
+        index = NonclusteredIndex("company", DBType.STRING, path=PATH)
+        for pk in range(20000):
+            self.assertEqual(index.insert("Acme" if pk % 4 else "Initech", pk), pk < 2)
+        # large lists live in chunk pages, keeping the tree value small
+        self.assertLess(len(index.tree.get("Acme")), 100)
+        self.assertEqual(list(index.get("Initech")), list(range(0, 20000, 4)))
+
+        for pk in range(0, 20000, 8):
+            self.assertFalse(index.delete("Initech", pk))
+        self.assertEqual(
+            dict(index.value_counts()), {"Acme": 15000, "Initech": 0 + 2500}
+        )
+        index.close()
+
+        index = NonclusteredIndex("company", DBType.STRING, path=PATH)
+        self.assertEqual(list(index.get("Initech")), list(range(4, 20000, 8)))
+        for pk in range(4, 20000, 8):
+            index.delete("Initech", pk)
+        self.assertIsNone(index.tree.get("Initech"))
+        self.assertEqual(index.range_pks().size, 15000)
+
+        pages = index.tree.pager.page_count
+        index.clear()
+        for pk in range(20000):
+            index.insert("Acme", pk)
+        # the pages of the cleared lists are reused
+        self.assertLessEqual(index.tree.pager.page_count, pages)
+        index.close()
+
+    def test_insert_many(self):
+        index = NonclusteredIndex("company", DBType.STRING, path=PATH)
+        index.insert("Initech", 3)
+        items = sorted((("Acme", "Initech")[pk % 2], pk) for pk in range(0, 20000, 3))
+        is_new = index.insert_many(items)
+        self.assertEqual(sum(is_new), 1)
+        self.assertEqual(list(index.get("Acme")), list(range(0, 20000, 6)))
+        self.assertEqual(list(index.get("Initech")), list(range(3, 20000, 6)))
+        index.close()
+
+    def test_legacy_arrays(self):
+        tree = BPlusTree(path=f"{PATH}/number.tree", max_degree=50)
+        tree.insert(1, np.array([5, 3, 9], dtype=np.int32).tobytes())
+        tree.insert(2, np.array([4], dtype=np.int32).tobytes())
+        tree.close()
+
+        index = NonclusteredIndex("number", DBType.INTEGER, path=PATH)
+        self.assertEqual(list(index.get(1)), [3, 5, 9])
+        self.assertEqual(list(index.get(2)), [4])
+        index.insert(2, 7)
+        index.close()
+        index = NonclusteredIndex("number", DBType.INTEGER, path=PATH)
+        self.assertEqual(list(index.get(2)), [4, 7])
+        index.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import json
+import unittest
+
+from gdb_rowformat import FLOAT, INTEGER, STRING, RowFormat
+
+
+class RowFormatTests(unittest.TestCase):
+    def setUp(self):
+        self.format = RowFormat(
+            [("pk", INTEGER), ("name", STRING), ("score", FLOAT), ("city", STRING)]
+        )
+        self.row = {"pk": 7, "name": "Albert ✓", "score": 2.5, "city": ""}
+
+    def test_round_trip(self):
+        data = self.format.encode(self.row)
+        self.assertLess(len(data), len(json.dumps(self.row)))
+        self.assertEqual(self.format.decode(data), self.row)
+        self.assertEqual(list(self.format.decode(data).keys()), list(self.row.keys()))
+
+    def test_decode_column(self):
+        data = self.format.encode(self.row)
+        for name, value in self.row.items():
+            self.assertEqual(self.format.decode_column(data, name), value)
+        self.assertEqual(
+            self.format.decode(data, ["city", "pk"]), {"city": "", "pk": 7}
+        )
+
+        row = self.format.row(data)
+        self.assertEqual(row["name"], "Albert ✓")
+        self.assertEqual(dict(row), self.row)
+        with self.assertRaises(KeyError):
+            row["missing"]
+
+    def test_decode_columns(self):
+        other = dict(self.row, pk=8, name="Ada", score=-1.0, city="Gainesville")
+        rows = [self.format.encode(self.row), self.format.encode(other)]
+        columns = self.format.decode_columns(rows, ["score", "pk", "city"])
+        self.assertEqual(columns["pk"].tolist(), [7, 8])
+        self.assertEqual(columns["score"].tolist(), [2.5, -1.0])
+        self.assertEqual(columns["city"].tolist(), ["", "Gainesville"])
+        # rows written before the binary format are decoded one by one
+        rows[0] = json.dumps(self.row).encode("utf-8")
+        self.assertEqual(
+            self.format.decode_columns(rows, ["name"])["name"].tolist(),
+            ["Albert ✓", "Ada"],
+        )
+
+    def test_legacy_json(self):
+        data = json.dumps(self.row).encode("utf-8")
+        self.assertEqual(self.format.decode(data), self.row)
+        self.assertEqual(self.format.decode_column(data, "score"), 2.5)
+        self.assertEqual(dict(self.format.row(data)), self.row)
+
+    def test_type_mismatch(self):
+        with self.assertRaises(ValueError):
+            self.format.encode({**self.row, "pk": "seven"})
+        with self.assertRaises(ValueError):
+            self.format.encode({**self.row, "name": 3})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+import asyncio
+import os
+import shutil
+import threading
+import unittest
+
+from client import AsyncClient, Client
+from db import DB
+from server import Server
+
+SOCKET = "/tmp/gatordb_server.sock"
+
+
+class ServerTests(unittest.TestCase):
+    def setUp(self):
+        shutil.rmtree("/tmp/gatordb_server", ignore_errors=True)
+        if os.path.exists(SOCKET):
+            os.remove(SOCKET)
+        self.db = DB("/tmp/gatordb_server")
+        self.server = Server(self.db, workers=2)
+        self.loop = asyncio.new_event_loop()
+        self.listener = self.loop.run_until_complete(
+            self.server.start(unix_socket=SOCKET)
+        )
+        self.thread = threading.Thread(target=self.loop.run_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        async def stop():
+            self.listener.close()
+            await self.listener.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(stop(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.server.close()
+        self.db.close()
+        shutil.rmtree("/tmp/gatordb_server", ignore_errors=True)
+
+    def test_execute(self):
+        with Client(unix_socket=SOCKET) as client:
+            client.execute(
+                "CREATE TABLE orders (pk int primary key, customer int, total float)"
+            )
+            results = client.pipeline(
+                ("INSERT INTO orders VALUES (?, ?, ?)", (pk, pk % 3, pk / 2))
+                for pk in range(10)
+            )
+            self.assertEqual([result.count for result in results], [1] * 10)
+
+            result = client.execute(
+                "SELECT pk, total FROM orders WHERE customer = ? LIMIT 2", (1,)
+            )
+            self.assertEqual(result.columns, ["pk", "total"])
+            self.assertEqual(result.rows, [[1, 0.5], [4, 2.0]])
+            self.assertEqual(
+                client.execute("DELETE FROM orders WHERE customer = 0").count, 4
+            )
+            self.assertIn(
+                "Full scan", client.execute("EXPLAIN SELECT * FROM orders").message
+            )
+            explain = "EXPLAIN SELECT * FROM orders WHERE customer = 1"
+            self.assertIn("Full scan", client.execute(explain).message)
+            client.execute("CREATE INDEX ON orders (customer)")
+            self.assertIn("Index probe", client.execute(explain).message)
+            client.execute("DROP INDEX orders_customer_idx")
+            self.assertIn("Full scan", client.execute(explain).message)
+
+            with self.assertRaises(ValueError):
+                client.execute("SELECT * FROM missing")
+            # a failed statement does not stop the ones after it
+            with self.assertRaises(ValueError):
+                client.pipeline(
+                    [
+                        ("SELECT * FROM missing WHERE pk = ?", (1,)),
+                        ("INSERT INTO orders VALUES (?, ?, ?)", (20, 1, 1.0)),
+                    ]
+                )
+            self.assertEqual(
+                client.execute("SELECT * FROM orders WHERE pk = 20").rows,
+                [[20, 1, 1.0]],
+            )
+
+    def test_async_pipelining(self):
+        with Client(unix_socket=SOCKET) as client:
+            client.execute("CREATE TABLE numbers (pk int primary key, square int)")
+            client.pipeline(
+                ("INSERT INTO numbers VALUES (?, ?)", (n, n * n)) for n in range(50)
+            )
+
+        async def run():
+            clients = [await AsyncClient.connect(unix_socket=SOCKET) for _ in range(3)]
+            results = await asyncio.gather(
+                *(
+                    clients[n % 3].execute(
+                        "SELECT square FROM numbers WHERE pk = ?", (n,)
+                    )
+                    for n in range(50)
+                )
+            )
+            for client in clients:
+                await client.close()
+            return results
+
+        results = asyncio.run(run())
+        self.assertEqual(
+            [result.rows for result in results], [[[n * n]] for n in range(50)]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,15 @@
+import os
+import pickle
+import random
+import tempfile
 import unittest
+from array import array
 
-from gdb_bplustree import BPlusTree
+import numpy as np
+
+from gdb_bplustree import BPlusTree, _LegacyObject
+from gdb_bufferpool import BufferPool
+from gdb_pager import PAGE_SIZE
 
 
 class TreeTests(unittest.TestCase):
@@ -28,6 +37,23 @@ class TreeTests(unittest.TestCase):
         tree[2] = "twooo"
         self.assertEqual(list(tree), [(1, "oneee"), (2, "twooo")])
 
+    def test_insert_many(self):
+        tree = BPlusTree(4)
+        for key in range(0, 100, 2):
+            tree.insert(key, str(key))
+
+        self.assertEqual(
+            tree.insert_many((key, str(key)) for key in range(0, 100, 3)),
+            [key % 2 == 1 for key in range(0, 100, 3)],
+        )
+        # unsorted keys are still placed correctly
+        tree.insert_many(
+            [(99, "99"), (1, "1"), (50, "x")], merge=lambda old, new: old or new
+        )
+        expected = {key: str(key) for key in range(100) if key % 2 == 0 or key % 3 == 0}
+        expected.update({99: "99", 1: "1"})
+        self.assertEqual(list(tree), sorted(expected.items()))
+
     def test_split(self):
         tree = BPlusTree(4)
         for i in range(0, 9):
@@ -51,6 +77,295 @@ class TreeTests(unittest.TestCase):
             tree.insert(i, f"value{i}")
 
         self.assertEqual(tree.get(3), tree[3], "value3")
+        self.assertIsNone(tree.get(-1))
+        self.assertIsNone(tree.get(4.5))
+        self.assertIsNone(tree.get(100))
+
+    def test_reopen(self):
+        path = os.path.join(tempfile.mkdtemp(), "reopen.tree")
+        tree = BPlusTree(4, path=path)
+        for i in range(0, 100):
+            tree.insert(i, f"value{i}".encode())
+        tree.close()
+
+        tree = BPlusTree(path=path)
+        self.assertEqual(tree.max_keys, 3)
+        self.assertEqual(tree[42], b"value42")
+        self.assertEqual(list(tree), [(i, f"value{i}".encode()) for i in range(100)])
+        tree.close()
+
+        # only the node read to answer the lookup is loaded
+        tree = BPlusTree(path=path)
+        tree.get(42)
+        self.assertEqual(tree.pool.misses, len(tree.find_with_path(42)[1]) + 1)
+        tree.close()
+
+    def test_buffer_pool_eviction(self):
+        path = os.path.join(tempfile.mkdtemp(), "evict.tree")
+        pool = BufferPool(capacity=8 * PAGE_SIZE)
+        tree = BPlusTree(4, path=path, pool=pool)
+        for i in range(0, 200):
+            tree.insert(i, f"value{i}".encode())
+
+        self.assertLessEqual(pool.used, pool.capacity)
+        self.assertGreater(pool.evictions, 0)
+        self.assertEqual(list(tree), [(i, f"value{i}".encode()) for i in range(200)])
+
+        tree.close()
+        tree = BPlusTree(path=path)
+        self.assertEqual(tree[199], b"value199")
+        tree.close()
+
+    def test_bounded_writes(self):
+        path = os.path.join(tempfile.mkdtemp(), "bounded.tree")
+        tree = BPlusTree(4, path=path)
+        tree.bulk_load((i, b"before") for i in range(10))
+        tree.close()
+
+        pool = BufferPool(capacity=16 * PAGE_SIZE)
+        tree = BPlusTree(path=path, pool=pool)
+        tree.pager.dirty_limit = 32 * PAGE_SIZE
+        items = [(i, bytes(100)) for i in range(20000)]
+        tree.bulk_load(items)
+        # far more pages were written than the pool and the pager hold in memory
+        self.assertLessEqual(pool.used, pool.capacity)
+        self.assertLessEqual(tree.pager.buffered_bytes, tree.pager.dirty_limit)
+        self.assertGreater(os.path.getsize(path + ".journal"), 100 * PAGE_SIZE)
+        self.assertEqual(tree[12345], bytes(100))
+
+        # a crash before the flush leaves the tree as it was
+        tree.pager.file.close()
+        tree = BPlusTree(path=path)
+        self.assertEqual(list(tree), [(i, b"before") for i in range(10)])
+        self.assertFalse(os.path.exists(path + ".journal"))
+
+        tree.pager.dirty_limit = 32 * PAGE_SIZE
+        tree.bulk_load(items)
+        tree.close()
+        tree = BPlusTree(path=path)
+        self.assertEqual(list(tree), items)
+        tree.close()
+
+    def test_bulk_load(self):
+        for count in (0, 1, 3, 4, 5, 9, 100, 1001):
+            for fill_factor in (1.0, 0.5):
+                tree = BPlusTree(4)
+                tree.bulk_load(((i, i * 2) for i in range(count)), fill_factor)
+                self.assertEqual(list(tree), [(i, i * 2) for i in range(count)])
+                for i in range(count):
+                    self.assertEqual(tree[i], i * 2)
+
+                # the loaded tree keeps working like any other
+                tree.insert(count // 2 + 0.5, "new")
+                self.assertEqual(tree[count // 2 + 0.5], "new")
+
+        tree = BPlusTree(4)
+        tree.bulk_load((i, "value") for i in range(0, 9))
+        self.assertEqual(
+            tree.display(),
+            ("└─ [3, 6]\n" "   ├─ [0, 1, 2]\n" "   ├─ [3, 4, 5]\n" "   └─ [6, 7, 8]"),
+        )
+
+        # an underfull last leaf is merged into the one before it
+        tree = BPlusTree(4)
+        tree.bulk_load(((i, "value") for i in range(0, 3)), fill_factor=0.5)
+        self.assertEqual(tree.display(), "└─ [0, 1, 2]")
+
+        with self.assertRaises(ValueError):
+            BPlusTree(4).bulk_load([(2, "two"), (1, "one")])
+
+    def test_delete(self):
+        tree = BPlusTree(4)
+        for i in range(0, 9):
+            tree.insert(i, "value")
+
+        # borrows from the right sibling
+        tree.delete(0)
+        tree.delete(1)
+        self.assertEqual(
+            tree.display(),
+            ("└─ [4, 6]\n" "   ├─ [2, 3]\n" "   ├─ [4, 5]\n" "   └─ [6, 7, 8]"),
+        )
+
+        # merges with a sibling and collapses the root
+        for i in range(2, 7):
+            tree.delete(i)
+        self.assertEqual(tree.display(), "└─ [7, 8]")
+        self.assertEqual(list(tree), [(7, "value"), (8, "value")])
+
+        with self.assertRaises(ValueError):
+            tree.delete(0)
+
+    def test_compact(self):
+        tree = BPlusTree(4)
+        for i in range(0, 100):
+            tree.insert(i, "value")
+        for i in range(0, 100, 3):
+            tree.delete(i)
+
+        stats = tree.compact()
+        self.assertGreater(stats["after"]["leaf_fill"], stats["before"]["leaf_fill"])
+        self.assertLess(stats["after"]["leaves"], stats["before"]["leaves"])
+        self.assertEqual(stats["after"]["underfull_nodes"], 0)
+        self.assertEqual(
+            list(tree), [(i, "value") for i in range(0, 100) if i % 3 != 0]
+        )
+
+    def test_range(self):
+        tree = BPlusTree(4)
+        for i in range(0, 20, 2):
+            tree.insert(i, f"value{i}")
+
+        self.assertEqual([key for key, _ in tree.range(4, 10)], [4, 6, 8, 10])
+        self.assertEqual([key for key, _ in tree.range(4, 10, inclusive=False)], [6, 8])
+        self.assertEqual(
+            [key for key, _ in tree.range(3, 11, inclusive=(True, False))],
+            [4, 6, 8, 10],
+        )
+        self.assertEqual([key for key, _ in tree.range(hi=5)], [0, 2, 4])
+        self.assertEqual([key for key, _ in tree.range(lo=15)], [16, 18])
+        self.assertEqual(
+            [key for key, _ in tree.range(5, 13, reverse=True)], [12, 10, 8, 6]
+        )
+        self.assertEqual(
+            [key for key, _ in tree.range(lo=14, reverse=True)], [18, 16, 14]
+        )
+        self.assertEqual(list(tree.range(7, 7)), [])
+        self.assertEqual(next(tree.range(7)), (8, "value8"))
+
+    def test_snapshot(self):
+        path = os.path.join(tempfile.mkdtemp(), "snapshot.tree")
+        pool = BufferPool(capacity=8 * PAGE_SIZE)
+        tree = BPlusTree(4, path=path, pool=pool)
+        for i in range(0, 100, 2):
+            tree.insert(i, "old")
+
+        snapshot = tree.snapshot()
+        # splits, merges, updates and a whole new root after the snapshot was taken
+        for i in range(1, 100, 2):
+            tree.insert(i, "new")
+        for i in range(0, 50, 2):
+            tree.delete(i)
+        tree.insert(98, "new")
+        later = tree.snapshot()
+        tree.compact()
+
+        with snapshot.view():
+            self.assertEqual(list(tree), [(i, "old") for i in range(0, 100, 2)])
+            self.assertEqual(tree[42], "old")
+            self.assertIsNone(tree[43])
+        with later.view():
+            self.assertEqual(len(list(tree)), 75)
+            self.assertEqual(tree[98], "new")
+        self.assertIsNone(tree[42])
+        self.assertEqual(len(list(tree)), 75)
+
+        snapshot.close()
+        self.assertGreater(pool.stats()["page_versions"], 0)
+        later.close()
+        self.assertEqual(pool.stats()["page_versions"], 0)
+        with self.assertRaises(ValueError):
+            with snapshot.view():
+                pass
+        tree.close()
+
+    def test_key_types(self):
+        path = os.path.join(tempfile.mkdtemp(), "typed.tree")
+        keys = random.Random(0).sample(range(-1000, 1000), 500)
+        tree = BPlusTree(4, path=path, key_type="q")
+        for key in keys:
+            tree.insert(key, str(key))
+        for key in keys[:250]:
+            tree.delete(key)
+        self.assertIsInstance(tree.leftmost_leaf().keys, array)
+        self.assertEqual(list(tree), sorted((key, str(key)) for key in keys[250:]))
+        tree.close()
+
+        # reopened with the key type it was created with
+        tree = BPlusTree(path=path)
+        self.assertEqual(tree.key_type, "q")
+        self.assertEqual(tree[keys[-1]], str(keys[-1]))
+        tree.compact()
+        self.assertEqual(tree.fill_stats()["keys"], 250)
+        tree.close()
+
+        tree = BPlusTree(4, key_type="d")
+        tree.bulk_load((i / 2, i) for i in range(100))
+        tree.insert(7, "seven")
+        self.assertEqual(tree.get(7.0), "seven")
+        self.assertEqual(tree.get(3.5), 7)
+        self.assertEqual(tree.display().splitlines()[1], "   ├─ [6.0, 12.0]")
+        with self.assertRaises(TypeError):
+            tree.insert("text", "value")
+        with self.assertRaises(ValueError):
+            BPlusTree(4, key_type="s")
+
+    def test_key_arrays(self):
+        tree = BPlusTree(4, key_type="q")
+        tree.bulk_load((i, "value") for i in range(0, 40, 2))
+        for lo, hi, inclusive in (
+            (None, None, True),
+            (4, 10, True),
+            (4, 10, False),
+            (3, 11, (True, False)),
+            (None, 5, True),
+            (15, None, True),
+            (7, 7, True),
+            (50, None, True),
+            (None, -1, True),
+        ):
+            arrays = list(tree.key_arrays(lo, hi, inclusive))
+            self.assertTrue(all(len(keys) for keys in arrays))
+            self.assertEqual(
+                np.concatenate(arrays or [np.array([], dtype=np.int64)]).tolist(),
+                [key for key, _ in tree.range(lo, hi, inclusive)],
+            )
+        with self.assertRaises(ValueError):
+            next(BPlusTree(4).key_arrays())
+
+    def test_legacy_tree(self):
+        # trees were saved by pickling the whole tree, with each leaf linked to the next
+        leaves = [_LegacyObject() for _ in range(20000)]
+        for i, leaf in enumerate(leaves):
+            leaf.__dict__.update(
+                keys=[i],
+                values=[f"value{i}"],
+                next=leaves[i + 1] if i + 1 < 20000 else None,
+            )
+        root = _LegacyObject()
+        root.__dict__.update(keys=[1], values=[leaves[0], leaves[1]])
+        old_tree = _LegacyObject()
+        # the leaves are pickled from the last one, so pickling them does not recurse
+        old_tree.__dict__.update(leaves=leaves[::-1], root=root, max_keys=49)
+        path = os.path.join(tempfile.mkdtemp(), "legacy.tree")
+        with open(path, "wb") as f:
+            pickle.dump(old_tree, f)
+
+        # a conversion cut short leaves the pickled tree to convert again
+        insert = BPlusTree.insert
+        inserted = []
+
+        def crash(tree, key, value):
+            if len(inserted) == 50:
+                tree.pager.file.close()
+                raise RuntimeError("crash")
+            inserted.append(key)
+            return insert(tree, key, value)
+
+        BPlusTree.insert = crash
+        try:
+            with self.assertRaises(RuntimeError):
+                BPlusTree(path=path)
+        finally:
+            BPlusTree.insert = insert
+        self.assertTrue(os.path.exists(path + ".legacy"))
+
+        tree = BPlusTree(path=path)
+        self.assertEqual(tree.max_keys, 49)
+        self.assertEqual(tree[12345], "value12345")
+        self.assertEqual(len(list(tree)), 20000)
+        self.assertFalse(os.path.exists(path + ".legacy"))
+        tree.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,145 @@
+import os
+import shutil
+import threading
+import unittest
+
+from db import DB, ColumnInfo, DBTable, DBType
+from gdb_pager import Pager
+from gdb_wal import WriteAheadLog
+from query import Change, Condition, ConditionType
+
+PATH = "/tmp/gatordb_wal"
+
+
+class WALTests(unittest.TestCase):
+    def setUp(self):
+        shutil.rmtree(PATH, ignore_errors=True)
+        os.mkdir(PATH)
+
+    def test_append_commit(self):
+        wal = WriteAheadLog(f"{PATH}/wal.log")
+        self.assertEqual(wal.append(("a", 1)), 1)
+        self.assertEqual(wal.append(("b", 2)), 2)
+        # buffered records are not durable until commit
+        self.assertEqual(list(wal.records()), [])
+        self.assertEqual(wal.commit(), 2)
+        self.assertEqual(list(wal.records()), [(1, ("a", 1)), (2, ("b", 2))])
+
+        # a torn record at the end is dropped on open
+        wal.append(("c", 3))
+        wal.commit()
+        wal.close()
+        with open(f"{PATH}/wal.log", "r+b") as f:
+            f.truncate(os.path.getsize(f"{PATH}/wal.log") - 1)
+        wal = WriteAheadLog(f"{PATH}/wal.log")
+        self.assertEqual([lsn for lsn, _ in wal.records()], [1, 2])
+        self.assertEqual(wal.append(("c", 3)), 3)
+
+        # lsns keep increasing after the log is emptied
+        wal.truncate()
+        self.assertEqual(list(wal.records()), [])
+        self.assertEqual(wal.append(("d", 4)), 4)
+        wal.close()
+
+    def test_failed_write(self):
+        wal = WriteAheadLog(f"{PATH}/wal.log")
+        wal.commit(wal.append(("a", 1)))
+        write = wal.file.write
+
+        def fail(data):
+            # writes part of the records before running out of space
+            write(data[:10])
+            raise OSError(28, "No space left on device")
+
+        wal.file.write = fail
+        wal.append(("b", 2))
+        with self.assertRaises(OSError):
+            wal.commit()
+        self.assertEqual(wal.synced_lsn, 1)
+        self.assertEqual(list(wal.records()), [(1, ("a", 1))])
+
+        # the records kept buffered are written by the next commit
+        wal.file.write = write
+        wal.append(("c", 3))
+        self.assertEqual(wal.commit(), 3)
+        self.assertEqual(wal.synced_lsn, 3)
+        self.assertEqual(
+            list(wal.records()), [(1, ("a", 1)), (2, ("b", 2)), (3, ("c", 3))]
+        )
+        wal.close()
+
+    def test_group_commit(self):
+        wal = WriteAheadLog(f"{PATH}/wal.log", commit_delay=0.01)
+
+        def worker(i):
+            for j in range(10):
+                wal.commit(wal.append((i, j)))
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(list(wal.records())), 80)
+        self.assertEqual(wal.commits, 80)
+        self.assertLess(wal.syncs, 80)
+        wal.close()
+
+    def test_journal_recovery(self):
+        pager = Pager(f"{PATH}/pages")
+        page_id = pager.allocate()
+        pager.write(page_id, b"before")
+        pager.flush()
+
+        # crash after the journal was written but before the pages were written in place
+        pager.write(page_id, b"after")
+        pager._dirty[0] = open(f"{PATH}/pages", "rb").read(pager.page_size)
+        pager._write_journal()
+        pager.file.close()
+        self.assertEqual(Pager(f"{PATH}/pages").read(page_id), b"after")
+        self.assertFalse(os.path.exists(f"{PATH}/pages.journal"))
+
+        # a torn journal is ignored
+        pager = Pager(f"{PATH}/pages")
+        pager.write(page_id, b"torn")
+        pager._write_journal()
+        pager.file.close()
+        with open(f"{PATH}/pages.journal", "r+b") as f:
+            f.truncate(100)
+        self.assertEqual(Pager(f"{PATH}/pages").read(page_id), b"after")
+
+    def test_recovery(self):
+        db = DB(f"{PATH}/db")
+        table = DBTable(name="numbers", path=db.name, pool=db.pool)
+        table.add_column("pk", ColumnInfo(dbtype=DBType.INTEGER, primary_key=True))
+        table.add_column("number", ColumnInfo(dbtype=DBType.INTEGER))
+        db["numbers"] = table
+        table.save()
+
+        table.bulk_insert([{"pk": pk, "number": pk % 3} for pk in range(30)])
+        db.checkpoint()
+        for pk in range(30, 40):
+            table.insert({"pk": pk, "number": pk % 3})
+        table.update(
+            table.filter(Condition(ConditionType.LESS_THAN, "pk", 5)),
+            [Change(col="number", val=7)],
+        )
+        table.delete(table.filter(Condition(ConditionType.EQUALS, "number", 2)))
+        db.commit()
+        expected = table.select_all()
+
+        # reopen without closing, as after a crash
+        db = DB(f"{PATH}/db")
+        table = db["numbers"]
+        self.assertEqual(table.select_all(), expected)
+        self.assertEqual(
+            list(table.filter(Condition(ConditionType.EQUALS, "number", 7))),
+            [0, 1, 2, 3, 4],
+        )
+        self.assertEqual(table.row_count(), len(expected))
+        self.assertEqual(db.wal.size(), 0)
+        db.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,10 +1,3 @@
-import json
-
-
-def serialize_dict(to_serialize: dict) -> bytes:
-    return json.dumps(to_serialize).encode("utf-8")
-
-
 def bolden(msg: str) -> str:
     return "\033[1m" + msg + "\033[0m"
 